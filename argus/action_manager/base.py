@@ -14,6 +14,7 @@
 #    under the License.
 
 import abc
+import threading
 
 import six
 
@@ -22,6 +23,66 @@ from argus import log as argus_log
 LOG = argus_log.LOG
 
 
+class InstanceFacts(object):
+    """A cache for the facts about an instance which are costly to find.
+
+    The remote calls needed for finding every fact are counted,
+    so that the cache can tell how many remote calls it saved.
+    The cache can be shared by recipe steps which run concurrently,
+    a fact is found by a single one of them at a time.
+    """
+
+    def __init__(self):
+        self._facts = {}
+        self._finding = {}
+        self._lock = threading.Lock()
+        self.saved_calls = 0
+
+    def get(self, name, finder, execute_function):
+        """Get a fact, finding it if it is not known yet.
+
+        :param name: The name of the fact.
+        :param finder:
+            A callable which receives an execute function
+            and returns the fact. Unknown facts (None) are not cached.
+        :param execute_function:
+            The function used by the finder for executing commands.
+        """
+        with self._lock:
+            finding = self._finding.setdefault(name, threading.Lock())
+
+        # The steps which miss the same fact wait for the first one
+        # to find it, instead of finding it once more.
+        with finding:
+            with self._lock:
+                if name in self._facts:
+                    value, calls = self._facts[name]
+                    self.saved_calls += calls
+                    LOG.debug("Using the cached %s, %d remote calls were "
+                              "saved so far.", name, self.saved_calls)
+                    return value
+
+            calls = [0]
+
+            def counted_execute(*args, **kwargs):
+                calls[0] += 1
+                return execute_function(*args, **kwargs)
+
+            value = finder(counted_execute)
+            if value is not None:
+                with self._lock:
+                    self._facts[name] = (value, calls[0])
+            return value
+
+    def invalidate(self, reason):
+        """Forget every fact, because the instance changed."""
+        with self._lock:
+            if self._facts:
+                LOG.debug("Forgetting the facts about the instance: %s",
+                          reason)
+            self._facts.clear()
+
+
 @six.add_metaclass(abc.ABCMeta)
 class BaseActionManager(object):
     """Get a Action Manager that can handle basic actions.
@@ -35,6 +96,7 @@ class BaseActionManager(object):
     def __init__(self, client, os_type):
         self._client = client
         self._os_type = os_type
+        self.facts = InstanceFacts()
 
         self._config_os_type_on_logger()
 
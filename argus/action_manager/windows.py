@@ -13,9 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+import json
 import ntpath
 import os
 import socket
+import threading
 import time
 
 import requests
@@ -33,14 +37,89 @@ from argus import util
 LOG = argus_log.LOG
 CONFIG = argus_config.CONFIG
 
+PathStat = collections.namedtuple("PathStat", "path exists type size mtime")
+"""The stat of a remote path, as returned by
+:meth:`WindowsActionManager.stat_many`. The type is ``Leaf`` for
+files and ``Container`` for directories, the size is in bytes
+and the modification time is a UNIX timestamp."""
+
+# The .NET ticks of the UNIX epoch.
+_EPOCH_TICKS = 621355968000000000
+
+
+def _stat_script(paths):
+    """Get the command which prints the stat of every path on a line.
+
+    A dash is printed instead for the paths which don't exist.
+    """
+    paths = ", ".join("'{}'".format(path.replace("'", "''"))
+                      for path in paths)
+    return ("foreach ($argusPath in @({})) {{ "
+            "$argusItem = Get-Item -LiteralPath $argusPath -Force "
+            "-ErrorAction SilentlyContinue; "
+            "if ($argusItem -eq $null) {{ '-' }} "
+            "elseif ($argusItem.PSIsContainer) {{ 'Container|0|' + "
+            "$argusItem.LastWriteTimeUtc.Ticks }} "
+            "else {{ 'Leaf|' + $argusItem.Length + '|' + "
+            "$argusItem.LastWriteTimeUtc.Ticks }} }}".format(paths))
+
+
+def _parse_stats(paths, stdout):
+    """Get the :class:`PathStat` of every path from the stat script."""
+    lines = [line.strip() for line in stdout.splitlines() if line.strip()]
+    if len(lines) != len(paths):
+        raise exceptions.ArgusCLIError(
+            "Expected the stats of {} paths, got: {!r}"
+            .format(len(paths), stdout))
+    stats = []
+    for path, line in zip(paths, lines):
+        if line == "-":
+            stats.append(PathStat(path, False, None, None, None))
+            continue
+        try:
+            path_type, size, ticks = line.split("|")
+            stats.append(PathStat(path, True, path_type, int(size),
+                                  (int(ticks) - _EPOCH_TICKS) / 1e7))
+        except ValueError:
+            raise exceptions.ArgusCLIError(
+                "Invalid stat of {}: {!r}".format(path, line))
+    return stats
+
+
+def _changes_files(func):
+    """Forget the cached stats after the decorated method ran."""
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.invalidate_stats()
+    return wrapper
+
 
 def wait_boot_completion(client, username):
+    """Wait until the instance runs commands for the given user.
+
+    The WinRM endpoint is probed cheaply until it listens, and
+    only then a real command is executed.
+    """
+    start = time.time()
+    stages = client.wait_for_endpoint()
+
+    command_start = time.time()
     wait_cmd = ("echo '{}'".format(username))
     client.run_command_until_condition(
         wait_cmd,
         lambda stdout: stdout.strip() == username,
         retry_count=CONFIG.argus.retry_count, delay=CONFIG.argus.retry_delay,
         command_type=util.POWERSHELL)
+    stages["command"] = time.time() - command_start
+
+    LOG.info("The instance was ready after %.1f seconds (%s).",
+             time.time() - start,
+             ", ".join("{}: {:.1f}s".format(stage, seconds)
+                       for stage, seconds in stages.items()))
 
 
 class WindowsActionManager(base.BaseActionManager):
@@ -55,24 +134,41 @@ class WindowsActionManager(base.BaseActionManager):
     _INSTALL_SCRIPT = r"C:\installCBinit.ps1"
     _ARGUS_AGENT_SCRIPT = r"C:\argusagent.py"
 
+    # The facts found by the OS probe, set by get_windows_action_manager.
+    os_facts = None
+
+    # The number of seconds for which the stats of the paths are
+    # trusted, unless the files are changed through the manager
+    # or any other call is sent through the client.
+    STAT_CACHE_TTL = 5
+
     def __init__(self, client, os_type=util.WINDOWS):
         super(WindowsActionManager, self).__init__(client, os_type)
+        self._stats = {}
+        self._stats_generation = 0
+        self._stats_calls = None
+        self._stats_lock = threading.Lock()
 
     def get_agent_command(self, agent_action,
                           agent_path=None, **kwargs):
         """Command builder for the argus utilitary agent.
 
         Returns a command string formed by the given action and its
-        required arguments.
+        required arguments, which are either the `source` and the
+        `location` or the list of `arguments`. The Python directory
+        is taken from the facts cache, so only the first agent
+        command needs to look it up.
         """
         agent_path = agent_path or self._ARGUS_AGENT_SCRIPT
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = self.get_python_dir()
+        arguments = kwargs.get('arguments', (kwargs.get('source', ''),
+                                             kwargs.get('location', '')))
         cmd = (r'& "{pydir}\python.exe" {agent_path} --{agent_action} '
-               ' "{source}" "{location}"'.format(
+               ' {arguments}'.format(
                    pydir=python_dir, agent_path=agent_path,
                    agent_action=agent_action,
-                   source=kwargs.get('source', ''),
-                   location=kwargs.get('location', '')))
+                   arguments=" ".join('"{}"'.format(argument)
+                                      for argument in arguments)))
         return cmd
 
     def archive_file(self, file_path, destination_path):
@@ -88,6 +184,25 @@ class WindowsActionManager(base.BaseActionManager):
             LOG.debug("Could not archive %s: %s", file_path, exc)
             return file_path
 
+    def collect_files(self, files, archive_path):
+        """Archive many files at once, with a single agent call.
+
+        :param files:
+            An iterable of tuples of two elements, the path of a file
+            and its name in the archive. The missing files are skipped.
+        :param archive_path:
+            The path of the archive which will be created.
+        """
+        files = list(files)
+        LOG.info("Collecting %d files in %s.", len(files), archive_path)
+        arguments = [archive_path]
+        for file_path, name in files:
+            arguments.extend((file_path, name))
+        collect_cmd = self.get_agent_command(agent_action="collect",
+                                             arguments=arguments)
+        self._client.run_remote_cmd(cmd=collect_cmd,
+                                    command_type=util.POWERSHELL)
+
     def encode_file_to_base64_str(self, file_path):
         """Returns a base64 encoded string resulted from the given file."""
         LOG.debug("Encoding %s to base64.", file_path)
@@ -174,12 +289,41 @@ class WindowsActionManager(base.BaseActionManager):
             upper_timeout=upper_timeout)
         return stdout
 
+    def get_cbinit_dir(self):
+        """Get the Cloudbase-Init installation directory.
+
+        The directory is looked up once, then it is taken from
+        the facts cache.
+        """
+        return self.facts.get(
+            "cbinit_dir",
+            lambda execute: introspection.get_cbinit_dir(
+                execute, self._program_files()),
+            self._execute)
+
+    def _program_files(self):
+        """Get the Program Files directories from the OS facts, if any."""
+        if not self.os_facts:
+            return None
+        locations = [self.os_facts["program_files"]]
+        if self.os_facts["architecture"] == "AMD64":
+            locations.append(self.os_facts["program_files_x86"])
+        return locations
+
+    def get_python_dir(self):
+        """Get the Python directory of the Cloudbase-Init installation."""
+        return self.facts.get(
+            "python_dir",
+            lambda execute: introspection.get_python_dir(
+                execute, self.get_cbinit_dir()),
+            self._execute)
+
     def check_cbinit_installation(self):
         """Check if Cloudbase-Init was installed successfully."""
         LOG.info("Checking Cloudbase-Init installation.")
 
         try:
-            python_dir = introspection.get_python_dir(self._execute)
+            python_dir = self.get_python_dir()
         except exceptions.ArgusError as exc:
             LOG.warning("Could not check Cloudbase-Init installation: %s", exc)
             return False
@@ -200,7 +344,8 @@ class WindowsActionManager(base.BaseActionManager):
         """Cleans up Cloudbase-Init if the installation failed."""
         LOG.debug("Cleaning up Cloudbase-Init from the instance.")
         try:
-            cbinit_dir = introspection.get_cbinit_dir(self._execute)
+            cbinit_dir = self.get_cbinit_dir()
+            self.facts.invalidate("Cloudbase-Init was removed")
             self.rmdir(ntpath.dirname(cbinit_dir))
         except exceptions.ArgusError as exc:
             LOG.warning("Could not cleanup Cloudbase-Init: %s", exc)
@@ -217,9 +362,13 @@ class WindowsActionManager(base.BaseActionManager):
     def install_cbinit(self):
         """Install Cloudbase-Init on the underlying instance."""
         LOG.info("Trying to install Cloudbase-Init.")
+        self.facts.invalidate("Cloudbase-Init is installed again")
         installer = self._get_installer_name()
+        # Every round can take minutes, so it is bounded only by count.
+        retrier = util.RetryPolicy.from_config(
+            retries=CONFIG.argus.retry_count - 1, deadline=None).start()
 
-        for _ in range(CONFIG.argus.retry_count):
+        while True:
             for install_method in (self._run_installation_script,
                                    self._deploy_using_scheduled_task):
                 try:
@@ -230,8 +379,8 @@ class WindowsActionManager(base.BaseActionManager):
                     if self.check_cbinit_installation():
                         return True
                 self.cbinit_cleanup()
-
-        return False
+            if not retrier.sleep():
+                return False
 
     def _run_installation_script(self, installer):
         """Run the installation script for Cloudbase-Init."""
@@ -267,6 +416,9 @@ class WindowsActionManager(base.BaseActionManager):
             # This fixes errors that stops scenarios from getting
             # created on different windows images.
             LOG.debug("Currently rebooting...")
+        # The pooled shells didn't survive the reboot.
+        self._client.invalidate_shells()
+        self.facts.invalidate("the instance was sysprepped")
         LOG.info("Wait for the machine to finish rebooting ...")
         self.wait_boot_completion()
 
@@ -278,7 +430,7 @@ class WindowsActionManager(base.BaseActionManager):
         :param location: The target location for where to clone the repository.
         :param count:
             The number of tries that should be attempted in case it fails.
-        :param delay: The time delay before retrying.
+        :param delay: The maximum time delay before retrying.
         :returns: True if the clone was successful, False if not.
         :raises: ArgusCLIError if the path is not valid.
         :rtype: bool
@@ -290,26 +442,37 @@ class WindowsActionManager(base.BaseActionManager):
         cmd = "git clone '{repo}' '{location}'".format(repo=repo_url,
                                                        location=location)
 
-        while count > 0:
-            try:
-                self._client.run_command(cmd)
-            except exceptions.ArgusError as exc:
-                LOG.debug("Cloning failed with %r.", exc)
-                if self.exists(location):
-                    rem = self.rmdir if self.is_dir(location) else self.remove
-                    rem(location)
-                count -= 1
-                if count:
-                    LOG.debug('Retrying...')
-                    time.sleep(delay)
-            else:
-                return True
+        if count > 0:
+            # The first try is not a retry, but it is in the count.
+            retrier = util.RetryPolicy.from_config(
+                retries=count - 1, max_delay=delay).start()
+            while True:
+                try:
+                    self._client.run_command(cmd)
+                    return True
+                except exceptions.ArgusError as exc:
+                    LOG.debug("Cloning failed with %r.", exc)
+                    # A failed clone can leave a partial checkout.
+                    self.invalidate_stats()
+                    if self.exists(location):
+                        rem = (self.rmdir if self.is_dir(location)
+                               else self.remove)
+                        rem(location)
+                if not retrier.sleep():
+                    break
+                LOG.debug('Retrying...')
 
         LOG.debug('Could not clone %s', repo_url)
         return False
 
-    def wait_cbinit_service(self):
-        """Wait if the Cloudbase-Init Service to stop."""
+    def wait_cbinit_service(self, wake=None):
+        """Wait if the Cloudbase-Init Service to stop.
+
+        :param wake:
+            An optional :class:`threading.Event`, set when the
+            service is expected to be stopped, for checking it
+            right away.
+        """
         wait_cmd = ('(Get-Service | where {$_.Name '
                     '-match "cloudbase-init"}).Status')
         self._client.run_command_until_condition(
@@ -317,24 +480,36 @@ class WindowsActionManager(base.BaseActionManager):
             lambda out: out.strip() == 'Stopped',
             retry_count=CONFIG.argus.retry_count,
             delay=CONFIG.argus.retry_delay,
-            command_type=util.POWERSHELL)
+            command_type=util.POWERSHELL, wake=wake)
 
-    def check_cbinit_service(self, searched_paths=None):
+    def check_cbinit_service(self, searched_paths=None, wake=None):
         """Check if the Cloudbase-Init service started.
 
         :param searched_paths:
             Paths to files that should exist if the heartbeat patch is
             applied.
+        :param wake:
+            An optional :class:`threading.Event`, set when the
+            service is expected to be running, for checking it
+            right away.
         """
-        test_cmd = 'Test-Path "{}"'
-        check_cmds = [test_cmd.format(path) for path in searched_paths or []]
-        for check_cmd in check_cmds:
-            self._client.run_command_until_condition(
-                check_cmd,
-                lambda out: out.strip() == 'True',
-                retry_count=CONFIG.argus.retry_count,
-                delay=CONFIG.argus.retry_delay,
-                command_type=util.POWERSHELL)
+        paths = list(searched_paths or [])
+        if not paths:
+            return
+
+        def all_exist(stdout):
+            try:
+                return all(stat.exists
+                           for stat in _parse_stats(paths, stdout))
+            except exceptions.ArgusCLIError:
+                return False
+
+        # All the paths are checked by every poll.
+        self._client.run_command_until_condition(
+            _stat_script(paths), all_exist,
+            retry_count=CONFIG.argus.retry_count,
+            delay=CONFIG.argus.retry_delay,
+            command_type=util.POWERSHELL, wake=wake)
 
     def wait_boot_completion(self):
         """Wait for a reasonable amount of time the instance to boot."""
@@ -348,6 +523,7 @@ class WindowsActionManager(base.BaseActionManager):
                                self._ARGUS_AGENT_SCRIPT)
         LOG.debug("Prepare something specific for OS Type %s", self._os_type)
 
+    @_changes_files
     def copy_file(self, path, new_file):
         """Copy a file to the destination"""
         if not self.exists(path):
@@ -358,6 +534,7 @@ class WindowsActionManager(base.BaseActionManager):
                "-Destination '{newname}'".format(path=path, newname=new_file))
         self._client.run_command_with_retry(cmd, command_type=util.POWERSHELL)
 
+    @_changes_files
     def remove(self, path):
         """Remove a file."""
         if not self.exists(path) or not self.is_file(path):
@@ -368,6 +545,7 @@ class WindowsActionManager(base.BaseActionManager):
                "-Path '{path}'}}".format(path=path))
         self._client.run_command_with_retry(cmd, command_type=util.POWERSHELL)
 
+    @_changes_files
     def rmdir(self, path):
         """Remove a directory."""
         if not self.exists(path) or not self.is_dir(path):
@@ -377,19 +555,70 @@ class WindowsActionManager(base.BaseActionManager):
         cmd = ("IF EXIST '{path}' (RD /S /Q '{path}')".format(path=path))
         self._client.run_command_with_retry(cmd, command_type=util.CMD)
 
+    def stat_many(self, paths):
+        """Get the stats of many paths, with a single command.
+
+        The stats are cached for :attr:`STAT_CACHE_TTL` seconds, so
+        only the paths which were not checked recently are looked up.
+        The cache is dropped as soon as the client sends anything else
+        to the instance, since the client's commands, uploads and
+        agent calls can change the files without the manager knowing.
+
+        :returns: A list with the :class:`PathStat` of every path.
+        """
+        paths = list(paths)
+        now = time.time()
+        stats = {}
+        with self._stats_lock:
+            if self._stats_calls != self._remote_calls():
+                self._stats.clear()
+            generation = self._stats_generation
+            for path in paths:
+                cached = self._stats.get(ntpath.normcase(path))
+                if cached and now - cached[0] < self.STAT_CACHE_TTL:
+                    stats[path] = cached[1]
+
+        missing = list(collections.OrderedDict.fromkeys(
+            path for path in paths if path not in stats))
+        if missing:
+            stdout, _, _ = self._client.run_command_with_retry(
+                cmd=_stat_script(missing), command_type=util.POWERSHELL)
+            with self._stats_lock:
+                if self._stats_calls != self._remote_calls():
+                    self._stats.clear()
+                    self._stats_calls = self._remote_calls()
+                for stat in _parse_stats(missing, stdout):
+                    stats[stat.path] = stat
+                    # The files might have changed during the lookup.
+                    if generation == self._stats_generation:
+                        self._stats[ntpath.normcase(stat.path)] = (now, stat)
+        return [stats[path] for path in paths]
+
+    def stat(self, path):
+        """Get the :class:`PathStat` of the given path."""
+        return self.stat_many([path])[0]
+
+    def _remote_calls(self):
+        return getattr(self._client, "remote_calls", None)
+
+    def invalidate_stats(self):
+        """Forget the cached stats, because the files were changed."""
+        with self._stats_lock:
+            self._stats_generation += 1
+            self._stats.clear()
+
     def _exists(self, path, path_type):
         """Check if the path exists and it has the specified type.
 
         :param path:
             Path to check if it exists.
         :param path_type:
-            This can be 'Leaf' or 'Container'
+            This can be 'Any', 'Leaf' or 'Container'
         """
-        cmd = 'Test-Path -PathType {} -Path "{}"'.format(path_type, path)
-        stdout, _, _ = self._client.run_command_with_retry(
-            cmd=cmd, command_type=util.POWERSHELL)
-
-        return stdout.strip() == "True"
+        stat = self.stat(path)
+        if path_type == self.PATH_ANY:
+            return stat.exists
+        return stat.type == path_type
 
     def exists(self, path):
         """Check if the path exists.
@@ -427,6 +656,7 @@ class WindowsActionManager(base.BaseActionManager):
         self._client.run_command_with_retry(cmd=cmd,
                                             command_type=util.POWERSHELL)
 
+    @_changes_files
     def mkdir(self, path):
         """Create a directory in the instance if the path is valid.
 
@@ -440,6 +670,7 @@ class WindowsActionManager(base.BaseActionManager):
         else:
             self._new_item(path, self._DIRECTORY)
 
+    @_changes_files
     def mkfile(self, path):
         """Create a file in the instance if the path is valid.
 
@@ -458,6 +689,7 @@ class WindowsActionManager(base.BaseActionManager):
                 " directory.".format(path))
         self._new_item(path, self._FILE)
 
+    @_changes_files
     def touch(self, path):
         """Update the access and modification time.
 
@@ -711,6 +943,9 @@ class WindowsNanoActionManager(WindowsSever2016ActionManager):
             # This fixes errors that stop scenarios from getting
             # created on different windows images.
             LOG.debug("Currently rebooting...")
+        # The pooled shells didn't survive the reboot.
+        self._client.invalidate_shells()
+        self.facts.invalidate("the instance was sysprepped")
         LOG.info("Wait for the machine to finish rebooting ...")
         self.wait_boot_completion()
 
@@ -750,68 +985,76 @@ WindowsActionManagers = {
 }
 
 
-def _is_nanoserver(client):
-    """Returns True if the client is connected to a NanoServer machine.
-
-       Using the powershell code from here: https://goo.gl/UD27SK
+# NOTE: PowerShell 2.0 has no ConvertTo-Json, so the probe builds
+# the JSON document by hand. Windows 10 and newer use the Common
+# Information Model (Cim), the others the Windows Management
+# Instrumentation (Wmi), as the action managers do.
+_OS_PROBE = "; ".join([
+    "$version = [Environment]::OSVersion.Version",
+    "if ($version.Major -ge 10) {"
+    " $os = Get-CimInstance -Class Win32_OperatingSystem } else {"
+    " $os = Get-WmiObject -Class Win32_OperatingSystem }",
+    r"$levels = 'HKLM:\Software\Microsoft\Windows NT\CurrentVersion"
+    r"\Server\ServerLevels'",
+    "$nano = (Test-Path $levels) -and "
+    "((Get-ItemProperty $levels).NanoServer -eq 1)",
+    r"""function Quote($value) { '"' + ([string]$value)"""
+    r""".Replace('\', '\\').Replace('"', '\"') + '"' }""",
+    """'{{"major": {0}, "minor": {1}, "product_type": {2}, "nano": {3}, """
+    """"architecture": {4}, "program_files": {5}, """
+    """"program_files_x86": {6}}}' -f $version.Major, $version.Minor, """
+    "$os.ProductType, ([string]$nano).ToLower(), "
+    "(Quote $ENV:PROCESSOR_ARCHITECTURE), (Quote $ENV:ProgramFiles), "
+    "(Quote ${ENV:ProgramFiles(x86)})",
+])
+
+
+def probe_os(client):
+    """Detect the operating system facts with a single command.
+
+    Returns a dictionary with the major and the minor version,
+    the product type, the nano flag, the processor architecture
+    and the Program Files directories of the instance.
     """
-    server_level_key = (r'HKLM:\Software\Microsoft\Windows NT\CurrentVersion'
-                        r'\Server\ServerLevels')
-
-    cmd = r'Test-Path "{}"'.format(server_level_key)
-    path_exists, _, _ = client.run_command_with_retry(
-        cmd, count=CONFIG.argus.retry_count, delay=CONFIG.argus.retry_delay,
-        command_type=util.POWERSHELL)
-
-    if path_exists == "False":
-        return False
-
-    cmd = r'(Get-ItemProperty "{}").NanoServer'.format(server_level_key)
-    nanoserver_property, _, _ = client.run_command_with_retry(
-        cmd, count=CONFIG.argus.retry_count, delay=CONFIG.argus.retry_delay,
-        command_type=util.POWERSHELL)
-
-    return len(nanoserver_property) > 0 and nanoserver_property[0] == "1"
-
-
-def _get_product_type(client, major_version):
-    """Return the minor version of the OS.
-
-    :param client:
-        A Windows Client.
-    :param  major_version:
-        Windows Major version according to
-        https://msdn.microsoft.com/en-us/library/aa394239(v=vs.85).aspx
+    stdout, _, _ = client.run_command_with_retry(
+        _OS_PROBE, count=CONFIG.argus.retry_count,
+        delay=CONFIG.argus.retry_delay, command_type=util.POWERSHELL)
+    try:
+        facts = json.loads(stdout.strip())
+    except ValueError:
+        raise exceptions.ArgusError(
+            "Could not parse the OS facts: {!r}".format(stdout))
+    return facts
+
+
+def get_os_facts(client):
+    """Get the operating system facts of the client's instance.
+
+    The facts given to the client by its back-end, found by an
+    earlier client of the same instance, are used as they are.
+    Otherwise they are probed, once the instance finished booting.
     """
-    # NOTE(mmicu): For Windows 10, Windows Server 2016 and Windows Nano
-    # we use Common Information Model (Cim) and for the others we use
-    # Windows Management Instrumentation (Wmi)
-    cmdlet = Windows8ActionManager.WINDOWS_MANAGEMENT_CMDLET
-    if major_version == 10:
-        cmdlet = Windows10ActionManager.WINDOWS_MANAGEMENT_CMDLET
-    cmd = r"({} -Class Win32_OperatingSystem).producttype".format(cmdlet)
-
-    product_type, _, _ = client.run_command_with_retry(
-        cmd, count=CONFIG.argus.retry_count, delay=CONFIG.argus.retry_delay,
-        command_type=util.POWERSHELL)
-    return util.get_int_from_str(product_type.strip())
+    if client.os_facts is not None:
+        LOG.debug("Using the known OS facts of the instance %s.",
+                  client.instance_id)
+        return client.os_facts
 
-
-def get_windows_action_manager(client):
-    """Get the OS specific Action Manager."""
     LOG.info("Waiting for boot completion in order to select an "
              "Action Manager ...")
+    wait_boot_completion(client, CONFIG.openstack.image_username)
+    client.os_facts = probe_os(client)
+    return client.os_facts
 
-    username = CONFIG.openstack.image_username
-    wait_boot_completion(client, username)
 
-    # get OS type
-    major_version = introspection.get_os_version(client, 'Major')
-    minor_version = introspection.get_os_version(client, 'Minor')
-    product_type = _get_product_type(client, major_version)
+def get_windows_action_manager(client):
+    """Get the OS specific Action Manager."""
+    facts = get_os_facts(client)
+    major_version = facts["major"]
+    minor_version = facts["minor"]
+    product_type = facts["product_type"]
+    is_nanoserver = facts["nano"]
     windows_type = util.WINDOWS_VERSION.get((major_version, minor_version,
                                              product_type), util.WINDOWS)
-    is_nanoserver = _is_nanoserver(client)
 
     if isinstance(windows_type, dict):
         windows_type = windows_type[is_nanoserver]
@@ -820,5 +1063,6 @@ def get_windows_action_manager(client):
                " IsNanoserver: %s"), windows_type, major_version,
               minor_version, product_type, is_nanoserver)
 
-    action_manager = WindowsActionManagers[windows_type]
-    return action_manager(client=client)
+    action_manager = WindowsActionManagers[windows_type](client=client)
+    action_manager.os_facts = facts
+    return action_manager
@@ -18,6 +18,7 @@ import os
 
 import six
 
+from argus.backends import console
 from argus import config as argus_config
 from argus import log as argus_log
 
@@ -77,6 +78,18 @@ class BaseBackend(object):
 class CloudBackend(BaseBackend):
     """Base back-end for cloud related tasks."""
 
+    supports_snapshots = False
+    """Whether the back-end implements the snapshot hooks."""
+
+    _console = None
+
+    @property
+    def console(self):
+        """A :class:`ConsoleTailer` of the underlying instance output."""
+        if self._console is None:
+            self._console = console.ConsoleTailer(self.instance_output)
+        return self._console
+
     @abc.abstractmethod
     def get_remote_client(self, username=None, password=None, **kwargs):
         """Get a remote client
@@ -112,10 +125,38 @@ class CloudBackend(BaseBackend):
             LOG.warning("Empty console output; nothing to save.")
             return
 
+        if isinstance(content, six.text_type):
+            content = content.encode("utf-8")
         LOG.info("Saving instance console output to: %s", path)
         with open(path, "wb") as stream:
             stream.write(content)
 
+    def snapshot_instance(self, name):
+        """Snapshot the underlying instance.
+
+        Back-ends which set :attr:`supports_snapshots` should
+        implement this, together with :meth:`boot_from_snapshot`
+        and :meth:`delete_snapshot`.
+
+        :param name: The name of the new snapshot.
+        :returns: The id of the snapshot.
+        """
+        raise NotImplementedError(
+            "{} can't snapshot instances.".format(type(self).__name__))
+
+    def boot_from_snapshot(self, snapshot):
+        """Boot the instance created by :meth:`setup_instance` from a snapshot.
+
+        :param snapshot: A snapshot id returned by :meth:`snapshot_instance`.
+        """
+        raise NotImplementedError(
+            "{} can't boot from snapshots.".format(type(self).__name__))
+
+    def delete_snapshot(self, snapshot):
+        """Delete a snapshot created by :meth:`snapshot_instance`."""
+        raise NotImplementedError(
+            "{} can't delete snapshots.".format(type(self).__name__))
+
     @abc.abstractmethod
     def instance_output(self, limit=None):
         """Get the underlying instance output, if any.
@@ -0,0 +1,187 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Follow the progress of Cloudbase-Init through the console output."""
+
+import collections
+import contextlib
+import re
+import threading
+import time
+
+import six
+
+from argus import config as argus_config
+from argus import log as argus_log
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+# The number of lines requested from the end of the console output.
+TAIL_SIZE = 128
+# How many of the lines already seen are kept for finding
+# where the new lines start in a tail of the console output.
+_KEPT_LINES = 1024
+# How many lines have to be found again in a tail for the overlap
+# with the lines already seen to be trusted, unless it covers all
+# of them. A shorter overlap can be a coincidence, such as a
+# repeated blank line.
+_MIN_OVERLAP = 8
+
+# The lines logged on the serial port by Cloudbase-Init.
+PLUGIN_STARTED = "plugin_started"
+PLUGIN_SKIPPED = "plugin_skipped"
+FINISHED = "finished"
+MARKERS = collections.OrderedDict([
+    (PLUGIN_STARTED, re.compile(r"Executing plugin '(?P<plugin>[^']+)'")),
+    (PLUGIN_SKIPPED, re.compile(r"Plugin '(?P<plugin>[^']+)' execution "
+                                r"already done, skipping")),
+    (FINISHED, re.compile(r"Plugins execution done")),
+])
+
+ConsoleEvent = collections.namedtuple("ConsoleEvent",
+                                      "name details line timestamp")
+
+
+class ConsoleTailer(object):
+    """Follow the console output of an instance, reading only new lines.
+
+    The console output can be retrieved only as a number of lines
+    from its end, so every poll requests a short tail and finds where
+    the lines which were not seen yet start in it. The tail is
+    doubled when it doesn't reach the lines which were already seen,
+    or when its overlap with them is too short to be trusted.
+
+    A reply shorter than the requested tail is not always the whole
+    console output, since the clouds truncate it (Nova keeps only
+    its last 100KB or so), so the new lines are always found by
+    their overlap with the lines already seen.
+
+    Every line which matches one of the markers is recorded as an
+    event, and the :class:`threading.Event` of that marker is set.
+
+    :param fetch:
+        A callable which receives a number of lines and returns
+        that many lines from the end of the console output.
+    :param from_start:
+        Read the whole console output on the first poll, instead
+        of only its last lines.
+    """
+
+    def __init__(self, fetch, markers=MARKERS, tail_size=TAIL_SIZE,
+                 from_start=False):
+        self._fetch = fetch
+        self._from_start = from_start
+        self._markers = markers
+        self._tail_size = tail_size
+        self._seen = collections.deque(maxlen=_KEPT_LINES)
+        self._lock = threading.Lock()
+        self.events = []
+        self.signals = {name: threading.Event() for name in markers}
+
+    def _fetch_lines(self, limit):
+        output = self._fetch(limit) or ""
+        if isinstance(output, six.binary_type):
+            output = output.decode("utf-8", "replace")
+        lines = output.splitlines()
+        if lines and not output.endswith(("\n", "\r")):
+            # The last line is not completely written yet.
+            lines.pop()
+        return lines, len(output.splitlines()) < limit
+
+    def _overlap(self, lines):
+        """Find the last lines seen in the given lines.
+
+        :returns:
+            The index of the first line which follows them and how
+            many of them were found, the lines before the tail
+            being unknown.
+        """
+        seen = list(self._seen)
+        for end in range(len(lines), 0, -1):
+            length = min(len(seen), end)
+            if seen[-length:] == lines[end - length:end]:
+                return end, length
+        return 0, 0
+
+    def _trusted(self, overlap, lines):
+        return (overlap == len(lines) or
+                overlap >= min(len(self._seen), _MIN_OVERLAP))
+
+    def poll(self):
+        """Read the console lines written since the previous poll."""
+        with self._lock:
+            limit = self._tail_size
+            while True:
+                lines, short = self._fetch_lines(limit)
+                if not self._seen:
+                    if short or not self._from_start:
+                        new_lines = lines
+                        break
+                else:
+                    end, overlap = self._overlap(lines)
+                    if self._trusted(overlap, lines):
+                        new_lines = lines[end:]
+                        break
+                    if short:
+                        # The output was truncated and a larger tail
+                        # won't reach further into the lines seen.
+                        LOG.debug("The console output overlaps only %d "
+                                  "of the lines seen before, some lines "
+                                  "might be missed.", overlap)
+                        new_lines = lines[end:]
+                        break
+                limit *= 2
+
+            self._seen.extend(new_lines)
+            for line in new_lines:
+                self._match(line)
+            return new_lines
+
+    def _match(self, line):
+        for name, marker in self._markers.items():
+            match = marker.search(line)
+            if match:
+                LOG.debug("Console event %s: %s", name, line.strip())
+                self.events.append(ConsoleEvent(name, match.groupdict(),
+                                                line, time.time()))
+                self.signals[name].set()
+
+    def count(self, name):
+        """Get how many times the given marker was seen."""
+        return sum(1 for event in self.events if event.name == name)
+
+    @contextlib.contextmanager
+    def follow(self, interval=None):
+        """Poll the console output in a thread, while in the context."""
+        interval = interval or CONFIG.argus.console_poll_interval
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                try:
+                    self.poll()
+                except Exception as exc:  # pylint: disable=broad-except
+                    LOG.debug("Could not read the console output: %r", exc)
+                stop.wait(interval)
+
+        thread = threading.Thread(target=run, name="console-tailer")
+        thread.daemon = True
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
@@ -23,6 +23,8 @@ from keystoneclient import exceptions as ks_exc
 from keystoneclient import session as kssession
 from six.moves import urllib_parse as urlparse
 
+from argus import profiling
+
 
 def _discover_auth_versions(session, auth_url):
     # discover the API versions the server is supporting base on the
@@ -144,4 +146,9 @@ def heat_client(credentials, api_version=1):
         'include_pass': False
     }
 
-    return client.Client(api_version, endpoint, **kwargs)
+    heat = client.Client(api_version, endpoint, **kwargs)
+    # Every API call made through the managers of the client is profiled.
+    for name in ("stacks", "resources"):
+        setattr(heat, name, profiling.InstrumentedClient(
+            getattr(heat, name), "heat." + name))
+    return heat
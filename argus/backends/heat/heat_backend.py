@@ -162,6 +162,7 @@ class BaseHeatBackend(base.CloudBackend):
     def cleanup(self):
         if self._keypair:
             self._keypair.destroy()
+        self._manager.cleanup_console_logs()
 
         # if no stack was created
         if not six.functools.reduce(lambda a, b: a + 1,
@@ -259,7 +260,7 @@ class BaseHeatBackend(base.CloudBackend):
         """Get the underlying floating IP."""
         return self._floating_ip_resource['ip']
 
-    def instance_output(self, limit=api_manager.OUTPUT_SIZE):
+    def instance_output(self, limit=None):
         """Get the console output, sent from the instance."""
         return self._manager.instance_output(
             self.internal_instance_id(),
@@ -0,0 +1,121 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from argus.backends import base
+from argus.client import replay
+from argus.client import session as argus_session
+from argus import config as argus_config
+from argus import exceptions
+from argus import log as argus_log
+from argus import util
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+
+class ReplayBackend(base.CloudBackend):
+    """A back-end whose instance is a session recorded by an earlier run.
+
+    Nothing is created in a cloud: the commands are answered by the
+    session of the scenario, found in the ``replay_directory``, and
+    the console output, the password and the other values of the
+    instance are the recorded ones.
+    """
+
+    def __init__(self, name=None, userdata=None, metadata=None,
+                 availability_zone=None):
+        super(ReplayBackend, self).__init__(name, userdata, metadata,
+                                            availability_zone)
+        self.session = argus_session.Session.load(
+            argus_session.session_path(CONFIG.argus.replay_directory, name))
+        self._os_facts = None
+
+    def _recorded(self, name):
+        if name in self.session.redacted:
+            raise exceptions.ArgusReplayError(
+                "The {} of the session {} was not recorded, the sessions "
+                "keep the secrets only with the record_secrets option."
+                .format(name, self.session.name))
+        try:
+            return self.session.backend[name]
+        except KeyError:
+            raise exceptions.ArgusReplayError(
+                "The session {} has no recorded {}."
+                .format(self.session.name, name))
+
+    def setup_instance(self):
+        LOG.info("Replaying the session %s.", self.session.name)
+
+    def cleanup(self):
+        LOG.info("Replayed %d commands of the session %s, which ran for "
+                 "%.1f seconds on the recorded instance.",
+                 self.session.played, self.session.name,
+                 self.session.recorded_seconds)
+
+    # pylint: disable=unused-argument
+    def get_remote_client(self, username=None, password=None, **kwargs):
+        if username is None:
+            username = CONFIG.openstack.image_username
+        if password is None:
+            password = CONFIG.openstack.image_password
+        # The OS facts are shared by the clients as they were by the
+        # recorded ones, which didn't run the probe again.
+        client = replay.ReplayRemoteClient(
+            self.session, username, password,
+            instance_id=self.internal_instance_id(),
+            recorder=argus_session.get_recorder(self._name),
+            os_facts=self._os_facts)
+        self._os_facts = client.os_facts
+        return client
+
+    remote_client = util.cached_property(get_remote_client, 'remote_client')
+
+    def reboot_instance(self):
+        # The commands run after the reboot are in the session as well.
+        self._os_facts = None
+
+    def instance_output(self, limit=None):
+        output = self._recorded("instance_output")
+        if limit:
+            return "".join(output.splitlines(True)[-limit:])
+        return output
+
+    def internal_instance_id(self):
+        return self.session.backend.get("internal_instance_id",
+                                        self.session.name)
+
+    def instance_password(self):
+        return self._recorded("instance_password")
+
+    def instance_server(self):
+        return self._recorded("instance_server")
+
+    def private_key(self):
+        return self._recorded("private_key")
+
+    def public_key(self):
+        return self._recorded("public_key")
+
+    def floating_ip(self):
+        return self._recorded("floating_ip")
+
+    def get_image_by_ref(self):
+        return self._recorded("get_image_by_ref")
+
+    def get_mtu(self):
+        return self._recorded("get_mtu")
+
+    def get_network_interfaces(self):
+        return self._recorded("get_network_interfaces")
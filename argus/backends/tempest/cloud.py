@@ -187,6 +187,7 @@ class RescueWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
 
     def rescue_server(self):
         """Rescue the underlying instance."""
+        self.forget_os_facts()
         admin_pass = CONFIG.openstack.image_password
         self._manager.servers_client.rescue_server(
             self.internal_instance_id(),
@@ -198,6 +199,7 @@ class RescueWindowsBackend(tempest_backend.BaseWindowsTempestBackend):
 
     def unrescue_server(self):
         """Unrescue the underlying instance."""
+        self.forget_os_facts()
         self._manager.servers_client.unrescue_server(
             self.internal_instance_id())
         waiters.wait_for_server_status(
@@ -13,12 +13,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import contextlib
+import functools
+import io
 import os
 import tempfile
+import threading
 
+from argus.backends import console
+from argus import config as argus_config
 from argus import exceptions
 from argus import log as argus_log
+from argus import profiling
 from argus import util
 
 with util.restore_excepthook():
@@ -29,7 +36,7 @@ with util.restore_excepthook():
 
 OUTPUT_STATUS_OK = 200
 OUTPUT_SIZE = 128
-OUTPUT_EPSILON = int(OUTPUT_SIZE / 10)
+CONFIG = argus_config.CONFIG
 LOG = argus_log.LOG
 
 
@@ -63,6 +70,9 @@ class APIManager(object):
         # Glance image client v1
         self.image_client = self._manager.image_client
 
+        # Glance image client v2
+        self.image_client_v2 = self._manager.image_client_v2
+
         # Compute image client
         self.compute_images_client = self._manager.compute_images_client
         self.keypairs_client = self._manager.keypairs_client
@@ -88,10 +98,24 @@ class APIManager(object):
         # Heat client
         self.orchestration_client = self._manager.orchestration_client
 
+        # Every API call made through the clients is profiled.
+        for name, client in list(vars(self).items()):
+            if name.endswith("_client"):
+                setattr(self, name,
+                        profiling.InstrumentedClient(client, name))
+
+        self._console_logs = {}
+
     def cleanup_credentials(self):
         """Cleanup any credentials created during the initialization."""
         self.isolated_creds.clear_creds()
 
+    def cleanup_console_logs(self):
+        """Remove the temporary console logs of the instances."""
+        for console_log in self._console_logs.values():
+            console_log.close()
+        self._console_logs.clear()
+
     def primary_credentials(self):
         """Get the primary credentials.
 
@@ -143,23 +167,36 @@ class APIManager(object):
         return self.servers_client.get_console_output(
             server_id=instance_id, length=limit)['output']
 
-    def instance_output(self, instance_id, limit):
+    def _console_log(self, instance_id):
+        if instance_id not in self._console_logs:
+            path = None
+            if CONFIG.argus.output_directory:
+                path = os.path.join(
+                    CONFIG.argus.output_directory,
+                    "{}-console-{}.log".format(
+                        argus_log.get_log_extra_item(LOG, 'scenario'),
+                        instance_id))
+            self._console_logs[instance_id] = ConsoleLog(
+                functools.partial(self._instance_output, instance_id),
+                path=path)
+        return self._console_logs[instance_id]
+
+    def instance_output(self, instance_id, limit=None):
         """Get the console output, sent from the instance.
 
+        Only the lines written since the previous call are requested
+        from the API, the output being served from a local cache.
+
         :param instance_id:
             The id of the instance for which the output will
             be retrieved.
         :param limit:
-            Number of lines to fetch from the end of console log.
+            Number of lines to return from the end of console log.
+            If it is not given, the whole console log is returned.
         """
-        content = None
-        while True:
-            content = self._instance_output(instance_id, limit)
-            if len(content.splitlines()) >= (limit - OUTPUT_EPSILON):
-                limit *= 2
-            else:
-                break
-        return content
+        console_log = self._console_log(instance_id)
+        console_log.update()
+        return console_log.read(limit)
 
     def instance_server(self, instance_id):
         """Get more details about the given instance id."""
@@ -174,6 +211,58 @@ class APIManager(object):
                                         'tempest backend: %s' % exc)
 
 
+class ConsoleLog(object):
+    """An incremental cache of the console output of an instance.
+
+    The lines which were not seen yet are requested through a
+    :class:`argus.backends.console.ConsoleTailer` and appended to
+    a log file, from which the console output is read afterwards.
+
+    :param fetch:
+        A callable which receives a number of lines and returns
+        that many lines from the end of the console output.
+    :param path:
+        The path of the log file. A temporary file, removed
+        by :meth:`close`, is used if it is not given.
+    """
+
+    def __init__(self, fetch, path=None):
+        self._tailer = console.ConsoleTailer(fetch, markers={},
+                                             tail_size=OUTPUT_SIZE,
+                                             from_start=True)
+        self._lock = threading.Lock()
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".log")
+            os.close(fd)
+        else:
+            open(path, "wb").close()
+        self.path = path
+
+    def update(self):
+        """Append the lines written since the last update to the log."""
+        with self._lock:
+            lines = self._tailer.poll()
+            if lines:
+                with open(self.path, "ab") as stream:
+                    stream.write("".join(
+                        line + "\n" for line in lines).encode("utf-8"))
+            return lines
+
+    def read(self, limit=None):
+        """Read the last `limit` lines of the log, or all of them."""
+        with self._lock:
+            with io.open(self.path, encoding="utf-8") as stream:
+                if limit is None:
+                    return stream.read()
+                return "".join(collections.deque(stream, maxlen=limit))
+
+    def close(self):
+        """Remove the log file, if it is a temporary one."""
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
 class Keypair(object):
     """A key-pair container."""
 
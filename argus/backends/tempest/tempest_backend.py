@@ -27,14 +27,12 @@ from argus import util
 
 with util.restore_excepthook():
     from tempest.common import waiters
+    from tempest.lib.common.utils import data_utils
 
 
 CONFIG = argus_config.CONFIG
 LOG = argus_log.LOG
 
-# Starting size as number of lines and tolerance.
-OUTPUT_SIZE = 128
-
 
 # pylint: disable=abstract-method
 @six.add_metaclass(abc.ABCMeta)
@@ -56,6 +54,8 @@ class BaseTempestBackend(base_backend.CloudBackend):
         The availability zone in which the underlying instance
         will be available.
     """
+    supports_snapshots = True
+
     def __init__(self, name, userdata, metadata, availability_zone):
         if userdata:
             # NOTE(dtoncu): `encodestring` is a deprecated alias in Python 3.*;
@@ -209,6 +209,7 @@ class BaseTempestBackend(base_backend.CloudBackend):
         if self._keypair:
             self._keypair.destroy()
 
+        self._manager.cleanup_console_logs()
         self._manager.cleanup_credentials()
 
     def setup_instance(self):
@@ -243,12 +244,45 @@ class BaseTempestBackend(base_backend.CloudBackend):
     def internal_instance_id(self):
         return self._server["id"]
 
-    def instance_output(self, limit=OUTPUT_SIZE):
+    def instance_output(self, limit=None):
         """Get the console output, sent from the instance."""
         return self._manager.instance_output(
             self.internal_instance_id(),
             limit)
 
+    def snapshot_instance(self, name):
+        """Snapshot the underlying instance, through the compute API.
+
+        The instance is stopped first, so that its disk is consistent,
+        and it is left stopped. Every back-end has its own project, so
+        the snapshot is made visible to the other projects, with the
+        ``golden_snapshot_visibility`` option.
+        """
+        instance_id = self.internal_instance_id()
+        servers_client = self._manager.servers_client
+        LOG.info("Stopping instance %s before the snapshot...", instance_id)
+        servers_client.stop_server(instance_id)
+        waiters.wait_for_server_status(servers_client, instance_id,
+                                       "SHUTOFF")
+
+        LOG.info("Creating snapshot %s...", name)
+        images_client = self._manager.compute_images_client
+        response = images_client.create_image(instance_id, name=name)
+        # Older compute API versions return the id only in the location.
+        snapshot = (response.get("image_id") or
+                    data_utils.parse_image_id(response.response["location"]))
+        waiters.wait_for_image_status(images_client, snapshot, "ACTIVE")
+        self._manager.image_client_v2.update_image(
+            snapshot, [{"replace": "/visibility",
+                        "value": CONFIG.argus.golden_snapshot_visibility}])
+        return snapshot
+
+    def boot_from_snapshot(self, snapshot):
+        self.image_ref = snapshot
+
+    def delete_snapshot(self, snapshot):
+        self._manager.compute_images_client.delete_image(snapshot)
+
     def instance_server(self):
         """Get the instance server object."""
         return self._manager.instance_server(self.internal_instance_id())
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from argus.client import session
 from argus.client import windows
 from argus import config as argus_config
 from argus import util
@@ -23,6 +24,11 @@ CONFIG = argus_config.CONFIG
 class WindowsBackendMixin(object):
     """Mixin back-end tailored for interacting with Windows."""
 
+    # The facts about the operating system of the instance, found
+    # by its first client and given to the next ones, until the
+    # instance is rebooted, rescued or replaced.
+    _os_facts = None
+
     # pylint: disable=unused-argument
     def get_remote_client(self, username=None, password=None,
                           protocol='http', **kwargs):
@@ -32,8 +38,34 @@ class WindowsBackendMixin(object):
             username = CONFIG.openstack.image_username
         if password is None:
             password = CONFIG.openstack.image_password
-        return windows.WinRemoteClient(self.floating_ip(),
-                                       username, password,
-                                       transport_protocol=protocol)
+        client_type = windows.WinRemoteClient
+        if CONFIG.argus.async_winrm:
+            # The asyncio client can't be imported on Python 2.
+            from argus.client import async_windows
+            client_type = async_windows.SyncWinRemoteClient
+        client = client_type(self.floating_ip(),
+                             username, password,
+                             transport_protocol=protocol,
+                             instance_id=self.internal_instance_id(),
+                             recorder=session.get_recorder(self._name),
+                             os_facts=self._os_facts)
+        self._os_facts = client.os_facts
+        return client
 
     remote_client = util.cached_property(get_remote_client, 'remote_client')
+
+    def forget_os_facts(self):
+        """Forget the OS facts, the next client will wait for the boot."""
+        self._os_facts = None
+
+    def reboot_instance(self):
+        self.forget_os_facts()
+        return super(WindowsBackendMixin, self).reboot_instance()
+
+    def boot_from_snapshot(self, snapshot):
+        self.forget_os_facts()
+        return super(WindowsBackendMixin, self).boot_from_snapshot(snapshot)
+
+    def cleanup(self):
+        self.forget_os_facts()
+        return super(WindowsBackendMixin, self).cleanup()
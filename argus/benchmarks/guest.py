@@ -0,0 +1,217 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A scripted Windows guest, answering the commands sent by argus.
+
+The guest is a responder for :class:`argus.unit_tests.fake_winrm.
+FakeWinRMServer`, which plays a Windows Server 2012 R2 instance with
+enough state for preparing it with :class:`CloudbaseinitRecipe`:
+Cloudbase-Init is installed by the installation script, the files
+and the directories created by the commands are remembered and the
+agent archives the files it is asked to collect.
+"""
+
+import io
+import json
+import ntpath
+import re
+import threading
+import zipfile
+
+from argus.unit_tests import fake_winrm
+
+PROGRAM_FILES = r"C:\Program Files"
+PROGRAM_FILES_X86 = r"C:\Program Files (x86)"
+CBINIT_DIR = ntpath.join(PROGRAM_FILES, "Cloudbase Solutions",
+                         "Cloudbase-Init")
+
+OS_FACTS = {
+    "major": 6, "minor": 3, "product_type": 3, "nano": False,
+    "architecture": "AMD64", "program_files": PROGRAM_FILES,
+    "program_files_x86": PROGRAM_FILES_X86,
+}
+
+# The logs found on the instance after Cloudbase-Init ran, with the
+# number of lines written in each of them.
+LOGS = {
+    r"C:\installation.log": 200,
+    ntpath.join(CBINIT_DIR, "log", "cloudbase-init.log"): 1000,
+    ntpath.join(CBINIT_DIR, "log", "cloudbase-init-unattend.log"): 1000,
+}
+
+_NETSH_OUTPUT = """
+SubInterface Loopback Pseudo-Interface 1 Parameters
+----------------------------------------------
+IfLuid                             : loopback_0
+IfIndex                            : 1
+State                              : connected
+MTU                                : 4294967295
+Bytes In                           : 0
+
+SubInterface Ethernet Parameters
+----------------------------------------------
+IfLuid                             : ethernet_6
+IfIndex                            : 12
+State                              : connected
+MTU                                : 1500
+Bytes In                           : 143211
+"""
+
+
+def _log_content(path, lines):
+    line = u"2016-06-01 10:00:00.000 1234 DEBUG {} [-] A line of the log."
+    return u"\r\n".join(line.format(ntpath.basename(path))
+                        for _ in range(lines)).encode("utf-8")
+
+
+class ScriptedGuest(object):
+    """A responder which behaves like a Windows instance.
+
+    The uploads, the writes and the downloads are handled by a
+    :class:`fake_winrm.FileStore`, whose files are the files of
+    the guest, the batches by a :class:`fake_winrm.BatchRunner` and
+    the staged scripts by a :class:`fake_winrm.StagedScriptRunner`.
+    Every other command is matched against the rules
+    of the guest, in order, and the commands matched by none of
+    them succeed without any output.
+
+    :param username: The user whose name is echoed when the guest booted.
+    :param installed: Whether Cloudbase-Init is already installed.
+    """
+
+    def __init__(self, username, installed=False):
+        self.username = username
+        self.installed = False
+        self.directories = set()
+        if installed:
+            self._install(None)
+        self.store = fake_winrm.FileStore(fallback=self._respond)
+        self.store.files.update((path, _log_content(path, lines))
+                                for path, lines in LOGS.items())
+        self._batches = fake_winrm.BatchRunner(responder=self._respond,
+                                               fallback=self.store)
+        self._staged = fake_winrm.StagedScriptRunner(
+            responder=self._respond, fallback=self._batches)
+        self._lock = threading.Lock()
+        self._rules = [
+            (r"^echo '(.*)'$", self._echo),
+            (r"\[Environment\]::OSVersion", self._os_facts),
+            (r"^\$ENV:PROCESSOR_ARCHITECTURE$", self._architecture),
+            (r'^echo "\$\{ENV:ProgramFiles\(x86\)\}"$',
+             lambda match: PROGRAM_FILES_X86),
+            (r'^echo "\$ENV:ProgramFiles"$', lambda match: PROGRAM_FILES),
+            (r'^Test-Path "(.*)\\Cloudbase` Solutions"$',
+             self._cbinit_exists),
+            (r'^dir "(.*)" /b$', self._list_cbinit_dir),
+            (r'installCBinit\.ps1" -installer', self._install),
+            (r"-c \"import cloudbaseinit\"", self._check_installation),
+            (r"^netsh interface ipv4 show subinterfaces",
+             lambda match: _NETSH_OUTPUT),
+            (r"^\(Get-Service ", lambda match: "Stopped"),
+            (r"^foreach \(\$argusPath in @\((.*?)\)\) ", self._stat),
+            (r"^New-Item -Path '(.*)' -Type (\w+)", self._new_item),
+            (r'^mkdir "(.*)"$', self._mkdir),
+            (r"--collect (.*)$", self._collect),
+            (r'^Get-Content "(.*)"$', self._get_content),
+        ]
+
+    def __call__(self, command, stdin):
+        with self._lock:
+            return self._staged(command, stdin)
+
+    def _respond(self, command, stdin):
+        # pylint: disable=unused-argument
+        for pattern, rule in self._rules:
+            match = re.search(pattern, command)
+            if match:
+                result = rule(match)
+                if isinstance(result, tuple):
+                    return result
+                return result, "", 0
+        return "", "", 0
+
+    def _echo(self, match):
+        return match.group(1)
+
+    def _os_facts(self, match):
+        # pylint: disable=unused-argument
+        return json.dumps(OS_FACTS)
+
+    def _architecture(self, match):
+        # pylint: disable=unused-argument
+        return OS_FACTS["architecture"]
+
+    def _cbinit_exists(self, match):
+        found = self.installed and match.group(1) == PROGRAM_FILES.replace(
+            " ", "` ")
+        return str(found)
+
+    def _list_cbinit_dir(self, match):
+        # pylint: disable=unused-argument
+        return "\r\n".join(("bin", "conf", "LocalScripts", "log", "Python"))
+
+    def _install(self, match):
+        # pylint: disable=unused-argument
+        self.installed = True
+        self.directories.update((CBINIT_DIR,
+                                 ntpath.join(CBINIT_DIR, "log")))
+        return ""
+
+    def _check_installation(self, match):
+        # pylint: disable=unused-argument
+        if self.installed:
+            return ""
+        return "", "No module named cloudbaseinit", 1
+
+    def _stat(self, match):
+        lines = []
+        for path in re.findall(r"'((?:[^']|'')*)'", match.group(1)):
+            path = path.replace("''", "'")
+            if path in self.directories:
+                lines.append("Container|0|0")
+            elif path in self.store.files:
+                lines.append("Leaf|{}|0".format(len(self.store.files[path])))
+            elif re.match(r"^C:\\cloudbaseinit_\w+$", path):
+                # The files written by the heartbeat patch.
+                lines.append("Leaf|0|0")
+            else:
+                lines.append("-")
+        return "\r\n".join(lines)
+
+    def _new_item(self, match):
+        path, item_type = match.groups()
+        if item_type == "Directory":
+            self.directories.add(path)
+        else:
+            self.store.files.setdefault(path, b"")
+        return ""
+
+    def _mkdir(self, match):
+        self.directories.add(match.group(1))
+        return ""
+
+    def _collect(self, match):
+        arguments = re.findall(r'"([^"]*)"', match.group(1))
+        archive_path, files = arguments[0], arguments[1:]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path, name in zip(files[0::2], files[1::2]):
+                if path in self.store.files:
+                    archive.writestr(name, self.store.files[path])
+        self.store.files[archive_path] = buffer.getvalue()
+        return ""
+
+    def _get_content(self, match):
+        return self.store.files.get(match.group(1), b"").decode("utf-8")
@@ -0,0 +1,319 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the overhead of argus itself, without any instance.
+
+Every benchmark runs an operation of the WinRM client, of the config
+generators, of the action managers or of the recipes against a local
+fake WS-Management endpoint, which answers as a
+:class:`~argus.benchmarks.guest.ScriptedGuest` after a configurable
+latency. The round trips, the payload bytes on the wire and the wall
+time of every operation are reported.
+
+The round trips don't depend on the machine running the benchmarks,
+so they are compared with the ones recorded in ``baseline.json``,
+which is updated with ``--update`` when an operation changes on
+purpose::
+
+    python -m argus.benchmarks.suite --check
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import io
+import json
+import ntpath
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from argus.action_manager import windows as action_manager
+from argus.backends import console as backend_console
+from argus.benchmarks import guest as scripted_guest
+from argus.client import windows
+from argus import config as argus_config
+from argus.config_generator.windows import cb_init
+from argus.recipes.cloud import windows as recipe
+from argus.unit_tests import fake_winrm
+
+CONFIG = argus_config.CONFIG
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+
+COPIED_SIZE = 1024 * 1024
+WRITTEN_SIZE = 4 * 1024
+
+Result = collections.namedtuple("Result", "name requests sent received "
+                                          "seconds")
+"""The cost of an operation, with the payload bytes sent and received
+by argus."""
+
+_BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    """Register the decorated function as a benchmark.
+
+    The function receives an :class:`Environment` and prepares
+    everything the operation needs, then returns a callable which
+    runs the measured operation.
+    """
+    def decorator(func):
+        _BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class _Backend(object):
+    """The parts of a back-end used by the recipes."""
+
+    def __init__(self, remote_client):
+        self.remote_client = remote_client
+        self.console = backend_console.ConsoleTailer(lambda limit: "")
+
+    @staticmethod
+    def instance_server():
+        return {"id": "benchmark"}
+
+
+class Environment(object):
+    """A scripted guest behind a fake endpoint, with a local directory.
+
+    The artifacts of the recipes are grabbed in the directory and
+    the recipe steps are run one after the other, so that the
+    round trips don't depend on how the threads are scheduled.
+
+    :param latency: Number of seconds the endpoint waits before answering.
+    :param installed: Whether Cloudbase-Init is already installed.
+    """
+
+    _OVERRIDES = (("output_directory", None), ("recipe_concurrency", 1))
+
+    def __init__(self, latency=0, installed=False):
+        self.guest = scripted_guest.ScriptedGuest(
+            CONFIG.openstack.image_username, installed=installed)
+        self.server = fake_winrm.FakeWinRMServer(self.guest, latency)
+        self.directory = None
+        self._client = None
+        self._original_values = {}
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix="argus-benchmark-")
+        for key, value in self._OVERRIDES:
+            self._original_values[key] = CONFIG.argus.get(key)
+            CONFIG.set_override(key, value or self.directory, "argus")
+        self.server.start()
+        return self
+
+    def __exit__(self, *args):
+        if self._client is not None:
+            self._client.close()
+        self.server.stop()
+        for key, value in self._original_values.items():
+            CONFIG.set_override(key, value, "argus")
+        shutil.rmtree(self.directory)
+
+    @property
+    def client(self):
+        """A client connected to the guest, with its action manager."""
+        if self._client is None:
+            self._client = windows.WinRemoteClient(
+                "127.0.0.1", CONFIG.openstack.image_username, "Passw0rd",
+                port=self.server.port)
+        return self._client
+
+    def local_file(self, name, content):
+        """Write a file in the local directory and get its path."""
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as stream:
+            stream.write(content)
+        return path
+
+
+@benchmark("run_command")
+def _run_command(environment):
+    client = environment.client
+    return lambda: client.run_command("echo 1")
+
+
+@benchmark("copy_file")
+def _copy_file(environment):
+    client = environment.client
+    path = environment.local_file("installer.msi", os.urandom(COPIED_SIZE))
+    return lambda: client.copy_file(path, r"C:\installer.msi")
+
+
+def _written_data():
+    line = u"option = value\r\n"
+    return line * (WRITTEN_SIZE // len(line))
+
+
+@benchmark("write_file")
+def _write_file(environment):
+    client = environment.client
+    return lambda: client.write_file(_written_data(), r"C:\written.txt")
+
+
+@benchmark("write_file_unchanged")
+def _write_file_unchanged(environment):
+    client = environment.client
+    client.write_file(_written_data(), r"C:\written.txt")
+    return lambda: client.write_file(_written_data(), r"C:\written.txt")
+
+
+@benchmark("read_file")
+def _read_file(environment):
+    client = environment.client
+    client.write_file(_written_data(), r"C:\written.txt")
+    return lambda: client.read_file(r"C:\written.txt")
+
+
+@benchmark("apply_config")
+def _apply_config(environment):
+    environment.guest.installed = True
+    config = cb_init.CBInitConfig(environment.client)
+    conf_dir = ntpath.join(scripted_guest.CBINIT_DIR, "conf")
+    return lambda: config.apply_config(conf_dir)
+
+
+@benchmark("get_windows_action_manager")
+def _get_windows_action_manager(environment):
+    client = environment.client
+
+    def operation():
+        # As for the first client of an instance, with no known facts.
+        client.os_facts = None
+        return action_manager.get_windows_action_manager(client)
+    return operation
+
+
+@benchmark("recipe_prepare")
+def _recipe_prepare(environment):
+    cbinit_recipe = recipe.CloudbaseinitRecipe(
+        _Backend(environment.client))
+    return cbinit_recipe.prepare
+
+
+def run_benchmark(name, latency=0):
+    """Run a benchmark against a new scripted guest.
+
+    :returns: A :class:`Result` with the cost of the operation.
+    """
+    with Environment(latency) as environment:
+        operation = _BENCHMARKS[name](environment)
+        server = environment.server
+        requests = server.requests
+        sent, received = server.bytes_received, server.bytes_sent
+        start = time.time()
+        operation()
+        seconds = time.time() - start
+        return Result(name, server.requests - requests,
+                      server.bytes_received - sent,
+                      server.bytes_sent - received, seconds)
+
+
+def run(names=None, latency=0):
+    """Run the given benchmarks, all of them by default."""
+    return [run_benchmark(name, latency) for name in names or _BENCHMARKS]
+
+
+def format_results(results):
+    """Format the results as a text table."""
+    rows = [("operation", "round trips", "sent", "received", "seconds")]
+    rows.extend((result.name, str(result.requests), str(result.sent),
+                 str(result.received), "%.3f" % result.seconds)
+                for result in results)
+    widths = [max(len(row[column]) for row in rows)
+              for column in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width)
+                               for cell, width in zip(row, widths)).rstrip()
+                     for row in rows)
+
+
+def load_baseline(path=BASELINE):
+    """Get the round trips recorded for every operation."""
+    if not os.path.isfile(path):
+        return {}
+    with io.open(path, encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def write_baseline(results, path=BASELINE):
+    """Record the round trips of the results as the baseline."""
+    baseline = load_baseline(path)
+    baseline.update((result.name, result.requests) for result in results)
+    with io.open(path, "w", encoding="utf-8") as stream:
+        stream.write(json.dumps(baseline, indent=2, sort_keys=True) +
+                     u"\n")
+
+
+def compare(results, baseline):
+    """Find the operations whose round trips differ from the baseline.
+
+    :returns: A list of messages, one for every difference.
+    """
+    differences = []
+    for result in results:
+        expected = baseline.get(result.name)
+        if expected is None:
+            differences.append("{}: {} round trips, not in the baseline."
+                               .format(result.name, result.requests))
+        elif expected != result.requests:
+            differences.append("{}: {} round trips instead of {}."
+                               .format(result.name, result.requests,
+                                       expected))
+    return differences
+
+
+def main(argv=None):
+    """The entry point of the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="operation",
+                        help="The operations to measure, all by default: "
+                             "{}.".format(", ".join(_BENCHMARKS)))
+    parser.add_argument("-l", "--latency", type=float, default=0,
+                        help="The number of seconds the endpoint waits "
+                             "before answering every request.")
+    parser.add_argument("--check", action="store_true",
+                        help="Fail if the round trips differ from the "
+                             "baseline.")
+    parser.add_argument("--update", action="store_true",
+                        help="Record the round trips as the baseline.")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(_BENCHMARKS)
+    if unknown:
+        parser.error("unknown operations: {}".format(
+            ", ".join(sorted(unknown))))
+
+    results = run(args.names, args.latency)
+    print(format_results(results))
+    if args.update:
+        write_baseline(results)
+    if args.check:
+        differences = compare(results, load_baseline())
+        for difference in differences:
+            print(difference)
+        if differences:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
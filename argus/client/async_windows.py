@@ -0,0 +1,804 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A WinRM client built on asyncio, which needs Python 3.5 or newer.
+
+The requests of :class:`AsyncWinRemoteClient` are sent by a small
+HTTP transport over asyncio streams, so a single thread can wait for
+the commands of many instances at the same time, instead of a thread
+blocked in `pywinrm` for every one of them.
+
+:class:`SyncWinRemoteClient` is the adapter for the code which
+expects a :class:`argus.client.windows.WinRemoteClient`: it has the
+same interface, but its requests run in a shared event loop thread.
+"""
+
+# pylint: disable=protected-access
+
+import asyncio
+import base64
+import collections
+import hashlib
+import os
+import ssl
+import threading
+import time
+import uuid
+from urllib import parse
+from xml.etree import ElementTree
+from xml.sax import saxutils
+
+from winrm import exceptions as winrm_exceptions
+
+from argus.client import windows
+from argus import config as argus_config
+from argus import exceptions
+from argus import log as argus_log
+from argus import profiling
+from argus import util
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+# The same timeouts as the ones used by default by `pywinrm`.
+OPERATION_TIMEOUT = 20
+READ_TIMEOUT = 30
+# The fault code of a Receive which got no output during the timeout.
+_OPERATION_TIMEOUT_CODE = "2150858793"
+
+_SHELL_URI = "http://schemas.microsoft.com/wbem/wsman/1/windows/shell"
+_CREATE = "http://schemas.xmlsoap.org/ws/2004/09/transfer/Create"
+_DELETE = "http://schemas.xmlsoap.org/ws/2004/09/transfer/Delete"
+_COMMAND = _SHELL_URI + "/Command"
+_SEND = _SHELL_URI + "/Send"
+_RECEIVE = _SHELL_URI + "/Receive"
+_SIGNAL = _SHELL_URI + "/Signal"
+_TERMINATE = _SHELL_URI + "/signal/terminate"
+_DONE = _SHELL_URI + "/CommandState/Done"
+
+_ENVELOPE = (
+    '<env:Envelope xmlns:env="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+    'xmlns:w="http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd" '
+    'xmlns:p="http://schemas.microsoft.com/wbem/wsman/1/wsman.xsd" '
+    'xmlns:rsp="http://schemas.microsoft.com/wbem/wsman/1/windows/shell">'
+    '<env:Header>'
+    '<a:To>{endpoint}</a:To>'
+    '<a:ReplyTo><a:Address mustUnderstand="true">'
+    'http://schemas.xmlsoap.org/ws/2004/08/addressing/role/anonymous'
+    '</a:Address></a:ReplyTo>'
+    '<w:MaxEnvelopeSize mustUnderstand="true">153600</w:MaxEnvelopeSize>'
+    '<a:MessageID>uuid:{message_id}</a:MessageID>'
+    '<w:Locale mustUnderstand="false" xml:lang="en-US"/>'
+    '<p:DataLocale mustUnderstand="false" xml:lang="en-US"/>'
+    '<w:OperationTimeout>PT{timeout}S</w:OperationTimeout>'
+    '<w:ResourceURI mustUnderstand="true">' + _SHELL_URI + '/cmd'
+    '</w:ResourceURI>'
+    '<a:Action mustUnderstand="true">{action}</a:Action>'
+    '{selector}{options}</env:Header>'
+    '<env:Body>{body}</env:Body></env:Envelope>')
+_SELECTOR = ('<w:SelectorSet><w:Selector Name="ShellId">{}</w:Selector>'
+             '</w:SelectorSet>')
+_OPTION = '<w:Option Name="{}">{}</w:Option>'
+
+
+def _options(**options):
+    return "<w:OptionSet>{}</w:OptionSet>".format("".join(
+        _OPTION.format(name, value) for name, value in sorted(
+            options.items())))
+
+
+def _find_all(root, suffix):
+    return [node for node in root.iter() if node.tag.endswith(suffix)]
+
+
+def _find(root, suffix):
+    nodes = _find_all(root, suffix)
+    return nodes[0] if nodes else None
+
+
+def _fault_error(status, payload):
+    """Get the exception for a fault returned by the WinRM service."""
+    try:
+        root = ElementTree.fromstring(payload)
+    except ElementTree.ParseError:
+        return winrm_exceptions.WinRMTransportError(
+            "http", status, "Bad HTTP response returned from server. "
+                            "Code {}".format(status))
+    fault = _find(root, "WSManFault")
+    code = fault.get("Code") if fault is not None else None
+    if code == _OPERATION_TIMEOUT_CODE:
+        return winrm_exceptions.WinRMOperationTimeoutError()
+    text = _find(root, "Text")
+    reason = text.text if text is not None else "Unknown fault."
+    return winrm_exceptions.WSManFaultError(
+        status, "Bad HTTP response returned from server. "
+                "Code {}".format(status),
+        payload, reason, wsman_fault_code=int(code) if code else None)
+
+
+class _Connection(object):
+    """A HTTP/1.1 connection, which is kept alive between requests."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if not size:
+                # The trailer ends with an empty line.
+                while (await self.reader.readline()).strip():
+                    pass
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    async def request(self, request):
+        """Send the request and return the status and the body of the reply.
+
+        :raises: :class:`ConnectionError` if the connection was closed.
+        """
+        try:
+            return await self._request(request)
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError("The connection was closed.")
+
+    async def _request(self, request):
+        self.writer.write(request)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("The connection was closed.")
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked()
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(
+                int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.closed = True
+
+        connection = headers.get("connection", "").lower()
+        if (version != b"HTTP/1.1" and connection != "keep-alive" or
+                connection == "close"):
+            self.close()
+        return int(status), body
+
+
+class AsyncTransport(object):
+    """Send WS-Management messages over a pool of HTTP connections.
+
+    :param endpoint: The URL of the WinRM endpoint.
+    :param username: The user for the basic authentication.
+    :param password: The password for the basic authentication.
+    :param cert_pem:
+        Client authentication certificate file path in PEM format,
+        used for the HTTPS endpoints.
+    :param cert_key:
+        Client authentication certificate key file path in PEM format.
+    :param read_timeout: Seconds to wait for the reply of a request.
+    """
+
+    def __init__(self, endpoint, username, password, cert_pem=None,
+                 cert_key=None, read_timeout=READ_TIMEOUT):
+        url = parse.urlparse(endpoint)
+        self._host = url.hostname
+        self._port = url.port or (443 if url.scheme == "https" else 80)
+        self._path = url.path or "/wsman"
+        self._read_timeout = read_timeout
+        self._ssl = None
+        if url.scheme == "https":
+            # The certificates of the instances are self signed.
+            self._ssl = ssl.create_default_context()
+            self._ssl.check_hostname = False
+            self._ssl.verify_mode = ssl.CERT_NONE
+            if cert_pem:
+                self._ssl.load_cert_chain(cert_pem, cert_key)
+        credentials = "{}:{}".format(username, password).encode("utf-8")
+        self._authorization = "Basic {}".format(
+            base64.b64encode(credentials).decode())
+        self._idle = collections.deque()
+
+    def _request(self, payload):
+        headers = [
+            "POST {} HTTP/1.1".format(self._path),
+            "Host: {}:{}".format(self._host, self._port),
+            "User-Agent: argus",
+            "Authorization: {}".format(self._authorization),
+            "Content-Type: application/soap+xml;charset=UTF-8",
+            "Content-Length: {}".format(len(payload)),
+        ]
+        return "\r\n".join(headers).encode("latin-1") + b"\r\n\r\n" + payload
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port, ssl=self._ssl)
+        return _Connection(reader, writer)
+
+    @staticmethod
+    async def _request_on(connection, request):
+        try:
+            return connection, await connection.request(request)
+        except BaseException:
+            # A failed, cancelled or timed out request leaves
+            # the connection in the middle of an exchange.
+            connection.close()
+            raise
+
+    async def _exchange(self, request):
+        while self._idle:
+            try:
+                return await self._request_on(self._idle.popleft(), request)
+            except ConnectionError:
+                # The server closed the idle connection meanwhile.
+                pass
+        return await self._request_on(await self._connect(), request)
+
+    async def send_message(self, message):
+        """Send a message and return the payload of the reply.
+
+        :raises:
+            :class:`winrm.exceptions.WinRMOperationTimeoutError` when
+            the operation timed out remotely, other `pywinrm` exceptions
+            for the faults and for the transport errors.
+        """
+        payload = message.encode("utf-8")
+        try:
+            connection, (status, body) = await asyncio.wait_for(
+                self._exchange(self._request(payload)), self._read_timeout)
+        except asyncio.TimeoutError:
+            raise winrm_exceptions.WinRMTransportError(
+                "http", 0, "The request timed out after {} seconds."
+                .format(self._read_timeout))
+        if not connection.closed:
+            self._idle.append(connection)
+
+        if status == 401:
+            raise winrm_exceptions.InvalidCredentialsError(
+                "the specified credentials were rejected by the server")
+        if status != 200:
+            raise _fault_error(status, body)
+        return body
+
+    def close(self):
+        """Close the idle connections."""
+        while self._idle:
+            self._idle.popleft().close()
+
+
+class AsyncProtocol(object):
+    """The WS-Management shell operations used by argus, as coroutines.
+
+    They mirror the methods of :class:`winrm.protocol.Protocol`.
+    """
+
+    def __init__(self, transport, endpoint,
+                 operation_timeout=OPERATION_TIMEOUT):
+        self.transport = transport
+        self._endpoint = endpoint
+        self._operation_timeout = operation_timeout
+
+    async def _send(self, action, body="", shell_id=None, options=""):
+        message = _ENVELOPE.format(
+            endpoint=self._endpoint, message_id=uuid.uuid4(),
+            timeout=self._operation_timeout, action=action,
+            selector=_SELECTOR.format(shell_id) if shell_id else "",
+            options=options, body=body)
+        return ElementTree.fromstring(
+            await self.transport.send_message(message))
+
+    async def open_shell(self, codepage=windows.CODEPAGE_UTF8):
+        root = await self._send(
+            _CREATE,
+            "<rsp:Shell><rsp:InputStreams>stdin</rsp:InputStreams>"
+            "<rsp:OutputStreams>stdout stderr</rsp:OutputStreams>"
+            "</rsp:Shell>",
+            options=_options(WINRS_NOPROFILE="FALSE",
+                             WINRS_CODEPAGE=codepage))
+        return next(node.text for node in root.iter()
+                    if node.get("Name") == "ShellId")
+
+    async def close_shell(self, shell_id):
+        await self._send(_DELETE, shell_id=shell_id)
+
+    async def run_command(self, shell_id, command):
+        root = await self._send(
+            _COMMAND,
+            "<rsp:CommandLine><rsp:Command>{}</rsp:Command>"
+            "</rsp:CommandLine>".format(saxutils.escape(command)),
+            shell_id=shell_id,
+            options=_options(WINRS_CONSOLEMODE_STDIN="TRUE",
+                             WINRS_SKIP_CMD_SHELL="FALSE"))
+        return _find(root, "CommandId").text
+
+    async def send_command_input(self, shell_id, command_id, data,
+                                 end=False):
+        await self._send(
+            _SEND,
+            '<rsp:Send><rsp:Stream Name="stdin" CommandId="{}" End="{}">'
+            '{}</rsp:Stream></rsp:Send>'.format(
+                command_id, "true" if end else "false",
+                base64.b64encode(data).decode()),
+            shell_id=shell_id)
+
+    async def get_command_output_raw(self, shell_id, command_id):
+        """Get the next output of a command.
+
+        :returns: stdout, stderr, exit code and if the command is done.
+        """
+        root = await self._send(
+            _RECEIVE,
+            '<rsp:Receive><rsp:DesiredStream CommandId="{}">stdout stderr'
+            '</rsp:DesiredStream></rsp:Receive>'.format(command_id),
+            shell_id=shell_id)
+        streams = {"stdout": [], "stderr": []}
+        for node in _find_all(root, "Stream"):
+            if node.text and node.get("Name") in streams:
+                streams[node.get("Name")].append(base64.b64decode(node.text))
+        state = _find(root, "CommandState")
+        done = state is not None and state.get("State") == _DONE
+        exit_code = -1
+        if done:
+            code = _find(state, "ExitCode")
+            if code is not None:
+                exit_code = int(code.text)
+        return (b"".join(streams["stdout"]), b"".join(streams["stderr"]),
+                exit_code, done)
+
+    async def cleanup_command(self, shell_id, command_id):
+        await self._send(
+            _SIGNAL,
+            '<rsp:Signal CommandId="{}"><rsp:Code>{}</rsp:Code>'
+            '</rsp:Signal>'.format(command_id, _TERMINATE),
+            shell_id=shell_id)
+
+
+async def _retry_sleep(retrier):
+    """Wait before the next retry, without blocking the event loop.
+
+    The wake event of the retrier is set by other threads, so it is
+    waited for in the default executor of the loop.
+    """
+    delay = retrier.advance()
+    if delay is None:
+        return False
+    with profiling.span(profiling.SLEEP, "retry", delay=delay):
+        if retrier.wake is None:
+            await asyncio.sleep(delay)
+        else:
+            start = time.time()
+            woken = await asyncio.get_event_loop().run_in_executor(
+                None, retrier.wake.wait, delay)
+            if woken:
+                retrier.restart()
+                delay = time.time() - start
+    util.record_retry(delay)
+    return True
+
+
+class _PooledProtocol(object):
+    """An :class:`AsyncProtocol` whose shells are kept in a shell pool.
+
+    :class:`argus.client.windows.ShellPool` closes the shells it gives
+    up without waiting for anything, so closing a shell starts a task
+    in the event loop, which can be awaited with :meth:`wait_closed`.
+    """
+
+    def __init__(self, protocol):
+        self._protocol = protocol
+        self._closing = set()
+
+    def __getattr__(self, name):
+        return getattr(self._protocol, name)
+
+    async def _close_shell(self, shell_id):
+        try:
+            await self._protocol.close_shell(shell_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug("Could not close the shell %s: %r", shell_id, exc)
+
+    def close_shell(self, shell_id):
+        task = asyncio.ensure_future(self._close_shell(shell_id))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+        return task
+
+    async def wait_closed(self):
+        """Wait for the shells which are being closed."""
+        if self._closing:
+            await asyncio.wait(list(self._closing))
+
+
+class AsyncWinRemoteClient(object):
+    """A remote client to a Windows instance, whose methods are coroutines.
+
+    The parameters are the same as the ones of
+    :class:`argus.client.windows.WinRemoteClient`. The idle shells are
+    shared by the clients of the same endpoint, which must be used from
+    a single event loop.
+    """
+
+    def __init__(self, hostname, username, password,
+                 transport_protocol='http',
+                 cert_pem=None, cert_key=None, port=None, instance_id=None):
+        self.instance_id = instance_id
+        _, self._hostname = windows.get_endpoint(hostname,
+                                                 transport_protocol, port)
+        self.protocol = _PooledProtocol(AsyncProtocol(
+            AsyncTransport(self._hostname, username, password,
+                           cert_pem, cert_key),
+            self._hostname))
+        self._shell_pool = windows.get_shell_pool(
+            (type(self), self._hostname, username, password,
+             cert_pem, cert_key))
+
+    async def _open_shell(self):
+        with profiling.span(profiling.SHELL, "open_shell"):
+            return windows.Shell(self.protocol,
+                                 await self.protocol.open_shell())
+
+    async def close(self):
+        """Close the idle shells and the connections of the client."""
+        self._shell_pool.close()
+        await self.protocol.wait_closed()
+        self.protocol.transport.close()
+
+    async def _get_command_output(self, shell_id, command_id, upper_timeout):
+        deadline = time.time() + upper_timeout
+        stdout_buffer, stderr_buffer = [], []
+        while True:
+            try:
+                stdout, stderr, exit_code, done = (
+                    await self.protocol.get_command_output_raw(
+                        shell_id, command_id))
+            except winrm_exceptions.WinRMOperationTimeoutError:
+                # Nothing was written by the command in the meantime.
+                pass
+            else:
+                stdout_buffer.append(stdout)
+                stderr_buffer.append(stderr)
+                if done:
+                    return (b"".join(stdout_buffer),
+                            b"".join(stderr_buffer), exit_code)
+            if time.time() >= deadline:
+                return None
+
+    async def _run_command(self, shell_id, command, command_type,
+                           upper_timeout, stdin=None):
+        command_id = None
+        bare_command = command
+        command, stdin = windows._command_line(command, command_type, stdin)
+
+        with profiling.span(profiling.COMMAND, command_type,
+                            sent=len(command), received=0) as details:
+            try:
+                try:
+                    command_id = await self.protocol.run_command(shell_id,
+                                                                 command)
+                except windows.SHELL_ERRORS as exc:
+                    raise windows._ShellUnavailable(exc)
+
+                if stdin is not None:
+                    for data in stdin:
+                        details["sent"] += len(data)
+                        await self.protocol.send_command_input(
+                            shell_id, command_id, data)
+                    await self.protocol.send_command_input(
+                        shell_id, command_id, b"", end=True)
+
+                result = await self._get_command_output(
+                    shell_id, command_id, upper_timeout)
+                if result is None:
+                    # The command is terminated by the cleanup below.
+                    raise exceptions.ArgusTimeoutError(
+                        "The command '{cmd}' has timed out."
+                        .format(cmd=bare_command))
+
+                stdout, stderr, exit_code = result
+                details["received"] = len(stdout) + len(stderr)
+                if exit_code:
+                    output = b"\n\n".join(
+                        [out for out in (stdout, stderr) if out])
+                    raise exceptions.ArgusError(
+                        "Executing command {command!r} with encoded Command"
+                        "{encoded_command!r} failed with exit code "
+                        "{exit_code!r} and output {output!r}."
+                        .format(command=bare_command,
+                                encoded_command=command,
+                                exit_code=exit_code,
+                                output=output))
+
+                return (util.sanitize_command_output(stdout), stderr,
+                        exit_code)
+            finally:
+                if command_id:
+                    await self.protocol.cleanup_command(shell_id, command_id)
+
+    async def _with_shell(self, action):
+        """Await `action` with a pooled shell, like the blocking client.
+
+        The shell IDs are known by every connection to the endpoint,
+        so a shell opened by another client is used through the
+        protocol of this one.
+        """
+        shell, reused = self._shell_pool.acquire(self._open_shell)
+        if not reused:
+            shell = await shell
+        try:
+            result = await action(shell.shell_id)
+        except windows._ShellUnavailable as exc:
+            # The dead shell is closed in the background.
+            self._shell_pool.discard(shell)
+            if not reused:
+                raise exc.error
+            LOG.debug("The pooled shell %s is not usable anymore (%r), "
+                      "opening a new one.", shell.shell_id, exc.error)
+            self._shell_pool.invalidate()
+            return await self._with_shell(action)
+        except exceptions.ArgusTimeoutError:
+            # The command might still run in the shell.
+            self._shell_pool.discard(shell)
+            await shell.protocol.wait_closed()
+            raise
+        except exceptions.ArgusError:
+            self._shell_pool.release(shell)
+            raise
+        except Exception:
+            self._shell_pool.discard(shell)
+            await shell.protocol.wait_closed()
+            raise
+        self._shell_pool.release(shell)
+        return result
+
+    async def run_remote_cmd(self, cmd, command_type=util.POWERSHELL,
+                             upper_timeout=CONFIG.argus.upper_timeout):
+        """Run the given remote command.
+
+        :rtype: tuple
+        :returns: stdout, stderr, exit_code
+        """
+        return await self._with_shell(lambda shell_id: self._run_command(
+            shell_id, cmd, command_type, upper_timeout))
+
+    run_command = run_remote_cmd
+
+    async def _run_stdin_script(self, lines, upper_timeout):
+        stdin = [line.encode("utf-8") + b"\r\n" for line in lines]
+        return await self._with_shell(lambda shell_id: self._run_command(
+            shell_id, windows.STDIN_POWERSHELL, util.CMD, upper_timeout,
+            stdin=stdin))
+
+    async def run_command_with_retry(
+            self, cmd, count=CONFIG.argus.retry_count,
+            delay=CONFIG.argus.retry_delay, command_type=util.POWERSHELL,
+            upper_timeout=CONFIG.argus.upper_timeout):
+        """Run the given `cmd` until it succeeds.
+
+        See :meth:`WinRemoteClient.run_command_with_retry`.
+        """
+        retries = count - 1 if count and count > 0 else None
+        retrier = util.RetryPolicy.from_config(
+            retries=retries, max_delay=delay).start()
+
+        while True:
+            try:
+                return await self.run_command(
+                    cmd, command_type=command_type,
+                    upper_timeout=upper_timeout)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.debug("Command failed with %r.", exc)
+                if not await _retry_sleep(retrier):
+                    raise exceptions.ArgusTimeoutError(
+                        "Command {!r} failed too many times."
+                        .format(cmd))
+                LOG.debug("Retrying '%s'", cmd)
+
+    async def run_command_until_condition(
+            self, cmd, cond, retry_count=CONFIG.argus.retry_count,
+            delay=CONFIG.argus.retry_delay, command_type=util.POWERSHELL,
+            upper_timeout=CONFIG.argus.upper_timeout, wake=None):
+        """Run the given `cmd` until a condition `cond` occurs.
+
+        See :meth:`WinRemoteClient.run_command_until_condition`.
+        """
+        if not retry_count or retry_count < 0:
+            retry_count = 0
+        retrier = util.RetryPolicy.from_config(
+            retries=retry_count, max_delay=delay).start(wake)
+
+        while True:
+            try:
+                stdout, stderr, exit_code = await self.run_command(
+                    cmd, command_type=command_type,
+                    upper_timeout=upper_timeout)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.debug("Command failed with %r.", exc)
+            else:
+                if stderr and exit_code:
+                    raise exceptions.ArgusCLIError(
+                        ("Executing command {!r} failed with {!r}"
+                         " and exit code {}.")
+                        .format(cmd, stderr, exit_code))
+                elif cond(stdout):
+                    return
+                else:
+                    LOG.debug("Condition not met, retrying...")
+
+            if not await _retry_sleep(retrier):
+                raise exceptions.ArgusTimeoutError(
+                    "Command {!r} failed too many times."
+                    .format(cmd))
+            LOG.debug("Retrying '%s'", cmd)
+
+    async def upload_stream(self, stream, remote_destination,
+                            upper_timeout=CONFIG.argus.io_upper_timeout):
+        """Write the content of a binary stream in the remote destination.
+
+        :returns: The hex digest of the uploaded data.
+        """
+        digest = hashlib.sha256()
+        lines = list(windows._upload_script(stream, remote_destination,
+                                            digest))
+        stdout, _, _ = await self._run_stdin_script(lines, upper_timeout)
+        windows._check_digest(stdout, remote_destination, digest.hexdigest())
+        return digest.hexdigest()
+
+    async def copy_file(self, filepath, remote_destination):
+        """Copy the given file-path in the remote destination."""
+        size = os.path.getsize(filepath)
+        start = time.time()
+        with open(filepath, 'rb') as stream:
+            await self.upload_stream(stream, remote_destination)
+        LOG.info("Copied %s (%d bytes) to %s in %.2f seconds.",
+                 filepath, size, remote_destination, time.time() - start)
+
+    async def write_file(self, data, remote_destination, encoding="utf-8"):
+        """Write the given data in the remote destination.
+
+        :returns: True if the file was written, False if it was up to date.
+        """
+        if isinstance(data, str):
+            data = data.encode(encoding, "replace")
+        stdout, _, _ = await self._run_stdin_script(
+            list(windows._write_script(data, remote_destination)),
+            CONFIG.argus.io_upper_timeout)
+        lines = windows._output_lines(stdout)
+        if lines and lines[-1] == "unchanged":
+            return False
+        windows._check_digest(stdout, remote_destination,
+                              hashlib.sha256(data).hexdigest())
+        return True
+
+    async def read_file(self, filepath):
+        """Get the content of the given file."""
+        cmd = 'Get-Content "{}"'.format(filepath)
+        return (await self.run_command_with_retry(
+            cmd, command_type=util.POWERSHELL,
+            upper_timeout=CONFIG.argus.io_upper_timeout))[0]
+
+
+class EventLoopThread(object):
+    """An event loop running forever in a daemon thread.
+
+    The blocking code submits coroutines to it and waits for
+    their results.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name="argus-asyncio")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self, coroutine):
+        """Run a coroutine in the loop and return its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+_LOOP_THREAD = None
+_LOOP_THREAD_LOCK = threading.Lock()
+
+
+def get_loop_thread():
+    """Get the event loop thread shared by the blocking adapters."""
+    global _LOOP_THREAD  # pylint: disable=global-statement
+    with _LOOP_THREAD_LOCK:
+        if _LOOP_THREAD is None:
+            _LOOP_THREAD = EventLoopThread()
+        return _LOOP_THREAD
+
+
+class SyncProtocol(object):
+    """The blocking interface of :class:`winrm.protocol.Protocol`.
+
+    The calls are made by an :class:`AsyncProtocol`, in the event
+    loop of the given :class:`EventLoopThread`.
+    """
+
+    def __init__(self, protocol, loop_thread):
+        self._protocol = protocol
+        self._run = loop_thread.run
+
+    def open_shell(self, codepage=windows.CODEPAGE_UTF8):
+        return self._run(self._protocol.open_shell(codepage))
+
+    def close_shell(self, shell_id):
+        return self._run(self._protocol.close_shell(shell_id))
+
+    def run_command(self, shell_id, command):
+        return self._run(self._protocol.run_command(shell_id, command))
+
+    def send_command_input(self, shell_id, command_id, data, end=False):
+        return self._run(self._protocol.send_command_input(
+            shell_id, command_id, data, end))
+
+    def get_command_output_raw(self, shell_id, command_id):
+        return self._run(self._protocol.get_command_output_raw(
+            shell_id, command_id))
+
+    _raw_get_command_output = get_command_output_raw
+
+    def cleanup_command(self, shell_id, command_id):
+        return self._run(self._protocol.cleanup_command(shell_id,
+                                                        command_id))
+
+
+class SyncWinRemoteClient(windows.WinRemoteClient):
+    """A :class:`WinRemoteClient` whose requests are made by asyncio.
+
+    Everything works as for the blocking client, including the
+    shell pool and the action manager, so the recipes and the
+    introspection can use it as they are.
+    """
+
+    def __init__(self, hostname, username, password,
+                 transport_protocol='http',
+                 cert_pem=None, cert_key=None, port=None, instance_id=None,
+                 recorder=None, os_facts=None):
+        # The base constructor already runs commands, for getting
+        # the action manager, so the protocol must be ready before.
+        _, url = windows.get_endpoint(hostname, transport_protocol, port)
+        self._sync_protocol = SyncProtocol(
+            AsyncProtocol(AsyncTransport(url, username, password,
+                                         cert_pem, cert_key),
+                          url),
+            get_loop_thread())
+        super(SyncWinRemoteClient, self).__init__(
+            hostname, username, password,
+            transport_protocol=transport_protocol, cert_pem=cert_pem,
+            cert_key=cert_key, port=port, instance_id=instance_id,
+            recorder=recorder, os_facts=os_facts)
+
+    def _get_protocol(self):
+        return self._sync_protocol
@@ -0,0 +1,45 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+from argus.client import session as argus_session
+from argus.client import windows
+
+
+class ReplayRemoteClient(windows.WinRemoteClient):
+    """A :class:`WinRemoteClient` answered by a recorded session.
+
+    Everything runs as for a real instance, from building the
+    commands to parsing their output, except for the requests,
+    which are answered right away from the session.
+
+    :param session: The :class:`argus.client.session.Session` to replay.
+    """
+
+    def __init__(self, session, username, password, instance_id=None,
+                 recorder=None, os_facts=None):
+        self.session = session
+        super(ReplayRemoteClient, self).__init__(
+            session.host, username, password, instance_id=instance_id,
+            recorder=recorder, os_facts=os_facts)
+
+    def _get_protocol(self):
+        return argus_session.ReplayProtocol(self.session)
+
+    def wait_for_endpoint(self, timeout=None, interval=None,
+                          probe_timeout=None):
+        """The recorded endpoint is always ready."""
+        return collections.OrderedDict()
@@ -0,0 +1,401 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Record the commands run on an instance and play them back.
+
+When the ``record_directory`` option is set, the clients of every
+scenario write the commands they run, with their output, exit code
+and duration, in a session file named after the scenario. The
+values of the back-end which are used by the recipes and by the
+tests are recorded as well, when the scenario ends, except for the
+secrets, unless the ``record_secrets`` option is set.
+
+A session file has a JSON object on every line: the first one
+describes the session and the following ones are the commands,
+in the order in which they finished. The commands are recorded
+as they were given to :func:`argus.util.get_command` and only
+the SHA-256 of their standard input is kept, so the uploads don't
+end up in the session.
+"""
+
+import base64
+import collections
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+import six
+
+from argus import config as argus_config
+from argus import exceptions
+from argus import log as argus_log
+from argus import util
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+FORMAT_VERSION = 1
+SESSION_SUFFIX = ".session.jsonl"
+
+# The values of the back-end which are recorded, by their method names.
+BACKEND_VALUES = (
+    "floating_ip",
+    "get_image_by_ref",
+    "get_mtu",
+    "get_network_interfaces",
+    "instance_output",
+    "instance_password",
+    "instance_server",
+    "internal_instance_id",
+    "private_key",
+    "public_key",
+)
+# The values of the back-end which are recorded only on request.
+SECRET_VALUES = frozenset(("instance_password", "private_key"))
+
+# The tokens which are different every time a command is run,
+# such as the markers of the batches.
+_VOLATILE = re.compile(r"\b[0-9a-f]{32}\b")
+
+_RECORDERS = {}
+_RECORDERS_LOCK = threading.Lock()
+_SESSION_IDS = itertools.count()
+
+
+def session_path(directory, name):
+    """Get the path of the session file of the given scenario."""
+    return os.path.join(directory, name + SESSION_SUFFIX)
+
+
+def _dump_line(entry):
+    return six.text_type(json.dumps(entry, sort_keys=True, default=str,
+                                    separators=(",", ":"))) + u"\n"
+
+
+def _dump_output(data):
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(data).decode()}
+
+
+def _load_output(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value["base64"])
+    return value.encode("utf-8")
+
+
+class _Fingerprint(object):
+    """Identify a command by its script and its standard input.
+
+    The volatile tokens are left out of the fingerprint, so that
+    the command matches its recording when it is run again, and
+    they are kept in order in :attr:`tokens`.
+    """
+
+    def __init__(self, command_line):
+        self.command = util.decode_command(command_line)
+        self.encoded = self.command != command_line
+        self.tokens = _VOLATILE.findall(self.command)
+        self._stdin = None
+
+    def feed(self, data):
+        """Add a chunk of the standard input of the command."""
+        text = data.decode("utf-8", "replace")
+        self.tokens.extend(_VOLATILE.findall(text))
+        if self._stdin is None:
+            self._stdin = hashlib.sha256()
+        self._stdin.update(_VOLATILE.sub("-", text).encode("utf-8"))
+
+    @property
+    def stdin(self):
+        """The SHA-256 of the standard input, None if there was none."""
+        return self._stdin.hexdigest() if self._stdin else None
+
+    @property
+    def key(self):
+        return _command_key(self.command, self.encoded, self.stdin)
+
+
+def _command_key(command, encoded, stdin):
+    return encoded, _VOLATILE.sub("-", command), stdin
+
+
+class _Capture(object):
+    """The output of a command which is being recorded."""
+
+    def __init__(self, command_line):
+        self.fingerprint = _Fingerprint(command_line)
+        self.start = time.time()
+        self.stdout = []
+        self.stderr = []
+
+
+class Recorder(object):
+    """Write the commands run on an instance in a session file.
+
+    :param path: The path of the session file, which is overwritten.
+    :param name: The name of the session, usually the scenario name.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self._lock = threading.Lock()
+        with io.open(path, "w", encoding="utf-8") as stream:
+            stream.write(_dump_line({"session": name,
+                                     "version": FORMAT_VERSION}))
+
+    def _write(self, entry):
+        line = _dump_line(entry)
+        with self._lock:
+            with io.open(self.path, "a", encoding="utf-8") as stream:
+                stream.write(line)
+
+    def record_command(self, capture, exit_code):
+        """Record a command which finished."""
+        fingerprint = capture.fingerprint
+        entry = {"command": fingerprint.command,
+                 "seconds": round(time.time() - capture.start, 3)}
+        if fingerprint.encoded:
+            entry["encoded"] = True
+        if fingerprint.stdin:
+            entry["stdin"] = fingerprint.stdin
+        if fingerprint.tokens:
+            entry["tokens"] = fingerprint.tokens
+        stdout, stderr = b"".join(capture.stdout), b"".join(capture.stderr)
+        if stdout:
+            entry["stdout"] = _dump_output(stdout)
+        if stderr:
+            entry["stderr"] = _dump_output(stderr)
+        if exit_code:
+            entry["exit_code"] = exit_code
+        self._write(entry)
+
+    def record_backend(self, backend):
+        """Record the values of the back-end, from :data:`BACKEND_VALUES`.
+
+        The back-ends don't have all of them, so the missing
+        values and the ones which can't be retrieved are skipped.
+        The :data:`SECRET_VALUES` are only named as redacted,
+        unless the ``record_secrets`` option is set.
+        """
+        values, redacted = {}, []
+        for name in BACKEND_VALUES:
+            method = getattr(backend, name, None)
+            if method is None:
+                continue
+            if name in SECRET_VALUES and not CONFIG.argus.record_secrets:
+                redacted.append(name)
+                continue
+            try:
+                value = method()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.debug("Could not record the %s of the back-end: %r",
+                          name, exc)
+                continue
+            if isinstance(value, six.binary_type):
+                value = value.decode("utf-8", "replace")
+            values[name] = value
+        entry = {"backend": values}
+        if redacted:
+            entry["redacted"] = redacted
+        self._write(entry)
+
+
+def get_recorder(name):
+    """Get the recorder of the given scenario.
+
+    :returns:
+        A :class:`Recorder`, shared by all the clients of the
+        scenario, or None if the sessions are not recorded.
+    """
+    directory = CONFIG.argus.record_directory
+    if not directory:
+        return None
+    path = session_path(directory, name)
+    with _RECORDERS_LOCK:
+        recorder = _RECORDERS.get(path)
+        if recorder is None:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            recorder = _RECORDERS[path] = Recorder(path, name)
+        return recorder
+
+
+class RecordingProtocol(object):
+    """Record the commands run through a protocol client.
+
+    Only the commands which finished are recorded, the ones which
+    were abandoned after a timeout are left out.
+
+    :param protocol_client:
+        A :class:`winrm.protocol.Protocol` or anything with the
+        same interface.
+    :param recorder: The :class:`Recorder` of the commands.
+    """
+
+    def __init__(self, protocol_client, recorder):
+        self._protocol = protocol_client
+        self._recorder = recorder
+        self._captures = {}
+
+    def __getattr__(self, name):
+        return getattr(self._protocol, name)
+
+    def run_command(self, shell_id, command, *args, **kwargs):
+        command_id = self._protocol.run_command(shell_id, command,
+                                                *args, **kwargs)
+        self._captures[command_id] = _Capture(command)
+        return command_id
+
+    def send_command_input(self, shell_id, command_id, data, end=False):
+        capture = self._captures.get(command_id)
+        if capture is not None:
+            capture.fingerprint.feed(data)
+        return self._protocol.send_command_input(shell_id, command_id,
+                                                 data, end=end)
+
+    def _raw_get_command_output(self, shell_id, command_id):
+        # pylint: disable=protected-access
+        result = self._protocol._raw_get_command_output(shell_id,
+                                                        command_id)
+        stdout, stderr, exit_code, done = result
+        capture = self._captures.get(command_id)
+        if capture is not None:
+            capture.stdout.append(stdout)
+            capture.stderr.append(stderr)
+            if done:
+                del self._captures[command_id]
+                self._recorder.record_command(capture, exit_code)
+        return result
+
+    def cleanup_command(self, shell_id, command_id):
+        self._captures.pop(command_id, None)
+        return self._protocol.cleanup_command(shell_id, command_id)
+
+
+class Session(object):
+    """The commands recorded in a session file, ready to be replayed.
+
+    Every command gets the recorded answers of the same command, in
+    the order in which they were recorded, and the last answer is
+    given again once the others were used, for the commands which
+    were run more times than in the recording.
+
+    :param name: The name of the session.
+    :param entries: The entries of the commands, as they were recorded.
+    :param backend: The values recorded from the back-end.
+    :param redacted: The names of the values which were not recorded.
+    """
+
+    def __init__(self, name, entries, backend, redacted=()):
+        self.name = name
+        self.backend = backend
+        self.redacted = frozenset(redacted)
+        # The host of the clients, which don't share their
+        # shells with the clients of other sessions.
+        self.host = "{}-{}".format(name, next(_SESSION_IDS))
+        self.played = 0
+        self.recorded_seconds = 0
+        self._answers = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        for entry in entries:
+            key = _command_key(entry["command"], entry.get("encoded", False),
+                               entry.get("stdin"))
+            self._answers[key].append(entry)
+            self.recorded_seconds += entry.get("seconds", 0)
+
+    @classmethod
+    def load(cls, path):
+        """Load the session from the given session file."""
+        with io.open(path, encoding="utf-8") as stream:
+            lines = [json.loads(line) for line in stream if line.strip()]
+        header = lines[0] if lines else {}
+        if header.get("version") != FORMAT_VERSION:
+            raise exceptions.ArgusReplayError(
+                "{} is not a session file of version {}."
+                .format(path, FORMAT_VERSION))
+        entries, backend, redacted = [], {}, set()
+        for entry in lines[1:]:
+            if "backend" in entry:
+                backend.update(entry["backend"])
+                redacted.update(entry.get("redacted", ()))
+            else:
+                entries.append(entry)
+        return cls(header["session"], entries, backend, redacted)
+
+    def play(self, fingerprint):
+        """Get the recorded stdout, stderr and exit code of a command."""
+        with self._lock:
+            answers = self._answers.get(fingerprint.key)
+            if not answers:
+                raise exceptions.ArgusReplayError(
+                    "The session {} has no recording of the command {!r}."
+                    .format(self.name, fingerprint.command))
+            entry = answers.popleft() if len(answers) > 1 else answers[0]
+            self.played += 1
+
+        stdout = _load_output(entry.get("stdout", u""))
+        stderr = _load_output(entry.get("stderr", u""))
+        for recorded, live in zip(entry.get("tokens", ()),
+                                  fingerprint.tokens):
+            recorded, live = recorded.encode(), live.encode()
+            stdout = stdout.replace(recorded, live)
+            stderr = stderr.replace(recorded, live)
+        return stdout, stderr, entry.get("exit_code", 0)
+
+
+class ReplayProtocol(object):
+    """Answer the commands with the ones recorded in a :class:`Session`.
+
+    It has the interface of :class:`winrm.protocol.Protocol` which
+    is used by :class:`argus.client.windows.WinRemoteClient` and every
+    command finishes right away.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._commands = {}
+        self._ids = itertools.count()
+
+    def open_shell(self, *args, **kwargs):
+        # pylint: disable=unused-argument
+        return "replay-shell-{}".format(next(self._ids))
+
+    def close_shell(self, shell_id):
+        pass
+
+    def run_command(self, shell_id, command, *args, **kwargs):
+        # pylint: disable=unused-argument
+        command_id = "replay-command-{}".format(next(self._ids))
+        self._commands[command_id] = _Fingerprint(command)
+        return command_id
+
+    def send_command_input(self, shell_id, command_id, data, end=False):
+        # pylint: disable=unused-argument
+        self._commands[command_id].feed(data)
+
+    def _raw_get_command_output(self, shell_id, command_id):
+        stdout, stderr, exit_code = self._session.play(
+            self._commands[command_id])
+        return stdout, stderr, exit_code, True
+
+    def cleanup_command(self, shell_id, command_id):
+        self._commands.pop(command_id, None)
@@ -16,32 +16,106 @@
 #    under the License.
 
 import base64
+import codecs
+import collections
 import functools
-
-try:
-    import StringIO
-except ImportError:
-    import io as StringIO
-
-import multiprocessing
+import hashlib
 from multiprocessing import pool
+import os
+import socket
+import threading
 import time
+import uuid
 
+import requests
 import six
+from winrm import exceptions as winrm_exceptions
 from winrm import protocol
 
 from argus.action_manager.windows import get_windows_action_manager
 from argus.client import base
+from argus.client import session
 from argus import config as argus_config
 from argus import exceptions
 from argus import log as argus_log
+from argus import profiling
 from argus import util
 
 
 LOG = argus_log.LOG
 CONFIG = argus_config.CONFIG
 CODEPAGE_UTF8 = 65001
-THREADS = 1
+
+# Each chunk of an upload is sent as a base64 encoded PowerShell line
+# on the standard input of a remote process, which is base64 encoded
+# again in the SOAP envelope. 64 KiB of raw data end up as ~117 KB,
+# which fits the default WinRM envelope size of 150 KB.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# A PowerShell process which runs the lines received on its stdin.
+STDIN_POWERSHELL = "powershell -NoProfile -NonInteractive -Command -"
+# The default size of the ranges read by a download.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# The defaults of the multi-stream uploads.
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_STREAMS = 4
+_BYTES_IN_MB = 1024.0 * 1024.0
+
+# Errors which tell us that a shell can't be used anymore,
+# usually because the instance was rebooted in the meantime.
+SHELL_ERRORS = (
+    socket.error,
+    requests.ConnectionError,
+    requests.Timeout,
+    winrm_exceptions.WinRMError,
+    winrm_exceptions.WinRMTransportError,
+)
+
+Shell = collections.namedtuple("Shell", "protocol shell_id")
+
+# An unauthenticated WS-Management Identify request, which is answered
+# by the WinRM service as soon as it listens, without opening a shell.
+_IDENTIFY_REQUEST = (
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:wsmid="http://schemas.dmtf.org/wbem/wsman/identity/1/'
+    'wsmanidentity.xsd"><s:Header/><s:Body><wsmid:Identify/></s:Body>'
+    '</s:Envelope>')
+_IDENTIFY_HEADERS = {
+    "Content-Type": "application/soap+xml;charset=UTF-8",
+    "WSMANIDENTIFY": "unauthenticated",
+}
+
+
+def probe_tcp(host, port, timeout):
+    """Check if the given port accepts TCP connections."""
+    try:
+        connection = socket.create_connection((host, port), timeout=timeout)
+    except socket.error:
+        return False
+    connection.close()
+    return True
+
+
+def probe_identify(url, timeout):
+    """Check if the WS-Management endpoint answers an Identify request.
+
+    The endpoints which don't allow the unauthenticated Identify
+    requests reject them with 401, which still tells that the
+    WinRM service is listening.
+    """
+    try:
+        response = requests.post(url, data=_IDENTIFY_REQUEST,
+                                 headers=_IDENTIFY_HEADERS,
+                                 timeout=timeout, verify=False)
+    except requests.RequestException:
+        return False
+    if response.status_code == 401:
+        return True
+    return (response.status_code == 200 and
+            b"IdentifyResponse" in response.content)
+
+
+_SHELL_POOLS = {}
+_SHELL_POOLS_LOCK = threading.Lock()
 
 
 def _encode(data):
@@ -51,12 +125,412 @@ def _encode(data):
     return encoded
 
 
-def _base64_read_file(filepath, size=2048):
-    with open(filepath, 'rb') as stream:
-        reader = functools.partial(stream.read, size)
-        for data in iter(reader, b''):
-            encoded = _encode(data)
-            yield encoded
+def _quote(value):
+    """Quote the given value as a PowerShell literal string."""
+    return "'{}'".format(value.replace("'", "''"))
+
+
+# Prints the SHA-256 of a remote file, as an upper case hex string.
+_HASH_FUNCTION = (
+    "function Get-ArgusHash($path) { "
+    "$stream = [IO.File]::Open($path, 'Open', 'Read', 'ReadWrite'); "
+    "try { $hash = [Security.Cryptography.SHA256]::Create()"
+    ".ComputeHash($stream) } finally { $stream.Close() }; "
+    "[BitConverter]::ToString($hash).Replace('-', '') }")
+_SCRIPT_PROLOGUE = "$ErrorActionPreference = 'Stop'; " + _HASH_FUNCTION
+
+
+def _upload_script(stream, remote_destination, digest,
+                   chunk_size=UPLOAD_CHUNK_SIZE):
+    """Generate the PowerShell lines which write the stream remotely.
+
+    The data is written with a raw file stream in a temporary file,
+    whose SHA-256 is printed after it was moved over the remote
+    destination. The `digest` object is updated with every chunk
+    that is read from the stream.
+    """
+    temporary = _quote(remote_destination + ".argus-upload")
+    yield _SCRIPT_PROLOGUE
+    yield ("$argusStream = [IO.File]::Open({}, [IO.FileMode]::Create, "
+           "[IO.FileAccess]::Write)".format(temporary))
+    for data in iter(functools.partial(stream.read, chunk_size), b''):
+        digest.update(data)
+        yield ("$argusData = [Convert]::FromBase64String('{}'); "
+               "$argusStream.Write($argusData, 0, $argusData.Length)"
+               .format(_encode(data)))
+    yield "$argusStream.Close()"
+    yield ("Move-Item -Force -LiteralPath {} -Destination {}"
+           .format(temporary, _quote(remote_destination)))
+    yield "Get-ArgusHash {}".format(_quote(remote_destination))
+
+
+def _write_script(data, remote_destination):
+    """Generate the lines which write the data, unless it is already there.
+
+    The upload is skipped when the remote file has the same SHA-256
+    as the data, in which case `unchanged` is printed instead of
+    the SHA-256 of the written file.
+    """
+    path = _quote(remote_destination)
+    yield _SCRIPT_PROLOGUE
+    yield ("$argusWrite = -not ((Test-Path -LiteralPath {path}) -and "
+           "((Get-ArgusHash {path}) -eq '{digest}'))"
+           .format(path=path,
+                   digest=hashlib.sha256(data).hexdigest().upper()))
+    lines = _upload_script(six.BytesIO(data), remote_destination,
+                           hashlib.sha256())
+    next(lines)
+    for line in lines:
+        yield "if ($argusWrite) {{ {} }}".format(line)
+    yield "if (-not $argusWrite) { 'unchanged' }"
+
+
+def _stat_script(remote_path):
+    """Get the command which prints the size and the SHA-256 of a file."""
+    return ("{prologue}; (Get-Item -LiteralPath {path}).Length; "
+            "Get-ArgusHash {path}".format(prologue=_SCRIPT_PROLOGUE,
+                                          path=_quote(remote_path)))
+
+
+def _read_range_script(remote_path, offset, length):
+    """Get the command which prints a range of a file, base64 encoded.
+
+    The file can be read even if it is still open for writing,
+    as it happens for the logs of a running service.
+    """
+    return ("$argusStream = [IO.File]::Open({path}, 'Open', 'Read', "
+            "'ReadWrite'); try {{ [void]$argusStream.Seek({offset}, "
+            "'Begin'); $argusData = New-Object byte[] {length}; "
+            "$argusRead = $argusStream.Read($argusData, 0, {length}) }} "
+            "finally {{ $argusStream.Close() }}; "
+            "[Convert]::ToBase64String($argusData, 0, $argusRead)"
+            .format(path=_quote(remote_path), offset=offset, length=length))
+
+
+def _digests_script(remote_paths):
+    """Generate the lines which print the SHA-256 of the given files.
+
+    A dash is printed instead for the files which don't exist.
+    """
+    yield _SCRIPT_PROLOGUE
+    for remote_path in remote_paths:
+        yield ("if (Test-Path -LiteralPath {path}) "
+               "{{ Get-ArgusHash {path} }} else {{ '-' }}"
+               .format(path=_quote(remote_path)))
+
+
+def _assemble_script(remote_parts, remote_destination):
+    """Generate the lines which concatenate the parts of a file.
+
+    The parts are removed after they are copied and the SHA-256
+    of the assembled file is printed.
+    """
+    temporary = _quote(remote_destination + ".argus-upload")
+    yield _SCRIPT_PROLOGUE
+    yield ("$argusStream = [IO.File]::Open({}, [IO.FileMode]::Create, "
+           "[IO.FileAccess]::Write); "
+           "$argusBuffer = New-Object byte[] 1048576".format(temporary))
+    for remote_part in remote_parts:
+        yield ("$argusPart = [IO.File]::OpenRead({path}); "
+               "while (($argusRead = $argusPart.Read($argusBuffer, 0, "
+               "$argusBuffer.Length)) -gt 0) "
+               "{{ $argusStream.Write($argusBuffer, 0, $argusRead) }}; "
+               "$argusPart.Close(); Remove-Item -LiteralPath {path}"
+               .format(path=_quote(remote_part)))
+    yield "$argusStream.Close()"
+    yield ("Move-Item -Force -LiteralPath {} -Destination {}"
+           .format(temporary, _quote(remote_destination)))
+    yield "Get-ArgusHash {}".format(_quote(remote_destination))
+
+
+# Runs a base64 encoded command and prints a single line with its
+# index, its exit code and its base64 encoded stdout and stderr, all
+# of them prefixed by the marker of the batch. The lines written by
+# the native commands on their standard error don't fail them, only
+# their exit codes do, as when they are run on their own.
+_BATCH_FUNCTION = (
+    "function Invoke-ArgusCommand($index, $command) { "
+    "$global:LASTEXITCODE = 0; $code = 0; "
+    "$block = [ScriptBlock]::Create([Text.Encoding]::UTF8.GetString("
+    "[Convert]::FromBase64String($command))); "
+    "try { $output = @(& $block 2>&1) } "
+    "catch { $output = @($_); $code = 1 }; "
+    "$errors = @($output | Where-Object "
+    "{ $_ -is [Management.Automation.ErrorRecord] }); "
+    "$stdout = $output | Where-Object "
+    "{ -not ($_ -is [Management.Automation.ErrorRecord]) } | Out-String; "
+    "$stderr = $errors | Out-String; "
+    "$failures = @($errors | Where-Object "
+    "{ $_.FullyQualifiedErrorId -notlike 'NativeCommandError*' }); "
+    "if ($LASTEXITCODE) { $code = $LASTEXITCODE } "
+    "elseif ($failures.Count -and -not $code) { $code = 1 }; "
+    "'{0}:{1}:{2}:{3}:{4}' -f $argusMarker, $index, $code, "
+    "[Convert]::ToBase64String([Text.Encoding]::UTF8.GetBytes($stdout)), "
+    "[Convert]::ToBase64String([Text.Encoding]::UTF8.GetBytes($stderr)) }")
+
+
+def _batch_script(commands, marker):
+    """Generate the lines which run every command of a batch."""
+    yield "$argusMarker = {}".format(_quote(marker))
+    yield _BATCH_FUNCTION
+    for index, command in enumerate(commands):
+        yield "Invoke-ArgusCommand {} '{}'".format(
+            index, _encode(command.encode("utf-8")))
+
+
+def _staged_script(script, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Generate the lines which run a script too long for a command line.
+
+    The script is written in a temporary file, which is run by a new
+    PowerShell process and removed afterwards. The exit code of the
+    script becomes the exit code of the command.
+    """
+    # Without a byte order mark, PowerShell reads the script
+    # with the ANSI code page.
+    encoded = _encode(codecs.BOM_UTF8 + script.encode("utf-8"))
+    yield "$argusScript = New-Object Text.StringBuilder"
+    for index in range(0, len(encoded), chunk_size):
+        yield "[void]$argusScript.Append('{}')".format(
+            encoded[index:index + chunk_size])
+    yield ("$argusPath = Join-Path ([IO.Path]::GetTempPath()) "
+           "'argus-{}.ps1'".format(uuid.uuid4().hex))
+    yield ("[IO.File]::WriteAllBytes($argusPath, "
+           "[Convert]::FromBase64String($argusScript.ToString()))")
+    yield "& " + util.get_command("$argusPath",
+                                  util.POWERSHELL_SCRIPT_BYPASS)
+    yield "$argusCode = $LASTEXITCODE"
+    yield "Remove-Item -LiteralPath $argusPath"
+    yield "exit $argusCode"
+
+
+def _stdin_lines(lines):
+    return (line.encode("utf-8") + b"\r\n" for line in lines)
+
+
+def _command_line(command, command_type, stdin):
+    """Get the command line and the standard input which run a command.
+
+    The PowerShell commands which are too long for a command line
+    are staged in a script file instead, through the standard input,
+    since the instance would refuse them.
+    """
+    command_line = util.get_command(command, command_type)
+    if (command_type == util.POWERSHELL and stdin is None and
+            not util.fits_command_line(command_line)):
+        LOG.debug("Staging a command of %d characters in a script file.",
+                  len(command))
+        return STDIN_POWERSHELL, _stdin_lines(_staged_script(command))
+    return command_line, stdin
+
+
+def _parse_batch_output(stdout, marker, count):
+    """Get the stdout, stderr and exit code of every batched command."""
+    if isinstance(stdout, six.binary_type):
+        stdout = stdout.decode("utf-8", "replace")
+    results = [None] * count
+    for line in stdout.splitlines():
+        fields = line.strip().split(":")
+        if len(fields) != 5 or fields[0] != marker:
+            continue
+        index, exit_code = int(fields[1]), int(fields[2])
+        results[index] = (
+            util.sanitize_command_output(base64.b64decode(fields[3])),
+            base64.b64decode(fields[4]).decode("utf-8", "replace"),
+            exit_code)
+    missing = [index for index, result in enumerate(results)
+               if result is None]
+    if missing:
+        raise exceptions.ArgusError(
+            "The batch has no results for the commands {!r}: {!r}"
+            .format(missing, stdout))
+    return results
+
+
+def _output_lines(stdout):
+    if isinstance(stdout, six.binary_type):
+        stdout = stdout.decode("utf-8", "replace")
+    return [line.strip().lower()
+            for line in stdout.strip().splitlines()]
+
+
+def _check_digest(stdout, remote_destination, expected):
+    lines = _output_lines(stdout)
+    remote_digest = lines[-1] if lines else ""
+    if remote_digest != expected:
+        raise exceptions.ArgusError(
+            "The checksum of {!r} does not match the uploaded data: "
+            "{!r} != {!r}.".format(remote_destination, remote_digest,
+                                   expected))
+
+
+class _RangeReader(object):
+    """Read at most `length` bytes of a file, starting from `offset`."""
+
+    def __init__(self, stream, offset, length):
+        self._stream = stream
+        self._stream.seek(offset)
+        self._left = length
+
+    def read(self, size):
+        data = self._stream.read(min(size, self._left))
+        self._left -= len(data)
+        return data
+
+
+_Part = collections.namedtuple("_Part", "index offset length remote_path "
+                                        "digest")
+
+
+def _split_file(path, remote_path, part_size):
+    """Split a local file into parts, computing their SHA-256.
+
+    :returns:
+        A tuple of the list of :class:`_Part` and the SHA-256
+        of the whole file.
+    """
+    parts = []
+    whole = hashlib.sha256()
+    # Even an empty file has a part.
+    offsets = range(0, os.path.getsize(path), part_size) or [0]
+    with open(path, 'rb') as stream:
+        for index, offset in enumerate(offsets):
+            data = stream.read(part_size)
+            whole.update(data)
+            parts.append(_Part(index, offset, len(data),
+                               "{}.part{}".format(remote_path, index),
+                               hashlib.sha256(data).hexdigest()))
+    return parts, whole.hexdigest()
+
+
+class _ShellUnavailable(Exception):
+    """The shell refused a command before executing it."""
+
+    def __init__(self, error):
+        super(_ShellUnavailable, self).__init__(error)
+        self.error = error
+
+
+class ShellPool(object):
+    """A bounded pool of open shells for the same WinRM endpoint.
+
+    Opening and closing a remote shell are round trips of their own,
+    so instead of doing them for every command, the idle shells are
+    kept open and handed over to the next command.
+
+    The pool doesn't know how to open shells, every client gives
+    its own opener when it acquires one, so the pool doesn't keep
+    the clients alive.
+
+    :param size:
+        The maximum number of idle shells kept open. The shells
+        released while the pool is full are closed.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    @property
+    def stats(self):
+        """The counters of the pool, as a dictionary."""
+        return {"hits": self.hits, "misses": self.misses,
+                "discarded": self.discarded, "idle": len(self._idle)}
+
+    def acquire(self, opener):
+        """Get a shell, opening a new one if there is no idle shell.
+
+        :param opener:
+            A callable which opens a new remote shell and returns
+            a :class:`Shell`.
+
+        :returns:
+            A tuple of two elements, the :class:`Shell` and a flag
+            which tells if the shell was reused from the pool.
+        """
+        with self._lock:
+            if self._idle:
+                self.hits += 1
+                return self._idle.popleft(), True
+            self.misses += 1
+        return opener(), False
+
+    def release(self, shell):
+        """Give back a healthy shell to the pool."""
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(shell)
+                return
+        self._close(shell)
+
+    def discard(self, shell):
+        """Forget about a shell which can't be used anymore."""
+        with self._lock:
+            self.discarded += 1
+        try:
+            shell.protocol.close_shell(shell.shell_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug("Could not close the discarded shell %s: %r",
+                      shell.shell_id, exc)
+
+    def invalidate(self):
+        """Drop all the idle shells, without closing them remotely.
+
+        Useful when the instance was rebooted and the shells
+        died with it.
+        """
+        with self._lock:
+            self.discarded += len(self._idle)
+            self._idle.clear()
+
+    def close(self):
+        """Close all the idle shells."""
+        with self._lock:
+            shells = list(self._idle)
+            self._idle.clear()
+        for shell in shells:
+            self._close(shell)
+
+    @staticmethod
+    def _close(shell):
+        try:
+            shell.protocol.close_shell(shell.shell_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug("Could not close the shell %s: %r",
+                      shell.shell_id, exc)
+
+
+def get_shell_pool(key):
+    """Get the shell pool for the given key.
+
+    The pools are shared between all the clients which connect
+    to the same endpoint, using the same credentials and the
+    same kind of shells, see :meth:`WinRemoteClient._pool_key`.
+    """
+    with _SHELL_POOLS_LOCK:
+        shell_pool = _SHELL_POOLS.get(key)
+        if shell_pool is None:
+            shell_pool = ShellPool(CONFIG.argus.shell_pool_size)
+            _SHELL_POOLS[key] = shell_pool
+        return shell_pool
+
+
+def get_endpoint(hostname, transport_protocol='http', port=None):
+    """Get the address and the URL of a WinRM endpoint.
+
+    :param port:
+        The port of the WinRM listener. If it is not given, the
+        default port for the transport protocol will be used.
+    :returns: A tuple of the (host, port) address and the URL.
+    """
+    if port is None:
+        port = 5985 if transport_protocol == 'http' else 5986
+    url = "{protocol}://{hostname}:{port}/wsman".format(
+        protocol=transport_protocol, hostname=hostname, port=port)
+    return (hostname, port), url
 
 
 class WinRemoteClient(base.BaseClient):
@@ -72,16 +546,34 @@ class WinRemoteClient(base.BaseClient):
         Client authentication certificate file path in PEM format.
     :param cert_key:
         Client authentication certificate key file path in PEM format.
+    :param port:
+        The port of the WinRM listener. If it is not given, the
+        default port for the transport protocol will be used.
+    :param instance_id: The ID of the instance.
+    :param os_facts:
+        The facts about the operating system of the instance, found
+        by an earlier client. If they are not given, they are probed
+        when the instance finished booting.
+    :param recorder:
+        An optional :class:`argus.client.session.Recorder`, which
+        records every command run by the client.
     """
     def __init__(self, hostname, username, password,
                  transport_protocol='http',
-                 cert_pem=None, cert_key=None):
+                 cert_pem=None, cert_key=None, port=None, instance_id=None,
+                 recorder=None, os_facts=None):
         super(WinRemoteClient, self).__init__(hostname, username, password,
                                               cert_pem, cert_key)
-        self._hostname = "{protocol}://{hostname}:{port}/wsman".format(
-            protocol=transport_protocol,
-            hostname=hostname,
-            port=5985 if transport_protocol == 'http' else 5986)
+        self.instance_id = instance_id
+        self.os_facts = os_facts
+        self.recorder = recorder
+        # The number of calls sent to the instance, any of which
+        # might have changed its files.
+        self.remote_calls = 0
+        self._calls_lock = threading.Lock()
+        self._address, self._hostname = get_endpoint(
+            hostname, transport_protocol, port)
+        self._shell_pool = get_shell_pool(self._pool_key())
         self.manager = get_windows_action_manager(self)
 
     @staticmethod
@@ -90,55 +582,250 @@ class WinRemoteClient(base.BaseClient):
                                     CONFIG.argus.retry_delay)
 
     @staticmethod
-    def _run_command(protocol_client, shell_id, command,
+    def _get_command_output(protocol_client, shell_id, command_id,
+                            upper_timeout):
+        """Wait for the output of a command, for at most `upper_timeout`.
+
+        Every receive request is bounded by the operation timeout of
+        the WinRM protocol, so the deadline is checked between
+        them, without needing a separate thread for waiting.
+        """
+        deadline = time.time() + upper_timeout
+        stdout_buffer, stderr_buffer = [], []
+        while True:
+            try:
+                # pylint: disable=protected-access
+                stdout, stderr, exit_code, done = (
+                    protocol_client._raw_get_command_output(
+                        shell_id, command_id))
+            except winrm_exceptions.WinRMOperationTimeoutError:
+                # Nothing was written by the command in the meantime.
+                pass
+            else:
+                stdout_buffer.append(stdout)
+                stderr_buffer.append(stderr)
+                if done:
+                    return (b"".join(stdout_buffer),
+                            b"".join(stderr_buffer), exit_code)
+            if time.time() >= deadline:
+                return None
+
+    @classmethod
+    def _run_command(cls, protocol_client, shell_id, command,
                      command_type=util.POWERSHELL,
-                     upper_timeout=CONFIG.argus.upper_timeout):
+                     upper_timeout=CONFIG.argus.upper_timeout,
+                     stdin=None):
+        """Run a command in the given shell.
+
+        :param stdin:
+            An optional iterable of byte strings, which are sent in
+            order to the standard input of the command, which is
+            closed afterwards.
+        """
         command_id = None
         bare_command = command
-        thread_pool = pool.ThreadPool(processes=THREADS)
 
-        command = util.get_command(command, command_type)
+        command, stdin = _command_line(command, command_type, stdin)
+
+        with profiling.span(profiling.COMMAND, command_type,
+                            sent=len(command), received=0) as details:
+            try:
+                try:
+                    command_id = protocol_client.run_command(shell_id,
+                                                             command)
+                except SHELL_ERRORS as exc:
+                    raise _ShellUnavailable(exc)
+
+                if stdin is not None:
+                    for data in stdin:
+                        details["sent"] += len(data)
+                        protocol_client.send_command_input(
+                            shell_id, command_id, data)
+                    protocol_client.send_command_input(
+                        shell_id, command_id, b"", end=True)
+
+                result = cls._get_command_output(protocol_client, shell_id,
+                                                 command_id, upper_timeout)
+                if result is None:
+                    # The command is terminated by the cleanup below.
+                    raise exceptions.ArgusTimeoutError(
+                        "The command '{cmd}' has timed out."
+                        .format(cmd=bare_command))
+
+                stdout, stderr, exit_code = result
+                details["received"] = len(stdout) + len(stderr)
+                if exit_code:
+                    output = b"\n\n".join(
+                        [out for out in (stdout, stderr) if out])
+                    raise exceptions.ArgusError(
+                        "Executing command {command!r} with encoded Command"
+                        "{encoded_command!r} failed with exit code "
+                        "{exit_code!r} and output {output!r}."
+                        .format(command=bare_command,
+                                encoded_command=command,
+                                exit_code=exit_code,
+                                output=output))
+
+                return (util.sanitize_command_output(stdout), stderr,
+                        exit_code)
+            finally:
+                if command_id:
+                    protocol_client.cleanup_command(shell_id, command_id)
+
+    def _pool_key(self):
+        """Get the key of the shell pool used by the client.
+
+        The shells are opened through the protocol of the client
+        and its recorder, so only the clients which open the same
+        kind of shells can share them.
+        """
+        return (type(self), self._hostname, self._username, self._password,
+                self._cert_pem, self._cert_key, self.recorder)
+
+    def _open_shell(self):
+        """Open a new remote shell."""
+        protocol_client = self._get_protocol()
+        if self.recorder is not None:
+            protocol_client = session.RecordingProtocol(protocol_client,
+                                                        self.recorder)
+        with profiling.span(profiling.SHELL, "open_shell"):
+            shell_id = self.exec_with_retry(lambda: (
+                protocol_client.open_shell(codepage=CODEPAGE_UTF8)))
+        return Shell(protocol_client, shell_id)
 
+    def wait_for_endpoint(self, timeout=None, interval=None,
+                          probe_timeout=None):
+        """Wait until the WinRM endpoint is able to answer requests.
+
+        Cheap probes are used, which don't wait for the long timeouts
+        of the WinRM protocol: first a TCP connection to the port of
+        the endpoint, then an unauthenticated WS-Management Identify
+        request. The defaults are taken from the readiness options.
+
+        :returns:
+            An ordered dictionary with the seconds spent
+            waiting for every probe.
+        """
+        options = CONFIG.argus
+        deadline = time.time() + (timeout or options.readiness_timeout)
+        interval = interval or options.readiness_probe_interval
+        probe_timeout = probe_timeout or options.readiness_probe_timeout
+
+        host, port = self._address
+        probes = (
+            ("tcp", lambda: probe_tcp(host, port, probe_timeout)),
+            ("identify", lambda: probe_identify(self._hostname,
+                                                probe_timeout)),
+        )
+        stages = collections.OrderedDict()
+        for stage, probe in probes:
+            start = time.time()
+            while not probe():
+                if time.time() + interval > deadline:
+                    raise exceptions.ArgusTimeoutError(
+                        "The WinRM endpoint {} did not pass the {} probe "
+                        "in time.".format(self._hostname, stage))
+                time.sleep(interval)
+            stages[stage] = time.time() - start
+        return stages
+
+    @property
+    def shell_pool_stats(self):
+        """The hit and miss counters of the underlying shell pool."""
+        return self._shell_pool.stats
+
+    def invalidate_shells(self):
+        """Forget the pooled shells, because the instance rebooted."""
+        self._shell_pool.invalidate()
+
+    def close(self):
+        """Close the shells which are kept open by this client."""
+        self._shell_pool.close()
+
+    def _with_shell(self, action):
+        """Call `action` with a shell from the pool and return its result.
+
+        The shell is given back to the pool, unless it can't be
+        trusted anymore.
+        """
+        with self._calls_lock:
+            self.remote_calls += 1
+        shell, reused = self._shell_pool.acquire(self._open_shell)
         try:
-            command_id = protocol_client.run_command(shell_id, command)
-
-            result = thread_pool.apply_async(
-                protocol_client.get_command_output,
-                args=(shell_id, command_id))
-            stdout, stderr, exit_code = result.get(
-                timeout=upper_timeout)
-            if exit_code:
-                output = "\n\n".join([out for out in (stdout, stderr) if out])
-                raise exceptions.ArgusError(
-                    "Executing command {command!r} with encoded Command"
-                    "{encoded_command!r} failed with exit code {exit_code!r}"
-                    " and output {output!r}."
-                    .format(command=bare_command,
-                            encoded_command=command,
-                            exit_code=exit_code,
-                            output=output))
-
-            return util.sanitize_command_output(stdout), stderr, exit_code
-        except multiprocessing.TimeoutError:
-            raise exceptions.ArgusTimeoutError(
-                "The command '{cmd}' has timed out.".format(cmd=bare_command))
-        finally:
-            thread_pool.terminate()
-            protocol_client.cleanup_command(shell_id, command_id)
+            result = action(shell)
+        except _ShellUnavailable as exc:
+            self._shell_pool.discard(shell)
+            if not reused:
+                raise exc.error
+            # The shell died while it was idle, probably because the
+            # instance was rebooted, so the other idle shells are dead
+            # as well. Nothing was executed yet, so retry on a new shell.
+            LOG.debug("The pooled shell %s is not usable anymore (%r), "
+                      "opening a new one.", shell.shell_id, exc.error)
+            self._shell_pool.invalidate()
+            return self._with_shell(action)
+        except exceptions.ArgusTimeoutError:
+            # The command might still run in the shell.
+            self._shell_pool.discard(shell)
+            raise
+        except exceptions.ArgusError:
+            self._shell_pool.release(shell)
+            raise
+        except Exception:
+            self._shell_pool.discard(shell)
+            raise
+        self._shell_pool.release(shell)
+        return result
 
     def _run_commands(self, commands, commands_type=util.POWERSHELL,
                       upper_timeout=CONFIG.argus.upper_timeout):
-        protocol_client = self._get_protocol()
-        shell_id = self.exec_with_retry(lambda: (protocol_client.open_shell(
-            codepage=CODEPAGE_UTF8)))
+        def run(shell):
+            results = []
+            for command in commands:
+                try:
+                    results.append(self._run_command(
+                        shell.protocol, shell.shell_id, command,
+                        commands_type, upper_timeout))
+                except _ShellUnavailable as exc:
+                    if results:
+                        # Some commands were already executed.
+                        raise exc.error
+                    raise
+            return results
 
-        try:
-            results = [self._run_command(protocol_client, shell_id, command,
-                                         commands_type, upper_timeout)
-                       for command in commands]
-        finally:
-            protocol_client.close_shell(shell_id)
-        return results
+        return self._with_shell(run)
+
+    def _run_stdin_script(self, lines, upper_timeout):
+        """Run the given PowerShell lines, fed through the standard input.
+
+        Unlike the encoded commands, the script is not limited by
+        the maximum length of a command line.
+        """
+        stdin = _stdin_lines(lines)
+        return self._with_shell(lambda shell: self._run_command(
+            shell.protocol, shell.shell_id, STDIN_POWERSHELL,
+            command_type=util.CMD, upper_timeout=upper_timeout,
+            stdin=stdin))
+
+    def run_batch(self, commands, upper_timeout=CONFIG.argus.upper_timeout):
+        """Run many independent PowerShell commands with one round trip.
+
+        The commands are sent together in a single script, which
+        runs each of them on its own, even if the previous ones failed.
+
+        :param commands: A list of PowerShell commands.
+        :rtype: list
+        :returns:
+            A tuple of stdout, stderr and exit code for every command,
+            in the order of the given commands. Failed commands
+            don't raise, their exit codes have to be checked.
+        """
+        if not commands:
+            return []
+        marker = "argus-batch-{}".format(uuid.uuid4().hex)
+        stdout, _, _ = self._run_stdin_script(
+            _batch_script(commands, marker), upper_timeout)
+        return _parse_batch_output(stdout, marker, len(commands))
 
     def _get_protocol(self):
         protocol.Protocol.DEFAULT_TIMEOUT = "PT3600S"
@@ -161,53 +848,215 @@ class WinRemoteClient(base.BaseClient):
         return self._run_commands([cmd], command_type,
                                   upper_timeout=upper_timeout)[0]
 
+    def upload_stream(self, stream, remote_destination,
+                      upper_timeout=CONFIG.argus.io_upper_timeout):
+        """Write the content of a binary stream in the remote destination.
+
+        The data is sent in large chunks to a single remote process,
+        which writes it to a temporary file, moved afterwards over
+        the remote destination. The SHA-256 of the remote file is
+        checked against the one of the uploaded data.
+
+        :returns: The hex digest of the uploaded data.
+        """
+        digest = hashlib.sha256()
+        lines = _upload_script(stream, remote_destination, digest)
+        stdout, _, _ = self._run_stdin_script(lines, upper_timeout)
+        _check_digest(stdout, remote_destination, digest.hexdigest())
+        return digest.hexdigest()
+
+    def _remote_digests(self, remote_paths):
+        """Get the SHA-256 of the given remote files, in a single command.
+
+        The files which don't exist get a dash instead.
+        """
+        stdout, _, _ = self._run_stdin_script(
+            _digests_script(remote_paths), CONFIG.argus.io_upper_timeout)
+        digests = _output_lines(stdout)
+        if len(digests) != len(remote_paths):
+            raise exceptions.ArgusError(
+                "Expected {} checksums, got: {!r}".format(
+                    len(remote_paths), stdout))
+        return digests
+
+    def _upload_part(self, path, part, upper_timeout):
+        with open(path, 'rb') as stream:
+            self.upload_stream(_RangeReader(stream, part.offset, part.length),
+                               part.remote_path, upper_timeout)
+        LOG.debug("Uploaded part %d of %s (%d bytes).",
+                  part.index, path, part.length)
+
+    def _upload_parts(self, path, parts, streams, upper_timeout):
+        """Upload the given parts over concurrent shells.
+
+        Every part is waited for, even if some of them failed, so
+        that the verified ones can be reused. The first error is
+        raised afterwards.
+        """
+        workers = pool.ThreadPool(min(streams, len(parts)))
+        try:
+            results = [workers.apply_async(self._upload_part,
+                                           (path, part, upper_timeout))
+                       for part in parts]
+            errors = []
+            for result in results:
+                try:
+                    result.get()
+                except Exception as exc:  # pylint: disable=broad-except
+                    errors.append(exc)
+        finally:
+            workers.close()
+            workers.join()
+        if errors:
+            raise errors[0]
+
+    def upload(self, path, remote_path, streams=UPLOAD_STREAMS,
+               part_size=UPLOAD_PART_SIZE,
+               retry_count=CONFIG.argus.retry_count,
+               upper_timeout=CONFIG.argus.io_upper_timeout):
+        """Upload a big file over multiple concurrent shells.
+
+        The file is split in parts of `part_size` bytes, which are
+        uploaded by `streams` concurrent shells in part files next
+        to the remote path. The parts are assembled remotely once all
+        of them were uploaded.
+
+        Every part is verified by its SHA-256, and the parts which
+        are already present remotely are not uploaded again. This
+        means that an upload interrupted by a timeout is resumed
+        from the verified parts, at most `retry_count` times, and
+        so is a later upload of the same file after a failure.
+
+        :param upper_timeout:
+            The timeout for the upload of each part.
+        :returns: The hex digest of the uploaded file.
+        """
+        size = os.path.getsize(path)
+        start = time.time()
+        parts, digest = _split_file(path, remote_path, part_size)
+
+        for attempt in range(retry_count + 1):
+            remote_digests = self._remote_digests(
+                [part.remote_path for part in parts])
+            pending = [part for part, remote_digest
+                       in zip(parts, remote_digests)
+                       if remote_digest != part.digest]
+            LOG.debug("Uploading %d of the %d parts of %s.",
+                      len(pending), len(parts), path)
+            if not pending:
+                break
+            try:
+                self._upload_parts(path, pending, streams, upper_timeout)
+            except exceptions.ArgusTimeoutError as exc:
+                if attempt == retry_count:
+                    raise
+                LOG.warning("Uploading %s timed out (%s), resuming from "
+                            "the verified parts.", path, exc)
+            else:
+                break
+
+        stdout, _, _ = self._run_stdin_script(
+            _assemble_script([part.remote_path for part in parts],
+                             remote_path),
+            CONFIG.argus.io_upper_timeout)
+        _check_digest(stdout, remote_path, digest)
+
+        elapsed = max(time.time() - start, 1e-6)
+        LOG.info("Uploaded %s (%d bytes) to %s over %d streams in "
+                 "%.2f seconds (%.2f MB/s).", path, size, remote_path,
+                 streams, elapsed, size / _BYTES_IN_MB / elapsed)
+        return digest
+
     def copy_file(self, filepath, remote_destination):
         """Copy the given file-path in the remote destination.
 
         The remote destination is the file name where the content
-        of file-path will be written.
+        of file-path will be written. The content is copied as it is,
+        so binary files are supported as well.
         """
+        size = os.path.getsize(filepath)
+        start = time.time()
+        with open(filepath, 'rb') as stream:
+            self.upload_stream(stream, remote_destination)
+        elapsed = max(time.time() - start, 1e-6)
+        LOG.info("Copied %s (%d bytes) to %s in %.2f seconds (%.2f MB/s).",
+                 filepath, size, remote_destination, elapsed,
+                 size / _BYTES_IN_MB / elapsed)
 
-        # TODO(cpopa): This powershell dance is a little complicated,
-        # find a simpler way to send a file over a remote server,
-        # without relying on OpenStack infra.
-        get_string_cmd = ("[System.Text.Encoding]::UTF8.GetString("
-                          "[System.Convert]::FromBase64String('{}'))")
-        commands = []
-        for command in _base64_read_file(filepath):
-            remote_command = (
-                "{content} >> '{remote_destination}'"
-                .format(content=get_string_cmd.format(command),
-                        remote_destination=remote_destination))
+    def download(self, remote_path, local_path,
+                 chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Download a remote file straight to a local file.
 
-            commands.append(remote_command)
-        self._run_commands(commands, commands_type=util.POWERSHELL)
+        The file is read in ranges of at most `chunk_size` bytes, one
+        command for each range, and every range is decoded and written
+        as soon as it arrives, so neither the instance nor the
+        controller holds more than a chunk in memory. The SHA-256
+        of the downloaded data is checked against the remote one.
 
-    def write_file(self, data, remote_destination):
-        """Copy the given data in the remote destination.
+        :returns: The hex digest of the downloaded file.
+        """
+        start = time.time()
+        stdout, _, _ = self.run_command_with_retry(
+            _stat_script(remote_path),
+            upper_timeout=CONFIG.argus.io_upper_timeout)
+        lines = _output_lines(stdout)
+        try:
+            size, remote_digest = int(lines[0]), lines[1]
+        except (IndexError, ValueError):
+            raise exceptions.ArgusError(
+                "Could not get the size and the checksum of {!r}: {!r}"
+                .format(remote_path, stdout))
 
-        The remote destination is the file name where the content
-        of file-path will be written.
+        digest = hashlib.sha256()
+        offset = 0
+        with open(local_path, 'wb') as stream:
+            while offset < size:
+                stdout, _, _ = self.run_command_with_retry(
+                    _read_range_script(remote_path, offset,
+                                       min(chunk_size, size - offset)),
+                    upper_timeout=CONFIG.argus.io_upper_timeout)
+                data = base64.b64decode(stdout.strip())
+                if not data:
+                    raise exceptions.ArgusError(
+                        "The file {!r} ended after {} bytes, instead of {}."
+                        .format(remote_path, offset, size))
+                stream.write(data)
+                digest.update(data)
+                offset += len(data)
+
+        if digest.hexdigest() != remote_digest:
+            raise exceptions.ArgusError(
+                "The checksum of {!r} does not match the downloaded data: "
+                "{!r} != {!r}.".format(remote_path, remote_digest,
+                                       digest.hexdigest()))
+        elapsed = max(time.time() - start, 1e-6)
+        LOG.info("Downloaded %s (%d bytes) to %s in %.2f seconds "
+                 "(%.2f MB/s).", remote_path, size, local_path, elapsed,
+                 size / _BYTES_IN_MB / elapsed)
+        return digest.hexdigest()
+
+    def write_file(self, data, remote_destination, encoding="utf-8"):
+        """Write the given data in the remote destination.
+
+        The whole data is sent in a single command and replaces
+        atomically the content of the remote file. Nothing is
+        written if the remote file already has the same content.
+
+        :param data: The bytes or the text which will be written.
+        :param encoding: The encoding used for writing text.
+        :returns: True if the file was written, False if it was up to date.
         """
-        # TODO(mmicu): This powershell dance is a little complicated,
-        # find a simpler way to send a file over a remote server,
-        # without relying on OpenStack infra.
-        get_string_cmd = ("[System.Text.Encoding]::UTF8.GetString("
-                          "[System.Convert]::FromBase64String('{}'))")
-        commands = []
-        data = StringIO.StringIO(data)
-        data.seek(0)
-        content = data.read(1024)
-        while content:
-            remote_command = (
-                "{content} >> '{remote_destination}'"
-                .format(content=get_string_cmd.format(_encode(content)),
-                        remote_destination=remote_destination))
-
-            commands.append(remote_command)
-            content = data.read(1024)
-        self._run_commands(commands, commands_type=util.POWERSHELL,
-                           upper_timeout=CONFIG.argus.io_upper_timeout)
+        if isinstance(data, six.text_type):
+            data = data.encode(encoding, "replace")
+        stdout, _, _ = self._run_stdin_script(
+            _write_script(data, remote_destination),
+            CONFIG.argus.io_upper_timeout)
+        lines = _output_lines(stdout)
+        if lines and lines[-1] == "unchanged":
+            return False
+        _check_digest(stdout, remote_destination,
+                      hashlib.sha256(data).hexdigest())
+        return True
 
     def read_file(self, filepath):
         """Get the content of the given file."""
@@ -255,15 +1104,18 @@ class WinRemoteClient(base.BaseClient):
             The number of retries which this function has.
             If the value is ``None``, then the function will retry *forever*.
         :param delay:
-            The number of seconds to sleep when retrying a command.
+            The maximum number of seconds to sleep when retrying
+            a command. The delays grow up to it, as configured
+            by the retry options.
 
         :rtype: tuple
         :returns: stdout, stderr, exit_code
         """
 
         # Countdown normalization.
-        if not count or count < 0:
-            count = 0
+        retries = count - 1 if count and count > 0 else None
+        retrier = util.RetryPolicy.from_config(
+            retries=retries, max_delay=delay).start()
 
         while True:
             try:
@@ -271,27 +1123,27 @@ class WinRemoteClient(base.BaseClient):
                                         upper_timeout=upper_timeout)
             except Exception as exc:  # pylint: disable=broad-except
                 LOG.debug("Command failed with %r.", exc)
-                # A negative `count` means no count at all.
-                if count >= 0:
-                    count -= 1
-                if count == 0:
+                if not retrier.sleep():
                     raise exceptions.ArgusTimeoutError(
                         "Command {!r} failed too many times."
                         .format(cmd))
                 LOG.debug("Retrying '%s'", cmd)
-                time.sleep(delay)
 
     def run_command_until_condition(self, cmd, cond,
                                     retry_count=CONFIG.argus.retry_count,
                                     delay=CONFIG.argus.retry_delay,
                                     command_type=util.POWERSHELL,
-                                    upper_timeout=CONFIG.argus.upper_timeout):
+                                    upper_timeout=CONFIG.argus.upper_timeout,
+                                    wake=None):
         """Run the given `cmd` until a condition `cond` occurs.
 
         :param cond:
             A callable which receives the standard output returned by
             executing the command. It should return a boolean value,
             which tells to this function to stop execution.
+        :param wake:
+            An optional :class:`threading.Event`, which triggers
+            the next retry right away when it is set.
         :raises:
             `ArgusCLIError` if there is output found in the standard error.
 
@@ -302,6 +1154,8 @@ class WinRemoteClient(base.BaseClient):
         # countdown normalization
         if not retry_count or retry_count < 0:
             retry_count = 0
+        retrier = util.RetryPolicy.from_config(
+            retries=retry_count, max_delay=delay).start(wake)
 
         while True:
             try:
@@ -321,11 +1175,8 @@ class WinRemoteClient(base.BaseClient):
                 else:
                     LOG.debug("Condition not met, retrying...")
 
-            if retry_count > 0:
-                retry_count -= 1
-                LOG.debug("Retrying '%s'", cmd)
-                time.sleep(delay)
-            else:
+            if not retrier.sleep():
                 raise exceptions.ArgusTimeoutError(
                     "Command {!r} failed too many times."
                     .format(cmd))
+            LOG.debug("Retrying '%s'", cmd)
@@ -78,8 +78,81 @@ class ArgusOptions(conf_base.Options):
             cfg.IntOpt("retry_count", default=15,
                        help="The retry counts for a failing command."),
             cfg.IntOpt("retry_delay", default=10,
-                       help="The number of seconds between the retries "
-                            " of a failed command."),
+                       help="The maximum number of seconds between the "
+                            "retries of a failed command."),
+            cfg.FloatOpt("retry_initial_delay", default=1,
+                         help="The number of seconds before the first "
+                              "retry of a failed command."),
+            cfg.FloatOpt("retry_multiplier", default=2,
+                         help="The factor by which the delay between the "
+                              "retries of a failed command grows, until it "
+                              "reaches the retry delay."),
+            cfg.FloatOpt("retry_jitter", default=0.1,
+                         help="The fraction by which every delay between "
+                              "retries is randomly varied."),
+            cfg.IntOpt("retry_deadline", default=0,
+                       help="The number of seconds after which a failing "
+                            "command is not retried anymore, regardless "
+                            "of the retry count. It doesn't apply to the "
+                            "commands retried forever. 0 disables the "
+                            "deadline."),
+            cfg.IntOpt("readiness_timeout", default=IO_UPPER_TIMEOUT,
+                       help="The number of seconds to wait for the WinRM "
+                            "endpoint of a booting instance to listen."),
+            cfg.FloatOpt("readiness_probe_interval", default=2,
+                         help="The number of seconds between the probes "
+                              "which check if the WinRM endpoint of a "
+                              "booting instance listens."),
+            cfg.FloatOpt("readiness_probe_timeout", default=3,
+                         help="The timeout of every probe which checks if "
+                              "the WinRM endpoint of a booting instance "
+                              "listens."),
+            cfg.FloatOpt("console_poll_interval", default=5,
+                         help="The number of seconds between the reads of "
+                              "the console output, while following the "
+                              "progress of Cloudbase-Init."),
+            cfg.IntOpt("shell_pool_size", default=2,
+                       help="The number of idle WinRM shells which are kept "
+                            "open and reused for every set of credentials "
+                            "used to connect to an instance."),
+            cfg.BoolOpt("async_winrm", default=False,
+                        help="Send the WinRM requests through the asyncio "
+                             "transport, from a single event loop thread, "
+                             "instead of pywinrm. Needs Python 3.5+."),
+            cfg.IntOpt("scenario_concurrency", default=1,
+                       help="The number of scenarios whose instances are "
+                            "prepared at the same time, when the scenarios "
+                            "are run through a scheduler."),
+            cfg.IntOpt("scenario_quota", default=0,
+                       help="The maximum number of instances which can exist "
+                            "at the same time, when the scenarios are run "
+                            "through a scheduler. 0 means no limit."),
+            cfg.IntOpt("recipe_concurrency", default=1,
+                       help="The number of independent recipe steps which "
+                            "run at the same time, while preparing an "
+                            "instance."),
+            cfg.BoolOpt("golden_snapshots", default=False,
+                        help="Install Cloudbase-Init once per kind of "
+                             "instance, in a snapshot from which the "
+                             "instances of the scenarios are booted."),
+            cfg.StrOpt("golden_snapshot_visibility", default="community",
+                       choices=("community", "public"),
+                       help="The visibility of the golden snapshots, which "
+                            "must be bootable from the projects of the "
+                            "other scenarios. Public images usually need "
+                            "an administrator."),
+            cfg.StrOpt("record_directory", default=None,
+                       help="Record the commands run on the instance of "
+                            "every scenario, with their output, in a "
+                            "session file from this directory."),
+            cfg.BoolOpt("record_secrets", default=False,
+                        help="Record the password and the private key "
+                             "of the instances in the session files as "
+                             "well, in plain text."),
+            cfg.StrOpt("replay_directory", default=None,
+                       help="Run the scenarios against the sessions "
+                            "recorded in this directory, instead of "
+                            "creating instances."),
             cfg.BoolOpt("log_each_scenario", default=False,
                         help="Create individual log files for each scenario."),
             cfg.StrOpt(
@@ -42,6 +42,7 @@ class BaseWindowsConfig(base.BaseConfig):
 
     default_config = None
     config_name = None
+    encoding = "utf-8"
 
     """An object that holds the Cloudbase-Init config."""
 
@@ -63,8 +64,10 @@ class BaseWindowsConfig(base.BaseConfig):
     @staticmethod
     def _get_base_conf(config_name):
         """Return a ConfigParser object with default values."""
-        base_conf = StringIO.StringIO(
-            util.get_resource(config_name))
+        resource = util.get_resource(config_name)
+        if isinstance(resource, six.binary_type):
+            resource = resource.decode("utf-8")
+        base_conf = StringIO.StringIO(resource)
         conf = six.moves.configparser.ConfigParser()
 
         # NOTE(dtoncu): `readfp` is deprecated since Python 3.2,
@@ -93,14 +96,16 @@ class BaseWindowsConfig(base.BaseConfig):
             Path to the directory in which the config file is created.
         """
         file_path = ntpath.join(path, self.config_name)
-        if self._client.manager.is_file(file_path):
-            self._client.manager.remove(file_path)
 
         buff = StringIO.StringIO()
         self.conf.write(buff)
         buff.seek(0)
         data = buff.read()
 
+        # The whole file is pushed at once, with Windows line endings.
+        data = "".join(line + "\r\n" for line in data.splitlines())
         LOG.debug("Writing data in file '%s'.", file_path)
-        for line in data.splitlines():
-            self._client.write_file(data=line, remote_destination=file_path)
+        if not self._client.write_file(data=data,
+                                       remote_destination=file_path,
+                                       encoding=self.encoding):
+            LOG.debug("The file '%s' is already up to date.", file_path)
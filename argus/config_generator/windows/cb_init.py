@@ -18,7 +18,6 @@ import six
 
 from argus import config as argus_config
 from argus.config_generator.windows import base
-from argus.introspection.cloud import windows as introspect
 from argus import util
 
 CONFIG = argus_config.CONFIG
@@ -27,6 +26,10 @@ CONFIG = argus_config.CONFIG
 class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
     """An object that holds the Cloudbase-Init config."""
 
+    # NOTE(mmicu): Because python2.x does not support UTF-8 we need to
+    #              write the config file as ASCII.
+    encoding = "ascii"
+
     SERVICES = {
         util.HTTP_SERVICE: "httpservice.HttpService",
         util.CONFIG_DRIVE_SERVICE: "configdrive.ConfigDriveService",
@@ -43,6 +46,9 @@ class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
         """Set a config value in the specified section."""
         if not self.conf.has_section(section) and section != "DEFAULT":
             self.conf.add_section(section)
+        if isinstance(value, (bool, float) + six.integer_types):
+            # The ConfigParser of Python 3 takes only strings.
+            value = str(value)
         self.conf.set(section, name, value)
 
     def _execute(self, cmd, count=CONFIG.argus.retry_count,
@@ -59,7 +65,7 @@ class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
 
     def _config_specific_paths(self):
         """Populate the ConfigParser object with instance specific values."""
-        cbinit_dir = introspect.get_cbinit_dir(self._execute)
+        cbinit_dir = self._client.manager.get_cbinit_dir()
 
         self.set_conf_value("bsdtar_path",
                             ntpath.join(cbinit_dir, r'bin\bsdtar.exe'))
@@ -100,26 +106,6 @@ class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
         conf_value = ",".join(service_type)
         self.set_conf_value("metadata_services", conf_value)
 
-    def apply_config(self, path):
-        """Write the configuration values in the right place.
-
-            Take the current state of the `self.conf` object and
-            write it to the specific path.The name of the file
-            will be `config_name`.
-
-        :param path:
-            Path to the directory in which the config file is created.
-        """
-        super(BasePopulatedCBInitConfig, self).apply_config(path)
-
-        # NOTE(mmicu): Because python2.x does not support UTF-8 we need to
-        #              convert the config file.
-        file_path = ntpath.join(path, self.config_name)
-        cmd = ("(get-content '{filename}')| "
-               "out-file '{filename}' -encoding ascii")
-        self._client.run_command_with_retry(cmd.format(filename=file_path),
-                                            command_type=util.POWERSHELL)
-
 
 class CBInitConfig(BasePopulatedCBInitConfig):
     """Config object for cloudbase-init.conf."""
@@ -43,3 +43,8 @@ class ArgusEnvironmentError(ArgusError):
 class ArgusInvalidDecoratorError(ArgusError):
     """Exception triggered when a decorator has been improperly used."""
     pass
+
+
+class ArgusReplayError(ArgusError):
+    """Exception triggered when a recorded session can't answer a command."""
+    pass
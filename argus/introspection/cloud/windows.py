@@ -40,6 +40,35 @@ Address = collections.namedtuple("Address", ["v4", "v6"])
 NICDetails = collections.namedtuple("NICDetails", NIC_KEYS)
 Interface = collections.namedtuple('Interface', ['name', 'mtu'])
 
+# The PowerShell queries of the facts checked by the tests, which
+# can be gathered together by a bulk query. They are formatted with
+# the management cmdlet of the instance and with the argument
+# of the fact, if it needs one.
+_FACT_QUERIES = {
+    "disk_size": ('({cmdlet} win32_logicaldisk | where {{$_.DeviceID '
+                  '-Match "C:"}}).Size'),
+    "username": ('{cmdlet} Win32_Account | '
+                 'where {{$_.Name -contains "{argument}"}}'),
+    "ntp_peers": "w32tm /query /peers",
+    "working_directory": "(Get-Location).Path",
+    "file_content": '[io.file]::ReadAllText("{argument}")',
+    "txt_files": r"(Get-ChildItem -Path  C:\ *.txt).Count",
+    "subinterfaces": "netsh interface ipv4 show subinterfaces level=verbose",
+    "file_exists": "Test-Path {argument}",
+    "group_members": "net localgroup {argument}",
+    "location": "cmd /c dir {argument} /b",
+    "trim_state": "fsutil.exe behavior query disabledeletenotify",
+    # sc is the alias of Set-Content in PowerShell.
+    "service_triggers": "sc.exe qtriggerinfo {argument}",
+    "os_major": "[System.Environment]::OSVersion.Version.Major",
+    "os_minor": "[System.Environment]::OSVersion.Version.Minor",
+    "timezone": "tzutil /g",
+    "hostname": "hostname",
+    "paging_files": (r"(Get-ItemProperty 'HKLM:\SYSTEM\CurrentControlSet"
+                     r"\Control\Session Manager\Memory Management')"
+                     r".PagingFiles"),
+}
+
 
 @contextlib.contextmanager
 def _create_tempdir():
@@ -129,19 +158,25 @@ def _get_nic_details(details):
     return NICDetails(**nic_details)
 
 
-def get_cbinit_dir(execute_function):
-    """Get the location of Cloudbase-Init from the instance."""
-    stdout = execute_function(
-        '$ENV:PROCESSOR_ARCHITECTURE', command_type=util.POWERSHELL)
-    architecture = stdout.strip()
+def get_cbinit_dir(execute_function, locations=None):
+    """Get the location of Cloudbase-Init from the instance.
 
-    locations = [execute_function('echo "$ENV:ProgramFiles"',
-                                  command_type=util.POWERSHELL)]
-    if architecture == 'AMD64':
-        location = execute_function(
-            'echo "${ENV:ProgramFiles(x86)}"',
-            command_type=util.POWERSHELL)
-        locations.append(location)
+    :param locations:
+        The Program Files directories of the instance, if they are
+        already known. Otherwise, they are queried from the instance.
+    """
+    if locations is None:
+        stdout = execute_function(
+            '$ENV:PROCESSOR_ARCHITECTURE', command_type=util.POWERSHELL)
+        architecture = stdout.strip()
+
+        locations = [execute_function('echo "$ENV:ProgramFiles"',
+                                      command_type=util.POWERSHELL)]
+        if architecture == 'AMD64':
+            location = execute_function(
+                'echo "${ENV:ProgramFiles(x86)}"',
+                command_type=util.POWERSHELL)
+            locations.append(location)
 
     for location in locations:
         location = location.strip()
@@ -173,9 +208,9 @@ def set_config_option(option, value, execute_function):
     execute_function(cmd, command_type=util.POWERSHELL)
 
 
-def get_python_dir(execute_function):
+def get_python_dir(execute_function, cbinit_dir=None):
     """Find python directory from the Cloudbase-Init installation."""
-    cbinit_dir = get_cbinit_dir(execute_function)
+    cbinit_dir = cbinit_dir or get_cbinit_dir(execute_function)
     command = 'dir "{}" /b'.format(cbinit_dir)
     stdout = execute_function(command,
                               command_type=util.CMD).strip()
@@ -233,52 +268,110 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
     def __init__(self, remote_client):
         super(InstanceIntrospection, self).__init__(remote_client)
         self._cmdlet = remote_client.manager.WINDOWS_MANAGEMENT_CMDLET
+        self._facts = None
+        self._facts_calls = None
+
+    def _common_facts(self):
+        """The facts checked by most of the tests, with their arguments."""
+        facts = [(name, None) for name, query in _FACT_QUERIES.items()
+                 if "{argument}" not in query]
+        facts.extend([
+            ("username", CONFIG.cloudbaseinit.created_user),
+            ("group_members", CONFIG.cloudbaseinit.group),
+            ("location", "C:\\"),
+            ("file_exists", "C:\\Scripts\\exe.output"),
+            ("service_triggers", "w32time"),
+        ])
+        return facts
+
+    def _fact_query(self, name, argument=None):
+        return _FACT_QUERIES[name].format(cmdlet=self._cmdlet,
+                                          argument=argument)
+
+    def prefetch_facts(self):
+        """Gather the facts checked by most of the tests with one round trip.
+
+        The facts are kept only while nothing else is sent through
+        the remote client, since the recipe and the tests can change
+        the instance through it, or until :meth:`forget_facts`
+        is called. The facts whose queries failed are not kept.
+        """
+        facts = self._common_facts()
+        results = util.exec_with_retry(
+            lambda: self.remote_client.run_batch(
+                [self._fact_query(*fact) for fact in facts]),
+            CONFIG.argus.retry_count, CONFIG.argus.retry_delay)
+        self._facts = {fact: stdout for fact, (stdout, _, exit_code)
+                       in zip(facts, results) if not exit_code}
+        self._facts_calls = self._remote_calls()
+
+    def forget_facts(self):
+        """Forget the gathered facts, for when the instance changed."""
+        self._facts = None
+
+    def _remote_calls(self):
+        return getattr(self.remote_client, "remote_calls", None)
+
+    def _get_fact(self, name, argument=None):
+        if self._facts is None or self._facts_calls != self._remote_calls():
+            self.prefetch_facts()
+        fact = (name, argument)
+        if fact in self._facts:
+            return self._facts[fact]
+
+        # The other facts are not kept, they are queried every time.
+        stdout = self.bulk_query({fact: self._fact_query(name, argument)})
+        # Nothing but this query was sent since the facts were gathered.
+        self._facts_calls = self._remote_calls()
+        return stdout[fact]
 
     def get_disk_size(self):
-        cmd = ('({} win32_logicaldisk | where {{$_.DeviceID '
-               '-Match "C:"}}).Size').format(self._cmdlet)
-        return int(self.remote_client.run_command_verbose(
-            cmd, command_type=util.POWERSHELL))
+        return int(self._get_fact("disk_size"))
 
     def username_exists(self, username):
-        cmd = ('{0} Win32_Account | '
-               'where {{$_.Name -contains "{1}"}}'
-               .format(self._cmdlet, username))
-
-        stdout = self.remote_client.run_command_verbose(
-            cmd, command_type=util.POWERSHELL)
-        return bool(stdout)
+        stdout = self._get_fact("username", username)
+        return bool(stdout.strip())
 
     def get_instance_ntp_peers(self):
-        command = 'w32tm /query /peers'
-        stdout = self.remote_client.run_command_verbose(command,
-                                                        command_type=util.CMD)
+        stdout = self._get_fact("ntp_peers")
         return _get_ntp_peers(stdout)
 
     def get_instance_keys_path(self):
-        cmd = 'echo %cd%'
-        stdout = self.remote_client.run_command_verbose(cmd,
-                                                        command_type=util.CMD)
+        stdout = self._get_fact("working_directory").strip()
         homedir, _, _ = stdout.rpartition(ntpath.sep)
         return ntpath.join(
             homedir, CONFIG.cloudbaseinit.created_user,
             ".ssh", "authorized_keys")
 
+    def bulk_query(self, queries):
+        """Run many independent PowerShell queries with one round trip.
+
+        :param queries: A dictionary of query names and commands.
+        :returns: A dictionary with the stdout of every query.
+        """
+        names = list(queries)
+        results = util.exec_with_retry(
+            lambda: self.remote_client.run_batch(
+                [queries[name] for name in names]),
+            CONFIG.argus.retry_count, CONFIG.argus.retry_delay)
+
+        outputs = {}
+        for name, (stdout, stderr, exit_code) in zip(names, results):
+            if exit_code:
+                raise exceptions.ArgusError(
+                    "The query {!r} failed with exit code {!r}: {}"
+                    .format(name, exit_code, stderr))
+            outputs[name] = stdout
+        return outputs
+
     def get_instance_file_content(self, filepath):
-        cmd = '[io.file]::ReadAllText("%s")' % filepath
-        return self.remote_client.run_command_verbose(
-            cmd, command_type=util.POWERSHELL)
+        return self._get_fact("file_content", filepath)
 
     def get_userdata_executed_plugins(self):
-        cmd = r'(Get-ChildItem -Path  C:\ *.txt).Count'
-        stdout = self.remote_client.run_command_verbose(
-            cmd, command_type=util.POWERSHELL)
-        return int(stdout)
+        return int(self._get_fact("txt_files"))
 
     def get_instance_mtu(self):
-        cmd = 'netsh interface ipv4 show subinterfaces level=verbose'
-        stdout = self.remote_client.run_command_verbose(
-            cmd, command_type=util.CMD)
+        stdout = self._get_fact("subinterfaces")
         return parse_netsh_output(stdout)[0]
 
     def get_cloudbaseinit_traceback(self):
@@ -292,17 +385,14 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
             return stdout.strip()
 
     def _file_exist(self, filepath):
-        stdout = self.remote_client.run_command_verbose(
-            'Test-Path {}'.format(filepath), command_type=util.POWERSHELL)
+        stdout = self._get_fact("file_exists", filepath)
         return stdout.strip() == 'True'
 
     def instance_exe_script_executed(self):
         return self._file_exist("C:\\Scripts\\exe.output")
 
     def get_group_members(self, group):
-        cmd = "net localgroup {}".format(group)
-        std_out = self.remote_client.run_command_verbose(
-            cmd, command_type=util.CMD)
+        std_out = self._get_fact("group_members", group)
         member_search = re.search(
             r"Members\s+-+\s+(.*?)The\s+command",
             std_out, re.MULTILINE | re.DOTALL)
@@ -312,18 +402,14 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
         return list(filter(None, member_search.group(1).split()))
 
     def list_location(self, location):
-        command = "dir {} /b".format(location)
-        stdout = self.remote_client.run_command_verbose(
-            command, command_type=util.CMD)
+        stdout = self._get_fact("location", location)
         return list(filter(None, stdout.splitlines()))
 
     def get_trim_state(self):
         # Query the curent stat of DisableDeleteNotify
         # 1 - DeleteNotify is disabled
         # 0 - DeleteNotify is enabled
-        command = "fsutil.exe behavior query disabledeletenotify"
-        stdout = self.remote_client.run_command_verbose(
-            command, command_type=util.CMD)
+        stdout = self._get_fact("trim_state")
         return "DisableDeleteNotify = 0" in stdout
 
     def get_service_triggers(self, service):
@@ -332,9 +418,7 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
         Return a tuple of two elements, where the first is the start
         trigger and the second is the end trigger.
         """
-        command = "sc qtriggerinfo {}".format(service)
-        stdout = self.remote_client.run_command_verbose(
-            command, command_type=util.CMD)
+        stdout = self._get_fact("service_triggers", service)
         match = re.search(r"START SERVICE\s+(.*?):.*?STOP SERVICE\s+(.*?):",
                           stdout, re.DOTALL)
         if not match:
@@ -348,9 +432,8 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
          Return a tuple of two elements, the major and the minor
          version.
         """
-        major_version = get_os_version(self.remote_client, 'Major')
-        minor_version = get_os_version(self.remote_client, 'Minor')
-        return (major_version, minor_version)
+        return (util.get_int_from_str(self._get_fact("os_major")),
+                util.get_int_from_str(self._get_fact("os_minor")))
 
     def get_cloudconfig_executed_plugins(self):
         expected = {
@@ -358,23 +441,19 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
             'gzip', 'gzip_1',
             'gzip_base64', 'gzip_base64_1', 'gzip_base64_2'
         }
-        files = {}
-        for basefile in expected:
-            path = ntpath.join("C:\\", basefile)
-            content = self.get_instance_file_content(path)
-            files[basefile] = content.strip()
-        return files
+        files = self.bulk_query({
+            basefile: '[io.file]::ReadAllText("{}")'.format(
+                ntpath.join("C:\\", basefile))
+            for basefile in expected
+        })
+        return {basefile: content.strip()
+                for basefile, content in files.items()}
 
     def get_timezone(self):
-        command = "tzutil /g"
-        stdout = self.remote_client.run_command_verbose(
-            "{}".format(command), command_type=util.POWERSHELL)
-        return stdout
+        return self._get_fact("timezone")
 
     def get_instance_hostname(self):
-        command = "hostname"
-        stdout = self.remote_client.run_command_verbose(
-            command, command_type=util.CMD)
+        stdout = self._get_fact("hostname")
         return stdout.lower().strip()
 
     def get_network_interfaces(self):
@@ -429,8 +508,5 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
         :returns: True if swap memory is enabled, False if not.
         :rtype: bool
         """
-        swap_query = (r"HKLM:\SYSTEM\CurrentControlSet\Control\Session"
-                      r" Manager\Memory Management")
-        cmd = r"(Get-ItemProperty '{}').PagingFiles".format(swap_query)
-        stdout = self.remote_client.run_command_verbose(cmd)
+        stdout = self._get_fact("paging_files")
         return stdout.strip() == r'?:\pagefile.sys'
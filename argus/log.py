@@ -13,8 +13,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import os
 import logging
+import threading
+
+try:
+    from collections import abc as collections_abc
+except ImportError:
+    import collections as collections_abc
 
 from argus import config as argus_config
 
@@ -25,6 +32,48 @@ DEFAULT_FORMAT = ('%(scenario)s - %(os_type)s - %(asctime)s - %(name)s - '
                   '%(levelname)s - %(message)s')
 
 
+class ThreadExtra(collections_abc.MutableMapping):
+    """The extra items of a logger, which can be isolated per thread.
+
+    The items are shared by all the threads, except for the threads
+    which called :meth:`isolate`, whose changes are seen only by them.
+    """
+
+    def __init__(self, items):
+        self._shared = dict(items)
+        self._local = threading.local()
+
+    def _items(self):
+        return getattr(self._local, "items", self._shared)
+
+    def isolate(self, items=None):
+        """Keep the changes made by the current thread to itself.
+
+        :param items:
+            The items the thread starts with, instead of the shared ones.
+        """
+        self._local.items = dict(self._shared if items is None else items)
+
+    def release(self):
+        """Share the items of the current thread again."""
+        self._local.__dict__.pop("items", None)
+
+    def __getitem__(self, key):
+        return self._items()[key]
+
+    def __setitem__(self, key, value):
+        self._items()[key] = value
+
+    def __delitem__(self, key):
+        del self._items()[key]
+
+    def __iter__(self):
+        return iter(list(self._items()))
+
+    def __len__(self):
+        return len(self._items())
+
+
 def get_logger(name="argus",
                format_string=DEFAULT_FORMAT,
                logging_file=CONFIG.argus.argus_log_file):
@@ -34,7 +83,7 @@ def get_logger(name="argus",
     will be the format it will use for logging. `logging_file` is a file
     where the messages will be written.
     """
-    extra = {"scenario": "unknown", "os_type": "unknown"}
+    extra = ThreadExtra({"scenario": "unknown", "os_type": "unknown"})
 
     logger = logging.getLogger(name)
     formatter = logging.Formatter(format_string)
@@ -61,6 +110,21 @@ def set_scenario_name(log, name):
     log.extra["scenario"] = name
 
 
+@contextlib.contextmanager
+def isolated_extra(log, items=None):
+    """Keep the extra items set by the current thread to itself.
+
+    This is used by the threads which prepare scenarios at the
+    same time, so that each one logs with its own scenario name.
+    The helper threads of such a thread can start with its `items`.
+    """
+    log.extra.isolate(items)
+    try:
+        yield
+    finally:
+        log.extra.release()
+
+
 def get_log_extra_item(log, item):
     """Returns an extra item from the logging object."""
     return log.extra.get(item, 'unknown')
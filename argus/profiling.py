@@ -0,0 +1,308 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure where the time of a scenario goes.
+
+The recipe steps, the remote commands, the API calls of the back-ends
+and the sleeps between retries are recorded as spans, grouped by
+the scenario which was logging when they started. At the teardown
+of a scenario, its spans are written as a JSON profile in the output
+directory and summarized in the log.
+
+The spans of all the scenarios run by a process are also written as
+a trace in the Chrome Trace Event Format, which can be opened with
+Perfetto or ``chrome://tracing``. Every scenario is a track there.
+The traces of the processes of a parallel run are merged together by
+:func:`merge_traces`.
+"""
+
+import collections
+import contextlib
+import functools
+import glob
+import io
+import json
+import os
+import threading
+import time
+
+import six
+
+from argus import config as argus_config
+from argus import log as argus_log
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+STEP = "step"
+COMMAND = "command"
+SHELL = "shell"
+API = "api"
+SLEEP = "sleep"
+
+_SPANS = collections.defaultdict(list)
+_SPANS_LOCK = threading.Lock()
+
+
+class Span(collections.namedtuple("Span", "category name scenario thread "
+                                          "start end details")):
+    """Something which took time, with :func:`time.time` limits."""
+
+    __slots__ = ()
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def as_dict(self):
+        span = self._asdict()
+        span["duration"] = self.duration
+        return span
+
+
+@contextlib.contextmanager
+def span(category, name, **details):
+    """Record the time spent in the block as a span.
+
+    The block gets the details of the span, as a dictionary
+    which can be updated with what is known only afterwards,
+    such as the size of a response. The span is recorded even
+    if the block fails.
+    """
+    scenario = argus_log.get_log_extra_item(LOG, "scenario")
+    start = time.time()
+    try:
+        yield details
+    finally:
+        record(Span(category, name, scenario,
+                    threading.current_thread().name,
+                    start, time.time(), details))
+
+
+def instrumented(category, name=None):
+    """Record every call of the decorated function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(category, name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class InstrumentedClient(object):
+    """Record the calls made through an API client as spans.
+
+    The attributes which are not callable, such as the timeouts
+    read by the waiters, are given as they are.
+
+    :param client: The wrapped API client.
+    :param name: The name of the client, which prefixes the spans.
+    """
+
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._client, attr)
+        if not callable(value) or attr.startswith("_"):
+            return value
+        return instrumented(API, "{}.{}".format(self._name, attr))(value)
+
+
+def record(recorded):
+    """Add an already measured :class:`Span`."""
+    with _SPANS_LOCK:
+        _SPANS[recorded.scenario].append(recorded)
+
+
+def get_spans(scenario):
+    """Get the spans recorded for a scenario, in the order they ended."""
+    with _SPANS_LOCK:
+        return list(_SPANS.get(scenario, ()))
+
+
+def summarize(spans):
+    """Aggregate the spans with the same category and name.
+
+    :returns:
+        A list of dictionaries with the count, the total, mean and
+        maximum duration of every kind of span, the slowest first.
+    """
+    groups = collections.OrderedDict()
+    for recorded in spans:
+        groups.setdefault((recorded.category, recorded.name),
+                          []).append(recorded.duration)
+    summary = [{"category": category, "name": name,
+                "count": len(durations), "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations)}
+               for (category, name), durations in groups.items()]
+    summary.sort(key=lambda entry: entry["total"], reverse=True)
+    return summary
+
+
+def format_summary(summary, limit=20):
+    """Format the slowest entries of a summary as a text table."""
+    rows = [("category", "name", "count", "total", "mean", "max")]
+    rows.extend((entry["category"], entry["name"], str(entry["count"]),
+                 "%.2f" % entry["total"], "%.2f" % entry["mean"],
+                 "%.2f" % entry["max"])
+                for entry in summary[:limit])
+    widths = [max(len(row[column]) for row in rows)
+              for column in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width)
+                               for cell, width in zip(row, widths)).rstrip()
+                     for row in rows)
+
+
+def _dump(content, path):
+    with io.open(path, "w", encoding="utf-8") as stream:
+        stream.write(six.text_type(json.dumps(
+            content, indent=2, sort_keys=True, default=repr)))
+
+
+def write_profile(scenario, directory=None):
+    """Write the spans of a scenario and their summary as JSON.
+
+    :param directory:
+        Where the profile is written, ``output_directory`` from
+        the config by default.
+    :returns: The path of the profile, or None if there is no directory.
+    """
+    directory = directory or CONFIG.argus.output_directory
+    if not directory:
+        return None
+    spans = get_spans(scenario)
+    profile = {
+        "scenario": scenario,
+        "summary": summarize(spans),
+        "spans": [recorded.as_dict() for recorded in spans],
+    }
+    path = os.path.join(directory, "{}-profile.json".format(scenario))
+    _dump(profile, path)
+    return path
+
+
+def _sort_processes(events):
+    """Order the tracks of the scenarios by when they started."""
+    events = [event for event in events
+              if event["name"] != "process_sort_index"]
+    starts = {}
+    for event in events:
+        if event["ph"] == "X":
+            starts[event["pid"]] = min(event["ts"],
+                                       starts.get(event["pid"], event["ts"]))
+    ordered = sorted(starts, key=starts.get)
+    events.extend({"name": "process_sort_index", "ph": "M", "pid": pid,
+                   "tid": 0, "args": {"sort_index": index}}
+                  for index, pid in enumerate(ordered))
+    return events
+
+
+def trace_events(spans):
+    """Convert spans into events of the Chrome Trace Event Format.
+
+    Every scenario gets a process, named after it, and every thread
+    which recorded spans for it gets a thread of that process.
+    The time is in microseconds.
+    """
+    events = []
+    pids = {}
+    tids = {}
+    for recorded in sorted(spans, key=lambda recorded: recorded.start):
+        pid = pids.get(recorded.scenario)
+        if pid is None:
+            pid = pids[recorded.scenario] = len(pids) + 1
+            events.append({"name": "process_name", "ph": "M", "pid": pid,
+                           "tid": 0, "args": {"name": recorded.scenario}})
+        tid = tids.get((pid, recorded.thread))
+        if tid is None:
+            tid = tids[pid, recorded.thread] = len(tids) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                           "tid": tid, "args": {"name": recorded.thread}})
+        events.append({"name": recorded.name, "cat": recorded.category,
+                       "ph": "X", "pid": pid, "tid": tid,
+                       "ts": int(recorded.start * 1e6),
+                       "dur": int(recorded.duration * 1e6),
+                       "args": recorded.details})
+    return _sort_processes(events)
+
+
+def write_trace(directory=None):
+    """Write the spans of all the scenarios of this process as a trace.
+
+    The trace of every process has its own file in the directory,
+    ``output_directory`` from the config by default.
+
+    :returns: The path of the trace, or None if there is no directory.
+    """
+    directory = directory or CONFIG.argus.output_directory
+    if not directory:
+        return None
+    with _SPANS_LOCK:
+        spans = [recorded for scenario_spans in _SPANS.values()
+                 for recorded in scenario_spans]
+    path = os.path.join(directory, "trace-{}.json".format(os.getpid()))
+    _dump({"traceEvents": trace_events(spans), "displayTimeUnit": "ms"},
+          path)
+    return path
+
+
+def merge_traces(directory, destination):
+    """Merge the traces of the processes of a run into a single trace.
+
+    The processes of the scenarios are renumbered, so that they
+    don't collide between the traces.
+
+    :param directory: The directory where the processes wrote their traces.
+    :param destination: The path of the merged trace.
+    :returns: The destination, or None if no trace was found.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "trace-*.json")))
+    if not paths:
+        return None
+    events = []
+    offset = 0
+    for path in paths:
+        with io.open(path, encoding="utf-8") as stream:
+            trace = json.load(stream)
+        pids = {}
+        for event in trace["traceEvents"]:
+            pid = pids.get(event["pid"])
+            if pid is None:
+                pid = pids[event["pid"]] = offset + len(pids) + 1
+            event["pid"] = pid
+        offset += len(pids)
+        events.extend(trace["traceEvents"])
+    _dump({"traceEvents": _sort_processes(events), "displayTimeUnit": "ms"},
+          destination)
+    return destination
+
+
+def report(scenario):
+    """Write the profile of a scenario and log its summary table.
+
+    The trace of this process is updated with the spans of the scenario.
+    """
+    spans = get_spans(scenario)
+    if not spans:
+        return
+    path = write_profile(scenario)
+    write_trace()
+    LOG.info("Profile of scenario %s%s:\n%s", scenario,
+             " (written to {})".format(path) if path else "",
+             format_summary(summarize(spans)))
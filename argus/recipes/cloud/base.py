@@ -16,12 +16,14 @@
 """Base recipe for preparing instances for Cloudbase-Init testing."""
 
 import abc
+import functools
 
 import six
 
 from argus import config as argus_config
 from argus import log as argus_log
 from argus.recipes import base
+from argus.recipes import steps as recipe_steps
 
 __all__ = ('BaseCloudbaseinitRecipe', )
 
@@ -40,12 +42,54 @@ class BaseCloudbaseinitRecipe(base.BaseRecipe):
     * get an install script for CloudbaseInit
     * installs CloudbaseInit
     * waits for the finalization of the installation.
+
+    The steps up to the installation of Cloudbase-Init, listed in
+    :attr:`golden_steps`, can be run separately by :meth:`prepare_golden`
+    on an instance which will be snapshotted, so that other instances
+    booted from that snapshot can skip them.
+    """
+
+    steps = (
+        recipe_steps.Step("wait_for_boot_completion", ()),
+        recipe_steps.Step("set_mtu", ("wait_for_boot_completion", )),
+        recipe_steps.Step("execution_prologue",
+                          ("wait_for_boot_completion", )),
+        recipe_steps.Step("get_installation_script",
+                          ("wait_for_boot_completion", )),
+        recipe_steps.Step("install_cbinit",
+                          ("set_mtu", "execution_prologue",
+                           "get_installation_script")),
+        recipe_steps.Step("replace_install", ("install_cbinit", )),
+        recipe_steps.Step("replace_code", ("replace_install", )),
+        recipe_steps.Step("prepare_cbinit_config", ("install_cbinit", )),
+        recipe_steps.Step("inject_cbinit_config",
+                          ("prepare_cbinit_config", "replace_code")),
+        recipe_steps.Step("pre_sysprep", ("inject_cbinit_config", )),
+        recipe_steps.Step("pause", ("pre_sysprep", )),
+        recipe_steps.Step("sysprep", ("pause", )),
+        recipe_steps.Step("wait_cbinit_finalization", ("sysprep", )),
+        recipe_steps.Step("get_cb_init_artifacts",
+                          ("wait_cbinit_finalization", )),
+    )
+    """The steps run by :meth:`prepare`, with the steps they require.
+
+    The steps which don't depend on each other run at the same time.
     """
 
+    golden_steps = ("wait_for_boot_completion", "set_mtu",
+                    "execution_prologue", "get_installation_script",
+                    "install_cbinit")
+    """The steps whose results can be shared through a snapshot."""
+
+    from_snapshot = False
+    """Whether the instance was booted from a snapshot prepared
+    by :meth:`prepare_golden`."""
+
     def __init__(self, backend):
         super(BaseCloudbaseinitRecipe, self).__init__(backend)
         self._cbinit_conf = None
         self._cbinit_unattend_conf = None
+        self.step_timings = []
 
     @abc.abstractmethod
     def wait_for_boot_completion(self):
@@ -124,6 +168,38 @@ class BaseCloudbaseinitRecipe(base.BaseRecipe):
         """Get the Cloudbase-Init configs from the instance."""
         pass
 
+    def get_cb_init_artifacts(self):
+        """Get the Cloudbase-Init logs and configs from the instance."""
+        self.get_cb_init_logs()
+        self.get_cb_init_confs()
+
+    def pause(self):
+        """Wait for the user before sysprepping, if asked to."""
+        if CONFIG.argus.pause:
+            six.moves.input("Press Enter to continue...")
+
+    def _run_steps(self, names, service_type=None):
+        graph = recipe_steps.StepGraph(self.steps).subgraph(names)
+        actions = {step.name: getattr(self, step.name) for step in graph}
+        if "prepare_cbinit_config" in actions:
+            actions["prepare_cbinit_config"] = functools.partial(
+                self.prepare_cbinit_config, service_type)
+
+        executor = recipe_steps.StepExecutor(graph, actions)
+        try:
+            executor.run()
+        finally:
+            self.step_timings.extend(executor.timings.values())
+        executor.log_critical_path()
+
+    def prepare_golden(self):
+        """Run the steps which can be shared through a snapshot.
+
+        The instance is left with Cloudbase-Init installed, but
+        not configured and not sysprepped.
+        """
+        self._run_steps(self.golden_steps)
+
     def prepare(self, service_type=None, **kwargs):
         """Prepare the underlying instance.
 
@@ -133,23 +209,16 @@ class BaseCloudbaseinitRecipe(base.BaseRecipe):
         * get an installation script for CloudbaseInit
         * install CloudbaseInit by running the previously downloaded file.
         * wait until the instance is up and running.
+
+        The steps are run as declared in :attr:`steps`. If the instance
+        was booted from a snapshot prepared by :meth:`prepare_golden`,
+        the installation is skipped.
         """
         LOG.info("Preparing instance...")
-        self.wait_for_boot_completion()
-        self.set_mtu()
-        self.execution_prologue()
-        self.get_installation_script()
-        self.install_cbinit()
-        self.replace_install()
-        self.replace_code()
-        self.prepare_cbinit_config(service_type)
-        self.inject_cbinit_config()
-        self.pre_sysprep()
-        if CONFIG.argus.pause:
-            six.moves.input("Press Enter to continue...")
-
-        self.sysprep()
-        self.wait_cbinit_finalization()
+        names = [step.name for step in self.steps]
+        if self.from_snapshot:
+            skipped = set(self.golden_steps) - {"wait_for_boot_completion",
+                                                "set_mtu"}
+            names = [name for name in names if name not in skipped]
+        self._run_steps(names, service_type)
         LOG.info("Finished preparing instance.")
-        self.get_cb_init_logs()
-        self.get_cb_init_confs()
@@ -15,13 +15,13 @@
 
 """Windows Cloudbase-Init recipes."""
 
-import base64
 import ntpath
 import os
 import zipfile
 
 import six
 
+from argus.backends import console as backend_console
 from argus import config as argus_config
 from argus.config_generator.windows import cb_init as cbinit_config
 from argus import exceptions
@@ -43,6 +43,13 @@ _CBINIT_TARGET_LOCATION = r"C:\cloudbaseinit"
 class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
     """Recipe for preparing a Windows instance."""
 
+    # The Cloudbase-Init files grabbed after the instance was prepared,
+    # as locations from the installation directory and their files.
+    _CBINIT_LOGS = ("log", ["cloudbase-init.log",
+                            "cloudbase-init-unattend.log"])
+    _CBINIT_CONFS = ("conf", ["cloudbase-init.conf",
+                              "cloudbase-init-unattend.conf"])
+
     def wait_for_boot_completion(self):
         LOG.info("Waiting for first boot completion...")
         self._backend.remote_client.manager.wait_boot_completion()
@@ -81,7 +88,7 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
     def install_cbinit(self):
         """Proceed on checking if Cloudbase-Init should be installed."""
         try:
-            introspection.get_cbinit_dir(self._execute)
+            self._backend.remote_client.manager.get_cbinit_dir()
         except exceptions.ArgusError:
             self._backend.remote_client.manager.install_cbinit()
             self._grab_cbinit_installation_log()
@@ -99,13 +106,12 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
     def transfer_encoded_file_b64(self, file_source, destination_path,
                                   archive=False):
-        """Creates a new file to the path by decoding a base64 string."""
-        encoded_content = (self._backend.remote_client.manager.
-                           encode_file_to_base64_str(
-                               file_path=file_source))
-        file_64_decoded = base64.standard_b64decode(encoded_content[0])
-        with open(destination_path, 'wb') as file_result:
-            file_result.write(file_64_decoded)
+        """Download the remote file source in the destination path.
+
+        The file is streamed to the disk in bounded chunks, so
+        big logs are never held whole in memory.
+        """
+        self._backend.remote_client.download(file_source, destination_path)
         if archive:
             self.extract_files_from_archive(destination_path,
                                             CONFIG.argus.output_directory)
@@ -117,21 +123,29 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
             LOG.warning("The output directory wasn't given, "
                         "the log will not be grabbed.")
             return
-        # Rename the installation log and archive it.
-        installation_log = r"C:\installation.log"
-        renamed_log = (r"C:\{0}-installation-{1}.log".format(
-            argus_log.get_log_extra_item(LOG, 'scenario'),
-            self._backend.instance_server()['id']))
-        self._backend.remote_client.manager.copy_file(installation_log,
-                                                      renamed_log)
-        zip_source = r"C:\installation.zip"
-        self._backend.remote_client.manager.archive_file(
-            file_path=renamed_log,
-            destination_path=zip_source)
-        log_template = "installation-{}.zip".format(
-            self._backend.instance_server()['id'])
-        path = os.path.join(CONFIG.argus.output_directory, log_template)
-        self.transfer_encoded_file_b64(zip_source, path, archive=True)
+        instance_id = self._backend.instance_server()['id']
+        renamed_log = "{0}-installation-{1}.log".format(
+            argus_log.get_log_extra_item(LOG, 'scenario'), instance_id)
+        self._collect_artifacts([(r"C:\installation.log", renamed_log)],
+                                "installation-{}.zip".format(instance_id))
+
+    def _collect_artifacts(self, files, archive_name):
+        """Bring the given remote files in the output directory at once.
+
+        The files are archived remotely with a single agent call, then
+        the archive is transferred and extracted locally.
+
+        :param files:
+            An iterable of tuples of two elements, the remote path
+            of a file and its local name.
+        :param archive_name:
+            The name of the archive used for the transfer.
+        """
+        remote_archive = ntpath.join("C:\\", archive_name)
+        self._backend.remote_client.manager.collect_files(files,
+                                                          remote_archive)
+        path = os.path.join(CONFIG.argus.output_directory, archive_name)
+        self.transfer_encoded_file_b64(remote_archive, path, archive=True)
 
     def replace_install(self):
         """Replace the Cloudbase-Init installed files with the downloaded ones.
@@ -150,6 +164,10 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         if link.startswith("\\\\"):
             cmd = 'copy "{}" "C:\\install.zip"'.format(link)
             self._execute(cmd, command_type=util.CMD)
+        elif os.path.isfile(link):
+            # A bundle from the local disk is pushed directly to
+            # the instance, without hosting it somewhere.
+            self._backend.remote_client.copy_file(link, r'C:\install.zip')
         else:
             location = r'C:\install.zip'
             self._backend.remote_client.manager.download(
@@ -163,7 +181,7 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         self._execute(cmd, command_type=util.POWERSHELL)
 
         LOG.debug("Replace old files with the new ones.")
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = self._backend.remote_client.manager.get_cbinit_dir()
         self._execute('xcopy /y /e /q "C:\\install"'
                       ' "{}"'.format(cbdir), command_type=util.CMD)
 
@@ -183,7 +201,7 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
         LOG.debug("Getting Cloudbase-Init location...")
         # Get Cloudbase-Init python location.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = self._backend.remote_client.manager.get_python_dir()
 
         # Remove everything from the Cloudbase-Init installation.
         LOG.debug("Recursively removing Cloudbase-Init...")
@@ -228,7 +246,7 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         # monitoring the service, because on some OSes, just checking
         # if the service is stopped leads to errors, due to the
         # fact that the service starts later on.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = self._backend.remote_client.manager.get_python_dir()
         cbinit = ntpath.join(python_dir, 'Lib', 'site-packages',
                              'cloudbaseinit')
 
@@ -248,13 +266,26 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         paths = [
             r"C:\cloudbaseinit_unattended",
             r"C:\cloudbaseinit_normal"]
+        self._wait_cbinit_service(paths)
 
-        LOG.debug("Check the heartbeat patch ...")
-        self._backend.remote_client.manager.check_cbinit_service(
-            searched_paths=paths)
+    def _wait_cbinit_service(self, paths):
+        """Wait for the Cloudbase-Init service to run and to stop.
 
-        LOG.debug("Wait for the Cloudbase-Init service to stop ...")
-        self._backend.remote_client.manager.wait_cbinit_service()
+        The console output is followed meanwhile, so that the checks
+        are retried right away when it shows that Cloudbase-Init
+        started executing plugins or finished executing them.
+        """
+        manager = self._backend.remote_client.manager
+        console = self._backend.console
+        with console.follow():
+            LOG.debug("Check the heartbeat patch ...")
+            manager.check_cbinit_service(
+                searched_paths=paths,
+                wake=console.signals[backend_console.PLUGIN_STARTED])
+
+            LOG.debug("Wait for the Cloudbase-Init service to stop ...")
+            manager.wait_cbinit_service(
+                wake=console.signals[backend_console.FINISHED])
 
     def prepare_cbinit_config(self, service_type):
         """Prepare the Cloudbase-Init config."""
@@ -290,13 +321,15 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
     def _make_dir_if_needed(self, path):
         """Check if the directory exists, if it doesn't create it."""
-        if not self._backend.remote_client.manager.is_dir(path):
+        manager = self._backend.remote_client.manager
+        if not manager.is_dir(path):
             cmd = 'mkdir "{}"'.format(path)
             self._backend.remote_client.run_remote_cmd(cmd, util.POWERSHELL)
+            manager.invalidate_stats()
 
     def inject_cbinit_config(self):
         """Inject the Cloudbase-Init config in the right place."""
-        cbinit_dir = introspection.get_cbinit_dir(self._execute)
+        cbinit_dir = self._backend.remote_client.manager.get_cbinit_dir()
 
         conf_dir = ntpath.join(cbinit_dir, "conf")
         needed_directories = [
@@ -304,6 +337,9 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
             conf_dir,
         ]
 
+        # All the directories are checked at once, the checks
+        # below are answered by the cached stats.
+        self._backend.remote_client.manager.stat_many(needed_directories)
         for directory in needed_directories:
             self._make_dir_if_needed(directory)
 
@@ -311,7 +347,19 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         self._cbinit_unattend_conf.apply_config(conf_dir)
 
     def get_cb_init_files(self, location, files):
-        LOG.info("Obtaining Cloudbase-Init files from %s" % location)
+        self.collect_cb_init_files([(location, files)])
+
+    def collect_cb_init_files(self, locations):
+        """Get Cloudbase-Init files from multiple locations, all at once.
+
+        :param locations:
+            An iterable of tuples of two elements, a location from
+            the installation directory and the names of the files
+            from it.
+        """
+        locations = list(locations)
+        LOG.info("Obtaining Cloudbase-Init files from %s",
+                 ", ".join(location for location, _ in locations))
         if not CONFIG.argus.output_directory:
             LOG.warning("The output directory wasn't given, "
                         "the files will not be grabbed.")
@@ -319,49 +367,21 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
         instance_id = self._backend.instance_server()['id']
         scenario_name = argus_log.get_log_extra_item(LOG, 'scenario')
-        cbdir = introspection.get_cbinit_dir(self._execute)
-        cb_files = files
-        renamed_cb_files = []
-        cb_files_path = []
-        renamed_cb_files_path = []
-        for cb_file in cb_files:
-            renamed_cb_files.append(scenario_name + "-" + instance_id +
-                                    "-" + cb_file)
-
-        for cb_file in cb_files:
-            file_path = os.path.join(cbdir, r"{location}\{file}".format(
-                location=location, file=cb_file))
-            renamed_path = (os.path.join(cbdir,
-                                         (r"{location}\{scenario}-{instance}-"
-                                          "-{file}".
-                                          format(location=location,
-                                                 scenario=scenario_name,
-                                                 instance=instance_id,
-                                                 file=cb_file))))
-            cb_files_path.append(file_path)
-            renamed_cb_files_path.append(renamed_path)
-
-        files_to_rename = list(zip(cb_files_path,
-                                   renamed_cb_files_path))
-        for current_name, renamed in files_to_rename:
-            self._backend.remote_client.manager.copy_file(current_name,
-                                                          renamed)
-
-        source_destination = list(zip(renamed_cb_files_path,
-                                      renamed_cb_files))
-        for source, destination in source_destination:
-            path = os.path.join(CONFIG.argus.output_directory, destination)
-            self.transfer_encoded_file_b64(source, path)
+        prefix = "{}-{}-".format(scenario_name, instance_id)
+        cbdir = self._backend.remote_client.manager.get_cbinit_dir()
+        files = [(ntpath.join(cbdir, location, cb_file), prefix + cb_file)
+                 for location, cb_files in locations
+                 for cb_file in cb_files]
+        self._collect_artifacts(files, prefix + "cbinit-files.zip")
 
     def get_cb_init_logs(self):
-        self.get_cb_init_files(
-            location="log",
-            files=["cloudbase-init.log", "cloudbase-init-unattend.log"])
+        self.get_cb_init_files(*self._CBINIT_LOGS)
 
     def get_cb_init_confs(self):
-        self.get_cb_init_files(
-            location="conf",
-            files=["cloudbase-init.conf", "cloudbase-init-unattend.conf"])
+        self.get_cb_init_files(*self._CBINIT_CONFS)
+
+    def get_cb_init_artifacts(self):
+        self.collect_cb_init_files([self._CBINIT_LOGS, self._CBINIT_CONFS])
 
 
 class CloudbaseinitScriptRecipe(CloudbaseinitRecipe):
@@ -592,18 +612,16 @@ class CloudbaseinitLocalScriptsRecipe(CloudbaseinitRecipe):
 class CloudbaseinitImageRecipe(CloudbaseinitRecipe):
     """Calibrate already sys-prepared Cloudbase-Init images."""
 
+    # The instance is sysprepped already, so it can't be snapshotted
+    # before sysprep.
+    golden_steps = ()
+
     def wait_cbinit_finalization(self):
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = self._backend.remote_client.manager.get_cbinit_dir()
         paths = [ntpath.join(cbdir, "log", name)
                  for name in ["cloudbase-init-unattend.log",
                               "cloudbase-init.log"]]
-
-        LOG.debug("Check the heartbeat patch ...")
-        self._backend.remote_client.manager.check_cbinit_service(
-            searched_paths=paths)
-
-        LOG.debug("Wait for the Cloudbase-Init service to stop ...")
-        self._backend.remote_client.manager.wait_cbinit_service()
+        self._wait_cbinit_service(paths)
 
     def prepare(self, service_type=None, **kwargs):
         LOG.info("Preparing already sysprepped instance...")
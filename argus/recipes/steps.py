@@ -0,0 +1,233 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run the steps of a recipe as a graph of dependencies.
+
+A recipe declares its steps together with the steps they depend on.
+The steps whose dependencies finished can run at the same time, each
+one in its own thread, so their remote commands run over different
+WinRM shells of the client's shell pool.
+"""
+
+import collections
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+from argus import config as argus_config
+from argus import exceptions
+from argus import log as argus_log
+from argus import profiling
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+Step = collections.namedtuple("Step", "name requires")
+
+
+class StepTiming(collections.namedtuple("StepTiming", "name start end")):
+    """When a step started and ended, as :func:`time.time` values."""
+
+    __slots__ = ()
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class StepGraph(object):
+    """The steps of a recipe and their dependencies.
+
+    :param steps:
+        An iterable of :class:`Step`, whose `requires` are the names
+        of the steps which must finish before it starts.
+    """
+
+    def __init__(self, steps):
+        self._steps = collections.OrderedDict(
+            (step.name, Step(step.name, tuple(step.requires)))
+            for step in steps)
+        for step in self._steps.values():
+            unknown = set(step.requires) - set(self._steps)
+            if unknown:
+                raise exceptions.ArgusError(
+                    "Step %r requires the unknown steps %s."
+                    % (step.name, ", ".join(sorted(unknown))))
+        self.order = self._sort()
+
+    def _sort(self):
+        order = []
+        done = set()
+        while len(order) < len(self._steps):
+            ready = [step.name for step in self._steps.values()
+                     if step.name not in done and set(step.requires) <= done]
+            if not ready:
+                cycle = sorted(set(self._steps) - done)
+                raise exceptions.ArgusError(
+                    "The steps %s depend on each other." % ", ".join(cycle))
+            order.extend(ready)
+            done.update(ready)
+        return order
+
+    def __iter__(self):
+        return iter(self._steps.values())
+
+    def __len__(self):
+        return len(self._steps)
+
+    def __getitem__(self, name):
+        return self._steps[name]
+
+    def ancestors(self, name):
+        """Get the names of all the steps which run before the given one."""
+        found = set()
+        stack = list(self._steps[name].requires)
+        while stack:
+            required = stack.pop()
+            if required not in found:
+                found.add(required)
+                stack.extend(self._steps[required].requires)
+        return found
+
+    def subgraph(self, names):
+        """Get the graph of only the given steps.
+
+        The dependencies through the steps which are left out are kept.
+        """
+        names = set(names)
+        return StepGraph(
+            Step(step.name, [required for required in self.order
+                             if required in names and
+                             required in self.ancestors(step.name)])
+            for step in self if step.name in names)
+
+
+def critical_path(graph, timings):
+    """Get the chain of steps which determined the total duration.
+
+    The path starts with the step which ended last and goes back
+    through the dependency which ended last, for every step.
+
+    :param timings: A mapping between step names and :class:`StepTiming`.
+    """
+    if not timings:
+        return []
+    path = []
+    current = max(timings.values(), key=lambda timing: timing.end)
+    while current is not None:
+        path.append(current)
+        required = [timings[name] for name in graph[current.name].requires
+                    if name in timings]
+        current = (max(required, key=lambda timing: timing.end)
+                   if required else None)
+    return list(reversed(path))
+
+
+class StepExecutor(object):
+    """Run the steps of a graph, the independent ones concurrently.
+
+    :param graph: The :class:`StepGraph` to run.
+    :param actions:
+        A mapping between the step names and the callables
+        which run them.
+    :param concurrency:
+        How many steps can run at the same time. ``recipe_concurrency``
+        from the config is used by default. When it is 1, the steps run
+        one after the other, in the current thread.
+    """
+
+    def __init__(self, graph, actions, concurrency=None):
+        self._graph = graph
+        self._actions = actions
+        self.concurrency = max(concurrency or
+                               CONFIG.argus.recipe_concurrency, 1)
+        self.timings = collections.OrderedDict()
+
+    def _run_step(self, name):
+        start = time.time()
+        LOG.debug("Running step %s", name)
+        with profiling.span(profiling.STEP, name):
+            self._actions[name]()
+        self.timings[name] = StepTiming(name, start, time.time())
+
+    def _run_sequentially(self):
+        for name in self._graph.order:
+            self._run_step(name)
+
+    def _run_in_thread(self, name, extra, finished):
+        with argus_log.isolated_extra(LOG, extra):
+            try:
+                self._run_step(name)
+            except Exception:  # pylint: disable=broad-except
+                finished.put((name, sys.exc_info()))
+            else:
+                finished.put((name, None))
+
+    def _run_concurrently(self):
+        pending = collections.OrderedDict(
+            (step.name, set(step.requires)) for step in self._graph)
+        finished = queue.Queue()
+        extra = dict(LOG.extra)
+        done = set()
+        running = 0
+        error = None
+
+        while True:
+            if error is None:
+                ready = [name for name, requires in pending.items()
+                         if requires <= done]
+                for name in ready[:self.concurrency - running]:
+                    del pending[name]
+                    running += 1
+                    thread = threading.Thread(
+                        target=self._run_in_thread,
+                        args=(name, extra, finished),
+                        name="step-{}".format(name))
+                    thread.daemon = True
+                    thread.start()
+            if not running:
+                break
+
+            name, exc_info = finished.get()
+            running -= 1
+            if exc_info is None:
+                done.add(name)
+            elif error is None:
+                # The running steps are waited for, but no other starts.
+                error = exc_info
+
+        if error is not None:
+            six.reraise(*error)
+
+    def run(self):
+        """Run all the steps and return their timings."""
+        if self.concurrency == 1:
+            self._run_sequentially()
+        else:
+            self._run_concurrently()
+        return self.timings
+
+    def log_critical_path(self):
+        """Log how long the steps took and their critical path."""
+        path = critical_path(self._graph, self.timings)
+        if not path:
+            return
+        steps = ["{} ({:.1f}s)".format(timing.name, timing.duration)
+                 for timing in path]
+        LOG.info("The steps took %.1f seconds, with the critical path: %s",
+                 path[-1].end - path[0].start, " -> ".join(steps))
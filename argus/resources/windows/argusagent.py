@@ -16,6 +16,7 @@
 from __future__ import print_function
 import argparse
 import base64
+import os
 import sys
 import zipfile
 
@@ -32,6 +33,10 @@ def initialize_parser_args():
                         help="return an encoded base64 string")
     parser.add_argument("--archive", type=str, nargs="*",
                         help="archive given file")
+    parser.add_argument("--collect", type=str, nargs="*",
+                        metavar="ARCHIVE [PATH NAME ...]",
+                        help="archive the given files, each one with "
+                             "the name following its path")
     parser.add_argument("--get_user_flags", type=str, nargs="*",
                         help="Get information regarding the given user")
     parser_args = parser.parse_args()
@@ -66,6 +71,19 @@ def archive_file(filepath, archivepath):
         archive.write(filepath)
 
 
+def collect_files(archivepath, files):
+    """Archives many files at once, skipping the missing ones.
+
+    :param files: A list of pairs of file paths and archive names.
+    """
+    with zipfile.ZipFile(archivepath, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filepath, name in files:
+            if not os.path.isfile(filepath):
+                print("Skipping missing file %s" % filepath, file=sys.stderr)
+                continue
+            archive.write(filepath, name)
+
+
 def get_user_flags(user_name):
     """Gets the user flags and password expiry status for the given user."""
     user_info = _get_user_info(user_name, 4)
@@ -80,5 +98,8 @@ if __name__ == "__main__":
         base64_read_file(args.encode[0])
     if args.archive:
         archive_file(args.archive[0], args.archive[1])
+    if args.collect:
+        collect_files(args.collect[0],
+                      list(zip(args.collect[1::2], args.collect[2::2])))
     if args.get_user_flags:
         get_user_flags(args.get_user_flags[0])
@@ -19,8 +19,14 @@ import unittest
 
 import six
 
+from argus.backends import replay
+from argus.client import session
 from argus import config as argus_config
 from argus import log as argus_log
+from argus import profiling
+from argus.scenarios import pool
+from argus.scenarios import scheduler
+from argus import util
 
 LOG = argus_log.LOG
 CONFIG = argus_config.CONFIG
@@ -117,6 +123,9 @@ class BaseScenario(unittest.TestCase):
     introspection = None
     recipe = None
 
+    snapshot = None
+    """The golden snapshot from which the instance was booted, if any."""
+
     @classmethod
     def setUpClass(cls):
         """Prepare the scenario for running
@@ -125,7 +134,22 @@ class BaseScenario(unittest.TestCase):
         instance will be created and prepared. After the preparation
         is finished, the tests can run and can introspect the instance
         to check what they are supposed to be checking.
+
+        Nothing is done if the scenario was already prepared by a
+        :class:`argus.scenarios.scheduler.ScenarioSuite`, except for
+        raising the error of a failed preparation.
         """
+        preparation = scheduler.get_preparation(cls)
+        if preparation is not None and preparation.prepared:
+            if preparation.error is not None:
+                six.reraise(*preparation.error)
+            argus_log.set_scenario_name(LOG, cls.__name__)
+            return
+        cls.prepare_scenario()
+
+    @classmethod
+    def prepare_scenario(cls):
+        """Create the underlying instance and prepare it."""
         # pylint: disable=not-callable
         # Pylint is not aware that the attrs are reassigned in other modules,
         # so we're just disabling the errors for now.
@@ -142,10 +166,21 @@ class BaseScenario(unittest.TestCase):
             except OSError:
                 LOG.warning("Could not create the output directory.")
 
+        backend_type = cls.backend_type
+        if CONFIG.argus.replay_directory:
+            # The recorded session of the scenario stands for the instance.
+            backend_type = replay.ReplayBackend
+
         try:
-            cls.backend = cls.backend_type(cls.__name__,
-                                           cls.userdata, cls.metadata,
-                                           cls.availability_zone)
+            cls.backend = backend_type(cls.__name__,
+                                       cls.userdata, cls.metadata,
+                                       cls.availability_zone)
+            cls.snapshot = None
+            if (CONFIG.argus.golden_snapshots and
+                    not CONFIG.argus.replay_directory):
+                cls.snapshot = pool.POOL.snapshot(cls)
+            if cls.snapshot is not None:
+                cls.backend.boot_from_snapshot(cls.snapshot)
             cls.backend.setup_instance()
 
             cls.prepare_instance()
@@ -165,6 +200,8 @@ class BaseScenario(unittest.TestCase):
         # Pylint is not aware that the attrs are reassigned in other modules,
         # so we're just disabling the errors for now.
         cls.recipe = cls.recipe_type(cls.backend)
+        if cls.snapshot is not None:
+            cls.recipe.from_snapshot = True
 
         cls.prepare_recipe()
         cls.backend.save_instance_output()
@@ -185,5 +222,17 @@ class BaseScenario(unittest.TestCase):
         This usually means that any resource that was created in
         :meth:`setUpClass` needs to be destroyed here.
         """
-        if cls.backend:
-            cls.backend.cleanup()
+        try:
+            if cls.backend:
+                recorder = session.get_recorder(cls.__name__)
+                if recorder is not None:
+                    recorder.record_backend(cls.backend)
+                cls.backend.cleanup()
+        finally:
+            scheduler.release(cls)
+
+        stats = util.get_retry_stats(cls.__name__)
+        LOG.info("Scenario %s retried %d times and slept %.1f seconds "
+                 "between the retries.", cls.__name__, stats["retries"],
+                 stats["sleep"])
+        profiling.report(cls.__name__)
@@ -0,0 +1,126 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Share the installation of Cloudbase-Init between scenarios."""
+
+import atexit
+import threading
+
+import six
+
+from argus import log as argus_log
+from argus import util
+
+LOG = argus_log.LOG
+
+
+class _Golden(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backend = None
+        self.snapshot = None
+        self.failed = False
+
+
+class GoldenPool(object):
+    """Snapshots of instances with Cloudbase-Init installed.
+
+    For every kind of instance, a golden instance is prepared once,
+    up to the installation of Cloudbase-Init, through the
+    :meth:`prepare_golden` method of the recipe, and it is snapshotted
+    through the back-end. The scenarios boot their instances from that
+    snapshot and run only their own configuration and sysprep steps.
+
+    The instances are of the same kind when they are created by the
+    same back-end type and their recipes share the implementation
+    of all the golden steps.
+
+    The golden instances are kept until :meth:`cleanup`, since their
+    snapshots can belong to the credentials created by their back-ends.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._goldens = {}
+
+    @staticmethod
+    def _key(scenario):
+        recipe_type = scenario.recipe_type
+        steps = getattr(recipe_type, "golden_steps", ())
+        if not (steps and scenario.backend_type.supports_snapshots):
+            return None
+        return (scenario.backend_type, ) + tuple(
+            six.get_unbound_function(getattr(recipe_type, step))
+            for step in steps)
+
+    def _create(self, scenario, golden):
+        # pylint: disable=not-callable
+        name = "{}-golden".format(scenario.__name__)
+        LOG.info("Preparing golden instance %s...", name)
+        golden.backend = scenario.backend_type(
+            name, None, None, scenario.availability_zone)
+        golden.backend.setup_instance()
+        scenario.recipe_type(golden.backend).prepare_golden()
+        golden.snapshot = golden.backend.snapshot_instance(
+            util.rand_name(name))
+
+    def snapshot(self, scenario):
+        """Get the golden snapshot for the instance of a scenario.
+
+        The golden instance is prepared and snapshotted by the first
+        scenario which needs it, while the others wait for it.
+
+        :returns:
+            The id of the snapshot, or None if the scenario can't
+            use one or if its golden instance couldn't be prepared.
+        """
+        key = self._key(scenario)
+        if key is None:
+            return None
+        with self._lock:
+            golden = self._goldens.setdefault(key, _Golden())
+
+        with golden.lock:
+            if golden.snapshot is None and not golden.failed:
+                try:
+                    self._create(scenario, golden)
+                except Exception as exc:  # pylint: disable=broad-except
+                    # The scenarios are prepared from scratch instead.
+                    LOG.exception("Preparing the golden instance failed "
+                                  "with %s", exc)
+                    golden.failed = True
+            return golden.snapshot
+
+    def cleanup(self):
+        """Delete the snapshots and their golden instances."""
+        with self._lock:
+            goldens = list(self._goldens.values())
+            self._goldens.clear()
+
+        for golden in goldens:
+            if golden.backend is None:
+                continue
+            try:
+                if golden.snapshot is not None:
+                    golden.backend.delete_snapshot(golden.snapshot)
+                golden.backend.cleanup()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.exception("Cleaning up the golden instance failed "
+                              "with %s", exc)
+
+
+POOL = GoldenPool()
+atexit.register(POOL.cleanup)
@@ -0,0 +1,220 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Prepare the instances of multiple scenarios at the same time."""
+
+import sys
+import threading
+import unittest
+
+from six.moves import queue
+
+from argus import config as argus_config
+from argus import log as argus_log
+
+CONFIG = argus_config.CONFIG
+LOG = argus_log.LOG
+
+# The preparations of the scenarios which are run by a ScenarioSuite.
+_PREPARATIONS = {}
+_PREPARATIONS_LOCK = threading.Lock()
+
+
+class Preparation(object):
+    """The preparation of a scenario, done by a :class:`ScenarioSuite`.
+
+    :ivar prepared: Whether the preparation finished.
+    :ivar error: The exception info of a failed preparation, if any.
+    :ivar on_teardown:
+        A callable called once when the scenario is cleaned up,
+        releasing its instance from the quota.
+    """
+
+    def __init__(self):
+        self.prepared = False
+        self.error = None
+        self.on_teardown = None
+
+
+def get_preparation(scenario):
+    """Get the :class:`Preparation` of the given scenario class.
+
+    :returns:
+        None if the scenario is not run by a :class:`ScenarioSuite`.
+    """
+    with _PREPARATIONS_LOCK:
+        return _PREPARATIONS.get(scenario)
+
+
+def release(scenario):
+    """Tell the scheduler that the given scenario was cleaned up."""
+    with _PREPARATIONS_LOCK:
+        preparation = _PREPARATIONS.get(scenario)
+        if preparation is None or preparation.on_teardown is None:
+            return
+        on_teardown, preparation.on_teardown = preparation.on_teardown, None
+    on_teardown()
+
+
+def _test_cases(tests):
+    for test in tests:
+        if isinstance(test, unittest.TestSuite):
+            for case in _test_cases(test):
+                yield case
+        else:
+            yield test
+
+
+def load_scenarios(tests, concurrency=None, quota=None):
+    """Run the loaded scenarios through a :class:`ScenarioSuite`.
+
+    This is meant for the `load_tests` function of the modules
+    which define scenarios::
+
+        def load_tests(loader, tests, pattern):
+            return scheduler.load_scenarios(tests)
+
+    The tests are returned as they are when the scenarios are
+    prepared one at a time. The skipped scenarios and the other
+    tests are left to :mod:`unittest`.
+    """
+    concurrency = concurrency or CONFIG.argus.scenario_concurrency
+    if concurrency <= 1:
+        return tests
+
+    scenarios, others = [], unittest.TestSuite()
+    for test in _test_cases(tests):
+        scenario = type(test)
+        if (hasattr(scenario, "prepare_scenario") and
+                not getattr(scenario, "__unittest_skip__", False)):
+            if scenario not in scenarios:
+                scenarios.append(scenario)
+        else:
+            others.addTest(test)
+    others.addTest(ScenarioSuite(scenarios, concurrency, quota))
+    return others
+
+
+class ScenarioSuite(unittest.TestSuite):
+    """A test suite which prepares its scenarios concurrently.
+
+    The instances of the scenarios are created and prepared in
+    threads, at most `concurrency` at the same time, and the tests
+    of every scenario are run as soon as its instance is ready,
+    in the order in which the instances become ready.
+
+    When a `quota` is given, at most that many instances exist at
+    the same time: the preparation of a scenario starts only after
+    the instance of another one was cleaned up, if the limit
+    was reached.
+
+    The suites are usually built by :func:`load_scenarios`.
+
+    :param scenarios:
+        The scenario classes, subclasses of
+        :class:`argus.scenarios.base.BaseScenario`.
+    :param concurrency:
+        How many instances are prepared at the same time.
+        ``scenario_concurrency`` from the config is used by default.
+    :param quota:
+        How many instances can exist at the same time, 0 for no limit.
+        ``scenario_quota`` from the config is used by default.
+    """
+
+    def __init__(self, scenarios, concurrency=None, quota=None):
+        super(ScenarioSuite, self).__init__()
+        loader = unittest.TestLoader()
+        self._scenarios = list(scenarios)
+        self._suites = {}
+        for scenario in self._scenarios:
+            suite = loader.loadTestsFromTestCase(scenario)
+            self._suites[scenario] = suite
+            self.addTest(suite)
+
+        self.concurrency = max(concurrency or
+                               CONFIG.argus.scenario_concurrency, 1)
+        self.quota = CONFIG.argus.scenario_quota if quota is None else quota
+
+    @staticmethod
+    def _prepare(scenario, preparation, preparing, ready):
+        with argus_log.isolated_extra(LOG):
+            with preparing:
+                try:
+                    scenario.prepare_scenario()
+                except Exception:  # pylint: disable=broad-except
+                    # It is raised again by setUpClass, where it
+                    # is reported as the error of the scenario.
+                    preparation.error = sys.exc_info()
+            preparation.prepared = True
+            ready.put(scenario)
+
+    def _start(self, preparations, preparing, instances, ready):
+        for scenario in self._scenarios:
+            preparation = preparations[scenario]
+            if instances is not None:
+                instances.acquire()
+                # The instance is released when the scenario is cleaned up.
+                preparation.on_teardown = instances.release
+            thread = threading.Thread(
+                target=self._prepare,
+                args=(scenario, preparation, preparing, ready),
+                name="prepare-{}".format(scenario.__name__))
+            thread.daemon = True
+            thread.start()
+
+    def run(self, result, debug=False):
+        preparing = threading.BoundedSemaphore(self.concurrency)
+        instances = (threading.BoundedSemaphore(self.quota)
+                     if self.quota else None)
+        ready = queue.Queue()
+        preparations = {scenario: Preparation()
+                        for scenario in self._scenarios}
+        with _PREPARATIONS_LOCK:
+            _PREPARATIONS.update(preparations)
+        LOG.info("Preparing %d scenarios, %d at a time.",
+                 len(self._scenarios), self.concurrency)
+
+        starter = threading.Thread(
+            target=self._start, name="scheduler",
+            args=(preparations, preparing, instances, ready))
+        starter.daemon = True
+        starter.start()
+
+        try:
+            for _ in self._scenarios:
+                scenario = ready.get()
+                if result.shouldStop:
+                    if preparations[scenario].error is None:
+                        scenario.tearDownClass()
+                    continue
+                LOG.info("Scenario %s is ready.", scenario.__name__)
+                self._run_scenario(scenario, result)
+        finally:
+            with _PREPARATIONS_LOCK:
+                for scenario in preparations:
+                    _PREPARATIONS.pop(scenario, None)
+        return result
+
+    def _run_scenario(self, scenario, result):
+        # pylint: disable=protected-access
+        # Every scenario is run as a top level suite, so that it is
+        # cleaned up right after its tests, releasing its instance.
+        entered = getattr(result, "_testRunEntered", False)
+        result._testRunEntered = False
+        try:
+            self._suites[scenario].run(result)
+        finally:
+            result._testRunEntered = entered
+            result._previousTestClass = None
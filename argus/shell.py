@@ -25,6 +25,7 @@ from argus.backends.tempest import manager
 from argus import config as argus_config
 from argus.config import ci
 from argus import exceptions
+from argus import profiling
 
 import requests
 import six
@@ -224,6 +225,14 @@ def main():
 
     subunit2html.main()
 
+    # Merge the traces written by the testr workers, next to the report.
+    trace = profiling.merge_traces(
+        os.path.join(base_directory, "output"),
+        os.path.join(base_directory,
+                     "argus-trace-{}.json".format(image_name)))
+    if trace:
+        print("The trace of the run was written to {}".format(trace))
+
     return exit_code
 
 
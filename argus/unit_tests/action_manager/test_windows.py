@@ -18,7 +18,10 @@
 # pylint: disable=no-value-for-parameter, too-many-lines, protected-access
 # pylint: disable=too-many-public-methods
 
+import collections
+import json
 import ntpath
+import threading
 import unittest
 
 try:
@@ -27,13 +30,16 @@ except ImportError:
     import mock
 
 import requests
+import six
 
 from six.moves import urllib_parse as urlparse
 
 from argus.action_manager import windows as action_manager
+from argus.benchmarks import suite
 from argus import config as argus_config
 from argus import exceptions
 from argus.introspection.cloud import windows as introspection
+from argus.unit_tests import fake_winrm
 from argus.unit_tests import test_utils
 from argus import util
 
@@ -280,6 +286,7 @@ class WindowsActionManagerTest(unittest.TestCase):
                                              test_utils.LOCATION,
                                              count=0)
         self.assertFalse(res)
+        self.assertFalse(self._client.run_command.called)
 
     @mock.patch('argus.action_manager.windows.WindowsActionManager.'
                 'exists')
@@ -308,6 +315,22 @@ class WindowsActionManagerTest(unittest.TestCase):
                                              test_utils.LOCATION,
                                              count=2)
         self.assertFalse(res)
+        self.assertEqual(2, self._client.run_command.call_count)
+
+    @mock.patch('time.sleep')
+    def test_git_clone_removes_partial_checkout(self, _):
+        self._client.run_command_with_retry.side_effect = [
+            ("-", "", 0), ("Container|0|0", "", 0), ("", "", 0)]
+        self._client.run_command.side_effect = [exceptions.ArgusError,
+                                                None]
+
+        res = self._action_manager.git_clone(test_utils.URL,
+                                             test_utils.LOCATION, count=2)
+
+        self.assertTrue(res)
+        self._client.run_command_with_retry.assert_called_with(
+            "IF EXIST '{0}' (RD /S /Q '{0}')".format(test_utils.LOCATION),
+            command_type=util.CMD)
 
     def _test_wait_cbinit_service(self, run_command_exc=None):
         if run_command_exc:
@@ -348,13 +371,29 @@ class WindowsActionManagerTest(unittest.TestCase):
 
     def test_check_cbinit_service_fail_clierror(self):
         self._client.run_command_until_condition = mock.Mock(
-            side_effect=[None, exceptions.ArgusCLIError, None])
+            side_effect=exceptions.ArgusCLIError)
 
         with self.assertRaises(exceptions.ArgusCLIError):
             self._action_manager.check_cbinit_service(
                 test_utils.SEARCHED_PATHS)
         self.assertEqual(
-            self._client.run_command_until_condition.call_count, 2)
+            self._client.run_command_until_condition.call_count, 1)
+
+    def test_check_cbinit_service_polls_all_paths(self):
+        self._action_manager.check_cbinit_service(test_utils.SEARCHED_PATHS)
+
+        (command, condition), _ = (
+            self._client.run_command_until_condition.call_args)
+        self.assertEqual(
+            action_manager._stat_script(test_utils.SEARCHED_PATHS), command)
+        self.assertTrue(condition("Leaf|1|0\r\n" * 3))
+        self.assertFalse(condition("Leaf|1|0\r\n-\r\nLeaf|1|0"))
+        self.assertFalse(condition("garbage"))
+
+    def test_check_cbinit_service_no_paths(self):
+        self._action_manager.check_cbinit_service()
+
+        self.assertFalse(self._client.run_command_until_condition.called)
 
     @test_utils.ConfPatcher('image_username', test_utils.USERNAME, 'openstack')
     @mock.patch('argus.action_manager.windows.wait_boot_completion')
@@ -504,40 +543,100 @@ class WindowsActionManagerTest(unittest.TestCase):
     def test_rmdir_run_command_exception(self):
         self._test_rmdir(run_exc=exceptions.ArgusTimeoutError)
 
-    def _test__exists(self, fail=False, run_command_exc=None):
-        cmd = 'Test-Path -PathType {} -Path "{}"'.format(
-            test_utils.PATH_TYPE, test_utils.PATH)
-
-        if run_command_exc:
-            self._client.run_command_with_retry = mock.Mock(
-                side_effect=run_command_exc)
-            with self.assertRaises(run_command_exc):
-                self._action_manager._exists(
-                    test_utils.PATH, test_utils.PATH_TYPE)
-            return
+    def test_stat_many(self):
+        ticks = action_manager._EPOCH_TICKS + 15 * 10 ** 7
+        self._client.run_command_with_retry.return_value = (
+            "Leaf|10|{0}\r\n-\r\nContainer|0|{0}\r\n".format(ticks),
+            "", 0)
+        paths = [r"C:\file", r"C:\missing", r"C:\dir"]
 
-        if fail:
-            self._client.run_command_with_retry.return_value = (
-                "False", "fake-stderr", 0)
-            self.assertFalse(self._action_manager._exists(
-                test_utils.PATH, test_utils.PATH_TYPE))
-        else:
-            self._client.run_command_with_retry.return_value = (
-                "True", "fake-stderr", 0)
-            self.assertTrue(self._action_manager._exists(
-                test_utils.PATH, test_utils.PATH_TYPE))
+        stats = self._action_manager.stat_many(paths)
 
+        self.assertEqual(
+            [action_manager.PathStat(r"C:\file", True, "Leaf", 10, 15),
+             action_manager.PathStat(r"C:\missing", False, None, None,
+                                     None),
+             action_manager.PathStat(r"C:\dir", True, "Container", 0, 15)],
+            stats)
         self._client.run_command_with_retry.assert_called_once_with(
-            cmd=cmd, command_type=util.POWERSHELL)
+            cmd=action_manager._stat_script(paths),
+            command_type=util.POWERSHELL)
+
+    def test_stat_many_is_cached(self):
+        self._client.run_command_with_retry.return_value = ("-", "", 0)
+
+        self._action_manager.stat_many([test_utils.PATH])
+        stats = self._action_manager.stat_many([test_utils.PATH.upper()])
+
+        self.assertFalse(stats[0].exists)
+        self.assertEqual(1, self._client.run_command_with_retry.call_count)
+
+    @mock.patch('time.time')
+    def test_stat_many_cache_expires(self, mock_time):
+        self._client.run_command_with_retry.return_value = ("-", "", 0)
+        mock_time.return_value = 100
+        self._action_manager.stat_many([test_utils.PATH])
+
+        mock_time.return_value += self._action_manager.STAT_CACHE_TTL
+        self._action_manager.stat_many([test_utils.PATH])
+
+        self.assertEqual(2, self._client.run_command_with_retry.call_count)
+
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '._new_item')
+    def test_changes_invalidate_the_stats(self, _):
+        self._client.run_command_with_retry.return_value = ("-", "", 0)
+
+        self._action_manager.mkdir(test_utils.PATH)
+        self._action_manager.stat(test_utils.PATH)
+
+        self.assertEqual(2, self._client.run_command_with_retry.call_count)
+
+    def test_client_calls_invalidate_the_stats(self):
+        self._client.run_command_with_retry.return_value = ("-", "", 0)
+        self._client.remote_calls = 1
+        self._action_manager.stat(test_utils.PATH)
+
+        # Anything sent through the client might have changed the files.
+        self._client.remote_calls = 2
+        self._action_manager.stat(test_utils.PATH)
+        self._action_manager.stat(test_utils.PATH)
+
+        self.assertEqual(2, self._client.run_command_with_retry.call_count)
+
+    def test_stat_many_invalid_output(self):
+        self._client.run_command_with_retry.return_value = ("-\r\n-", "", 0)
+
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.stat_many([test_utils.PATH])
+
+        self._client.run_command_with_retry.return_value = ("Leaf", "", 0)
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.stat_many([test_utils.PATH])
+
+    def _test__exists(self, stdout, path_type, expected):
+        self._client.run_command_with_retry.return_value = (stdout, "", 0)
+
+        self.assertEqual(expected, self._action_manager._exists(
+            test_utils.PATH, path_type))
 
     def test__exists_successful(self):
-        self._test__exists()
+        self._test__exists("Leaf|1|0", self._action_manager.PATH_LEAF, True)
+        self._test__exists("Leaf|1|0", self._action_manager.PATH_ANY, True)
 
     def test__exists_fail(self):
-        self._test__exists(fail=True)
+        self._test__exists("Container|0|0", self._action_manager.PATH_LEAF,
+                           False)
+        self._action_manager.invalidate_stats()
+        self._test__exists("-", self._action_manager.PATH_ANY, False)
 
     def test__exists_fail_exception(self):
-        self._test__exists(run_command_exc=exceptions.ArgusTimeoutError)
+        self._client.run_command_with_retry.side_effect = (
+            exceptions.ArgusTimeoutError)
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager._exists(test_utils.PATH,
+                                         test_utils.PATH_TYPE)
 
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '._exists')
@@ -856,18 +955,124 @@ class WindowsActionManagerTest(unittest.TestCase):
     def test_execute_argus_error(self):
         self._test_execute(exceptions.ArgusError)
 
-    def _test_check_cbinit_installation(self, get_python_dir_exc=None,
+    def _fake_finder(self, calls, result):
+        self._client.run_command_with_retry.return_value = ("", "", 0)
+
+        def finder(execute_function, *args):
+            for _ in range(calls):
+                execute_function(mock.sentinel.cmd)
+            return result
+        return mock.Mock(side_effect=finder)
+
+    def test_get_cbinit_dir_is_cached(self):
+        finder = self._fake_finder(3, test_utils.CBINIT_DIR)
+        with mock.patch.object(introspection, 'get_cbinit_dir', finder):
+            for _ in range(3):
+                self.assertEqual(test_utils.CBINIT_DIR,
+                                 self._action_manager.get_cbinit_dir())
+
+        self.assertEqual(1, finder.call_count)
+        self.assertEqual(3, self._client.run_command_with_retry.call_count)
+        self.assertEqual(6, self._action_manager.facts.saved_calls)
+
+    def test_facts_found_once_by_concurrent_steps(self):
+        started, release = threading.Event(), threading.Event()
+
+        def finder(execute_function):
+            started.set()
+            release.wait(5)
+            return test_utils.CBINIT_DIR
+        finder = mock.Mock(side_effect=finder)
+        results = []
+
+        def get():
+            results.append(self._action_manager.facts.get(
+                "cbinit_dir", finder, mock.sentinel.execute))
+
+        threads = [threading.Thread(target=get) for _ in range(2)]
+        threads[0].start()
+        started.wait(5)
+        threads[1].start()
+        threads[1].join(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(1, finder.call_count)
+        self.assertEqual([test_utils.CBINIT_DIR] * 2, results)
+
+    def test_get_cbinit_dir_uses_the_os_facts(self):
+        finder = self._fake_finder(2, test_utils.CBINIT_DIR)
+        self._action_manager.os_facts = {
+            "architecture": "AMD64",
+            "program_files": r"C:\Program Files",
+            "program_files_x86": r"C:\Program Files (x86)",
+        }
+        with mock.patch.object(introspection, 'get_cbinit_dir', finder):
+            self._action_manager.get_cbinit_dir()
+
+        self.assertEqual([r"C:\Program Files", r"C:\Program Files (x86)"],
+                         finder.call_args[0][1])
+
+    def test_get_python_dir_uses_the_cached_cbinit_dir(self):
+        cbinit_finder = self._fake_finder(3, test_utils.CBINIT_DIR)
+        python_finder = self._fake_finder(1, test_utils.PYTHON_DIR)
+        with mock.patch.object(introspection, 'get_cbinit_dir',
+                               cbinit_finder):
+            with mock.patch.object(introspection, 'get_python_dir',
+                                   python_finder):
+                self._action_manager.get_cbinit_dir()
+                self.assertEqual(test_utils.PYTHON_DIR,
+                                 self._action_manager.get_python_dir())
+                self._action_manager.get_python_dir()
+
+        self.assertEqual(1, cbinit_finder.call_count)
+        self.assertEqual(1, python_finder.call_count)
+        self.assertEqual(test_utils.CBINIT_DIR,
+                         python_finder.call_args[0][1])
+        self.assertEqual(4, self._client.run_command_with_retry.call_count)
+
+    def test_unknown_facts_are_not_cached(self):
+        finder = self._fake_finder(1, None)
+        with mock.patch.object(introspection, 'get_cbinit_dir',
+                               mock.Mock(side_effect=exceptions.ArgusError)):
+            for _ in range(2):
+                self.assertRaises(exceptions.ArgusError,
+                                  self._action_manager.get_cbinit_dir)
+        with mock.patch.object(introspection, 'get_cbinit_dir',
+                               return_value=test_utils.CBINIT_DIR):
+            with mock.patch.object(introspection, 'get_python_dir', finder):
+                self._action_manager.get_python_dir()
+                self._action_manager.get_python_dir()
+
+        self.assertEqual(2, finder.call_count)
+
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.'
+                'check_cbinit_installation', return_value=True)
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.'
+                '_run_installation_script')
+    def test_install_cbinit_invalidates_the_facts(self, *_):
+        finder = self._fake_finder(1, test_utils.CBINIT_DIR)
+        with mock.patch.object(introspection, 'get_cbinit_dir', finder):
+            self._action_manager.get_cbinit_dir()
+            self._action_manager.install_cbinit()
+            self._action_manager.get_cbinit_dir()
+
+        self.assertEqual(2, finder.call_count)
+
+    @mock.patch.object(introspection, 'get_cbinit_dir')
+    @mock.patch.object(introspection, 'get_python_dir')
+    def _test_check_cbinit_installation(self, mock_get_python_dir, _,
+                                        get_python_dir_exc=None,
                                         run_remote_cmd_exc=None):
         if get_python_dir_exc:
-            introspection.get_python_dir = mock.Mock(
-                side_effect=get_python_dir_exc)
+            mock_get_python_dir.side_effect = get_python_dir_exc
             self.assertFalse(self._action_manager.check_cbinit_installation())
             return
 
         cmd = r'& "{}\python.exe" -c "import cloudbaseinit"'.format(
             test_utils.PYTHON_DIR)
-        introspection.get_python_dir = mock.Mock(
-            return_value=test_utils.PYTHON_DIR)
+        mock_get_python_dir.return_value = test_utils.PYTHON_DIR
         if run_remote_cmd_exc:
             self._client.run_remote_cmd = mock.Mock(
                 side_effect=run_remote_cmd_exc)
@@ -890,17 +1095,16 @@ class WindowsActionManagerTest(unittest.TestCase):
         self._test_check_cbinit_installation(
             run_remote_cmd_exc=exceptions.ArgusError)
 
+    @mock.patch.object(introspection, 'get_cbinit_dir')
     @mock.patch('argus.action_manager.windows.WindowsActionManager.rmdir')
-    def _test_cbinit_cleanup(self, mock_rmdir, get_cbinit_dir_exc=None,
-                             rmdir_exc=None):
+    def _test_cbinit_cleanup(self, mock_rmdir, mock_get_cbinit_dir,
+                             get_cbinit_dir_exc=None, rmdir_exc=None):
         if get_cbinit_dir_exc:
-            introspection.get_cbinit_dir = mock.Mock(
-                side_effect=get_cbinit_dir_exc)
+            mock_get_cbinit_dir.side_effect = get_cbinit_dir_exc
             self.assertFalse(self._action_manager.cbinit_cleanup())
             return
 
-        introspection.get_cbinit_dir = mock.Mock(
-            return_value=test_utils.CBINIT_DIR)
+        mock_get_cbinit_dir.return_value = test_utils.CBINIT_DIR
         if rmdir_exc:
             mock_rmdir.side_effect = rmdir_exc
             self.assertFalse(self._action_manager.cbinit_cleanup())
@@ -953,6 +1157,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         self.assertEqual(mock_deploy.call_count, 1)
         self.assertEqual(mock_cleanup.call_count, 1)
 
+    @mock.patch('time.sleep')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '.cbinit_cleanup')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
@@ -962,7 +1167,8 @@ class WindowsActionManagerTest(unittest.TestCase):
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '._run_installation_script')
     def test_install_cbinit_run_installation_script_exc(
-            self, mock_run, mock_deploy, mock_check, mock_cleanup):
+            self, mock_run, mock_deploy, mock_check, mock_cleanup,
+            mock_sleep):
         mock_check.side_effect = [False, True]
         mock_deploy.side_effect = exceptions.ArgusTimeoutError
 
@@ -972,6 +1178,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         self.assertEqual(mock_deploy.call_count, 1)
         self.assertEqual(mock_cleanup.call_count, 2)
 
+    @mock.patch('time.sleep')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '.cbinit_cleanup')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
@@ -981,7 +1188,8 @@ class WindowsActionManagerTest(unittest.TestCase):
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '._run_installation_script')
     def test_install_cbinit_at_last_try(
-            self, mock_run, mock_deploy, mock_check, mock_cleanup):
+            self, mock_run, mock_deploy, mock_check, mock_cleanup,
+            mock_sleep):
         mock_check.side_effect = [True]
         retry_count = CONFIG.argus.retry_count
         run_fails = [
@@ -1000,6 +1208,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         self.assertEqual(mock_cleanup.call_count,
                          CONFIG.argus.retry_count * 2 - 1)
 
+    @mock.patch('time.sleep')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '.cbinit_cleanup')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
@@ -1009,7 +1218,8 @@ class WindowsActionManagerTest(unittest.TestCase):
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '._run_installation_script')
     def test_install_cbinit_timeout_fail(
-            self, mock_run, mock_deploy, mock_check, mock_cleanup):
+            self, mock_run, mock_deploy, mock_check, mock_cleanup,
+            mock_sleep):
         retry_count = CONFIG.argus.retry_count
         mock_check.side_effect = [False for _ in range(2 * retry_count)]
 
@@ -1018,6 +1228,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         self.assertEqual(mock_run.call_count, retry_count)
         self.assertEqual(mock_deploy.call_count, retry_count)
         self.assertEqual(mock_cleanup.call_count, 2 * retry_count)
+        self.assertEqual(mock_sleep.call_count, retry_count - 1)
 
     @test_utils.ConfPatcher(
         'installer_root_url', test_utils.INSTALLER_ROOT_URL, 'argus')
@@ -1292,132 +1503,105 @@ class ActionManagerTest(unittest.TestCase):
                 action_manager.wait_boot_completion(
                     self._client, test_utils.USERNAME))
 
-    def test_wait_boot_completion_successful(self):
-        self._test_wait_boot_completion()
-
-    def test_wait_boot_completion_fail(self):
-        self._test_wait_boot_completion(
-            run_command_exc=exceptions.ArgusTimeoutError)
-
-    def _test_is_nanoserver(self, run_command_test_exc=None, path_exists=True,
-                            run_command_get_exc=None, is_nanoserver=True):
-        client = mock.MagicMock()
-
-        if run_command_test_exc:
-            client.run_command_with_retry.side_effect = run_command_test_exc
-            with self.assertRaises(run_command_test_exc):
-                action_manager._is_nanoserver(client)
-            return
-
-        if not path_exists:
-            client.run_command_with_retry.side_effect = [
-                ("False", test_utils.STDERR, test_utils.EXIT_CODE)]
-            self.assertFalse(action_manager._is_nanoserver(client))
-            return
-
-        client.run_command_with_retry.side_effect = [
-            ("True", test_utils.STDERR, test_utils.EXIT_CODE)]
-
-        if run_command_get_exc:
-            client.run_command_with_retry.side_effect = run_command_get_exc
-            with self.assertRaises(run_command_get_exc):
-                action_manager._is_nanoserver(client)
-            return
-
-        if is_nanoserver:
-            client.run_command_with_retry.side_effect = [
-                ("True", test_utils.STDERR, test_utils.EXIT_CODE),
-                ("1", test_utils.STDERR, test_utils.EXIT_CODE)]
-        else:
-            client.run_command_with_retry.side_effect = [
-                ("True", test_utils.STDERR, test_utils.EXIT_CODE),
-                ("0", test_utils.STDERR, test_utils.EXIT_CODE)]
-
-        action_manager._is_nanoserver(client)
-
-        server_level_key = (r'HKLM:\Software\Microsoft\Windows NT'
-                            r'\CurrentVersion\Server\ServerLevels')
-        cmd1 = r'Test-Path "{}"'.format(server_level_key)
-        cmd2 = r'(Get-ItemProperty "{}").NanoServer'.format(server_level_key)
+    def test_wait_boot_completion_probes_first(self):
+        calls = []
+        self._client.wait_for_endpoint.side_effect = lambda: calls.append(
+            "probe") or collections.OrderedDict([("tcp", 1.5),
+                                                 ("identify", 0.25)])
+        self._client.run_command_until_condition.side_effect = (
+            lambda *args, **kwargs: calls.append("command"))
 
-        calls = [
-            mock.call(cmd1, count=CONFIG.argus.retry_count,
-                      delay=CONFIG.argus.retry_delay,
-                      command_type=util.POWERSHELL),
-            mock.call(cmd2, count=CONFIG.argus.retry_count,
-                      delay=CONFIG.argus.retry_delay,
-                      command_type=util.POWERSHELL)
-        ]
+        with test_utils.LogSnatcher('argus.action_manager.windows'
+                                    '.wait_boot_completion') as snatcher:
+            action_manager.wait_boot_completion(self._client,
+                                                test_utils.USERNAME)
 
-        client.run_command_with_retry.assert_has_calls(calls)
+        self.assertEqual(["probe", "command"], calls)
+        self.assertEqual(1, len(snatcher.output))
+        six.assertRegex(
+            self, snatcher.output[0],
+            r"The instance was ready after \S+ seconds "
+            r"\(tcp: 1\.5s, identify: 0\.2s, command: \S+s\)\.")
 
-    def test_is_nanoserver(self):
-        self._test_is_nanoserver()
+    def test_wait_boot_completion_probe_exc(self):
+        self._client.wait_for_endpoint.side_effect = (
+            exceptions.ArgusTimeoutError)
 
-    def test_is_nanoserver_run_command_test_exc(self):
-        self._test_is_nanoserver(
-            run_command_test_exc=exceptions.ArgusTimeoutError)
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            action_manager.wait_boot_completion(self._client,
+                                                test_utils.USERNAME)
+        self.assertFalse(self._client.run_command_until_condition.called)
 
-    def test_is_nanoserver_path_not_exists(self):
-        self._test_is_nanoserver(path_exists=False)
+    def test_wait_boot_completion_successful(self):
+        self._test_wait_boot_completion()
 
-    def test_is_nanoserver_run_command_get_exc(self):
-        self._test_is_nanoserver(
-            run_command_get_exc=exceptions.ArgusTimeoutError)
+    def test_wait_boot_completion_fail(self):
+        self._test_wait_boot_completion(
+            run_command_exc=exceptions.ArgusTimeoutError)
 
-    def test_is_not_nanoserver(self):
-        self._test_is_nanoserver(is_nanoserver=False)
+    def _make_facts(self, major_version, minor_version, product_type,
+                    is_nanoserver=False):
+        return {
+            "major": major_version, "minor": minor_version,
+            "product_type": product_type, "nano": is_nanoserver,
+            "architecture": "AMD64",
+            "program_files": r"C:\Program Files",
+            "program_files_x86": r"C:\Program Files (x86)",
+        }
+
+    def test_probe_os(self):
+        facts = self._make_facts(10, 0, 3, is_nanoserver=True)
+        self._client.run_command_with_retry.return_value = (
+            json.dumps(facts) + "\r\n", "", 0)
+
+        self.assertEqual(facts, action_manager.probe_os(self._client))
+        self._client.run_command_with_retry.assert_called_once_with(
+            action_manager._OS_PROBE, count=CONFIG.argus.retry_count,
+            delay=CONFIG.argus.retry_delay, command_type=util.POWERSHELL)
 
-    def _test_get_product_type(self, major_version, run_command_exc=None):
-        self._client.run_command_with_retry = mock.Mock()
+    def test_probe_os_invalid_output(self):
+        self._client.run_command_with_retry.return_value = (
+            "garbage", "", 0)
 
-        if run_command_exc:
-            self._client.run_command_with_retry.side_effect = run_command_exc
-            with self.assertRaises(run_command_exc):
-                action_manager._get_product_type(self._client, major_version)
-            return
+        with self.assertRaises(exceptions.ArgusError):
+            action_manager.probe_os(self._client)
 
-        self._client.run_command_with_retry.side_effect = [
-            (test_utils.PRODUCT_TYPE_1, test_utils.STDERR,
-             test_utils.EXIT_CODE)
-        ]
+    @mock.patch('argus.action_manager.windows.wait_boot_completion')
+    @mock.patch('argus.action_manager.windows.probe_os')
+    def test_get_os_facts_are_kept_by_the_client(self, mock_probe_os,
+                                                 mock_wait_boot_completion):
+        self._client.os_facts = None
 
-        cmdlet = action_manager.Windows8ActionManager.WINDOWS_MANAGEMENT_CMDLET
-        if major_version == 10:
-            cmdlet = (action_manager.Windows10ActionManager
-                      .WINDOWS_MANAGEMENT_CMDLET)
-        cmd = r"({} -Class Win32_OperatingSystem).producttype".format(cmdlet)
+        for _ in range(3):
+            self.assertIs(mock_probe_os.return_value,
+                          action_manager.get_os_facts(self._client))
 
-        self.assertEqual(
-            action_manager._get_product_type(self._client, major_version),
-            int(test_utils.PRODUCT_TYPE_1))
-        self._client.run_command_with_retry.assert_called_once_with(
-            cmd, count=CONFIG.argus.retry_count,
-            delay=CONFIG.argus.retry_delay,
-            command_type=util.POWERSHELL)
+        self.assertIs(mock_probe_os.return_value, self._client.os_facts)
+        mock_probe_os.assert_called_once_with(self._client)
+        self.assertEqual(1, mock_wait_boot_completion.call_count)
 
-    def test_get_product_type_major_version_6(self):
-        self._test_get_product_type(major_version=test_utils.MAJOR_VERSION_6)
+    @mock.patch('argus.action_manager.windows.wait_boot_completion')
+    @mock.patch('argus.action_manager.windows.probe_os')
+    def test_get_os_facts_given_to_the_client(self, mock_probe_os,
+                                              mock_wait_boot_completion):
+        self._client.os_facts = mock.sentinel.facts
 
-    def test_get_product_type_major_version_10(self):
-        self._test_get_product_type(major_version=test_utils.MAJOR_VERSION_10)
+        self.assertIs(mock.sentinel.facts,
+                      action_manager.get_os_facts(self._client))
 
-    def test_get_product_type_run_command_exc(self):
-        self._test_get_product_type(
-            major_version=test_utils.MAJOR_VERSION_6,
-            run_command_exc=exceptions.ArgusTimeoutError)
+        self.assertFalse(mock_probe_os.called)
+        self.assertFalse(mock_wait_boot_completion.called)
 
     @test_utils.ConfPatcher('image_username', test_utils.IMAGE_USERNAME,
                             'openstack')
     @mock.patch('argus.action_manager.windows.wait_boot_completion')
-    @mock.patch('argus.action_manager.windows._get_product_type')
-    @mock.patch('argus.action_manager.windows._is_nanoserver')
+    @mock.patch('argus.action_manager.windows.probe_os')
     def _test_get_windows_action_manager(
-            self, mock_is_nanoserver, mock_get_product_type,
-            mock_wait_boot_completion, major_version, minor_version,
-            product_type, is_nanoserver=False, is_nanoserver_exc=None,
-            get_product_type_exc=None, get_os_version_exc=None,
+            self, mock_probe_os, mock_wait_boot_completion,
+            major_version, minor_version, product_type,
+            is_nanoserver=False, probe_os_exc=None,
             wait_boot_completion_exc=None):
+        self._client.os_facts = None
 
         if wait_boot_completion_exc:
             mock_wait_boot_completion.side_effect = wait_boot_completion_exc
@@ -1425,43 +1609,18 @@ class ActionManagerTest(unittest.TestCase):
                 action_manager.get_windows_action_manager(self._client)
             return
 
-        if get_os_version_exc is None:
-            get_os_version_exc = [None, None]
-        introspection.get_os_version = mock.Mock(
-            side_effect=get_os_version_exc)
-
-        if get_os_version_exc[0]:
-            with self.assertRaises(get_os_version_exc[0]):
-                action_manager.get_windows_action_manager(self._client)
-            return
-
-        if get_os_version_exc[1]:
-            with self.assertRaises(get_os_version_exc[1]):
+        if probe_os_exc:
+            mock_probe_os.side_effect = probe_os_exc
+            with self.assertRaises(probe_os_exc):
                 action_manager.get_windows_action_manager(self._client)
             return
 
-        introspection.get_os_version.side_effect = [major_version,
-                                                    minor_version]
-
-        if get_product_type_exc:
-            mock_get_product_type.side_effect = get_product_type_exc
-            with self.assertRaises(get_product_type_exc):
-                action_manager.get_windows_action_manager(self._client)
-            return
-
-        mock_get_product_type.return_value = product_type
+        facts = self._make_facts(major_version, minor_version, product_type,
+                                 is_nanoserver)
+        mock_probe_os.return_value = facts
 
         windows_type = util.WINDOWS_VERSION.get(
             (major_version, minor_version, product_type), util.WINDOWS)
-
-        if is_nanoserver_exc:
-            mock_is_nanoserver.side_effect = is_nanoserver_exc
-            with self.assertRaises(is_nanoserver_exc):
-                action_manager.get_windows_action_manager(self._client)
-            return
-
-        mock_is_nanoserver.return_value = is_nanoserver
-
         if isinstance(windows_type, dict):
             windows_type = windows_type[is_nanoserver]
 
@@ -1479,13 +1638,16 @@ class ActionManagerTest(unittest.TestCase):
                                   " version: {}").format(windows_type)
         with test_utils.LogSnatcher('argus.action_manager.windows'
                                     '.get_windows_action_manager') as snatcher:
+            manager = action_manager.get_windows_action_manager(self._client)
             self.assertTrue(isinstance(
-                action_manager.get_windows_action_manager(self._client),
-                action_manager.WindowsActionManagers[windows_type]))
+                manager, action_manager.WindowsActionManagers[windows_type]))
             self.assertEqual(snatcher.output,
                              [log_message_booting,
                               log_message_action_manager_type,
                               log_message_log_update])
+        self.assertIs(facts, manager.os_facts)
+        mock_wait_boot_completion.assert_called_once_with(
+            self._client, test_utils.IMAGE_USERNAME)
 
     def test_get_windows_action_manager_wait_boot_completion_exc(self):
         self._test_get_windows_action_manager(
@@ -1494,33 +1656,12 @@ class ActionManagerTest(unittest.TestCase):
             product_type=int(test_utils.PRODUCT_TYPE_1),
             wait_boot_completion_exc=exceptions.ArgusTimeoutError)
 
-    def test_get_windows_action_manager_get_major_version_exc(self):
-        self._test_get_windows_action_manager(
-            major_version=int(test_utils.MAJOR_VERSION_10),
-            minor_version=int(test_utils.MINOR_VERSION_0),
-            product_type=int(test_utils.PRODUCT_TYPE_1),
-            get_os_version_exc=[exceptions.ArgusTimeoutError, None])
-
-    def test_get_windows_action_manager_get_minor_version_exc(self):
-        self._test_get_windows_action_manager(
-            major_version=int(test_utils.MAJOR_VERSION_10),
-            minor_version=int(test_utils.MINOR_VERSION_0),
-            product_type=int(test_utils.PRODUCT_TYPE_1),
-            get_os_version_exc=[None, exceptions.ArgusTimeoutError])
-
-    def test_get_windows_action_manager_get_product_type_exc(self):
+    def test_get_windows_action_manager_probe_os_exc(self):
         self._test_get_windows_action_manager(
             major_version=int(test_utils.MAJOR_VERSION_10),
             minor_version=int(test_utils.MINOR_VERSION_0),
             product_type=int(test_utils.PRODUCT_TYPE_1),
-            get_product_type_exc=exceptions.ArgusTimeoutError)
-
-    def test_get_windows_action_manager_is_nanoserver_exc(self):
-        self._test_get_windows_action_manager(
-            major_version=int(test_utils.MAJOR_VERSION_10),
-            minor_version=int(test_utils.MINOR_VERSION_0),
-            product_type=int(test_utils.PRODUCT_TYPE_1),
-            is_nanoserver_exc=exceptions.ArgusTimeoutError)
+            probe_os_exc=exceptions.ArgusTimeoutError)
 
     def test_get_windows_10_action_manager(self):
         self._test_get_windows_action_manager(
@@ -1534,3 +1675,32 @@ class ActionManagerTest(unittest.TestCase):
             minor_version=int(test_utils.MINOR_VERSION_0),
             product_type=int(test_utils.PRODUCT_TYPE_3),
             is_nanoserver=True)
+
+
+class TestRoundTrips(unittest.TestCase):
+    """The remote traffic of the action manager, against a scripted guest."""
+
+    def setUp(self):
+        environment = suite.Environment(installed=True)
+        self._environment = environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+        self._client = self._environment.client
+
+    def _budget(self, **limits):
+        return fake_winrm.RoundTripBudget(self._environment.server, **limits)
+
+    def test_get_windows_action_manager(self):
+        with self._budget(shells=1, commands=2):
+            action_manager.get_windows_action_manager(self._client)
+
+    def test_agent_commands_reuse_the_python_dir(self):
+        manager = self._client.manager
+        manager.get_python_dir()
+
+        with self._budget(commands=3) as budget:
+            for _ in range(3):
+                manager.collect_files([(r"C:\installation.log", "log")],
+                                      r"C:\logs.zip")
+
+        self.assertTrue(all("--collect" in command
+                            for command in budget.commands))
@@ -16,7 +16,11 @@
 # pylint: disable=no-value-for-parameter, protected-access, arguments-differ
 # pylint: disable=no-member, unused-argument
 
+import os
+import shutil
+import tempfile
 import unittest
+
 from argus.backends.tempest import manager
 from argus import exceptions
 
@@ -100,15 +104,34 @@ class TestAPIManager(unittest.TestCase):
         self.assertEqual(result, "fake output")
 
     def test_instance_output(self):
-        fake_content = "fake content 1\nfake content 2"
-        mock__instance_output = mock.Mock()
-        mock__instance_output.return_value = fake_content
-
+        output = ["line {}\n".format(index) for index in range(200)]
+        mock__instance_output = mock.Mock(
+            side_effect=lambda instance_id, limit: "".join(output[-limit:]))
         self._api_manager._instance_output = mock__instance_output
+        self.addCleanup(self._api_manager.cleanup_console_logs)
+
+        first = self._api_manager.instance_output(instance_id="fake id")
+        output.extend(["line 200\n", "line 201\n"])
+        last = self._api_manager.instance_output(instance_id="fake id",
+                                                 limit=3)
+
+        self.assertEqual("".join(output[:200]), first)
+        self.assertEqual("line 199\nline 200\nline 201\n", last)
+        # The whole output was requested only once.
+        self.assertEqual(
+            [mock.call("fake id", 128), mock.call("fake id", 256),
+             mock.call("fake id", 128)],
+            mock__instance_output.call_args_list)
+
+    def test_cleanup_console_logs(self):
+        self._api_manager._instance_output = mock.Mock(return_value="line\n")
+        self._api_manager.instance_output(instance_id="fake id")
+        path = self._api_manager._console_logs["fake id"].path
 
-        self._api_manager.instance_output(instance_id="fake id", limit=10)
+        self._api_manager.cleanup_console_logs()
 
-        self.assertEqual(2, mock__instance_output.call_count)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual({}, self._api_manager._console_logs)
 
     def test_instance_server(self):
         mock_servers_client = mock.Mock()
@@ -145,6 +168,76 @@ class TestAPIManager(unittest.TestCase):
             mock_primary_credentials.assert_called_once()
 
 
+class TestConsoleLog(unittest.TestCase):
+
+    def setUp(self):
+        self._output = []
+        self._requests = []
+        self._console_log = manager.ConsoleLog(self._fetch)
+        self.addCleanup(self._console_log.close)
+
+    def _fetch(self, limit):
+        self._requests.append(limit)
+        return "".join(line + "\n" for line in self._output[-limit:])
+
+    def test_only_new_lines_are_appended(self):
+        self._output.extend(["boot", "sysprep"])
+        self.assertEqual(["boot", "sysprep"], self._console_log.update())
+
+        self._output.append("cloudbase-init")
+        self.assertEqual(["cloudbase-init"], self._console_log.update())
+        self.assertEqual([], self._console_log.update())
+
+        with open(self._console_log.path) as stream:
+            self.assertEqual("boot\nsysprep\ncloudbase-init\n",
+                             stream.read())
+
+    def test_more_lines_than_the_output_size(self):
+        self._output.extend(["boot", ""])
+        self._console_log.update()
+
+        # The last tail starts with a line seen before.
+        lines = ["sysprep {}".format(index) for index in range(5)]
+        lines += [""] + ["line {}".format(index)
+                         for index in range(manager.OUTPUT_SIZE - 1)]
+        self._output.extend(lines)
+        self._console_log.update()
+
+        with open(self._console_log.path) as stream:
+            self.assertEqual(["boot", ""] + lines,
+                             stream.read().splitlines())
+
+    def test_read(self):
+        self._output.extend(["line 1", "line 2", "line 3"])
+        self._console_log.update()
+        requests = list(self._requests)
+
+        self.assertEqual("line 1\nline 2\nline 3\n",
+                         self._console_log.read())
+        self.assertEqual("line 3\n", self._console_log.read(1))
+        # Reading the log doesn't request the console output again.
+        self.assertEqual(requests, self._requests)
+
+    @mock.patch('argus.backends.tempest.manager.CONFIG')
+    def test_path_in_output_directory(self, mock_config):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        mock_config.argus.output_directory = directory
+        api_manager = manager.APIManager.__new__(manager.APIManager)
+        api_manager._console_logs = {}
+        api_manager._instance_output = mock.Mock(return_value="line\n")
+
+        api_manager.instance_output("fake id")
+        path = api_manager._console_logs["fake id"].path
+        api_manager.cleanup_console_logs()
+
+        self.assertEqual(directory, os.path.dirname(path))
+        self.assertTrue(path.endswith("-console-fake id.log"))
+        # The log is kept, since it is not a temporary file.
+        with open(path) as stream:
+            self.assertEqual("line\n", stream.read())
+
+
 class TestKeypair(unittest.TestCase):
 
     def setUp(self):
@@ -412,6 +412,60 @@ class TestBaseTempestBackend(unittest.TestCase):
         self.assertEqual(result, "fake ip")
 
 
+class TestTempestSnapshots(unittest.TestCase):
+
+    @mock.patch('argus.backends.tempest.manager.APIManager')
+    def setUp(self, mock_api_manager):
+        self._backend = FakeBaseTempestBackend(
+            mock.sentinel, None, mock.sentinel, mock.sentinel)
+
+    @mock.patch('tempest.common.waiters.wait_for_server_status')
+    @mock.patch('tempest.common.waiters.wait_for_image_status')
+    def _test_snapshot_instance(self, mock_wait, mock_wait_server,
+                                response, headers=None):
+        images_client = self._backend._manager.compute_images_client
+        images_client.create_image.return_value = mock.MagicMock(
+            response=headers or {})
+        images_client.create_image.return_value.get.side_effect = (
+            response.get)
+        self._backend.internal_instance_id = mock.Mock(
+            return_value="fake id")
+
+        snapshot = self._backend.snapshot_instance("golden")
+
+        self.assertEqual("fake image id", snapshot)
+        images_client.create_image.assert_called_once_with(
+            "fake id", name="golden")
+        mock_wait.assert_called_once_with(images_client, "fake image id",
+                                          "ACTIVE")
+        servers_client = self._backend._manager.servers_client
+        servers_client.stop_server.assert_called_once_with("fake id")
+        mock_wait_server.assert_called_once_with(servers_client, "fake id",
+                                                 "SHUTOFF")
+        (self._backend._manager.image_client_v2.update_image.
+         assert_called_once_with("fake image id",
+                                 [{"replace": "/visibility",
+                                   "value": "community"}]))
+
+    def test_snapshot_instance(self):
+        self._test_snapshot_instance(response={"image_id": "fake image id"})
+
+    def test_snapshot_instance_location(self):
+        self._test_snapshot_instance(
+            response={},
+            headers={"location": "http://fake/v2/images/fake image id"})
+
+    def test_boot_from_snapshot(self):
+        self._backend.boot_from_snapshot("fake snapshot")
+        self.assertEqual("fake snapshot",
+                         self._backend.image_ref)
+
+    def test_delete_snapshot(self):
+        self._backend.delete_snapshot("fake snapshot")
+        (self._backend._manager.compute_images_client.
+         delete_image.assert_called_once_with("fake snapshot"))
+
+
 class TestBaseWindowsTempestBackend(unittest.TestCase):
 
     @mock.patch('argus.config.CONFIG.argus')
@@ -17,6 +17,7 @@
 
 import unittest
 from argus.backends import base
+from argus.backends import console
 from argus import util
 
 try:
@@ -180,6 +181,16 @@ class TestCloudBackend(unittest.TestCase):
         result = self._cloud_backend.instance_output()
         self.assertEqual(result, "fake output")
 
+    @mock.patch('argus.unit_tests.backends.test_base.'
+                'FakeCloudBackend.instance_output')
+    def test_console(self, mock_instance_output):
+        mock_instance_output.return_value = "fake output\n"
+        tailer = self._cloud_backend.console
+
+        self.assertIs(tailer, self._cloud_backend.console)
+        self.assertEqual(["fake output"], tailer.poll())
+        mock_instance_output.assert_called_once_with(console.TAIL_SIZE)
+
     def test_internal_instance_id(self):
         result = self._cloud_backend.internal_instance_id()
         self.assertEqual(result, "fake id")
@@ -0,0 +1,177 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import threading
+import unittest
+
+from argus.backends import console
+
+
+class FakeConsole(object):
+    """A console output which grows, served as a tail of lines."""
+
+    def __init__(self):
+        self.lines = []
+        self.partial = ""
+        self.requests = []
+
+    def write(self, *lines):
+        self.lines.extend(lines)
+
+    def __call__(self, limit):
+        self.requests.append(limit)
+        output = "".join(line + "\n" for line in self.lines[-limit:])
+        return output + self.partial
+
+
+def _plugin_line(plugin):
+    return ("2016-10-18 10:00:00.000 1234 INFO cloudbaseinit.init [-] "
+            "Executing plugin '{}'".format(plugin))
+
+
+class TestConsoleTailer(unittest.TestCase):
+
+    def setUp(self):
+        self._console = FakeConsole()
+        self._tailer = console.ConsoleTailer(self._console, tail_size=4)
+
+    def test_only_new_lines_are_returned(self):
+        self._console.write("boot", "sysprep")
+        self.assertEqual(["boot", "sysprep"], self._tailer.poll())
+
+        self._console.write("line 1", "line 2", "line 3")
+        self.assertEqual(["line 1", "line 2", "line 3"], self._tailer.poll())
+        self.assertEqual([], self._tailer.poll())
+        # Only one of the lines seen was in the second tail,
+        # which is too short an overlap to be trusted.
+        self.assertEqual([4, 4, 8, 4], self._console.requests)
+
+    def test_tail_is_grown_when_too_many_lines_are_new(self):
+        self._console.write("first")
+        self._tailer.poll()
+
+        lines = ["line {}".format(index) for index in range(10)]
+        self._console.write(*lines)
+
+        self.assertEqual(lines, self._tailer.poll())
+        self.assertEqual([4, 4, 8, 16], self._console.requests)
+
+    def test_truncated_output(self):
+        # The cloud returns at most 6 lines, whatever the tail.
+        self._console.write(*["old {}".format(index) for index in range(8)])
+        requests = []
+
+        def capped(limit):
+            requests.append(limit)
+            return self._console(min(limit, 6))
+
+        tailer = console.ConsoleTailer(capped, tail_size=8)
+        self.assertEqual(["old {}".format(index) for index in range(2, 8)],
+                         tailer.poll())
+
+        self._console.write("new 1", "new 2")
+        self.assertEqual(["new 1", "new 2"], tailer.poll())
+        self.assertEqual([], tailer.poll())
+
+        lines = ["line {}".format(index) for index in range(10)]
+        self._console.write(*lines)
+        # Only the lines which are still in the output can be read.
+        self.assertEqual(lines[-6:], tailer.poll())
+        # The tail is not grown for a truncated output.
+        self.assertEqual([8, 8, 8, 8], requests)
+
+    def test_from_start(self):
+        lines = ["line {}".format(index) for index in range(10)]
+        self._console.write(*lines)
+        tailer = console.ConsoleTailer(self._console, tail_size=4,
+                                       from_start=True)
+
+        self.assertEqual(lines, tailer.poll())
+        self.assertEqual([4, 8, 16], self._console.requests)
+
+    def test_repeated_lines(self):
+        self._console.write("a", "b", "c", "d", "e")
+        self._tailer.poll()
+
+        self._console.write("d", "e")
+
+        self.assertEqual(["d", "e"], self._tailer.poll())
+
+    def test_repeated_line_in_more_lines_than_the_tail(self):
+        self._console.write("a1", "a2", "")
+        self._tailer.poll()
+
+        lines = ["b{}".format(index) for index in range(6)]
+        lines += ["", "c1", "c2", "c3"]
+        self._console.write(*lines)
+
+        # The repeated blank line isn't taken as the lines seen.
+        self.assertEqual(lines, self._tailer.poll())
+
+    def test_unfinished_line_is_read_later(self):
+        self._console.write("first")
+        self._console.partial = "seco"
+        self.assertEqual(["first"], self._tailer.poll())
+
+        self._console.partial = ""
+        self._console.write("second")
+        self.assertEqual(["second"], self._tailer.poll())
+
+    def test_markers(self):
+        self._console.write(
+            _plugin_line("MTUPlugin"),
+            "Plugin 'NTPClientPlugin' execution already done, skipping",
+            _plugin_line("SetHostNamePlugin"))
+        self._tailer.poll()
+        self.assertFalse(self._tailer.signals[console.FINISHED].is_set())
+
+        self._console.write("Plugins execution done")
+        self._tailer.poll()
+
+        self.assertEqual(2, self._tailer.count(console.PLUGIN_STARTED))
+        self.assertEqual(1, self._tailer.count(console.PLUGIN_SKIPPED))
+        self.assertEqual([{"plugin": "MTUPlugin"},
+                          {"plugin": "NTPClientPlugin"},
+                          {"plugin": "SetHostNamePlugin"}, {}],
+                         [event.details for event in self._tailer.events])
+        self.assertTrue(self._tailer.signals[console.PLUGIN_STARTED].is_set())
+        self.assertTrue(self._tailer.signals[console.FINISHED].is_set())
+
+    def test_follow(self):
+        polled = threading.Event()
+
+        def fetch(limit):
+            polled.set()
+            return "Plugins execution done\n"
+
+        tailer = console.ConsoleTailer(fetch)
+        with tailer.follow(interval=0.01):
+            self.assertTrue(polled.wait(5))
+            self.assertTrue(tailer.signals[console.FINISHED].wait(5))
+
+    def test_follow_survives_errors(self):
+        calls = []
+
+        def fetch(limit):
+            calls.append(limit)
+            if len(calls) == 1:
+                raise ValueError("The API is not available.")
+            return "Plugins execution done\n"
+
+        tailer = console.ConsoleTailer(fetch)
+        with tailer.follow(interval=0.01):
+            self.assertTrue(tailer.signals[console.FINISHED].wait(5))
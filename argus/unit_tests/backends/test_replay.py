@@ -0,0 +1,95 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.backends import replay
+from argus.client import replay as replay_client
+from argus.client import session
+from argus import exceptions
+from argus.unit_tests import test_utils
+from argus import util
+
+
+class TestReplayBackend(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        recorder = session.Recorder(
+            session.session_path(directory, "scenario"), "scenario")
+        recorder._write({"command": "echo 1", "encoded": True,
+                         "stdout": "1"})
+        recorder._write({"backend": {
+            "instance_output": "first\nsecond\nthird\n",
+            "instance_password": "password",
+            "internal_instance_id": "instance id",
+        }, "redacted": ["private_key"]})
+        with test_utils.ConfPatcher("replay_directory", directory, "argus"):
+            self._backend = replay.ReplayBackend("scenario")
+
+    def test_recorded_values(self):
+        self.assertEqual("password", self._backend.instance_password())
+        self.assertEqual("instance id", self._backend.internal_instance_id())
+
+    def test_missing_value(self):
+        with self.assertRaises(exceptions.ArgusReplayError):
+            self._backend.instance_server()
+
+    def test_redacted_value(self):
+        with self.assertRaises(exceptions.ArgusReplayError) as context:
+            self._backend.private_key()
+        self.assertIn("record_secrets", str(context.exception))
+
+    def test_instance_output(self):
+        self.assertEqual("second\nthird\n",
+                         self._backend.instance_output(limit=2))
+        self.assertEqual("first\nsecond\nthird\n",
+                         self._backend.instance_output())
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def test_remote_client(self, _):
+        client = self._backend.get_remote_client("user", "password")
+        self.addCleanup(client.close)
+
+        self.assertIsInstance(client, replay_client.ReplayRemoteClient)
+        self.assertEqual("instance id", client.instance_id)
+        self.assertEqual(("1", b"", 0), client.run_command("echo 1"))
+        self.assertEqual(1, self._backend.session.played)
+        with self.assertRaises(exceptions.ArgusError):
+            client.run_remote_cmd("echo 2", util.CMD)
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def test_remote_clients_share_the_os_facts(self, _):
+        first = self._backend.get_remote_client("user", "password")
+        self.addCleanup(first.close)
+        first.os_facts = mock.sentinel.facts
+        self._backend._os_facts = first.os_facts
+
+        second = self._backend.get_remote_client("user", "password")
+        self.addCleanup(second.close)
+        self._backend.reboot_instance()
+        third = self._backend.get_remote_client("user", "password")
+        self.addCleanup(third.close)
+
+        self.assertIs(mock.sentinel.facts, second.os_facts)
+        self.assertIsNone(third.os_facts)
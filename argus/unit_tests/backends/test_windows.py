@@ -18,9 +18,10 @@
 import unittest
 from argus import config as argus_config
 from argus.backends import windows as windows_backend
+from argus.unit_tests import test_utils
 
 try:
-    import unittest.mock
+    import unittest.mock as mock
 except ImportError:
     import mock
 
@@ -28,12 +29,40 @@ except ImportError:
 CONFIG = argus_config.CONFIG
 
 
+class _FakeCloudBackend(object):
+
+    _name = "fake name"
+
+    def __init__(self):
+        self.calls = []
+
+    def floating_ip(self):
+        return "fake ip"
+
+    def internal_instance_id(self):
+        return "fake id"
+
+    def reboot_instance(self):
+        self.calls.append("reboot_instance")
+
+    def boot_from_snapshot(self, snapshot):
+        self.calls.append("boot_from_snapshot")
+
+    def cleanup(self):
+        self.calls.append("cleanup")
+
+
+class _Backend(windows_backend.WindowsBackendMixin, _FakeCloudBackend):
+    pass
+
+
 class TestWindowsBackendMixin(unittest.TestCase):
 
     def setUp(self):
         self._windows_backend_mixin = windows_backend.WindowsBackendMixin()
+        self._windows_backend_mixin._name = "fake name"
 
-    @mock.patch('argus.client.windows.WinRemoteClient.__init__')
+    @mock.patch('argus.client.windows.WinRemoteClient')
     def _test_get_remote_client(self, mock_win_remote_client,
                                 username=None, password=None):
         expected_username, expected_password = username, password
@@ -44,13 +73,16 @@ class TestWindowsBackendMixin(unittest.TestCase):
 
         self._windows_backend_mixin.floating_ip = mock.Mock()
         self._windows_backend_mixin.floating_ip.return_value = "fake ip"
-        mock_win_remote_client.return_value = None
+        self._windows_backend_mixin.internal_instance_id = mock.Mock()
+        self._windows_backend_mixin.internal_instance_id.return_value = (
+            "fake id")
         self._windows_backend_mixin.get_remote_client(username=username,
                                                       password=password,
                                                       protocol="fake protocol")
         mock_win_remote_client.assert_called_once_with(
             "fake ip", expected_username, expected_password,
-            transport_protocol="fake protocol")
+            transport_protocol="fake protocol", instance_id="fake id",
+            recorder=None, os_facts=None)
 
     def test_get_remote_client_with_username_password(self):
         self._test_get_remote_client(username="fake username",
@@ -67,3 +99,75 @@ class TestWindowsBackendMixin(unittest.TestCase):
     def test_get_remote_client_no_username_password(self):
         self._test_get_remote_client(username=None,
                                      password=None)
+
+    @test_utils.ConfPatcher('async_winrm', True, 'argus')
+    @mock.patch('argus.client.async_windows.SyncWinRemoteClient')
+    def test_get_remote_client_async_winrm(self, mock_client):
+        self._windows_backend_mixin.floating_ip = mock.Mock(
+            return_value="fake ip")
+        self._windows_backend_mixin.internal_instance_id = mock.Mock(
+            return_value="fake id")
+
+        client = self._windows_backend_mixin.get_remote_client(
+            username="user", password="password")
+
+        self.assertEqual(mock_client.return_value, client)
+        mock_client.assert_called_once_with(
+            "fake ip", "user", "password", transport_protocol="http",
+            instance_id="fake id", recorder=None, os_facts=None)
+
+    @mock.patch('argus.client.session.get_recorder')
+    @mock.patch('argus.client.windows.WinRemoteClient')
+    def test_get_remote_client_recorder(self, mock_client,
+                                        mock_get_recorder):
+        self._windows_backend_mixin.floating_ip = mock.Mock(
+            return_value="fake ip")
+        self._windows_backend_mixin.internal_instance_id = mock.Mock(
+            return_value="fake id")
+
+        self._windows_backend_mixin.get_remote_client(
+            username="user", password="password")
+
+        mock_get_recorder.assert_called_once_with("fake name")
+        mock_client.assert_called_once_with(
+            "fake ip", "user", "password", transport_protocol="http",
+            instance_id="fake id", recorder=mock_get_recorder.return_value,
+            os_facts=None)
+
+    @mock.patch('argus.client.windows.WinRemoteClient')
+    def test_get_remote_client_shares_the_os_facts(self, mock_client):
+        self._windows_backend_mixin.floating_ip = mock.Mock(
+            return_value="fake ip")
+        self._windows_backend_mixin.internal_instance_id = mock.Mock(
+            return_value="fake id")
+        mock_client.return_value.os_facts = mock.sentinel.facts
+
+        self._windows_backend_mixin.get_remote_client()
+        self._windows_backend_mixin.get_remote_client()
+
+        self.assertIsNone(
+            mock_client.call_args_list[0][1]["os_facts"])
+        self.assertIs(mock.sentinel.facts,
+                      mock_client.call_args_list[1][1]["os_facts"])
+
+    def _test_forgets_the_os_facts(self, method, *args):
+        backend = _Backend()
+        with mock.patch('argus.client.windows.WinRemoteClient') as mock_client:
+            mock_client.return_value.os_facts = mock.sentinel.facts
+            backend.get_remote_client()
+
+            getattr(backend, method)(*args)
+            backend.get_remote_client()
+
+        self.assertIsNone(mock_client.call_args_list[1][1]["os_facts"])
+        self.assertEqual([method], backend.calls)
+
+    def test_reboot_instance_forgets_the_os_facts(self):
+        self._test_forgets_the_os_facts("reboot_instance")
+
+    def test_boot_from_snapshot_forgets_the_os_facts(self):
+        self._test_forgets_the_os_facts("boot_from_snapshot",
+                                        mock.sentinel.snapshot)
+
+    def test_cleanup_forgets_the_os_facts(self):
+        self._test_forgets_the_os_facts("cleanup")
@@ -0,0 +1,88 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import six
+
+from argus.benchmarks import suite
+from argus import profiling
+
+
+def _result(name, requests):
+    return suite.Result(name, requests, 100, 200, 0.5)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    @mock.patch.dict(profiling._SPANS, clear=True)
+    def test_request_counts_match_the_baseline(self):
+        results = suite.run()
+
+        # If an operation needs a different number of round trips on
+        # purpose, update the baseline with --update.
+        self.assertEqual([], suite.compare(results, suite.load_baseline()))
+        self.assertTrue(all(result.sent and result.received
+                            for result in results))
+
+    def test_compare(self):
+        differences = suite.compare(
+            [_result("run_command", 3), _result("copy_file", 30),
+             _result("read_file", 3)],
+            {"run_command": 3, "copy_file": 25})
+
+        self.assertEqual(["copy_file: 30 round trips instead of 25.",
+                          "read_file: 3 round trips, not in the baseline."],
+                         differences)
+
+    def test_write_baseline(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "baseline.json")
+        suite.write_baseline([_result("run_command", 4)], path)
+        suite.write_baseline([_result("read_file", 3)], path)
+
+        with open(path) as stream:
+            self.assertEqual({"run_command": 4, "read_file": 3},
+                             json.load(stream))
+
+    def test_format_results(self):
+        table = suite.format_results([_result("run_command", 3)])
+
+        self.assertEqual(
+            ["operation    round trips  sent  received  seconds",
+             "run_command  3            100   200       0.500"],
+            table.splitlines())
+
+    @mock.patch('sys.stdout', new_callable=six.StringIO)
+    @mock.patch('argus.benchmarks.suite.load_baseline')
+    def test_check_fails_on_differences(self, mock_load_baseline,
+                                        mock_stdout):
+        mock_load_baseline.return_value = {"run_command": 1}
+
+        exit_code = suite.main(["--check", "run_command"])
+
+        self.assertEqual(1, exit_code)
+        self.assertEqual("run_command: 3 round trips instead of 1.",
+                         mock_stdout.getvalue().splitlines()[-1])
@@ -0,0 +1,327 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from six.moves import socketserver
+
+try:
+    import asyncio
+    from argus.client import async_windows
+except (ImportError, SyntaxError):
+    # The asyncio client needs Python 3.5 or newer.
+    async_windows = None
+from argus.action_manager import windows as action_manager
+from argus.benchmarks import suite
+from argus.client import windows
+from argus import config as argus_config
+from argus import exceptions
+from argus.unit_tests import fake_winrm
+from argus.unit_tests import test_utils
+
+CONFIG = argus_config.CONFIG
+
+
+@unittest.skipIf(async_windows is None, "The asyncio client needs Python 3.")
+class BaseAsyncTest(unittest.TestCase):
+
+    responder = staticmethod(fake_winrm.echo_responder)
+    latency = 0
+
+    def setUp(self):
+        self._server = fake_winrm.FakeWinRMServer(
+            self.responder, latency=self.latency).start()
+        self.addCleanup(self._server.stop)
+
+        patcher = mock.patch.dict(windows._SHELL_POOLS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self.addCleanup(self._loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self._client = self._get_client()
+
+    def _get_client(self):
+        client = async_windows.AsyncWinRemoteClient(
+            "127.0.0.1", test_utils.USERNAME, "fake-password",
+            port=self._server.port)
+        self.addCleanup(lambda: self._run(client.close()))
+        return client
+
+    def _run(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+
+class TestAsyncWinRemoteClient(BaseAsyncTest):
+
+    def test_run_command(self):
+        for index in range(3):
+            stdout, stderr, exit_code = self._run(
+                self._client.run_command("echo {}".format(index)))
+            self.assertEqual("echo {}".format(index), stdout)
+            self.assertEqual((b"", 0), (stderr, exit_code))
+
+        # The shell is reused by the following commands.
+        self.assertEqual(1, self._server.shells_opened)
+
+    def test_dead_shell_is_reopened(self):
+        self._run(self._client.run_command("before reboot"))
+        self._server.kill_shells()
+
+        stdout, _, _ = self._run(self._client.run_command("after reboot"))
+
+        self.assertEqual("after reboot", stdout)
+        self.assertEqual(2, self._server.shells_opened)
+
+    @mock.patch('asyncio.sleep')
+    def test_run_command_with_retry(self, mock_sleep):
+        future = asyncio.Future(loop=self._loop)
+        future.set_result(None)
+        mock_sleep.return_value = future
+        attempts = []
+
+        def responder(command, stdin):
+            # pylint: disable=unused-argument
+            attempts.append(command)
+            if len(attempts) < 3:
+                return "", "not yet", 1
+            return "done", "", 0
+
+        self._server.responder = responder
+
+        stdout, _, _ = self._run(
+            self._client.run_command_with_retry("retried", count=5))
+
+        self.assertEqual("done", stdout)
+        self.assertEqual(2, mock_sleep.call_count)
+
+    def test_run_command_until_condition(self):
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._run(self._client.run_command_until_condition(
+                "never", lambda stdout: False, retry_count=0))
+
+    def test_run_command_until_condition_wake(self):
+        outputs = iter(["not yet", "done"])
+        self._server.responder = (
+            lambda command, stdin: (next(outputs), "", 0))
+        wake = threading.Event()
+        wake.set()
+        start = time.time()
+
+        self._run(self._client.run_command_until_condition(
+            "service", lambda stdout: stdout == "done", retry_count=1,
+            delay=30, wake=wake))
+
+        self.assertLess(time.time() - start, 10)
+        self.assertFalse(wake.is_set())
+
+    def test_clients_share_the_idle_shells(self):
+        other_client = self._get_client()
+
+        self._run(self._client.run_command("first"))
+        stdout, _, _ = self._run(other_client.run_command("second"))
+
+        self.assertEqual("second", stdout)
+        self.assertEqual(1, self._server.shells_opened)
+
+    def test_command_timeout(self):
+        self._server.responder = lambda command, stdin: None
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._run(self._client.run_command("hanging",
+                                               upper_timeout=0.2))
+
+        self.assertEqual(1, self._server.signals)
+        # The shell might still be busy, so it is not reused.
+        self.assertEqual(1, self._server.shells_closed)
+
+    def test_write_and_read_files(self):
+        store = fake_winrm.FileStore()
+        self._server.responder = store
+        remote_path = r"C:\conf\cloudbase-init.conf"
+
+        self.assertTrue(self._run(self._client.write_file(
+            u"[DEFAULT]\r\n", remote_path)))
+        self.assertFalse(self._run(self._client.write_file(
+            u"[DEFAULT]\r\n", remote_path)))
+        self.assertEqual({remote_path: b"[DEFAULT]\r\n"}, store.files)
+
+        self.assertEqual('Get-Content "{}"'.format(remote_path),
+                         self._run(self._client.read_file(remote_path)))
+
+    def test_copy_file(self):
+        store = fake_winrm.FileStore()
+        self._server.responder = store
+        content = os.urandom(100000)
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(fd, content)
+        os.close(fd)
+
+        self._run(self._client.copy_file(path, r"C:\installer.msi"))
+
+        self.assertEqual({r"C:\installer.msi": content}, store.files)
+
+
+class TestConcurrentClients(BaseAsyncTest):
+
+    latency = 0.1
+
+    def test_clients_run_concurrently(self):
+        clients = [self._get_client() for _ in range(10)]
+        start = time.time()
+
+        results = self._run(asyncio.gather(*[
+            client.run_command("instance {}".format(index))
+            for index, client in enumerate(clients)]))
+
+        elapsed = time.time() - start
+        self.assertEqual(["instance {}".format(index) for index in range(10)],
+                         [stdout for stdout, _, _ in results])
+        # Every command needs four requests, so running the commands
+        # one after the other would take four seconds.
+        self.assertLess(elapsed, 2)
+
+
+class _ChunkedHandler(socketserver.StreamRequestHandler):
+    """Echo the requests back in chunks, over kept alive connections."""
+
+    def handle(self):
+        self.server.connections += 1
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            length = 0
+            while line.strip():
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+                line = self.rfile.readline()
+            body = self.rfile.read(length)
+            self.wfile.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n"
+                             b"3\r\nack\r\n" +
+                             "{:x}".format(len(body)).encode() +
+                             b"\r\n" + body + b"\r\n0\r\n\r\n")
+
+
+@unittest.skipIf(async_windows is None, "The asyncio client needs Python 3.")
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self._loop = asyncio.new_event_loop()
+        self.addCleanup(self._loop.close)
+
+    def test_keep_alive_and_chunked_replies(self):
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0),
+                                                 _ChunkedHandler)
+        server.daemon_threads = True
+        server.connections = 0
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        transport = async_windows.AsyncTransport(
+            "http://127.0.0.1:{}/wsman".format(server.server_address[1]),
+            "user", "password")
+
+        replies = [self._loop.run_until_complete(
+            transport.send_message(message)) for message in ("one", "two")]
+        transport.close()
+
+        self.assertEqual([b"ackone", b"acktwo"], replies)
+        self.assertEqual(1, server.connections)
+
+    def test_timed_out_idle_connection_is_closed(self):
+        transport = async_windows.AsyncTransport(
+            "http://127.0.0.1:1/wsman", "user", "password",
+            read_timeout=0.1)
+        connection = mock.Mock(closed=False)
+        # The reply never comes.
+        connection.request.return_value = asyncio.sleep(60)
+        transport._idle.append(connection)
+
+        with self.assertRaises(
+                async_windows.winrm_exceptions.WinRMTransportError):
+            self._loop.run_until_complete(transport.send_message("hang"))
+
+        connection.close.assert_called_once_with()
+        self.assertEqual(0, len(transport._idle))
+
+    def test_operation_timeout_fault(self):
+        payload = fake_winrm._FAULT.format(
+            reason="The operation timed out.",
+            detail=fake_winrm._OPERATION_TIMEOUT).encode()
+
+        error = async_windows._fault_error(500, payload)
+
+        self.assertIsInstance(
+            error, async_windows.winrm_exceptions.WinRMOperationTimeoutError)
+
+
+@unittest.skipIf(async_windows is None, "The asyncio client needs Python 3.")
+class TestSyncWinRemoteClient(unittest.TestCase):
+
+    def setUp(self):
+        self._store = fake_winrm.FileStore()
+        self._server = fake_winrm.FakeWinRMServer(self._store).start()
+        self.addCleanup(self._server.stop)
+
+        patcher = mock.patch.dict(windows._SHELL_POOLS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with mock.patch('argus.client.windows.get_windows_action_manager'):
+            self._client = async_windows.SyncWinRemoteClient(
+                "127.0.0.1", test_utils.USERNAME, "fake-password",
+                port=self._server.port)
+
+    def test_blocking_interface(self):
+        stdout, _, _ = self._client.run_command_with_retry("echo 1", count=1)
+        self.assertTrue(self._client.write_file(b"data", r"C:\data"))
+
+        self.assertEqual("echo 1", stdout)
+        self.assertEqual({r"C:\data": b"data"}, self._store.files)
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertIsInstance(self._client._get_protocol(),
+                              async_windows.SyncProtocol)
+
+    def test_action_manager(self):
+        environment = suite.Environment()
+        environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+
+        client = async_windows.SyncWinRemoteClient(
+            "127.0.0.1", CONFIG.openstack.image_username, "Passw0rd",
+            port=environment.server.port)
+        self.addCleanup(client.close)
+
+        self.assertIsInstance(client.manager,
+                              action_manager.WindowsSever2012R2ActionManager)
+        self.assertGreater(len(environment.server.commands), 0)
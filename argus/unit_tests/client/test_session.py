@@ -0,0 +1,259 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.benchmarks import suite
+from argus.client import replay
+from argus.client import session
+from argus.client import windows
+from argus import config as argus_config
+from argus import exceptions
+from argus import profiling
+from argus.recipes.cloud import windows as recipe
+from argus.unit_tests import test_utils
+from argus import util
+
+CONFIG = argus_config.CONFIG
+
+
+def _make_directory(test_case):
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+    return directory
+
+
+def _read_entries(path):
+    with io.open(path, encoding="utf-8") as stream:
+        return [json.loads(line) for line in stream]
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_decoded_command(self):
+        command = util.get_command("echo 1", util.POWERSHELL)
+
+        fingerprint = session._Fingerprint(command)
+
+        self.assertEqual("echo 1", fingerprint.command)
+        self.assertTrue(fingerprint.encoded)
+        self.assertIsNone(fingerprint.stdin)
+
+    def test_volatile_tokens_are_left_out(self):
+        first = session._Fingerprint("cmd")
+        first.feed(b"$marker = 'argus-batch-" + b"a" * 32 + b"'")
+        second = session._Fingerprint("cmd")
+        second.feed(b"$marker = 'argus-batch-" + b"b" * 32 + b"'")
+
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(["a" * 32], first.tokens)
+        self.assertFalse(first.encoded)
+
+
+class TestRecordingProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self._path = os.path.join(_make_directory(self), "session")
+        self._recorder = session.Recorder(self._path, "scenario")
+        self._protocol = mock.Mock()
+        self._protocol.run_command.return_value = "command id"
+        self._recording = session.RecordingProtocol(self._protocol,
+                                                    self._recorder)
+
+    def test_finished_command(self):
+        self._protocol._raw_get_command_output.side_effect = [
+            (b"out", b"", None, False),
+            (b"put", b"\xff", 1, True),
+        ]
+
+        command_id = self._recording.run_command(
+            "shell", util.get_command("dir", util.POWERSHELL))
+        self._recording.send_command_input("shell", command_id, b"input",
+                                           end=True)
+        for _ in range(2):
+            self._recording._raw_get_command_output("shell", command_id)
+        self._recording.cleanup_command("shell", command_id)
+
+        header, entry = _read_entries(self._path)
+        self.assertEqual({"session": "scenario",
+                          "version": session.FORMAT_VERSION}, header)
+        self.assertEqual("dir", entry["command"])
+        self.assertTrue(entry["encoded"])
+        self.assertEqual("output", entry["stdout"])
+        self.assertEqual({"base64": "/w=="}, entry["stderr"])
+        self.assertEqual(1, entry["exit_code"])
+        self.assertIn("stdin", entry)
+        self._protocol.send_command_input.assert_called_once_with(
+            "shell", "command id", b"input", end=True)
+        self._protocol.cleanup_command.assert_called_once_with(
+            "shell", "command id")
+
+    def test_abandoned_command(self):
+        self._protocol._raw_get_command_output.return_value = (
+            b"out", b"", None, False)
+
+        command_id = self._recording.run_command("shell", "dir")
+        self._recording._raw_get_command_output("shell", command_id)
+        self._recording.cleanup_command("shell", command_id)
+
+        self.assertEqual(1, len(_read_entries(self._path)))
+
+    def test_delegates_the_other_calls(self):
+        self.assertEqual(self._protocol.open_shell.return_value,
+                         self._recording.open_shell(codepage=65001))
+
+    def _record_backend(self):
+        backend = mock.Mock(spec=["instance_password", "private_key",
+                                  "instance_output", "get_mtu"])
+        backend.instance_password.return_value = "secret password"
+        backend.private_key.return_value = "secret key"
+        backend.instance_output.return_value = b"console"
+        backend.get_mtu.side_effect = ValueError
+
+        self._recorder.record_backend(backend)
+        return _read_entries(self._path)[-1]
+
+    def test_record_backend(self):
+        self.assertEqual(
+            {"backend": {"instance_output": "console"},
+             "redacted": ["instance_password", "private_key"]},
+            self._record_backend())
+        with open(self._path) as stream:
+            self.assertNotIn("secret", stream.read())
+
+    @test_utils.ConfPatcher("record_secrets", True, "argus")
+    def test_record_backend_secrets(self):
+        self.assertEqual({"backend": {"instance_password": "secret password",
+                                      "private_key": "secret key",
+                                      "instance_output": "console"}},
+                         self._record_backend())
+
+
+class TestSession(unittest.TestCase):
+
+    def _play(self, entries, command_line, stdin=None):
+        fingerprint = session._Fingerprint(command_line)
+        if stdin is not None:
+            fingerprint.feed(stdin)
+        return session.Session("scenario", entries, {}).play(fingerprint)
+
+    def test_answers_in_order(self):
+        replayed = session.Session("scenario", [
+            {"command": "dir", "stdout": "first", "exit_code": 1},
+            {"command": "dir", "stdout": "second"},
+        ], {})
+        fingerprint = session._Fingerprint("dir")
+
+        self.assertEqual((b"first", b"", 1), replayed.play(fingerprint))
+        self.assertEqual((b"second", b"", 0), replayed.play(fingerprint))
+        # The last answer is given again.
+        self.assertEqual((b"second", b"", 0), replayed.play(fingerprint))
+        self.assertEqual(3, replayed.played)
+
+    def test_volatile_tokens_are_replaced(self):
+        recorded, live = "a" * 32, "b" * 32
+        fingerprint = session._Fingerprint("cmd")
+        fingerprint.feed(recorded.encode())
+
+        stdout, _, _ = self._play(
+            [{"command": "cmd", "stdin": fingerprint.stdin,
+              "tokens": [recorded], "stdout": recorded + ":0"}],
+            "cmd", stdin=live.encode())
+
+        self.assertEqual(live.encode() + b":0", stdout)
+
+    def test_missing_command(self):
+        with self.assertRaises(exceptions.ArgusReplayError):
+            self._play([{"command": "dir"}], "dir", stdin=b"input")
+
+    def test_load(self):
+        path = os.path.join(_make_directory(self), "session")
+        recorder = session.Recorder(path, "scenario")
+        recorder._write({"command": "dir", "seconds": 1.5})
+        recorder._write({"backend": {"instance_password": "password"},
+                         "redacted": ["private_key"]})
+
+        loaded = session.Session.load(path)
+
+        self.assertEqual("scenario", loaded.name)
+        self.assertEqual({"instance_password": "password"}, loaded.backend)
+        self.assertEqual({"private_key"}, loaded.redacted)
+        self.assertEqual(1.5, loaded.recorded_seconds)
+
+    def test_load_unknown_version(self):
+        path = os.path.join(_make_directory(self), "session")
+        with open(path, "w") as stream:
+            stream.write('{"session": "scenario", "version": 0}\n')
+
+        with self.assertRaises(exceptions.ArgusReplayError):
+            session.Session.load(path)
+
+
+class TestGetRecorder(unittest.TestCase):
+
+    def test_not_recording(self):
+        self.assertIsNone(session.get_recorder("scenario"))
+
+    def test_recorder_per_scenario(self):
+        directory = os.path.join(_make_directory(self), "sessions")
+        with test_utils.ConfPatcher("record_directory", directory, "argus"):
+            recorder = session.get_recorder("scenario")
+            self.assertIs(recorder, session.get_recorder("scenario"))
+            self.assertIsNot(recorder, session.get_recorder("other"))
+
+        self.assertEqual(session.session_path(directory, "scenario"),
+                         recorder.path)
+        self.assertTrue(os.path.isfile(recorder.path))
+
+
+class TestRecordAndReplay(unittest.TestCase):
+    """Replay the preparation of a scripted guest, without the guest."""
+
+    def setUp(self):
+        environment = suite.Environment()
+        self._environment = environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+        self._path = os.path.join(_make_directory(self), "session")
+
+    @mock.patch.dict(profiling._SPANS, clear=True)
+    def test_recipe_prepare(self):
+        recorder = session.Recorder(self._path, "scenario")
+        client = windows.WinRemoteClient(
+            "127.0.0.1", CONFIG.openstack.image_username, "Passw0rd",
+            port=self._environment.server.port, recorder=recorder)
+        self.addCleanup(client.close)
+        recipe.CloudbaseinitRecipe(suite._Backend(client)).prepare()
+        recorded = len(self._environment.server.commands)
+
+        replayed = session.Session.load(self._path)
+        replay_client = replay.ReplayRemoteClient(
+            replayed, CONFIG.openstack.image_username, "Passw0rd")
+        self.addCleanup(replay_client.close)
+        recipe.CloudbaseinitRecipe(suite._Backend(replay_client)).prepare()
+
+        self.assertEqual(recorded, replayed.played)
+        self.assertEqual(recorded, len(self._environment.server.commands))
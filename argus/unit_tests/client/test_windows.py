@@ -0,0 +1,714 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import collections
+import functools
+import gc
+import hashlib
+import os
+import re
+import socket
+import tempfile
+import time
+import unittest
+import weakref
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from winrm import exceptions as winrm_exceptions
+
+from argus.client import windows
+from argus import exceptions
+from argus import log as argus_log
+from argus import profiling
+from argus.unit_tests import fake_winrm
+from argus.unit_tests import test_utils
+from argus import util
+
+
+class BaseFakeEndpointTest(unittest.TestCase):
+    """Tests which run a real client against a local fake endpoint."""
+
+    responder = staticmethod(fake_winrm.echo_responder)
+
+    def setUp(self):
+        self._server = fake_winrm.FakeWinRMServer(self.responder).start()
+        self.addCleanup(self._server.stop)
+
+        # Every test gets its own pools.
+        patcher = mock.patch.dict(windows._SHELL_POOLS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._client = self._get_client()
+
+    def _get_client(self, username=test_utils.USERNAME):
+        with mock.patch('argus.client.windows.get_windows_action_manager'):
+            return windows.WinRemoteClient(
+                "127.0.0.1", username, "fake-password",
+                port=self._server.port)
+
+
+class TestShellPool(BaseFakeEndpointTest):
+
+    def test_shells_are_reused(self):
+        for _ in range(5):
+            stdout, _, _ = self._client.run_command("echo 1")
+            self.assertEqual("echo 1", stdout)
+
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertEqual(0, self._server.shells_closed)
+        self.assertEqual({"hits": 4, "misses": 1, "discarded": 0,
+                          "idle": 1}, self._client.shell_pool_stats)
+
+    def test_shells_are_reused_by_all_the_run_methods(self):
+        self._client.run_command("first")
+        self._client.run_command_with_retry("second", count=1)
+        self._client.run_command_until_condition(
+            "third", lambda stdout: stdout == "third", retry_count=1)
+
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertEqual(["first", "second", "third"],
+                         self._server.commands)
+
+    def test_remote_calls_are_counted(self):
+        self._client.run_command("first")
+        self._client.run_command_with_retry("second", count=1)
+        self._client.run_command_verbose("third")
+
+        self.assertEqual(3, self._client.remote_calls)
+
+    def test_pool_is_shared_between_clients(self):
+        self._client.run_command("first")
+        self._get_client().run_command("second")
+
+        self.assertEqual(1, self._server.shells_opened)
+
+    def test_pool_is_per_credentials(self):
+        self._client.run_command("first")
+        self._get_client(username="other-user").run_command("second")
+
+        self.assertEqual(2, self._server.shells_opened)
+
+    def test_pool_is_per_recorder(self):
+        self._client.run_command("first")
+        with mock.patch('argus.client.windows.get_windows_action_manager'):
+            recording = windows.WinRemoteClient(
+                "127.0.0.1", test_utils.USERNAME, "fake-password",
+                port=self._server.port, recorder=mock.Mock())
+        with mock.patch.object(windows.session, 'RecordingProtocol',
+                               side_effect=lambda protocol, _: protocol):
+            recording.run_command("second")
+
+        self.assertEqual(2, self._server.shells_opened)
+        self.assertIsNot(self._client._shell_pool, recording._shell_pool)
+
+    def test_pool_does_not_keep_the_client(self):
+        self._client.run_command("first")
+        client = weakref.ref(self._client)
+        shell_pool = self._client._shell_pool
+
+        del self._client
+        gc.collect()
+
+        self.assertIsNone(client())
+        self.assertEqual(1, shell_pool.stats["idle"])
+
+    def test_pool_is_bounded(self):
+        shell_pool = windows.ShellPool(size=1)
+        shells = [shell_pool.acquire(self._client._open_shell)[0]
+                  for _ in range(3)]
+        for shell in shells:
+            shell_pool.release(shell)
+
+        self.assertEqual(3, self._server.shells_opened)
+        self.assertEqual(2, self._server.shells_closed)
+        self.assertEqual(1, shell_pool.stats["idle"])
+
+    def test_dead_shell_is_reopened(self):
+        self._client.run_command("before reboot")
+        self._server.kill_shells()
+
+        stdout, _, _ = self._client.run_command("after reboot")
+
+        self.assertEqual("after reboot", stdout)
+        self.assertEqual(2, self._server.shells_opened)
+        stats = self._client.shell_pool_stats
+        self.assertEqual(1, stats["discarded"])
+        self.assertEqual(1, stats["idle"])
+
+    def test_fresh_dead_shell_is_not_retried(self):
+        shell = self._client._open_shell()
+        self._server.kill_shells()
+
+        with mock.patch.object(self._client, '_open_shell',
+                               return_value=shell):
+            with self.assertRaises(winrm_exceptions.WinRMError):
+                self._client.run_command("never executed")
+        self.assertEqual([], self._server.commands)
+
+    def test_invalidate_shells(self):
+        self._client.run_command("first")
+        self._client.invalidate_shells()
+        self._client.run_command("second")
+
+        self.assertEqual(2, self._server.shells_opened)
+        self.assertEqual(0, self._server.shells_closed)
+
+    def test_close(self):
+        self._client.run_command("first")
+        self._client.close()
+
+        self.assertEqual(1, self._server.shells_closed)
+        self.assertEqual(0, self._client.shell_pool_stats["idle"])
+
+
+class TestRoundTripBudget(BaseFakeEndpointTest):
+
+    def test_within_budget(self):
+        with fake_winrm.RoundTripBudget(self._server, shells=1,
+                                        commands=2) as budget:
+            self._client.run_command("first")
+            self._client.run_command("second")
+
+        self.assertEqual(["first", "second"], budget.commands)
+        # Opening the shell, then three requests for every command.
+        self.assertEqual({"shells": 1, "commands": 2, "requests": 7},
+                         budget.used)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(AssertionError) as context:
+            with fake_winrm.RoundTripBudget(self._server, commands=1):
+                self._client.run_command("first")
+                self._client.run_command("second")
+
+        message = str(context.exception)
+        self.assertIn("2 commands instead of at most 1", message)
+        self.assertEqual(["first", "second"], message.splitlines()[-2:])
+
+
+class TestShellPoolFailures(BaseFakeEndpointTest):
+
+    @staticmethod
+    def responder(command, stdin):
+        # pylint: disable=unused-argument
+        return "", "failure", 1
+
+    def test_failed_command_keeps_the_shell(self):
+        for _ in range(2):
+            with self.assertRaises(exceptions.ArgusError):
+                self._client.run_command("failing")
+
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertEqual(0, self._client.shell_pool_stats["discarded"])
+
+
+class TestCommandTimeout(BaseFakeEndpointTest):
+
+    @staticmethod
+    def responder(command, stdin):
+        # pylint: disable=unused-argument
+        if command == "hanging":
+            return None
+        return command, "", 0
+
+    def test_command_is_cancelled_on_timeout(self):
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._client.run_command("hanging", upper_timeout=0.2)
+
+        self.assertEqual(1, self._server.signals)
+        # The shell is not reused, since it might still be busy.
+        self.assertEqual(1, self._client.shell_pool_stats["discarded"])
+        self._client.run_command("after timeout")
+        self.assertEqual(2, self._server.shells_opened)
+
+
+class TestCommandProfile(BaseFakeEndpointTest):
+
+    def setUp(self):
+        super(TestCommandProfile, self).setUp()
+        patcher = mock.patch.dict(profiling._SPANS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_commands_are_profiled(self):
+        self._client.run_command("echo 1")
+        self._client.run_command("echo 2", command_type=util.CMD)
+
+        scenario = argus_log.get_log_extra_item(profiling.LOG, "scenario")
+        spans = profiling.get_spans(scenario)
+        self.assertEqual([("shell", "open_shell"),
+                          ("command", util.POWERSHELL),
+                          ("command", util.CMD)],
+                         [span[:2] for span in spans])
+        command = spans[1]
+        self.assertEqual(
+            len(util.get_command("echo 1", util.POWERSHELL)),
+            command.details["sent"])
+        self.assertEqual(len("echo 1"), command.details["received"])
+
+
+class _InstantProtocol(object):
+    """A protocol whose commands finish as soon as they are sent."""
+
+    @staticmethod
+    def run_command(shell_id, command):
+        # pylint: disable=unused-argument
+        return "command-id"
+
+    @staticmethod
+    def get_command_output(shell_id, command_id):
+        # pylint: disable=unused-argument
+        return b"stdout", b"", 0
+
+    _raw_get_command_output = staticmethod(
+        lambda shell_id, command_id: (b"stdout", b"", 0, True))
+
+    @staticmethod
+    def cleanup_command(shell_id, command_id):
+        pass
+
+
+class TestRunCommandOverhead(unittest.TestCase):
+    """Micro-benchmark for the controller side cost of a command."""
+
+    CALLS = 200
+
+    @staticmethod
+    def _run_command_with_thread_pool(protocol_client, shell_id, command):
+        # How every command used to wait for its output.
+        from multiprocessing import pool
+        thread_pool = pool.ThreadPool(processes=1)
+        try:
+            command_id = protocol_client.run_command(shell_id, command)
+            result = thread_pool.apply_async(
+                protocol_client.get_command_output,
+                args=(shell_id, command_id))
+            return result.get(timeout=10)
+        finally:
+            thread_pool.terminate()
+
+    def _measure(self, function):
+        protocol_client = _InstantProtocol()
+        start = time.time()
+        for _ in range(self.CALLS):
+            function(protocol_client, "shell-id", "command")
+        return (time.time() - start) / self.CALLS
+
+    def test_per_call_overhead(self):
+        before = self._measure(self._run_command_with_thread_pool)
+        after = self._measure(functools.partial(
+            windows.WinRemoteClient._run_command, upper_timeout=10))
+
+        self.assertLess(after, before)
+
+
+class TestUpload(BaseFakeEndpointTest):
+
+    responder = fake_winrm.FileStore()
+
+    def setUp(self):
+        self.responder.files.clear()
+        super(TestUpload, self).setUp()
+
+    def _copy(self, content, remote_path=r"C:\it's\file.bin"):
+        with tempfile.NamedTemporaryFile(delete=False) as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, stream.name)
+        with test_utils.LogSnatcher('argus.client.windows') as snatcher:
+            self._client.copy_file(stream.name, remote_path)
+        return snatcher.output
+
+    def test_binary_content_is_preserved(self):
+        content = bytes(bytearray(range(256))) * 4
+        self._copy(content)
+
+        self.assertEqual({r"C:\it's\file.bin": content},
+                         self.responder.files)
+
+    def test_large_file_uses_one_command(self):
+        content = os.urandom(3 * windows.UPLOAD_CHUNK_SIZE + 1)
+        output = self._copy(content)
+
+        self.assertEqual(content, self.responder.files[r"C:\it's\file.bin"])
+        self.assertEqual([windows.STDIN_POWERSHELL], self._server.commands)
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertEqual(1, len(output))
+        self.assertIn("MB/s", output[0])
+
+    def test_empty_file(self):
+        self._copy(b"")
+
+        self.assertEqual({r"C:\it's\file.bin": b""}, self.responder.files)
+
+    def test_checksum_mismatch(self):
+        def run_script(lines, upper_timeout):
+            # pylint: disable=unused-argument
+            list(lines)
+            return hashlib.sha256(b"other").hexdigest().upper(), "", 0
+
+        with mock.patch.object(self._client, "_run_stdin_script",
+                               side_effect=run_script):
+            with self.assertRaises(exceptions.ArgusError) as context:
+                self._copy(b"data")
+
+        self.assertIn("does not match", str(context.exception))
+
+    def test_shell_is_reused_between_uploads(self):
+        self._copy(b"data")
+        self._copy(b"more data")
+
+        self.assertEqual(1, self._server.shells_opened)
+        self.assertEqual(b"more data",
+                         self.responder.files[r"C:\it's\file.bin"])
+
+
+class TestMultiStreamUpload(BaseFakeEndpointTest):
+
+    remote_path = r"C:\install.zip"
+
+    def setUp(self):
+        self._store = fake_winrm.FileStore()
+        self._stalled = set()
+        self._uploads = collections.Counter()
+        super(TestMultiStreamUpload, self).setUp()
+
+    def responder(self, command, stdin):
+        match = re.search(br"\.part(\d+)\.argus-upload", stdin)
+        if match:
+            index = int(match.group(1))
+            if index in self._stalled:
+                if not self._server.cancelled:
+                    # Stall until the client cancels the command.
+                    return None
+                self._stalled.discard(index)
+            self._uploads[index] += 1
+        return self._store(command, stdin)
+
+    def _upload(self, content, **kwargs):
+        with tempfile.NamedTemporaryFile(delete=False) as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, stream.name)
+        kwargs.setdefault("part_size", 1000)
+        return self._client.upload(stream.name, self.remote_path, **kwargs)
+
+    def test_parts_are_assembled(self):
+        content = os.urandom(5500)
+        digest = self._upload(content, streams=3)
+
+        self.assertEqual(hashlib.sha256(content).hexdigest(), digest)
+        self.assertEqual({self.remote_path: content}, self._store.files)
+        self.assertEqual({index: 1 for index in range(6)}, self._uploads)
+        self.assertLessEqual(self._server.shells_opened, 3)
+
+    def test_empty_file(self):
+        self._upload(b"")
+
+        self.assertEqual({self.remote_path: b""}, self._store.files)
+
+    def test_verified_parts_are_not_uploaded_again(self):
+        content = os.urandom(3000)
+        self._store.files.update({
+            self.remote_path + ".part0": content[:1000],
+            self.remote_path + ".part1": b"corrupted",
+        })
+
+        self._upload(content)
+
+        self.assertEqual({self.remote_path: content}, self._store.files)
+        self.assertEqual({1: 1, 2: 1}, self._uploads)
+
+    def test_resume_after_timeout(self):
+        content = os.urandom(4000)
+        self._stalled.add(2)
+
+        with test_utils.LogSnatcher('argus.client.windows') as snatcher:
+            self._upload(content, streams=2, upper_timeout=0.2)
+
+        self.assertEqual({self.remote_path: content}, self._store.files)
+        self.assertEqual({0: 1, 1: 1, 2: 1, 3: 1}, self._uploads)
+        self.assertEqual(1, self._server.cancelled)
+        self.assertTrue(any("resuming from the verified parts" in line
+                            for line in snatcher.output))
+
+    def test_timeout_after_retries(self):
+        self._stalled.add(0)
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._upload(os.urandom(10), retry_count=0, upper_timeout=0.2)
+
+
+class TestWriteFile(BaseFakeEndpointTest):
+
+    remote_path = r"C:\conf\cloudbase-init.conf"
+
+    def setUp(self):
+        self._store = fake_winrm.FileStore()
+        super(TestWriteFile, self).setUp()
+
+    def responder(self, command, stdin):
+        return self._store(command, stdin)
+
+    def test_write_in_one_command(self):
+        self._store.files[self.remote_path] = b"old content"
+        data = u"[DEFAULT]\r\n" + u"option = value\r\n" * 60
+
+        self.assertTrue(self._client.write_file(data, self.remote_path))
+
+        self.assertEqual({self.remote_path: data.encode("utf-8")},
+                         self._store.files)
+        self.assertEqual(1, len(self._server.commands))
+
+    def test_unchanged_file_is_not_written(self):
+        content = b"option = value\r\n"
+        self._store.files[self.remote_path] = content
+
+        written = self._client.write_file(u"option = value\r\n",
+                                          self.remote_path)
+
+        self.assertFalse(written)
+        self.assertIs(content, self._store.files[self.remote_path])
+        self.assertEqual(1, len(self._server.commands))
+
+    def test_encoding(self):
+        self._client.write_file(u"name = \xe9", self.remote_path,
+                                encoding="ascii")
+
+        self.assertEqual({self.remote_path: b"name = ?"}, self._store.files)
+
+
+class TestDownload(BaseFakeEndpointTest):
+
+    remote_path = r"C:\Program Files\Cloudbase Solutions\log\cbinit.log"
+
+    def setUp(self):
+        self._store = fake_winrm.FileStore()
+        super(TestDownload, self).setUp()
+        local = tempfile.NamedTemporaryFile(delete=False)
+        local.close()
+        self.addCleanup(os.remove, local.name)
+        self._local_path = local.name
+
+    def responder(self, command, stdin):
+        return self._store(command, stdin)
+
+    def _read_local(self):
+        with open(self._local_path, 'rb') as stream:
+            return stream.read()
+
+    def test_download_in_chunks(self):
+        content = os.urandom(10000)
+        self._store.files[self.remote_path] = content
+
+        digest = self._client.download(self.remote_path, self._local_path,
+                                       chunk_size=4096)
+
+        self.assertEqual(content, self._read_local())
+        self.assertEqual(hashlib.sha256(content).hexdigest(), digest)
+        # One command for the size, three for the chunks.
+        self.assertEqual(4, len(self._server.commands))
+
+    def test_empty_file(self):
+        self._store.files[self.remote_path] = b""
+
+        self._client.download(self.remote_path, self._local_path)
+
+        self.assertEqual(b"", self._read_local())
+        self.assertEqual(1, len(self._server.commands))
+
+    def test_checksum_mismatch(self):
+        self._store.files[self.remote_path] = b"content"
+        stat = self._store._digest
+        with mock.patch.object(self._store, "_digest",
+                               side_effect=lambda path: stat(path)[::-1]):
+            with self.assertRaises(exceptions.ArgusError) as context:
+                self._client.download(self.remote_path, self._local_path)
+
+        self.assertIn("does not match", str(context.exception))
+
+
+def _batched_command(command, stdin):
+    # pylint: disable=unused-argument
+    if command == "fail":
+        return "", "Something failed.", 3
+    return "ran " + command, "", 0
+
+
+class TestRunBatch(BaseFakeEndpointTest):
+
+    responder = fake_winrm.BatchRunner(_batched_command)
+
+    def setUp(self):
+        del self.responder.batches[:]
+        super(TestRunBatch, self).setUp()
+
+    def test_commands_run_in_one_round_trip(self):
+        commands = ["first", "second 'quoted'", "third\r\nline"]
+
+        results = self._client.run_batch(commands)
+
+        self.assertEqual([("ran " + command, "", 0)
+                          for command in commands], results)
+        self.assertEqual([commands], self.responder.batches)
+        self.assertEqual(1, len(self._server.commands))
+
+    def test_failed_commands_do_not_stop_the_batch(self):
+        results = self._client.run_batch(["first", "fail", "last"])
+
+        self.assertEqual([("ran first", "", 0),
+                          ("", "Something failed.", 3),
+                          ("ran last", "", 0)], results)
+
+    def test_empty_batch(self):
+        self.assertEqual([], self._client.run_batch([]))
+        self.assertEqual([], self._server.commands)
+
+    def test_missing_results(self):
+        marker = "argus-batch-fake"
+        stdout = "{}:0:0::\r\nnoise".format(marker)
+
+        with self.assertRaises(exceptions.ArgusError) as context:
+            windows._parse_batch_output(stdout, marker, 2)
+
+        self.assertIn("[1]", str(context.exception))
+
+
+class TestStagedCommands(BaseFakeEndpointTest):
+
+    responder = fake_winrm.StagedScriptRunner(_batched_command)
+
+    def setUp(self):
+        del self.responder.scripts[:]
+        super(TestStagedCommands, self).setUp()
+
+    def test_short_command_is_encoded(self):
+        self._client.run_remote_cmd("short")
+
+        self.assertEqual([], self.responder.scripts)
+        self.assertEqual(["short"], self._server.commands)
+
+    def test_long_command_is_staged(self):
+        # Every character takes more than two in the encoded command.
+        command = u"Write-Output '\u00e9{}'".format(
+            "x" * (util.MAX_COMMAND_LINE // 2))
+
+        stdout, _, _ = self._client.run_remote_cmd(command)
+
+        self.assertEqual("ran " + command, stdout)
+        self.assertEqual([command], self.responder.scripts)
+        self.assertEqual([windows.STDIN_POWERSHELL], self._server.commands)
+
+    def test_failed_staged_command(self):
+        self.responder.responder = lambda command, stdin: ("", "error", 3)
+        self.addCleanup(setattr, self.responder, "responder",
+                        _batched_command)
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.run_remote_cmd("x" * util.MAX_COMMAND_LINE)
+
+    def test_staged_script_runs_the_file(self):
+        lines = list(windows._staged_script("script", chunk_size=4))
+
+        self.assertEqual(["[void]$argusScript.Append('77u/')",
+                          "[void]$argusScript.Append('c2Ny')",
+                          "[void]$argusScript.Append('aXB0')"], lines[1:4])
+        self.assertIn(util.get_command(
+            "$argusPath", util.POWERSHELL_SCRIPT_BYPASS), lines[-4])
+        self.assertEqual("exit $argusCode", lines[-1])
+
+
+class TestReadinessProbes(BaseFakeEndpointTest):
+
+    @staticmethod
+    def _free_port():
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        return port
+
+    def _silent_listener(self):
+        # Accepts connections, but never answers anything.
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        return listener.getsockname()[1]
+
+    def test_probe_tcp(self):
+        self.assertTrue(windows.probe_tcp("127.0.0.1", self._server.port,
+                                          timeout=1))
+        self.assertFalse(windows.probe_tcp("127.0.0.1", self._free_port(),
+                                           timeout=1))
+
+    def test_probe_identify(self):
+        url = "http://127.0.0.1:{}/wsman".format(self._server.port)
+
+        self.assertTrue(windows.probe_identify(url, timeout=1))
+        self.assertEqual(1, self._server.identified)
+        # The Identify request doesn't need a shell.
+        self.assertEqual(0, self._server.shells_opened)
+
+    def test_probe_identify_rejected(self):
+        # The endpoint doesn't allow unauthenticated requests.
+        self._server.anonymous_identify = False
+        url = "http://127.0.0.1:{}/wsman".format(self._server.port)
+
+        self.assertTrue(windows.probe_identify(url, timeout=1))
+        self.assertEqual(1, self._server.identified)
+
+    def test_probe_identify_not_answering(self):
+        url = "http://127.0.0.1:{}/wsman".format(self._silent_listener())
+
+        self.assertFalse(windows.probe_identify(url, timeout=0.2))
+
+    def test_wait_for_endpoint(self):
+        stages = self._client.wait_for_endpoint(timeout=5, interval=0.01,
+                                                probe_timeout=1)
+
+        self.assertEqual(["tcp", "identify"], list(stages))
+        self.assertEqual(1, self._server.identified)
+
+    def test_wait_for_endpoint_until_listening(self):
+        port = self._free_port()
+        client = self._get_client()
+        client._address = ("127.0.0.1", port)
+        probes = []
+
+        def probe_tcp(host, port, timeout):
+            probes.append((host, port, timeout))
+            return len(probes) == 3
+
+        with mock.patch.object(windows, "probe_tcp", probe_tcp):
+            stages = client.wait_for_endpoint(timeout=5, interval=0.01,
+                                              probe_timeout=0.5)
+
+        self.assertEqual([("127.0.0.1", port, 0.5)] * 3, probes)
+        self.assertGreaterEqual(stages["tcp"], 0.02)
+
+    def test_wait_for_endpoint_timeout(self):
+        client = self._get_client()
+        client._address = ("127.0.0.1", self._free_port())
+
+        with self.assertRaises(exceptions.ArgusTimeoutError) as context:
+            client.wait_for_endpoint(timeout=0.1, interval=0.02,
+                                     probe_timeout=0.05)
+
+        self.assertIn("tcp probe", str(context.exception))
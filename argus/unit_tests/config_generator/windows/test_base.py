@@ -87,43 +87,38 @@ class BaseWindowsConfig(unittest.TestCase):
 
     @mock.patch('argus.config_generator.windows.base.'
                 'BaseWindowsConfig.conf')
-    @mock.patch('StringIO.StringIO')
+    @mock.patch('argus.config_generator.windows.base.StringIO.StringIO')
     @mock.patch('ntpath.join')
-    def _test_apply_config(self, mock_join, mock_string_io, _, is_file):
+    def _test_apply_config(self, mock_join, mock_string_io, _, written):
         mock_join.return_value = mock.sentinel
-        mock_manager = mock.Mock()
-        mock_manager.is_file.return_value = is_file
         mock_buff = mock.Mock()
-        mock_data = mock.Mock()
-        mock_data.splitlines.return_value = [mock.Mock] * 5
-        mock_buff.read.return_value = mock_data
+        mock_buff.read.return_value = "[DEFAULT]\nfirst = 1\nsecond = 2\n"
         mock_string_io.return_value = mock_buff
         mock_client = mock.Mock()
-        mock_client.mock_manager = mock_manager
+        mock_client.write_file.return_value = written
         self._cbinit_config._client = mock_client
         self._cbinit_config.config_name = mock.sentinel
 
         self._cbinit_config.apply_config(mock.sentinel)
 
         mock_join.assert_called_once_with(mock.sentinel, mock.sentinel)
-        self._cbinit_config._client.manager.is_file.assert_called_once_with(
-            mock.sentinel)
-        if is_file:
-            self._cbinit_config._client.manager.remove.assert_called_once_with(
-                mock.sentinel)
         mock_string_io.assert_called_once_with()
         self._cbinit_config.conf.write.assert_called_once_with(
             mock_string_io.return_value)
         mock_buff.seek.assert_called_once_with(0)
         mock_buff.read.assert_called_once_with()
-        mock_data.splitlines.assert_called_once_with()
-        self.assertEqual(self._cbinit_config._client.write_file.call_count, 5)
-
-    def test_apply_config_is_file(self):
-        self._test_apply_config(is_file=True)
-
-    def test_apply_config_is_no_file(self):
-        self._test_apply_config(is_file=None)
+        # The whole file is written at once, without removing it first.
+        mock_client.write_file.assert_called_once_with(
+            data="[DEFAULT]\r\nfirst = 1\r\nsecond = 2\r\n",
+            remote_destination=mock.sentinel, encoding="utf-8")
+        self.assertFalse(mock_client.manager.is_file.called)
+        self.assertFalse(mock_client.manager.remove.called)
+
+    def test_apply_config_written(self):
+        self._test_apply_config(written=True)
+
+    def test_apply_config_unchanged(self):
+        self._test_apply_config(written=False)
 
     def test_config_specific_paths(self):
         result = (super(FakeBaseWindowsConfig, self._cbinit_config).
@@ -0,0 +1,121 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""An in-memory cloud back-end, used for testing the scenario machinery.
+
+The instances and snapshots only exist in a :class:`FakeCloud`, which
+records everything that was done to it, so that the tests can check
+which instances were booted, from which images, and what was cleaned up.
+"""
+
+import itertools
+import threading
+
+from argus.backends import base
+from argus import exceptions
+
+
+class FakeCloud(object):
+    """The instances and snapshots shared by the fake back-ends."""
+
+    def __init__(self, image="base image"):
+        self.image = image
+        self.instances = {}
+        self.snapshots = {}
+        self.events = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_id(self, kind):
+        with self._lock:
+            return "{}-{}".format(kind, next(self._ids))
+
+    def record(self, *event):
+        with self._lock:
+            self.events.append(event)
+
+    def backend_type(self, supports_snapshots=True):
+        """Get a back-end class whose instances live in this cloud."""
+        return type("FakeBackend", (FakeBackend, ), {
+            "cloud": self, "supports_snapshots": supports_snapshots})
+
+
+class FakeBackend(base.CloudBackend):
+    """A back-end whose instances live in a :class:`FakeCloud`."""
+
+    cloud = None
+    supports_snapshots = True
+
+    def __init__(self, name=None, userdata=None, metadata=None,
+                 availability_zone=None):
+        super(FakeBackend, self).__init__(name, userdata, metadata,
+                                          availability_zone)
+        self.image_ref = self.cloud.image
+        self._instance_id = None
+
+    def setup_instance(self):
+        self._instance_id = self.cloud.new_id("instance")
+        self.cloud.instances[self._instance_id] = {
+            "name": self._name, "image": self.image_ref}
+        self.cloud.record("boot", self._name, self.image_ref)
+
+    def cleanup(self):
+        if self._instance_id is not None:
+            del self.cloud.instances[self._instance_id]
+            self.cloud.record("delete", self._name)
+            self._instance_id = None
+
+    def snapshot_instance(self, name):
+        snapshot = self.cloud.new_id("snapshot")
+        self.cloud.snapshots[snapshot] = name
+        self.cloud.record("snapshot", self._name, snapshot)
+        return snapshot
+
+    def boot_from_snapshot(self, snapshot):
+        if snapshot not in self.cloud.snapshots:
+            raise exceptions.ArgusError("No snapshot %s." % snapshot)
+        self.image_ref = snapshot
+
+    def delete_snapshot(self, snapshot):
+        del self.cloud.snapshots[snapshot]
+        self.cloud.record("delete snapshot", snapshot)
+
+    def get_remote_client(self, username=None, password=None, **kwargs):
+        return None
+
+    @property
+    def remote_client(self):
+        return self.get_remote_client()
+
+    def instance_output(self, limit=None):
+        return ""
+
+    def internal_instance_id(self):
+        return self._instance_id
+
+    def reboot_instance(self):
+        self.cloud.record("reboot", self._name)
+
+    def instance_password(self):
+        return "Passw0rd"
+
+    def private_key(self):
+        return None
+
+    def public_key(self):
+        return None
+
+    def floating_ip(self):
+        return "127.0.0.1"
@@ -0,0 +1,562 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A local fake WS-Management endpoint, used for testing the WinRM client.
+
+The endpoint understands the subset of the WinRM shell protocol used by
+:class:`argus.client.windows.WinRemoteClient` (Create, Command, Send,
+Receive, Signal and Delete) and the unauthenticated Identify requests.
+It answers every command through a *responder* callable, which receives
+the command line and returns the standard output, the standard error
+and the exit code.
+"""
+
+import base64
+import codecs
+import hashlib
+import itertools
+import re
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+
+import six
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from argus import util
+
+_ACTION_PREFIX = "http://schemas.microsoft.com/wbem/wsman/1/windows/shell/"
+_CREATE = "http://schemas.xmlsoap.org/ws/2004/09/transfer/Create"
+_DELETE = "http://schemas.xmlsoap.org/ws/2004/09/transfer/Delete"
+_COMMAND = _ACTION_PREFIX + "Command"
+_SEND = _ACTION_PREFIX + "Send"
+_RECEIVE = _ACTION_PREFIX + "Receive"
+_SIGNAL = _ACTION_PREFIX + "Signal"
+
+_ENVELOPE = (
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+    'xmlns:x="http://schemas.xmlsoap.org/ws/2004/09/transfer" '
+    'xmlns:w="http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd" '
+    'xmlns:rsp="http://schemas.microsoft.com/wbem/wsman/1/windows/shell">'
+    '<s:Header><a:RelatesTo>{relates_to}</a:RelatesTo></s:Header>'
+    '<s:Body>{body}</s:Body></s:Envelope>')
+_SHELL_CREATED = (
+    '<x:ResourceCreated><a:ReferenceParameters><w:SelectorSet>'
+    '<w:Selector Name="ShellId">{shell_id}</w:Selector>'
+    '</w:SelectorSet></a:ReferenceParameters></x:ResourceCreated>')
+_COMMAND_RESPONSE = (
+    '<rsp:CommandResponse><rsp:CommandId>{command_id}</rsp:CommandId>'
+    '</rsp:CommandResponse>')
+_RECEIVE_RESPONSE = (
+    '<rsp:ReceiveResponse>'
+    '<rsp:Stream Name="stdout" CommandId="{command_id}">{stdout}</rsp:Stream>'
+    '<rsp:Stream Name="stderr" CommandId="{command_id}">{stderr}</rsp:Stream>'
+    '<rsp:CommandState CommandId="{command_id}" State="{done}">'
+    '<rsp:ExitCode>{exit_code}</rsp:ExitCode></rsp:CommandState>'
+    '</rsp:ReceiveResponse>')
+_IDENTIFY_RESPONSE = (
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" '
+    'xmlns:wsmid="http://schemas.dmtf.org/wbem/wsman/identity/1/'
+    'wsmanidentity.xsd"><s:Header/><s:Body><wsmid:IdentifyResponse>'
+    '<wsmid:ProtocolVersion>http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd'
+    '</wsmid:ProtocolVersion><wsmid:ProductVendor>Fake</wsmid:ProductVendor>'
+    '</wsmid:IdentifyResponse></s:Body></s:Envelope>')
+_DONE = _ACTION_PREFIX + "CommandState/Done"
+_FAULT = (
+    '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope">'
+    '<s:Body><s:Fault><s:Code><s:Value>s:Receiver</s:Value></s:Code>'
+    '<s:Reason><s:Text xml:lang="en-US">{reason}</s:Text></s:Reason>'
+    '{detail}</s:Fault></s:Body></s:Envelope>')
+_OPERATION_TIMEOUT = (
+    '<s:Detail><f:WSManFault '
+    'xmlns:f="http://schemas.microsoft.com/wbem/wsman/1/wsmanfault" '
+    'Code="2150858793"/></s:Detail>')
+
+
+def echo_responder(command, stdin):
+    """The default responder, which echoes back the received command."""
+    # pylint: disable=unused-argument
+    return command, "", 0
+
+
+def _unquote(value):
+    return value.replace("''", "'")
+
+
+class FileStore(object):
+    """A responder which keeps the files uploaded by the client.
+
+    It understands the PowerShell scripts sent on the standard input
+    by :meth:`WinRemoteClient.upload_stream`,
+    :meth:`WinRemoteClient.upload` and :meth:`WinRemoteClient.write_file`,
+    the commands sent by :meth:`WinRemoteClient.download` and delegates
+    everything else to the `fallback` responder.
+    """
+
+    _OPEN = re.compile(r"\[IO\.File\]::Open\('((?:[^']|'')*)', "
+                       r"\[IO\.FileMode\]::Create")
+    _DATA = re.compile(r"FromBase64String\('([^']*)'\)")
+    _MOVE = re.compile(r"Move-Item -Force -LiteralPath '((?:[^']|'')*)' "
+                       r"-Destination '((?:[^']|'')*)'")
+    _APPEND = re.compile(r"\$argusPart = \[IO\.File\]::OpenRead\("
+                         r"'((?:[^']|'')*)'\)")
+    _CHECK = re.compile(r"\$argusWrite = .*Test-Path -LiteralPath "
+                        r"'((?:[^']|'')*)'.* -eq '([0-9A-F]+)'")
+    _EXISTS = re.compile(r"Test-Path -LiteralPath '((?:[^']|'')*)'")
+    _HASH = re.compile(r"Get-ArgusHash '((?:[^']|'')*)'")
+    _SIZE = re.compile(r"\(Get-Item -LiteralPath '((?:[^']|'')*)'\)\.Length")
+    _RANGE = re.compile(r"\[IO\.File\]::Open\('((?:[^']|'')*)', 'Open', "
+                        r"'Read'.*Seek\((\d+), .*byte\[\] (\d+)")
+
+    def __init__(self, fallback=echo_responder):
+        self.files = {}
+        self.fallback = fallback
+
+    def __call__(self, command, stdin):
+        if command.endswith("-Command -"):
+            lines = stdin.decode("utf-8").splitlines()
+        elif self._SIZE.search(command) or self._RANGE.search(command):
+            lines = [command]
+        else:
+            return self.fallback(command, stdin)
+
+        output = []
+        current = None
+        write = True
+        for line in lines:
+            match = self._SIZE.search(line) or self._RANGE.search(line)
+            if match and _unquote(match.group(1)) not in self.files:
+                return "", "Cannot find path.", 1
+            match = self._SIZE.search(line)
+            if match:
+                output.append(str(len(self.files[_unquote(match.group(1))])))
+            match = self._RANGE.search(line)
+            if match:
+                offset, length = int(match.group(2)), int(match.group(3))
+                data = self.files[_unquote(match.group(1))]
+                output.append(base64.b64encode(
+                    data[offset:offset + length]).decode())
+                continue
+            match = self._CHECK.search(line)
+            if match:
+                path = _unquote(match.group(1))
+                digest = self._digest(path) if path in self.files else None
+                write = digest != match.group(2)
+                continue
+            if line.startswith("if ($argusWrite)") and not write:
+                continue
+            if line.startswith("if (-not $argusWrite)"):
+                if not write:
+                    output.append("unchanged")
+                continue
+            match = self._EXISTS.search(line)
+            if match:
+                path = _unquote(match.group(1))
+                if path in self.files:
+                    output.append(self._digest(path))
+                else:
+                    output.append("-")
+                continue
+            match = self._OPEN.search(line)
+            if match:
+                current = _unquote(match.group(1))
+                self.files[current] = b""
+            match = self._DATA.search(line)
+            if match:
+                self.files[current] += base64.b64decode(match.group(1))
+            match = self._APPEND.search(line)
+            if match:
+                self.files[current] += self.files.pop(
+                    _unquote(match.group(1)))
+            match = self._MOVE.search(line)
+            if match:
+                source, destination = map(_unquote, match.groups())
+                self.files[destination] = self.files.pop(source)
+            match = self._HASH.search(line)
+            if match:
+                output.append(self._digest(_unquote(match.group(1))))
+        return "\r\n".join(output), "", 0
+
+    def _digest(self, path):
+        return hashlib.sha256(self.files[path]).hexdigest().upper()
+
+
+class BatchRunner(object):
+    """A responder which understands the scripts of
+    :meth:`WinRemoteClient.run_batch`.
+
+    Every batched command is answered by the `responder`, as if
+    it was sent on its own, while the other commands are
+    delegated to the `fallback` responder.
+    """
+
+    _MARKER = re.compile(r"^\$argusMarker = '([^']*)'$")
+    _COMMAND = re.compile(r"^Invoke-ArgusCommand (\d+) '([^']*)'$")
+
+    def __init__(self, responder=echo_responder, fallback=echo_responder):
+        self.responder = responder
+        self.fallback = fallback
+        self.batches = []
+
+    def __call__(self, command, stdin):
+        lines = stdin.decode("utf-8").splitlines()
+        match = self._MARKER.match(lines[0]) if lines else None
+        if not command.endswith("-Command -") or not match:
+            return self.fallback(command, stdin)
+
+        marker = match.group(1)
+        commands, output = [], []
+        for line in lines:
+            match = self._COMMAND.match(line)
+            if not match:
+                continue
+            script = base64.b64decode(match.group(2)).decode("utf-8")
+            commands.append(script)
+            stdout, stderr, exit_code = self.responder(script, b"")
+            output.append("{}:{}:{}:{}:{}".format(
+                marker, match.group(1), exit_code,
+                base64.b64encode(stdout.encode("utf-8")).decode(),
+                base64.b64encode(stderr.encode("utf-8")).decode()))
+        self.batches.append(commands)
+        return "\r\n".join(output), "", 0
+
+
+class StagedScriptRunner(object):
+    """A responder which understands the scripts staged in files
+    by :class:`WinRemoteClient`, for the commands too long for a
+    command line.
+
+    Every staged script is answered by the `responder`, as if it
+    was sent on its own, while the other commands are delegated
+    to the `fallback` responder.
+    """
+
+    _CHUNK = re.compile(r"^\[void\]\$argusScript\.Append\('([^']*)'\)$")
+
+    def __init__(self, responder=echo_responder, fallback=echo_responder):
+        self.responder = responder
+        self.fallback = fallback
+        self.scripts = []
+
+    def __call__(self, command, stdin):
+        lines = stdin.decode("utf-8").splitlines()
+        if (not command.endswith("-Command -") or not lines or
+                lines[0] != "$argusScript = New-Object Text.StringBuilder"):
+            return self.fallback(command, stdin)
+
+        encoded = "".join(match.group(1) for match in
+                          map(self._CHUNK.match, lines) if match)
+        script = base64.b64decode(encoded)
+        if script.startswith(codecs.BOM_UTF8):
+            script = script[len(codecs.BOM_UTF8):]
+        script = script.decode("utf-8")
+        self.scripts.append(script)
+        return self.responder(script, b"")
+
+
+def _find(root, suffix):
+    for node in root.iter():
+        if node.tag.endswith(suffix):
+            return node
+    return None
+
+
+class _Command(object):
+
+    def __init__(self, command_line):
+        self.script = util.decode_command(command_line)
+        self.stdin = []
+        self.done = False
+
+
+class FakeWinRMHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer the WS-Management requests sent by `pywinrm`."""
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length)
+        server = self.server.fake
+        server.record_request(len(payload))
+
+        if self.headers.get("WSMANIDENTIFY") == "unauthenticated":
+            server.identified += 1
+            if server.anonymous_identify:
+                self._reply(_IDENTIFY_RESPONSE)
+            else:
+                self._reply("", code=401)
+            return
+
+        root = ElementTree.fromstring(payload)
+        action = _find(root, "Action").text
+        message_id = _find(root, "MessageID").text
+        selector = _find(root, "Selector")
+        shell_id = selector.text if selector is not None else None
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if action != _CREATE and shell_id not in server.shells:
+            self._reply(_FAULT.format(
+                reason="The request for the Windows Remote Shell with "
+                       "ShellId {} failed because the shell was not "
+                       "found on the server.".format(shell_id),
+                detail=""), code=500)
+            return
+
+        handler = {
+            _CREATE: self._create,
+            _DELETE: self._delete,
+            _COMMAND: self._command,
+            _SEND: self._send,
+            _RECEIVE: self._receive,
+            _SIGNAL: self._signal,
+        }[action]
+        body = handler(root, shell_id)
+        if body is None:
+            self._reply(_FAULT.format(reason="The operation timed out.",
+                                      detail=_OPERATION_TIMEOUT), code=500)
+            return
+        self._reply(_ENVELOPE.format(relates_to=message_id, body=body))
+
+    def _reply(self, body, code=200):
+        body = body.encode("utf-8")
+        self.server.fake.record_response(len(body))
+        self.send_response(code)
+        self.send_header("Content-Type", "application/soap+xml;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _create(self, root, shell_id):
+        # pylint: disable=unused-argument
+        shell_id = self.server.fake.open_shell()
+        return _SHELL_CREATED.format(shell_id=shell_id)
+
+    def _delete(self, root, shell_id):
+        # pylint: disable=unused-argument
+        self.server.fake.close_shell(shell_id)
+        return ""
+
+    def _command(self, root, shell_id):
+        command_line = _find(root, "Command").text or ""
+        arguments = _find(root, "Arguments")
+        if arguments is not None and arguments.text:
+            command_line = "{} {}".format(command_line, arguments.text)
+        command_id = self.server.fake.new_command(shell_id, command_line)
+        return _COMMAND_RESPONSE.format(command_id=command_id)
+
+    def _send(self, root, shell_id):
+        stream = _find(root, "Stream")
+        command = self.server.fake.shells[shell_id][stream.get("CommandId")]
+        if stream.text:
+            command.stdin.append(base64.b64decode(stream.text))
+        return ""
+
+    def _receive(self, root, shell_id):
+        command_id = _find(root, "DesiredStream").get("CommandId")
+        command = self.server.fake.shells[shell_id][command_id]
+        response = self.server.fake.respond(command)
+        if response is None:
+            # The command is still running.
+            return None
+        stdout, stderr, exit_code = response
+        return _RECEIVE_RESPONSE.format(
+            command_id=command_id, exit_code=exit_code, done=_DONE,
+            stdout=base64.b64encode(stdout).decode(),
+            stderr=base64.b64encode(stderr).decode())
+
+    def _signal(self, root, shell_id):
+        command_id = _find(root, "Signal").get("CommandId")
+        self.server.fake.signal(shell_id, command_id)
+        return ""
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FakeWinRMServer(object):
+    """A fake WS-Management endpoint listening on localhost.
+
+    :param responder:
+        A callable which receives the decoded command line and the
+        bytes sent on its standard input and returns a tuple of
+        stdout, stderr and exit code. If it returns None, the command
+        is considered to be still running.
+    :param latency:
+        Number of seconds to wait before answering each request.
+
+    The server keeps track of the shells that were opened and closed,
+    of every command it answered and of the commands cancelled
+    before finishing, so tests can assert how many
+    round trips an operation needed.
+    """
+
+    def __init__(self, responder=echo_responder, latency=0):
+        self.responder = responder
+        self.latency = latency
+        self.shells = {}
+        self.commands = []
+        self.shells_opened = 0
+        self.shells_closed = 0
+        self.signals = 0
+        self.cancelled = 0
+        self.identified = 0
+        # Whether the unauthenticated Identify requests are answered.
+        self.anonymous_identify = True
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = _ThreadingHTTPServer(("127.0.0.1", 0),
+                                           FakeWinRMHandler)
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={"poll_interval": 0.01})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def record_request(self, size):
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+
+    def record_response(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def open_shell(self):
+        with self._lock:
+            shell_id = str(uuid.uuid4()).upper()
+            self.shells[shell_id] = {}
+            self.shells_opened += 1
+        return shell_id
+
+    def close_shell(self, shell_id):
+        with self._lock:
+            self.shells.pop(shell_id, None)
+            self.shells_closed += 1
+
+    def kill_shells(self):
+        """Forget every open shell, as a rebooted instance would do."""
+        with self._lock:
+            self.shells.clear()
+
+    def new_command(self, shell_id, command_line):
+        command_id = "CMD-{}".format(next(self._ids))
+        command = _Command(command_line)
+        with self._lock:
+            self.shells[shell_id][command_id] = command
+            self.commands.append(command.script)
+        return command_id
+
+    def signal(self, shell_id, command_id):
+        with self._lock:
+            command = self.shells[shell_id].pop(command_id, None)
+            self.signals += 1
+            if command is not None and not command.done:
+                self.cancelled += 1
+
+    def counters(self):
+        """Get the shells, the commands and the requests seen so far."""
+        with self._lock:
+            return {"shells": self.shells_opened,
+                    "commands": len(self.commands),
+                    "requests": self.requests}
+
+    def respond(self, command):
+        response = self.responder(command.script, b"".join(command.stdin))
+        if response is None:
+            return None
+        command.done = True
+        stdout, stderr, exit_code = response
+        if isinstance(stdout, six.text_type):
+            stdout = stdout.encode("utf-8")
+        if isinstance(stderr, six.text_type):
+            stderr = stderr.encode("utf-8")
+        return stdout, stderr, exit_code
+
+
+class RoundTripBudget(object):
+    """Fail a block which needs more remote traffic than allowed.
+
+    The commands answered by the server while in the block are
+    recorded in :attr:`commands` and the traffic is counted in
+    :attr:`used`. If the block opened more shells, ran more
+    commands or sent more requests than its budget, an
+    :class:`AssertionError` listing the commands is raised::
+
+        with fake_winrm.RoundTripBudget(server, shells=1, commands=2):
+            manager.collect_files(files, archive)
+
+    The limits which are not given are not checked.
+    """
+
+    def __init__(self, server, shells=None, commands=None, requests=None):
+        self._server = server
+        self._budget = {"shells": shells, "commands": commands,
+                        "requests": requests}
+        self._start = None
+        self.used = {}
+        self.commands = []
+
+    def __enter__(self):
+        self._start = self._server.counters()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = self._server.counters()
+        self.used = {name: end[name] - self._start[name] for name in end}
+        self.commands = self._server.commands[
+            self._start["commands"]:end["commands"]]
+        if exc_type is not None:
+            return False
+
+        exceeded = ["{} {} instead of at most {}".format(
+            self.used[name], name, limit)
+            for name, limit in sorted(self._budget.items())
+            if limit is not None and self.used[name] > limit]
+        if exceeded:
+            raise AssertionError(
+                "The round trip budget was exceeded: {}. The commands "
+                "were:\n{}".format(", ".join(exceeded),
+                                   "\n".join(self.commands)))
+        return False
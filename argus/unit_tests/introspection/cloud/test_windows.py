@@ -16,8 +16,15 @@
 # pylint: disable=no-value-for-parameter, protected-access, arguments-differ
 # pylint: disable=no-self-use, unused-argument, redefined-variable-type
 
+import collections
+import ntpath
 import unittest
+
+from argus.benchmarks import suite
+from argus import config as argus_config
+from argus import exceptions
 from argus.introspection.cloud import windows
+from argus.unit_tests import fake_winrm
 from argus import util
 
 try:
@@ -25,6 +32,8 @@ try:
 except ImportError:
     import mock
 
+CONFIG = argus_config.CONFIG
+
 
 class TestWindows(unittest.TestCase):
 
@@ -316,94 +325,81 @@ class TestInstanceIntrospection(unittest.TestCase):
         mock_remote_client.manager.WINDOWS_MANAGEMENT_CMDLET = "fake_cmdlet"
         self._introspect = windows.InstanceIntrospection(mock_remote_client)
 
-    @mock.patch('argus.util.POWERSHELL')
-    def test_get_disk_size(self, mock_util_ps):
-        self._introspect.remote_client.run_command_verbose.return_value = 0
+    def _answer(self, outputs, failed=()):
+        """Answer the batched queries with the given outputs."""
+        def run_batch(commands):
+            return [(outputs.get(command, ""), "", int(command in failed))
+                    for command in commands]
+        self._introspect.remote_client.run_batch.side_effect = run_batch
+
+    def _batches(self):
+        return [call[0][0] for call in
+                self._introspect.remote_client.run_batch.call_args_list]
+
+    def test_get_disk_size(self):
+        self._answer({'(fake_cmdlet win32_logicaldisk | where {$_.DeviceID '
+                      '-Match "C:"}).Size': "42\r\n"})
         result = self._introspect.get_disk_size()
-        self.assertEqual(result, 0)
+        self.assertEqual(result, 42)
 
-    def _test_username_exists(self, exists):
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = exists
+    def _test_username_exists(self, stdout):
+        cmd = ('fake_cmdlet Win32_Account | '
+               'where {$_.Name -contains "fake username"}')
+        self._answer({cmd: stdout})
         result = self._introspect.username_exists("fake username")
-        self.assertEqual(result, exists)
-        cmdlet = (self._introspect.remote_client.
-                  manager.WINDOWS_MANAGEMENT_CMDLET)
-        cmd = ('{0} Win32_Account | where {{$_.Name -contains "{1}"}}'
-               .format(cmdlet, "fake username"))
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.POWERSHELL))
+        self.assertEqual(result, bool(stdout))
+        self.assertEqual([cmd], self._batches()[-1])
 
     def test_username_exists(self):
-        self._test_username_exists(True)
+        self._test_username_exists("fake account\r\n")
 
     def test_username_not_exists(self):
-        self._test_username_exists(False)
+        self._test_username_exists("")
 
     @mock.patch('argus.introspection.cloud.windows._get_ntp_peers')
     def test_get_instance_ntp(self, mock_get_ntp_peers):
         mock_get_ntp_peers.return_value = mock.sentinel
-        stdout = mock.sentinel
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = stdout
+        self._answer({"w32tm /query /peers": "fake peers"})
         result = self._introspect.get_instance_ntp_peers()
         self.assertEqual(result, mock_get_ntp_peers.return_value)
-        mock_get_ntp_peers.assert_called_once_with(stdout)
+        mock_get_ntp_peers.assert_called_once_with("fake peers")
 
-    @mock.patch('argus.introspection.cloud.windows.CONFIG')
-    @mock.patch('ntpath.join')
-    def test_get_instance_keys_path(self, mock_join, mock_config):
-        mock_stdout = mock.Mock()
-        mock_stdout.rpartition.return_value = "fake dir", None, None
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = mock_stdout
-        mock_join.return_value = mock.sentinel
+    def test_get_instance_keys_path(self):
+        self._answer({"(Get-Location).Path": "C:\\Users\\fake\r\n"})
 
         result = self._introspect.get_instance_keys_path()
 
-        mock_join.assert_called_once_with(
-            "fake dir", mock_config.cloudbaseinit.created_user,
-            ".ssh", "authorized_keys")
-        self.assertEqual(result, mock_join.return_value)
+        expected = ntpath.join("C:\\Users", CONFIG.cloudbaseinit.created_user,
+                               ".ssh", "authorized_keys")
+        self.assertEqual(expected, result)
 
     def test_get_instance_file_content(self):
-        expected_result = mock.sentinel
-        filepath = "fake path"
-        cmd = '[io.file]::ReadAllText("%s")' % filepath
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = expected_result
+        cmd = '[io.file]::ReadAllText("fake path")'
+        self._answer({cmd: "fake content"})
 
-        result = self._introspect.get_instance_file_content(filepath)
+        result = self._introspect.get_instance_file_content("fake path")
 
-        self.assertEqual(result, expected_result)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.POWERSHELL))
+        self.assertEqual(result, "fake content")
+        self.assertEqual([cmd], self._batches()[-1])
 
     def test_get_userdata_executed_plugins(self):
-        expected_result = 1
         cmd = r'(Get-ChildItem -Path  C:\ *.txt).Count'
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = expected_result
+        self._answer({cmd: "1\r\n"})
 
         result = self._introspect.get_userdata_executed_plugins()
 
-        self.assertEqual(result, expected_result)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.POWERSHELL))
+        self.assertEqual(result, 1)
 
     @mock.patch('argus.introspection.cloud.windows.parse_netsh_output')
     def test_get_instance_mtu(self, mock_parse_netsh):
         mock_parse_netsh.return_value = [mock.sentinel]
-        expected_result = mock.sentinel
         cmd = 'netsh interface ipv4 show subinterfaces level=verbose'
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = expected_result
+        self._answer({cmd: "fake subinterfaces"})
 
         result = self._introspect.get_instance_mtu()
 
         self.assertEqual(result, mock_parse_netsh.return_value[0])
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.CMD))
+        mock_parse_netsh.assert_called_once_with("fake subinterfaces")
 
     @mock.patch('argus.introspection.cloud.windows._create_tempfile')
     @mock.patch('argus.introspection.cloud.windows.util')
@@ -429,16 +425,10 @@ class TestInstanceIntrospection(unittest.TestCase):
              command_type=mock_util.POWERSHELL_SCRIPT_REMOTESIGNED))
 
     def test_file_exists(self):
-        mock_stdout = mock.Mock()
-        mock_stdout.strip.return_value = 'True'
-        filepath = "fake path"
-        cmd = 'Test-Path {}'.format(filepath)
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = mock_stdout
-        result = self._introspect._file_exist(filepath)
+        self._answer({'Test-Path fake path': 'True\r\n'})
+        result = self._introspect._file_exist("fake path")
 
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.POWERSHELL))
+        self.assertEqual(["Test-Path fake path"], self._batches()[-1])
         self.assertEqual(result, True)
 
     @mock.patch('argus.introspection.cloud.windows.'
@@ -454,6 +444,7 @@ class TestInstanceIntrospection(unittest.TestCase):
     @mock.patch('argus.introspection.cloud.windows.re')
     def _test_get_group_members(self, mock_re, no_error=True):
         group = "fake group"
+        self._answer({})
         if no_error:
             mock_split = mock.Mock()
             mock_split.split.return_value = ["fake", None, "result"]
@@ -469,8 +460,7 @@ class TestInstanceIntrospection(unittest.TestCase):
             self.assertEqual(ex.exception.message, 'Unable to get members.')
 
         cmd = "net localgroup {}".format(group)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd, command_type=util.CMD))
+        self.assertEqual([cmd], self._batches()[-1])
 
     def test_get_group_members(self):
         self._test_get_group_members()
@@ -479,23 +469,17 @@ class TestInstanceIntrospection(unittest.TestCase):
         self._test_get_group_members(no_error=False)
 
     def test_list_location(self):
-        location = "fake location"
-        command = "dir {} /b".format(location)
-        mock_stdout = mock.Mock()
-        expected_result = [mock.sentinel, mock.sentinel]
-        mock_stdout.splitlines.return_value = [
-            mock.sentinel, None, mock.sentinel]
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = mock_stdout
+        command = "cmd /c dir fake location /b"
+        self._answer({command: "first\r\n\r\nsecond\r\n"})
 
-        result = self._introspect.list_location(location)
-        self.assertEqual(result, expected_result)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(command, command_type=util.CMD))
+        result = self._introspect.list_location("fake location")
+        self.assertEqual(result, ["first", "second"])
+        self.assertEqual([command], self._batches()[-1])
 
     @mock.patch('argus.introspection.cloud.windows.re')
     def _test_get_service_triggers(self, mock_re, no_error=True):
         service = "fake service"
+        self._answer({})
         mock_re.search.return_value = no_error
         if no_error:
             mock_strip = mock.Mock()
@@ -511,9 +495,8 @@ class TestInstanceIntrospection(unittest.TestCase):
             self.assertEqual(ex.exception.message,
                              "Unable to get the triggers for the "
                              "given service.")
-        command = "sc qtriggerinfo {}".format(service)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(command, command_type=util.CMD))
+        command = "sc.exe qtriggerinfo {}".format(service)
+        self.assertEqual([command], self._batches()[-1])
 
     def test_get_service_triggers(self):
         self._test_get_service_triggers()
@@ -521,17 +504,54 @@ class TestInstanceIntrospection(unittest.TestCase):
     def test_get_service_triggers_error(self):
         self._test_get_service_triggers(no_error=False)
 
-    @mock.patch('argus.introspection.cloud.windows.get_os_version')
-    def test_get_instance_os_version(self, mock_get_os_version):
-        expected_result = ['major version', 'minor version']
-        mock_get_os_version.side_effect = expected_result
+    def test_bulk_query(self):
+        self._introspect.remote_client.run_batch.return_value = [
+            ("first output", "", 0), ("second output", "", 0)]
+        queries = collections.OrderedDict([("first", "first command"),
+                                           ("second", "second command")])
+
+        result = self._introspect.bulk_query(queries)
+
+        self.assertEqual({"first": "first output",
+                          "second": "second output"}, result)
+        self._introspect.remote_client.run_batch.assert_called_once_with(
+            ["first command", "second command"])
+
+    def test_bulk_query_failed_query(self):
+        self._introspect.remote_client.run_batch.return_value = [
+            ("", "", 0), ("", "Cannot find path.", 1)]
+        queries = collections.OrderedDict([("first", "first command"),
+                                           ("second", "second command")])
+
+        with self.assertRaises(exceptions.ArgusError) as context:
+            self._introspect.bulk_query(queries)
+
+        self.assertIn("'second'", str(context.exception))
+
+    @mock.patch('argus.util.exec_with_retry')
+    def test_bulk_query_is_retried(self, mock_exec_with_retry):
+        mock_exec_with_retry.return_value = [("output", "", 0)]
+
+        self._introspect.bulk_query({"query": "command"})
+
+        mock_exec_with_retry.assert_called_once_with(
+            mock.ANY, CONFIG.argus.retry_count, CONFIG.argus.retry_delay)
+
+    def test_get_instance_os_version(self):
+        self._answer({
+            "[System.Environment]::OSVersion.Version.Major": "10\r\n",
+            "[System.Environment]::OSVersion.Version.Minor": "0\r\n",
+        })
+
         result = self._introspect.get_instance_os_version()
-        self.assertEqual(result, tuple(expected_result))
 
-    @mock.patch('argus.introspection.cloud.windows.'
-                'InstanceIntrospection.get_instance_file_content')
-    def test_get_cloudconfig_executed_plugins(self, mock_get_file_content):
-        mock_get_file_content.return_value = "fake content"
+        self.assertEqual((10, 0), result)
+        self.assertEqual(
+            1, self._introspect.remote_client.run_batch.call_count)
+
+    def test_get_cloudconfig_executed_plugins(self):
+        self._introspect.remote_client.run_batch.side_effect = (
+            lambda commands: [("fake content\r\n", "", 0)] * len(commands))
         result = self._introspect.get_cloudconfig_executed_plugins()
         files = {
             'b64': 'fake content',
@@ -543,25 +563,20 @@ class TestInstanceIntrospection(unittest.TestCase):
             'gzip_base64_2': 'fake content'
         }
         self.assertEqual(result, files)
-        self.assertEqual(mock_get_file_content.call_count, 7)
+        commands = self._introspect.remote_client.run_batch.call_args[0][0]
+        self.assertEqual(7, len(commands))
+        self.assertIn('[io.file]::ReadAllText("C:\\gzip_base64_2")',
+                      commands)
 
     def test_get_timezone(self):
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = "fake timezone"
-        command = "tzutil /g"
+        self._answer({"tzutil /g": "fake timezone"})
         result = self._introspect.get_timezone()
         self.assertEqual(result, "fake timezone")
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(command, command_type=util.POWERSHELL))
 
     def test_get_instance_hostname(self):
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = "fake hostname"
-        command = "hostname"
+        self._answer({"hostname": "Fake-Hostname\r\n"})
         result = self._introspect.get_instance_hostname()
-        self.assertEqual(result, "fake hostname")
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(command, command_type=util.CMD))
+        self.assertEqual(result, "fake-hostname")
 
     def test_get_user_flags(self):
         (self._introspect.remote_client.manager.get_agent_command.
@@ -578,15 +593,75 @@ class TestInstanceIntrospection(unittest.TestCase):
          assert_called_once_with("fake cmd"))
 
     def test_get_swap_status(self):
-        (self._introspect.remote_client.run_command_verbose.
-         return_value) = r'?:\pagefile.sys'
         swap_query = (r"HKLM:\SYSTEM\CurrentControlSet\Control\Session"
                       r" Manager\Memory Management")
         cmd = r"(Get-ItemProperty '{}').PagingFiles".format(swap_query)
+        self._answer({cmd: '?:\\pagefile.sys\r\n'})
         result = self._introspect.get_swap_status()
         self.assertEqual(result, True)
-        (self._introspect.remote_client.run_command_verbose.
-         assert_called_once_with(cmd))
+
+    def test_facts_are_gathered_once(self):
+        self._answer({"hostname": "fake-hostname", "tzutil /g": "fake"})
+
+        self._introspect.get_instance_hostname()
+        self._introspect.get_timezone()
+        self._introspect.get_trim_state()
+        self._introspect.list_location("C:\\")
+        self._introspect.username_exists(CONFIG.cloudbaseinit.created_user)
+
+        batches = self._batches()
+        self.assertEqual(1, len(batches))
+        self.assertIn("hostname", batches[0])
+        self.assertIn("cmd /c dir C:\\ /b", batches[0])
+
+    def test_failed_fact_is_queried_again(self):
+        self._answer({"hostname": "fake-hostname"}, failed={"hostname"})
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._introspect.get_instance_hostname()
+
+        self.assertEqual(["hostname"], self._batches()[-1])
+        self._answer({"hostname": "fake-hostname"})
+        self.assertEqual("fake-hostname",
+                         self._introspect.get_instance_hostname())
+        self.assertEqual(3, len(self._batches()))
+
+    def test_other_calls_drop_the_facts(self):
+        self._introspect.remote_client.remote_calls = 1
+        self._answer({"hostname": "old-hostname"})
+        self._introspect.get_instance_hostname()
+
+        # The recipe changed the instance through the client.
+        self._introspect.remote_client.remote_calls = 5
+        self._answer({"hostname": "new-hostname"})
+
+        self.assertEqual("new-hostname",
+                         self._introspect.get_instance_hostname())
+        self.assertEqual(2, len(self._batches()))
+
+    def test_other_facts_are_not_kept(self):
+        cmd = '[io.file]::ReadAllText("fake path")'
+        self._answer({cmd: "old content"})
+        self._introspect.get_instance_file_content("fake path")
+
+        self._answer({cmd: "new content"})
+        self.assertEqual(
+            "new content",
+            self._introspect.get_instance_file_content("fake path"))
+        # The gathered facts are still used.
+        self._introspect.get_instance_hostname()
+        self.assertEqual(3, len(self._batches()))
+
+    def test_forget_facts(self):
+        self._answer({"hostname": "old-hostname"})
+        self._introspect.get_instance_hostname()
+
+        self._introspect.forget_facts()
+        self._answer({"hostname": "new-hostname"})
+
+        self.assertEqual("new-hostname",
+                         self._introspect.get_instance_hostname())
+        self.assertEqual(2, len(self._batches()))
 
     @mock.patch('argus.introspection.cloud.windows._get_nic_details')
     def test_get_network_interfaces(self, mock_get_nic_details):
@@ -606,3 +681,49 @@ class TestInstanceIntrospection(unittest.TestCase):
          assert_called_once_with(location, command_type=util.POWERSHELL))
         mock_get_nic_details.assert_called_once_with(
             ['fake result', '', '', '', '', 'fake result'])
+
+
+class TestRoundTrips(unittest.TestCase):
+    """The remote traffic of the introspection, against a scripted guest."""
+
+    def setUp(self):
+        environment = suite.Environment(installed=True)
+        self._environment = environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+        self._introspection = windows.InstanceIntrospection(
+            self._environment.client)
+
+    def _budget(self, **limits):
+        return fake_winrm.RoundTripBudget(self._environment.server, **limits)
+
+    def test_bulk_query(self):
+        queries = {name: "echo '{}'".format(name)
+                   for name in ("hostname", "timezone", "mtu", "swap")}
+
+        with self._budget(commands=1):
+            outputs = self._introspection.bulk_query(queries)
+
+        self.assertEqual({name: name for name in queries}, outputs)
+
+    def test_user_flags(self):
+        self._introspection.get_user_flags("Admin")
+
+        with self._budget(commands=2):
+            self._introspection.get_user_flags("Admin")
+            self._introspection.get_user_flags("Guest")
+
+    def test_smoke_facts(self):
+        with self._budget(commands=2):
+            self._introspection.get_instance_hostname()
+            self._introspection.get_timezone()
+            self._introspection.get_swap_status()
+            self._introspection.get_trim_state()
+            self._introspection.instance_exe_script_executed()
+            self._introspection.username_exists(
+                CONFIG.cloudbaseinit.created_user)
+            self._introspection.list_location("C:\\")
+            mtu = self._introspection.get_instance_mtu().mtu
+            self._introspection.get_instance_file_content(
+                self._introspection.get_instance_keys_path())
+
+        self.assertEqual("1500", mtu)
@@ -17,6 +17,9 @@
 # pylint: disable=too-many-public-methods
 
 import unittest
+
+import six
+
 from argus import config as argus_config
 from argus.recipes.cloud import base
 from argus.unit_tests import test_utils
@@ -78,13 +81,17 @@ class TestBaseCloudbaseinitRecipe(unittest.TestCase):
     @mock.patch('argus.recipes.cloud.base.six.moves')
     def _test_prepare(self, mock_six_moves, pause=False):
         CONFIG.argus.pause = pause
-        expected_logging = [
-            "Preparing instance...",
-            "Finished preparing instance."
-        ]
         with test_utils.LogSnatcher('argus.recipes.cloud.base') as snatcher:
             self._base.prepare(service_type="fake type")
-        self.assertEqual(expected_logging, snatcher.output)
+        self.assertEqual("Preparing instance...", snatcher.output[0])
+        self.assertEqual("Finished preparing instance.", snatcher.output[-1])
+        six.assertRegex(self, snatcher.output[-2],
+                        r"The steps took [\d.]+ seconds, with the critical "
+                        r"path: wait_for_boot_completion \([\d.]+s\) -> .* "
+                        r"-> get_cb_init_artifacts \([\d.]+s\)")
+        self.assertEqual(
+            sorted(step.name for step in self._base.steps),
+            sorted(timing.name for timing in self._base.step_timings))
         if pause:
             mock_six_moves.input.assert_called_once_with(
                 "Press Enter to continue...")
@@ -94,3 +101,30 @@ class TestBaseCloudbaseinitRecipe(unittest.TestCase):
 
     def test_prepare_pause(self):
         self._test_prepare(pause=True)
+
+    def _mock_golden_steps(self):
+        steps = {}
+        for step in self._base.golden_steps:
+            steps[step] = mock.Mock()
+            setattr(self._base, step, steps[step])
+        return steps
+
+    @test_utils.ConfPatcher('pause', False, 'argus')
+    def test_prepare_runs_golden_steps(self):
+        steps = self._mock_golden_steps()
+
+        self._base.prepare()
+
+        for step in steps.values():
+            step.assert_called_once_with()
+
+    @test_utils.ConfPatcher('pause', False, 'argus')
+    def test_prepare_from_snapshot(self):
+        steps = self._mock_golden_steps()
+        self._base.from_snapshot = True
+
+        self._base.prepare()
+
+        self.assertEqual(
+            ["set_mtu", "wait_for_boot_completion"],
+            sorted(name for name, step in steps.items() if step.called))
@@ -17,10 +17,15 @@
 # pylint: disable=no-member
 
 import ntpath
+import os
 import unittest
+from argus.backends import console as backend_console
+from argus.benchmarks import suite
 from argus import config as argus_config
 from argus import exceptions
+from argus import profiling
 from argus.recipes.cloud import windows
+from argus.unit_tests import fake_winrm
 from argus.unit_tests import test_utils
 from argus import util
 
@@ -106,9 +111,9 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
 
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 '_grab_cbinit_installation_log')
-    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
-    def _test_install_cbinit(self, mock_get_cbinit_dir, mock_install_log,
-                             exception=False):
+    def _test_install_cbinit(self, mock_install_log, exception=False):
+        mock_get_cbinit_dir = (self._recipe._backend.remote_client.manager.
+                               get_cbinit_dir)
         expected_logging = [
             "Cloudbase-Init is already installed, skipping installation."
         ]
@@ -120,7 +125,7 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
         with test_utils.LogSnatcher('argus.recipes.cloud.'
                                     'windows') as snatcher:
             self._recipe.install_cbinit()
-        mock_get_cbinit_dir.assert_called_once_with(self._recipe._execute)
+        mock_get_cbinit_dir.assert_called_once_with()
         self.assertEqual(expected_logging, snatcher.output)
         if exception:
             (self._recipe._backend.remote_client.manager.install_cbinit.
@@ -145,33 +150,21 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
 
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 'extract_files_from_archive')
-    @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
-                '_grab_cbinit_installation_log')
-    @mock.patch('argus.recipes.cloud.windows.base64.standard_b64decode')
-    def _test_transfer_encoded_file_b64(self, mock_base64_decode,
-                                        mock_cbinit_install_log,
-                                        mock_extract_archive, archive=False):
-        file_source = mock.sentinel
-        destination_path = mock.sentinel
-        encoded_content = [mock.sentinel]
-        file_64_decoded = mock.sentinel
-        (self._recipe._backend.remote_client.manager.
-         encode_file_to_base64_str.return_value) = encoded_content
-        mock_base64_decode.return_value = file_64_decoded
+    def _test_transfer_encoded_file_b64(self, mock_extract_archive,
+                                        archive=False):
+        file_source = mock.sentinel.file_source
+        destination_path = mock.sentinel.destination_path
 
-        with mock.patch('argus.recipes.cloud.windows.open') as mock_open:
-            self._recipe.transfer_encoded_file_b64(
-                file_source, destination_path, archive)
+        self._recipe.transfer_encoded_file_b64(
+            file_source, destination_path, archive)
 
-        (self._recipe._backend.remote_client.manager.
-         encode_file_to_base64_str.assert_called_once_with(
-             file_path=file_source))
-        mock_base64_decode.assert_called_once_with(encoded_content[0])
-        mock_open.assert_called_once_with(destination_path, 'wb')
-        mock_open.write(file_64_decoded)
+        (self._recipe._backend.remote_client.download.
+         assert_called_once_with(file_source, destination_path))
         if archive is True:
             mock_extract_archive.assert_called_once_with(
                 destination_path, CONFIG.argus.output_directory)
+        else:
+            self.assertFalse(mock_extract_archive.called)
 
     def test_transfer_encoded_file_b64(self):
         self._test_transfer_encoded_file_b64()
@@ -196,29 +189,26 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
         else:
             installation_log = r"C:\installation.log"
             self._recipe._backend.instance_server.return_value = {
-                'id': mock.sentinel
+                'id': "fake-id"
             }
             mock_get_extra_item.return_value = "fake-scenario-log"
-            renamed_log = (r"C:\{0}-installation-{1}.log".format(
-                mock_get_extra_item.return_value,
-                self._recipe._backend.instance_server.return_value['id']))
-            zip_source = r"C:\installation.zip"
-            log_template = "installation-{}.zip".format(
-                self._recipe._backend.instance_server.return_value['id'])
+            renamed_log = "fake-scenario-log-installation-fake-id.log"
+            archive_name = "installation-fake-id.zip"
             mock_join.return_value = mock.sentinel
 
         with test_utils.LogSnatcher('argus.recipes.cloud.windows') as snatcher:
             self._recipe._grab_cbinit_installation_log()
         self.assertEqual(expected_logging, snatcher.output)
         if output_directory:
-            (self._recipe._backend.remote_client.manager.copy_file.
-             assert_called_once_with(installation_log, renamed_log))
-            (self._recipe._backend.remote_client.manager.archive_file(
-                file_path=renamed_log, destination_path=zip_source))
+            (self._recipe._backend.remote_client.manager.collect_files.
+             assert_called_once_with([(installation_log, renamed_log)],
+                                     "C:\\" + archive_name))
             mock_join.assert_called_once_with(CONFIG.argus.output_directory,
-                                              log_template)
+                                              archive_name)
             mock_transfer_file.assert_called_once_with(
-                zip_source, mock_join.return_value, archive=True)
+                "C:\\" + archive_name, mock_join.return_value, archive=True)
+        else:
+            self.assertFalse(mock_transfer_file.called)
 
     def test_grab_cbinit_installation_log_no_output_directory(self):
         self._test_grab_cbinit_installation_log(output_directory=False)
@@ -226,11 +216,11 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
     def test_grab_cbinit_installation_logy(self):
         self._test_grab_cbinit_installation_log()
 
-    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 '_execute')
-    def _test_replace_install(self, mock_execute, mock_get_cbinit_dir,
-                              link="fake link"):
+    def _test_replace_install(self, mock_execute, link="fake link"):
+        mock_get_cbinit_dir = (self._recipe._backend.remote_client.manager.
+                               get_cbinit_dir)
         CONFIG.argus.patch_install = link
         expected_logging = []
         if link:
@@ -252,7 +242,7 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
                 (self._recipe._backend.remote_client.manager.download.
                  assert_called_once_with(uri=link, location=location))
             self.assertEqual(mock_execute.call_count, execute_count)
-            mock_get_cbinit_dir.assert_called_once_with(mock_execute)
+            mock_get_cbinit_dir.assert_called_once_with()
             resource_location = "windows/updateCbinit.ps1"
             (self._recipe._backend.remote_client.manager.
              execute_powershell_resource_script.assert_called_once_with(
@@ -270,9 +260,10 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
     @mock.patch('argus.recipes.cloud.windows.ntpath.join')
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 '_execute')
-    @mock.patch('argus.introspection.cloud.windows.get_python_dir')
-    def _test_replace_code(self, mock_get_python_dir, mock_execute,
-                           mock_join, git_command=True, exception=False):
+    def _test_replace_code(self, mock_execute, mock_join, git_command=True,
+                           exception=False):
+        mock_get_python_dir = (self._recipe._backend.remote_client.manager.
+                               get_python_dir)
         CONFIG.argus.git_command = git_command
         expected_logging = []
         if git_command:
@@ -301,7 +292,7 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
                 self._recipe.replace_code()
         self.assertEqual(expected_logging, snatcher.output)
         if git_command:
-            mock_get_python_dir.assert_called_once_with(mock_execute)
+            mock_get_python_dir.assert_called_once_with()
             (self._recipe._backend.remote_client.manager.git_clone.
              assert_called_once_with(
                  repo_url=windows._CBINIT_REPO,
@@ -325,8 +316,9 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
     def test_replace_code(self):
         self._test_replace_code()
 
-    @mock.patch('argus.introspection.cloud.windows.get_python_dir')
-    def test_pre_sysprep(self, mock_get_python_dir):
+    def test_pre_sysprep(self):
+        mock_get_python_dir = (self._recipe._backend.remote_client.manager.
+                               get_python_dir)
         mock_get_python_dir.return_value = "fake path"
         cbinit = ntpath.join(mock_get_python_dir.return_value, 'Lib',
                              'site-packages', 'cloudbaseinit')
@@ -356,13 +348,18 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
             "Check the heartbeat patch ...",
             "Wait for the Cloudbase-Init service to stop ..."
         ]
+        console = self._recipe._backend.console = mock.MagicMock()
         with test_utils.LogSnatcher('argus.recipes.cloud.windows') as snatcher:
             self._recipe.wait_cbinit_finalization()
         self.assertEqual(expected_logging, snatcher.output)
+        console.follow.assert_called_once_with()
         (self._recipe._backend.remote_client.manager.check_cbinit_service.
-         assert_called_once_with(searched_paths=paths))
+         assert_called_once_with(
+             searched_paths=paths,
+             wake=console.signals[backend_console.PLUGIN_STARTED]))
         (self._recipe._backend.remote_client.manager.wait_cbinit_service.
-         assert_called_once_with())
+         assert_called_once_with(
+             wake=console.signals[backend_console.FINISHED]))
 
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 '_make_dir_if_needed')
@@ -410,8 +407,9 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
 
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 '_make_dir_if_needed')
-    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
-    def test_inject_cbinit_config(self, mock_get_cbinit_dir, mock_make_dir):
+    def test_inject_cbinit_config(self, mock_make_dir):
+        mock_get_cbinit_dir = (self._recipe._backend.remote_client.manager.
+                               get_cbinit_dir)
         mock_get_cbinit_dir.return_value = "fake dir"
         self._recipe._cbinit_conf = mock.Mock()
         self._recipe._cbinit_unattend_conf = mock.Mock()
@@ -428,11 +426,13 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
         (self._recipe._cbinit_unattend_conf.apply_config.
          assert_called_once_with(conf_dir))
 
+    @mock.patch('argus.log.get_log_extra_item')
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
                 'transfer_encoded_file_b64')
-    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
-    def _test_get_cb_init_files(self, mock_get_dir, mock_encode_file,
+    def _test_get_cb_init_files(self, mock_transfer_file, mock_get_extra_item,
                                 output_directory="fake_output_directory"):
+        mock_get_dir = (self._recipe._backend.remote_client.manager.
+                        get_cbinit_dir)
         CONFIG.argus.output_directory = output_directory
         fake_location = "fake_logs"
         cb_fake_files = []
@@ -445,6 +445,7 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
             self._recipe._backend.instance_server.return_value = {
                 'id': "fake_id"
             }
+            mock_get_extra_item.return_value = "fake_scenario"
             mock_get_dir.return_value = "fake_dir"
             cb_fake_files = [
                 "cloudbase-init.log",
@@ -453,14 +454,23 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
         with test_utils.LogSnatcher('argus.recipes.cloud.windows') as snatcher:
             self._recipe.get_cb_init_files(fake_location, cb_fake_files)
         self.assertEqual(snatcher.output, expected_logging)
+        manager = self._recipe._backend.remote_client.manager
         if output_directory:
             self._recipe._backend.instance_server.assert_called_once_with()
-            mock_get_dir.assert_called_once_with(self._recipe._execute)
-            self.assertEqual(
-                len(cb_fake_files),
-                (self._recipe._backend.remote_client.
-                 manager.copy_file.call_count))
-            self.assertEqual(mock_encode_file.call_count, len(cb_fake_files))
+            mock_get_dir.assert_called_once_with()
+            archive_name = "fake_scenario-fake_id-cbinit-files.zip"
+            manager.collect_files.assert_called_once_with(
+                [(r"fake_dir\fake_logs\cloudbase-init.log",
+                  "fake_scenario-fake_id-cloudbase-init.log"),
+                 (r"fake_dir\fake_logs\cloudbase-init-unattend.log",
+                  "fake_scenario-fake_id-cloudbase-init-unattend.log")],
+                "C:\\" + archive_name)
+            mock_transfer_file.assert_called_once_with(
+                "C:\\" + archive_name,
+                os.path.join(output_directory, archive_name), archive=True)
+        else:
+            self.assertFalse(manager.collect_files.called)
+            self.assertFalse(mock_transfer_file.called)
 
     def test_get_cb_init_files_no_directory(self):
         self._test_get_cb_init_files(output_directory=False)
@@ -468,6 +478,29 @@ class TestCloudbaseinitRecipe(unittest.TestCase):
     def test_get_cb_init_files(self):
         self._test_get_cb_init_files()
 
+    @mock.patch('argus.recipes.cloud.windows.CloudbaseinitRecipe.'
+                '_collect_artifacts')
+    def test_get_cb_init_artifacts(self, mock_collect_artifacts):
+        mock_get_dir = (self._recipe._backend.remote_client.manager.
+                        get_cbinit_dir)
+        CONFIG.argus.output_directory = "fake_output_directory"
+        self._recipe._backend.instance_server.return_value = {'id': "id"}
+        mock_get_dir.return_value = "fake_dir"
+
+        self._recipe.get_cb_init_artifacts()
+
+        # The logs and the configs are collected together.
+        mock_get_dir.assert_called_once_with()
+        self._recipe._backend.instance_server.assert_called_once_with()
+        self.assertEqual(1, mock_collect_artifacts.call_count)
+        files, _ = mock_collect_artifacts.call_args[0]
+        self.assertEqual(
+            [r"fake_dir\log\cloudbase-init.log",
+             r"fake_dir\log\cloudbase-init-unattend.log",
+             r"fake_dir\conf\cloudbase-init.conf",
+             r"fake_dir\conf\cloudbase-init-unattend.conf"],
+            [path for path, _ in files])
+
 
 class TestCloudbaseinitScriptRecipe(unittest.TestCase):
     def setUp(self):
@@ -675,8 +708,9 @@ class TestCloudbaseinitImageRecipe(unittest.TestCase):
     def setUp(self):
         self._recipe = windows.CloudbaseinitImageRecipe(mock.Mock())
 
-    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
-    def test_wait_cbinit_finalization(self, mock_get_cbinit_dir):
+    def test_wait_cbinit_finalization(self):
+        mock_get_cbinit_dir = (self._recipe._backend.remote_client.manager.
+                               get_cbinit_dir)
         expected_logging = [
             "Check the heartbeat patch ...",
             "Wait for the Cloudbase-Init service to stop ..."
@@ -686,14 +720,19 @@ class TestCloudbaseinitImageRecipe(unittest.TestCase):
         paths = [ntpath.join(mock_get_cbinit_dir.return_value, "log", name)
                  for name in ["cloudbase-init-unattend.log",
                               "cloudbase-init.log"]]
+        console = self._recipe._backend.console = mock.MagicMock()
         with test_utils.LogSnatcher('argus.recipes.cloud.windows') as snatcher:
             self._recipe.wait_cbinit_finalization()
         self.assertEqual(expected_logging, snatcher.output)
-        mock_get_cbinit_dir.assert_called_once_with(self._recipe._execute)
+        console.follow.assert_called_once_with()
+        mock_get_cbinit_dir.assert_called_once_with()
         (self._recipe._backend.remote_client.manager.check_cbinit_service.
-         assert_called_once_with(searched_paths=paths))
+         assert_called_once_with(
+             searched_paths=paths,
+             wake=console.signals[backend_console.PLUGIN_STARTED]))
         (self._recipe._backend.remote_client.manager.wait_cbinit_service.
-         assert_called_once_with())
+         assert_called_once_with(
+             wake=console.signals[backend_console.FINISHED]))
 
     @mock.patch('argus.recipes.cloud.windows.six.moves')
     @mock.patch('argus.recipes.cloud.windows.CloudbaseinitImageRecipe.'
@@ -721,3 +760,23 @@ class TestCloudbaseinitImageRecipe(unittest.TestCase):
 
     def test_prepare_with_pause(self):
         self._test_prepare(pause=True)
+
+
+class TestRoundTrips(unittest.TestCase):
+    """The remote traffic of the recipe, against a scripted guest."""
+
+    def setUp(self):
+        environment = suite.Environment()
+        self._environment = environment.__enter__()
+        self.addCleanup(environment.__exit__, None, None, None)
+        self._recipe = windows.CloudbaseinitRecipe(
+            suite._Backend(self._environment.client))
+
+    @mock.patch.dict(profiling._SPANS, clear=True)
+    def test_prepare(self):
+        # A shell is opened again after the reboot of the sysprep.
+        with fake_winrm.RoundTripBudget(self._environment.server,
+                                        shells=2, commands=35):
+            self._recipe.prepare()
+
+        self.assertTrue(self._environment.guest.installed)
@@ -0,0 +1,188 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus import exceptions
+from argus import log as argus_log
+from argus import profiling
+from argus.recipes import steps
+from argus.unit_tests import test_utils
+
+
+def _graph():
+    return steps.StepGraph([
+        steps.Step("boot", ()),
+        steps.Step("mtu", ("boot", )),
+        steps.Step("download", ("boot", )),
+        steps.Step("install", ("mtu", "download")),
+        steps.Step("sysprep", ("install", )),
+    ])
+
+
+class TestStepGraph(unittest.TestCase):
+
+    def test_order(self):
+        self.assertEqual(["boot", "mtu", "download", "install", "sysprep"],
+                         _graph().order)
+
+    def test_unknown_step(self):
+        with self.assertRaises(exceptions.ArgusError) as context:
+            steps.StepGraph([steps.Step("install", ("download", ))])
+        self.assertEqual("Step 'install' requires the unknown steps "
+                         "download.", str(context.exception))
+
+    def test_cycle(self):
+        with self.assertRaises(exceptions.ArgusError) as context:
+            steps.StepGraph([steps.Step("boot", ()),
+                             steps.Step("a", ("boot", "b")),
+                             steps.Step("b", ("a", ))])
+        self.assertEqual("The steps a, b depend on each other.",
+                         str(context.exception))
+
+    def test_subgraph_keeps_indirect_dependencies(self):
+        subgraph = _graph().subgraph(["boot", "sysprep", "mtu"])
+
+        self.assertEqual(["boot", "mtu", "sysprep"], subgraph.order)
+        self.assertEqual(("boot", "mtu"), subgraph["sysprep"].requires)
+
+
+class TestStepExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self._lock = threading.Lock()
+        self._ran = []
+
+    def _actions(self, graph, **overrides):
+        def record(name):
+            with self._lock:
+                self._ran.append(name)
+
+        actions = {step.name: lambda name=step.name: record(name)
+                   for step in graph}
+        actions.update(overrides)
+        return actions
+
+    def test_independent_steps_run_concurrently(self):
+        graph = _graph()
+        started = {"mtu": threading.Event(), "download": threading.Event()}
+
+        def overlapping(name, other):
+            started[name].set()
+            # Both steps must be running at the same time to finish.
+            self.assertTrue(started[other].wait(5))
+
+        actions = self._actions(
+            graph,
+            mtu=lambda: overlapping("mtu", "download"),
+            download=lambda: overlapping("download", "mtu"))
+
+        timings = steps.StepExecutor(graph, actions, concurrency=2).run()
+
+        self.assertEqual(["boot", "install", "sysprep"], self._ran)
+        self.assertEqual(set(graph.order), set(timings))
+
+    def test_dependencies_are_respected(self):
+        graph = _graph()
+
+        steps.StepExecutor(graph, self._actions(graph), concurrency=3).run()
+
+        order = self._ran
+        self.assertEqual("boot", order[0])
+        self.assertEqual(["install", "sysprep"], order[-2:])
+
+    def test_failed_step(self):
+        graph = _graph()
+
+        def fail():
+            raise ValueError("The download failed.")
+
+        executor = steps.StepExecutor(graph, self._actions(graph,
+                                                           download=fail),
+                                      concurrency=2)
+        with self.assertRaises(ValueError):
+            executor.run()
+
+        self.assertNotIn("install", self._ran)
+        self.assertNotIn("download", executor.timings)
+
+    def test_sequential(self):
+        graph = _graph()
+        threads = []
+        actions = {step.name: lambda: threads.append(
+            threading.current_thread()) for step in graph}
+
+        steps.StepExecutor(graph, actions, concurrency=1).run()
+
+        self.assertEqual([threading.current_thread()] * 5, threads)
+
+    @test_utils.ConfPatcher('recipe_concurrency', 4, 'argus')
+    def test_concurrency_from_config(self):
+        executor = steps.StepExecutor(_graph(), {})
+        self.assertEqual(4, executor.concurrency)
+
+    def test_steps_log_with_the_scenario_name(self):
+        graph = _graph()
+        names = set()
+        actions = {step.name: lambda: names.add(
+            argus_log.get_log_extra_item(steps.LOG, "scenario"))
+            for step in graph}
+
+        with argus_log.isolated_extra(steps.LOG):
+            argus_log.set_scenario_name(steps.LOG, "Scenario")
+            steps.StepExecutor(graph, actions, concurrency=2).run()
+
+        self.assertEqual({"Scenario"}, names)
+
+    @mock.patch.dict(profiling._SPANS, clear=True)
+    def test_steps_are_profiled(self):
+        graph = _graph()
+
+        with argus_log.isolated_extra(steps.LOG):
+            argus_log.set_scenario_name(steps.LOG, "Scenario")
+            steps.StepExecutor(graph, self._actions(graph),
+                               concurrency=2).run()
+
+        self.assertEqual(set(graph.order),
+                         {span.name for span in
+                          profiling.get_spans("Scenario")
+                          if span.category == profiling.STEP})
+
+
+class TestCriticalPath(unittest.TestCase):
+
+    def test_critical_path(self):
+        timings = {
+            "boot": steps.StepTiming("boot", 0, 10),
+            "mtu": steps.StepTiming("mtu", 10, 12),
+            "download": steps.StepTiming("download", 10, 30),
+            "install": steps.StepTiming("install", 30, 90),
+            "sysprep": steps.StepTiming("sysprep", 90, 100),
+        }
+
+        path = steps.critical_path(_graph(), timings)
+
+        self.assertEqual(["boot", "download", "install", "sysprep"],
+                         [timing.name for timing in path])
+        self.assertEqual(20, path[1].duration)
+
+    def test_no_timings(self):
+        self.assertEqual([], steps.critical_path(_graph(), {}))
@@ -0,0 +1,213 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.scenarios import base
+from argus.scenarios import pool
+from argus.unit_tests import fake_backend
+from argus.unit_tests import test_utils
+
+
+class _Recipe(object):
+    """A recipe which records its steps in the fake cloud."""
+
+    golden_steps = ("boot", "install_cbinit")
+    from_snapshot = False
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def _record(self, step):
+        self._backend.cloud.record(step, self._backend._name)
+
+    def boot(self):
+        self._record("wait boot")
+
+    def install_cbinit(self):
+        self._record("install")
+
+    def prepare_golden(self):
+        for step in self.golden_steps:
+            getattr(self, step)()
+
+    def prepare(self):
+        if not self.from_snapshot:
+            self.prepare_golden()
+        self._record("sysprep")
+
+
+class _OtherRecipe(_Recipe):
+
+    def install_cbinit(self):
+        self._record("install from sources")
+
+
+def _make_scenario(name, backend_type, recipe_type=_Recipe):
+    return type(name, (object, ), {
+        "backend_type": backend_type, "recipe_type": recipe_type,
+        "availability_zone": None})
+
+
+class TestGoldenPool(unittest.TestCase):
+
+    def setUp(self):
+        self._cloud = fake_backend.FakeCloud()
+        self._backend_type = self._cloud.backend_type()
+        self._pool = pool.GoldenPool()
+        self.addCleanup(self._pool.cleanup)
+
+    def _events(self, kind):
+        return [event[1:] for event in self._cloud.events
+                if event[0] == kind]
+
+    def test_golden_instance_is_prepared_once(self):
+        first = _make_scenario("First", self._backend_type)
+        second = _make_scenario("Second", self._backend_type)
+
+        snapshot = self._pool.snapshot(first)
+
+        self.assertEqual(snapshot, self._pool.snapshot(second))
+        self.assertIn(snapshot, self._cloud.snapshots)
+        self.assertEqual([("First-golden", "base image")],
+                         self._events("boot"))
+        self.assertEqual([("First-golden", )], self._events("install"))
+        # The golden instance is kept for its snapshot.
+        self.assertEqual(1, len(self._cloud.instances))
+
+    def test_concurrent_scenarios_wait_for_the_golden_instance(self):
+        scenarios = [_make_scenario("Scenario{}".format(index),
+                                    self._backend_type)
+                     for index in range(4)]
+        snapshots = []
+
+        threads = [threading.Thread(
+            target=lambda scenario=scenario: snapshots.append(
+                self._pool.snapshot(scenario)))
+            for scenario in scenarios]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(set(snapshots)))
+        self.assertEqual(1, len(self._events("install")))
+
+    def test_different_installation_gets_its_own_snapshot(self):
+        first = _make_scenario("First", self._backend_type)
+        other = _make_scenario("Other", self._backend_type, _OtherRecipe)
+
+        self.assertNotEqual(self._pool.snapshot(first),
+                            self._pool.snapshot(other))
+        self.assertEqual([("Other-golden", )],
+                         self._events("install from sources"))
+
+    def test_no_snapshot_support(self):
+        no_snapshots = _make_scenario(
+            "First", self._cloud.backend_type(supports_snapshots=False))
+        no_steps = _make_scenario(
+            "Second", self._backend_type,
+            type("Recipe", (_Recipe, ), {"golden_steps": ()}))
+
+        self.assertIsNone(self._pool.snapshot(no_snapshots))
+        self.assertIsNone(self._pool.snapshot(no_steps))
+        self.assertEqual([], self._cloud.events)
+
+    def test_failed_golden_instance(self):
+        recipe_type = type("Recipe", (_Recipe, ), {
+            "install_cbinit": mock.Mock(side_effect=ValueError("failed"))})
+        scenario = _make_scenario("First", self._backend_type, recipe_type)
+
+        with test_utils.LogSnatcher('argus.scenarios.pool') as snatcher:
+            self.assertIsNone(self._pool.snapshot(scenario))
+            self.assertIsNone(self._pool.snapshot(scenario))
+
+        # The golden instance is not prepared again after a failure.
+        self.assertEqual(["Preparing golden instance First-golden...",
+                          "Preparing the golden instance failed with "
+                          "failed"],
+                         [message.splitlines()[0]
+                          for message in snatcher.output])
+
+    def test_cleanup(self):
+        self._pool.snapshot(_make_scenario("First", self._backend_type))
+
+        self._pool.cleanup()
+
+        self.assertEqual({}, self._cloud.snapshots)
+        self.assertEqual({}, self._cloud.instances)
+        self.assertEqual([("First-golden", )], self._events("delete"))
+
+
+class TestScenarioFromSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self._cloud = fake_backend.FakeCloud()
+        self._backend_type = self._cloud.backend_type()
+        self._pool = pool.GoldenPool()
+        self.addCleanup(self._pool.cleanup)
+        patcher = mock.patch('argus.scenarios.pool.POOL', self._pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _scenario(self, name):
+        return type(name, (base.BaseScenario, ), {
+            "backend_type": self._backend_type,
+            "recipe_type": _Recipe,
+            "introspection_type": mock.Mock(),
+        })
+
+    def _events(self, kind):
+        return [event[1:] for event in self._cloud.events
+                if event[0] == kind]
+
+    @test_utils.ConfPatcher('output_directory', None, 'argus')
+    @test_utils.ConfPatcher('golden_snapshots', True, 'argus')
+    def test_scenarios_boot_from_the_golden_snapshot(self):
+        scenarios = [self._scenario("First"), self._scenario("Second")]
+
+        for scenario in scenarios:
+            scenario.prepare_scenario()
+            self.addCleanup(scenario.tearDownClass)
+
+        snapshot = scenarios[0].snapshot
+        self.assertIsNotNone(snapshot)
+        self.assertEqual([("First-golden", "base image"),
+                          ("First", snapshot), ("Second", snapshot)],
+                         self._events("boot"))
+        # Only the golden instance was installed, but all were sysprepped.
+        self.assertEqual([("First-golden", )], self._events("install"))
+        self.assertEqual([("First", ), ("Second", )],
+                         self._events("sysprep"))
+
+    @test_utils.ConfPatcher('output_directory', None, 'argus')
+    @test_utils.ConfPatcher('golden_snapshots', False, 'argus')
+    def test_golden_snapshots_are_disabled(self):
+        scenario = self._scenario("First")
+
+        scenario.prepare_scenario()
+        self.addCleanup(scenario.tearDownClass)
+
+        self.assertIsNone(scenario.snapshot)
+        self.assertEqual([("First", "base image")], self._events("boot"))
+        self.assertEqual([("First", )], self._events("install"))
@@ -0,0 +1,208 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import threading
+import time
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus import log as argus_log
+from argus.scenarios import base
+from argus.scenarios import scheduler
+from argus.unit_tests import test_utils
+
+
+class _Recorder(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.preparing = 0
+        self.max_preparing = 0
+
+    def record(self, *event):
+        with self.lock:
+            self.events.append(event)
+
+
+def _make_scenario(name, recorder, fail=False):
+
+    def prepare_scenario(cls):
+        with recorder.lock:
+            recorder.preparing += 1
+            recorder.max_preparing = max(recorder.max_preparing,
+                                         recorder.preparing)
+        recorder.record("prepare", cls.__name__,
+                        argus_log.get_log_extra_item(base.LOG, "scenario"))
+        argus_log.set_scenario_name(base.LOG, cls.__name__)
+        time.sleep(0.05)
+        with recorder.lock:
+            recorder.preparing -= 1
+        if fail:
+            cls.tearDownClass()
+            raise ValueError("The instance could not be created.")
+
+    def tearDownClass(cls):
+        recorder.record("teardown", cls.__name__)
+        super(scenario, cls).tearDownClass()
+
+    def test_scenario(self):
+        recorder.record("test", self.__class__.__name__)
+
+    scenario = type(name, (base.BaseScenario, ), {
+        "prepare_scenario": classmethod(prepare_scenario),
+        "tearDownClass": classmethod(tearDownClass),
+        "test_scenario": test_scenario,
+    })
+    return scenario
+
+
+class TestScenarioSuite(unittest.TestCase):
+
+    def setUp(self):
+        self._recorder = _Recorder()
+
+    def _run(self, scenarios, **kwargs):
+        suite = scheduler.ScenarioSuite(scenarios, **kwargs)
+        result = unittest.TestResult()
+        suite.run(result)
+        return result
+
+    def _events(self, kind):
+        return [event[1:] for event in self._recorder.events
+                if event[0] == kind]
+
+    def test_scenarios_are_prepared_concurrently(self):
+        scenarios = [_make_scenario("Scenario{}".format(index),
+                                    self._recorder)
+                     for index in range(4)]
+
+        result = self._run(scenarios, concurrency=2)
+
+        self.assertTrue(result.wasSuccessful())
+        self.assertEqual(4, result.testsRun)
+        self.assertEqual(2, self._recorder.max_preparing)
+        self.assertEqual(sorted(scenario.__name__ for scenario in scenarios),
+                         sorted(name for name, in self._events("test")))
+        self.assertEqual(4, len(self._events("teardown")))
+
+    def test_quota(self):
+        scenarios = [_make_scenario("Scenario{}".format(index),
+                                    self._recorder)
+                     for index in range(3)]
+
+        self._run(scenarios, concurrency=3, quota=1)
+
+        # An instance is prepared only after the previous one was
+        # cleaned up, since a single instance can exist.
+        self.assertEqual(1, self._recorder.max_preparing)
+        self.assertEqual(
+            ["prepare", "test", "teardown"] * 3,
+            [event[0] for event in self._recorder.events])
+
+    def test_failed_preparation(self):
+        scenario = _make_scenario("FailingScenario", self._recorder,
+                                  fail=True)
+
+        result = self._run([scenario], quota=1)
+
+        self.assertEqual(1, len(result.errors))
+        self.assertIn("The instance could not be created",
+                      result.errors[0][1])
+        self.assertEqual([], self._events("test"))
+        # The scenario was cleaned up only once, by the failed preparation.
+        self.assertEqual([("FailingScenario", )], self._events("teardown"))
+
+    def test_scenario_name_is_logged_per_thread(self):
+        argus_log.set_scenario_name(base.LOG, "main")
+        scenarios = [_make_scenario("Scenario{}".format(index),
+                                    self._recorder)
+                     for index in range(2)]
+
+        self._run(scenarios, concurrency=2)
+
+        self.assertEqual(["main", "main"],
+                         [event[1] for event in self._events("prepare")])
+
+    @test_utils.ConfPatcher('scenario_quota', 2, 'argus')
+    @test_utils.ConfPatcher('scenario_concurrency', 3, 'argus')
+    def test_defaults_from_config(self):
+        suite = scheduler.ScenarioSuite(
+            [_make_scenario("Scenario", self._recorder)])
+
+        self.assertEqual((3, 2), (suite.concurrency, suite.quota))
+        self.assertEqual(1, suite.countTestCases())
+
+    def test_preparations_are_forgotten(self):
+        scenario = _make_scenario("Scenario", self._recorder)
+
+        self._run([scenario], concurrency=2, quota=1)
+
+        self.assertIsNone(scheduler.get_preparation(scenario))
+
+
+class TestLoadScenarios(unittest.TestCase):
+
+    def _load(self, *test_cases, **kwargs):
+        loader = unittest.TestLoader()
+        return scheduler.load_scenarios(
+            unittest.TestSuite(loader.loadTestsFromTestCase(test_case)
+                               for test_case in test_cases), **kwargs)
+
+    def test_sequential(self):
+        scenario = _make_scenario("Scenario", _Recorder())
+
+        tests = self._load(scenario, concurrency=1)
+
+        self.assertNotIsInstance(list(tests)[-1], scheduler.ScenarioSuite)
+
+    @test_utils.ConfPatcher('scenario_concurrency', 2, 'argus')
+    def test_concurrent(self):
+        scenario = _make_scenario("Scenario", _Recorder())
+        skipped = unittest.skip("Not now.")(
+            _make_scenario("Skipped", _Recorder()))
+
+        tests = list(self._load(scenario, skipped, TestSetUpClass))
+
+        suite = tests[-1]
+        self.assertIsInstance(suite, scheduler.ScenarioSuite)
+        self.assertEqual([scenario], suite._scenarios)
+        self.assertEqual(2, suite.concurrency)
+        # The skipped scenario and the other tests are left as they are.
+        self.assertEqual(1 + 1, len(tests) - 1)
+
+
+class TestSetUpClass(unittest.TestCase):
+
+    def test_prepared_scenario_is_not_prepared_again(self):
+        recorder = _Recorder()
+        scenario = _make_scenario("PreparedScenario", recorder)
+        preparation = scheduler.Preparation()
+        preparation.prepared = True
+
+        with mock.patch.dict(scheduler._PREPARATIONS,
+                             {scenario: preparation}):
+            scenario.setUpClass()
+
+        self.assertEqual([], recorder.events)
+        self.assertEqual(
+            "PreparedScenario",
+            argus_log.get_log_extra_item(base.LOG, "scenario"))
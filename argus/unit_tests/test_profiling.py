@@ -0,0 +1,198 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus import log as argus_log
+from argus import profiling
+from argus.unit_tests import test_utils
+
+
+def _span(category, name, duration, scenario="Scenario",
+          thread="MainThread", start=100.0):
+    return profiling.Span(category, name, scenario, thread,
+                          start, start + duration, {})
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(profiling._SPANS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _record_in(self, scenario, category, name, **details):
+        with argus_log.isolated_extra(profiling.LOG):
+            argus_log.set_scenario_name(profiling.LOG, scenario)
+            with profiling.span(category, name, **details) as recorded:
+                recorded["received"] = 10
+
+    def test_spans_are_grouped_by_scenario(self):
+        self._record_in("First", profiling.COMMAND, "powershell", sent=5)
+        self._record_in("Second", profiling.STEP, "sysprep")
+
+        spans = profiling.get_spans("First")
+        self.assertEqual(1, len(spans))
+        self.assertEqual(("command", "powershell", "First"),
+                         spans[0][:3])
+        self.assertEqual({"sent": 5, "received": 10}, spans[0].details)
+        self.assertGreaterEqual(spans[0].duration, 0)
+        self.assertEqual(["sysprep"],
+                         [span.name for span in
+                          profiling.get_spans("Second")])
+
+    def test_failed_block_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with profiling.span(profiling.API, "create_server"):
+                raise ValueError("failed")
+
+        scenario = argus_log.get_log_extra_item(profiling.LOG, "scenario")
+        self.assertEqual(["create_server"],
+                         [span.name for span in
+                          profiling.get_spans(scenario)])
+
+    def test_instrumented_client(self):
+        client = mock.Mock(build_interval=1)
+        client.show_server.return_value = "server"
+        instrumented = profiling.InstrumentedClient(client, "servers_client")
+        scenario = argus_log.get_log_extra_item(profiling.LOG, "scenario")
+
+        self.assertEqual("server", instrumented.show_server("id"))
+        self.assertEqual(1, instrumented.build_interval)
+        client.show_server.assert_called_once_with("id")
+        self.assertEqual([("api", "servers_client.show_server")],
+                         [span[:2] for span in
+                          profiling.get_spans(scenario)])
+
+    def test_summarize(self):
+        summary = profiling.summarize([
+            _span("step", "install_cbinit", 60),
+            _span("command", "powershell", 1),
+            _span("command", "powershell", 3),
+        ])
+
+        self.assertEqual(
+            [{"category": "step", "name": "install_cbinit", "count": 1,
+              "total": 60, "mean": 60, "max": 60},
+             {"category": "command", "name": "powershell", "count": 2,
+              "total": 4, "mean": 2, "max": 3}],
+            summary)
+
+    def test_format_summary(self):
+        table = profiling.format_summary(profiling.summarize(
+            [_span("sleep", "retry", 2.5)]))
+
+        self.assertEqual(["category  name   count  total  mean  max",
+                          "sleep     retry  1      2.50   2.50  2.50"],
+                         table.splitlines())
+
+    def test_write_profile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profiling.record(_span("step", "sysprep", 30))
+
+        path = profiling.write_profile("Scenario", directory)
+
+        self.assertEqual(os.path.join(directory, "Scenario-profile.json"),
+                         path)
+        with open(path) as stream:
+            profile = json.load(stream)
+        self.assertEqual("Scenario", profile["scenario"])
+        self.assertEqual(30, profile["spans"][0]["duration"])
+        self.assertEqual("sysprep", profile["summary"][0]["name"])
+
+    @test_utils.ConfPatcher('output_directory', None, 'argus')
+    def test_report(self):
+        profiling.record(_span("step", "sysprep", 30))
+
+        with test_utils.LogSnatcher('argus.profiling') as snatcher:
+            profiling.report("Scenario")
+            profiling.report("Other scenario")
+
+        self.assertEqual(1, len(snatcher.output))
+        self.assertEqual("Profile of scenario Scenario:",
+                         snatcher.output[0].splitlines()[0])
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(profiling._SPANS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self._directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._directory)
+
+    @staticmethod
+    def _names(events, name):
+        return {event["pid"]: event["args"]
+                for event in events if event["name"] == name}
+
+    def test_trace_events(self):
+        events = profiling.trace_events([
+            _span("step", "install_cbinit", 2, "Second", start=10),
+            _span("step", "boot", 1, "First", start=5),
+            _span("command", "powershell", 0.5, "First", "step-mtu", 6),
+        ])
+
+        self.assertEqual({1: {"name": "First"}, 2: {"name": "Second"}},
+                         self._names(events, "process_name"))
+        self.assertEqual({1: {"sort_index": 0}, 2: {"sort_index": 1}},
+                         self._names(events, "process_sort_index"))
+        spans = [event for event in events if event["ph"] == "X"]
+        self.assertEqual(
+            [("boot", "step", 1, 1, 5000000, 1000000),
+             ("powershell", "command", 1, 2, 6000000, 500000),
+             ("install_cbinit", "step", 2, 3, 10000000, 2000000)],
+            [(event["name"], event["cat"], event["pid"], event["tid"],
+              event["ts"], event["dur"]) for event in spans])
+
+    def test_merge_traces(self):
+        workers = ((1, "First", 20), (2, "Second", 10))
+        for worker, scenario, start in workers:
+            profiling.record(_span("step", "boot", 1, scenario,
+                                   start=start))
+            with mock.patch('os.getpid', return_value=worker):
+                profiling.write_trace(self._directory)
+            profiling._SPANS.clear()
+        destination = os.path.join(self._directory, "merged.json")
+
+        path = profiling.merge_traces(self._directory, destination)
+
+        self.assertEqual(destination, path)
+        with open(path) as stream:
+            events = json.load(stream)["traceEvents"]
+        names = self._names(events, "process_name")
+        self.assertEqual(["First", "Second"],
+                         [names[pid]["name"] for pid in sorted(names)])
+        # The scenario which started first comes first.
+        self.assertEqual({1: {"sort_index": 1}, 2: {"sort_index": 0}},
+                         self._names(events, "process_sort_index"))
+
+    def test_merge_without_traces(self):
+        self.assertIsNone(profiling.merge_traces(
+            self._directory, os.path.join(self._directory, "merged.json")))
@@ -0,0 +1,226 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus import exceptions
+from argus import log as argus_log
+from argus.unit_tests import test_utils
+from argus import util
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('time.sleep')
+        self._sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.dict(util._RETRY_STATS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _delays(self):
+        return [call[0][0] for call in self._sleep.call_args_list]
+
+    def _exhaust(self, policy):
+        retrier = policy.start()
+        while retrier.sleep():
+            pass
+        return retrier
+
+    def test_exponential_backoff(self):
+        policy = util.RetryPolicy(retries=6, initial_delay=1, multiplier=2,
+                                  max_delay=10, jitter=0)
+
+        retrier = self._exhaust(policy)
+
+        self.assertEqual(6, retrier.retries)
+        self.assertEqual([1, 2, 4, 8, 10, 10], self._delays())
+
+    def test_jitter(self):
+        policy = util.RetryPolicy(retries=50, initial_delay=4, multiplier=1,
+                                  max_delay=10, jitter=0.25)
+
+        self._exhaust(policy)
+
+        delays = self._delays()
+        self.assertTrue(all(3 <= delay <= 5 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    @mock.patch('time.time')
+    def test_deadline(self, mock_time):
+        now = [100.0]
+        mock_time.side_effect = lambda: now[0]
+        self._sleep.side_effect = lambda delay: now.__setitem__(
+            0, now[0] + delay)
+        policy = util.RetryPolicy(retries=None, initial_delay=1,
+                                  multiplier=2, max_delay=10, jitter=0,
+                                  deadline=20)
+
+        self._exhaust(policy)
+
+        # The next delay of 10 seconds would pass the deadline.
+        self.assertEqual([1, 2, 4, 8], self._delays())
+
+    def test_no_retries(self):
+        retrier = util.RetryPolicy(retries=0).start()
+
+        self.assertFalse(retrier.sleep())
+        self.assertFalse(self._sleep.called)
+
+    @test_utils.ConfPatcher('retry_deadline', 0, 'argus')
+    @test_utils.ConfPatcher('retry_jitter', 0.5, 'argus')
+    @test_utils.ConfPatcher('retry_multiplier', 3, 'argus')
+    @test_utils.ConfPatcher('retry_initial_delay', 2, 'argus')
+    @test_utils.ConfPatcher('retry_delay', 30, 'argus')
+    @test_utils.ConfPatcher('retry_count', 7, 'argus')
+    def test_from_config(self):
+        policy = util.RetryPolicy.from_config()
+        overridden = util.RetryPolicy.from_config(retries=2, max_delay=1,
+                                                  deadline=60)
+
+        self.assertEqual((7, 2, 3, 30, 0.5, None),
+                         (policy.retries, policy.initial_delay,
+                          policy.multiplier, policy.max_delay,
+                          policy.jitter, policy.deadline))
+        self.assertEqual((2, 1, 1, 60),
+                         (overridden.retries, overridden.initial_delay,
+                          overridden.max_delay, overridden.deadline))
+
+    @test_utils.ConfPatcher('retry_deadline', 60, 'argus')
+    def test_from_config_deadline(self):
+        self.assertEqual(60, util.RetryPolicy.from_config().deadline)
+        self.assertEqual(
+            10, util.RetryPolicy.from_config(retries=None,
+                                             deadline=10).deadline)
+        # Retrying forever is not cut short by the option.
+        unbounded = util.RetryPolicy.from_config(retries=None)
+        self.assertEqual((None, None),
+                         (unbounded.retries, unbounded.deadline))
+
+    def test_from_config_no_deadline_by_default(self):
+        self.assertIsNone(util.RetryPolicy.from_config().deadline)
+
+    def test_wake_event(self):
+        wake = threading.Event()
+        wake.set()
+        policy = util.RetryPolicy(retries=3, initial_delay=5, multiplier=2,
+                                  max_delay=60, jitter=0)
+        retrier = policy.start(wake)
+
+        self.assertTrue(retrier.sleep())
+
+        # The event was consumed and the backoff started again.
+        self.assertFalse(wake.is_set())
+        self.assertEqual(5, retrier.next_delay())
+        self.assertFalse(self._sleep.called)
+
+    def test_sleep_is_recorded_per_scenario(self):
+        policy = util.RetryPolicy(retries=3, initial_delay=1, multiplier=2,
+                                  jitter=0)
+        scenario = argus_log.get_log_extra_item(util.LOG, "scenario")
+
+        self._exhaust(policy)
+
+        self.assertEqual({"retries": 3, "sleep": 7.0},
+                         util.get_retry_stats(scenario))
+        self.assertEqual({"retries": 0, "sleep": 0.0},
+                         util.get_retry_stats("other scenario"))
+
+    def test_exec_with_retry(self):
+        action = mock.Mock(side_effect=[ValueError, ValueError, "result"])
+
+        self.assertEqual("result", util.exec_with_retry(action, 5, 10))
+        self.assertEqual(2, len(self._delays()))
+
+    def test_exec_with_retry_fails(self):
+        action = mock.Mock(side_effect=ValueError)
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            util.exec_with_retry(action, 2, 10)
+        self.assertEqual(3, action.call_count)
+
+
+class TestDecodeCommand(unittest.TestCase):
+
+    def test_powershell_command(self):
+        script = u"Write-Output '\u00e9'"
+        command = util.get_command(script, util.POWERSHELL)
+
+        self.assertEqual(script, util.decode_command(command))
+
+    def test_other_commands(self):
+        for command_type in (util.CMD, util.POWERSHELL_SCRIPT_BYPASS):
+            command = util.get_command("script.ps1", command_type)
+            self.assertEqual(command, util.decode_command(command))
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_least_recently_used_is_dropped(self):
+        cache = util.LRUCache(2)
+        cache.put("first", 1)
+        cache.put("second", 2)
+        self.assertEqual(1, cache.get("first"))
+
+        cache.put("third", 3)
+
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(1, cache.get("first"))
+        self.assertEqual(3, cache.get("third"))
+        self.assertEqual(2, len(cache))
+        self.assertEqual((3, 1), (cache.hits, cache.misses))
+
+    def test_clear(self):
+        cache = util.LRUCache(2)
+        cache.put("first", 1)
+
+        cache.clear()
+
+        self.assertEqual("default", cache.get("first", "default"))
+
+
+class TestGetCommand(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(util, "_ENVELOPES",
+                                    util.LRUCache(util.ENVELOPE_CACHE_SIZE))
+        self._cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_encoded_commands_are_cached(self):
+        first = util.get_command("echo 1", util.POWERSHELL)
+        second = util.get_command("echo 1", util.POWERSHELL)
+
+        self.assertIs(first, second)
+        self.assertEqual(1, self._cache.hits)
+        self.assertNotEqual(first, util.get_command("echo 1", util.CMD))
+
+    def test_long_commands_are_not_cached(self):
+        command = "x" * util.MAX_COMMAND_LINE
+
+        encoded = util.get_command(command, util.POWERSHELL)
+
+        self.assertFalse(util.fits_command_line(encoded))
+        self.assertEqual(0, len(self._cache))
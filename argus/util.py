@@ -23,14 +23,18 @@ import socket
 import struct
 import subprocess
 import sys
+import threading
 import time
 import unittest
 
 import six
 
+from argus import config as argus_config
 from argus import log as argus_log
 from argus import exceptions
+from argus import profiling
 
+CONFIG = argus_config.CONFIG
 LOG = argus_log.LOG
 
 CMD = "cmd"
@@ -52,6 +56,12 @@ OPEN_NEBULA_SERVICE = 'opennebula'
 CLOUD_STACK_SERVICE = 'cloudstack'
 MAAS_SERVICE = 'maas'
 
+# The longest command line accepted by cmd.exe, which starts
+# the commands received by WinRM.
+MAX_COMMAND_LINE = 8191
+# The number of encoded commands kept by :func:`get_command`.
+ENVELOPE_CACHE_SIZE = 256
+
 __all__ = (
     'decrypt_password',
     'get_logger',
@@ -80,16 +90,166 @@ NETWORK_KEYS = [
 ]
 
 
+# The number of retries and the seconds spent sleeping
+# between them, for every scenario.
+_RETRY_STATS = collections.defaultdict(lambda: {"retries": 0, "sleep": 0.0})
+_RETRY_STATS_LOCK = threading.Lock()
+
+_UNSET = object()
+
+
+def record_retry(delay):
+    """Count a retry of the current scenario, after waiting `delay`."""
+    scenario = argus_log.get_log_extra_item(LOG, "scenario")
+    with _RETRY_STATS_LOCK:
+        stats = _RETRY_STATS[scenario]
+        stats["retries"] += 1
+        stats["sleep"] += delay
+
+
+def get_retry_stats(scenario):
+    """Get the number of retries and the time slept by a scenario."""
+    with _RETRY_STATS_LOCK:
+        return dict(_RETRY_STATS.get(scenario, {"retries": 0, "sleep": 0.0}))
+
+
+class RetryPolicy(object):
+    """Decide how many times and how long to wait before a retry.
+
+    The delay before the first retry is `initial_delay` and it is
+    multiplied by `multiplier` for every retry after it, without
+    going over `max_delay`. Every delay is varied randomly by up to
+    the `jitter` fraction of it, so that the clients waiting for the
+    same event don't retry in lockstep.
+
+    There are no more retries after `retries` retries or when the
+    next one would start after `deadline` seconds since the first
+    attempt. None means no limit for both of them.
+    """
+
+    def __init__(self, retries=None, initial_delay=1, multiplier=2,
+                 max_delay=10, jitter=0.1, deadline=None):
+        self.retries = retries
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    @classmethod
+    def from_config(cls, retries=_UNSET, max_delay=None, deadline=_UNSET):
+        """Get the policy from the argus options.
+
+        The arguments which are given override the options. The
+        ``retry_deadline`` option doesn't apply when `retries` is
+        None, since retrying forever was asked explicitly.
+        """
+        options = CONFIG.argus
+        if deadline is _UNSET:
+            deadline = None if retries is None else (
+                options.retry_deadline or None)
+        if retries is _UNSET:
+            retries = options.retry_count
+        if max_delay is None:
+            max_delay = options.retry_delay
+        return cls(retries=retries,
+                   initial_delay=min(options.retry_initial_delay, max_delay),
+                   multiplier=options.retry_multiplier,
+                   max_delay=max_delay, jitter=options.retry_jitter,
+                   deadline=deadline)
+
+    def start(self, wake=None):
+        """Start counting the retries of a new action.
+
+        :param wake:
+            An optional :class:`threading.Event`, which interrupts
+            the waiting when it is set, for retrying right away.
+        """
+        return Retrier(self, wake)
+
+
+class Retrier(object):
+    """Count the retries of an action, following a :class:`RetryPolicy`."""
+
+    def __init__(self, policy, wake=None):
+        self._policy = policy
+        self._wake = wake
+        self._started = time.time()
+        self._delay = policy.initial_delay
+        self.retries = 0
+
+    @property
+    def wake(self):
+        """The event which interrupts the waiting, if there is one."""
+        return self._wake
+
+    def restart(self):
+        """Clear the wake event and start again from the initial delay."""
+        self._wake.clear()
+        self._delay = self._policy.initial_delay
+
+    def next_delay(self):
+        """Get the delay before the next retry, None if there is none."""
+        policy = self._policy
+        if policy.retries is not None and self.retries >= policy.retries:
+            return None
+        delay = self._delay * (1 + random.uniform(-policy.jitter,
+                                                  policy.jitter))
+        delay = max(0, min(delay, policy.max_delay))
+        if policy.deadline is not None:
+            elapsed = time.time() - self._started
+            if elapsed + delay > policy.deadline:
+                return None
+        return delay
+
+    def advance(self):
+        """Count the next retry, without waiting for it.
+
+        This is for the callers which wait on their own,
+        such as the coroutines.
+
+        :returns: The delay before the retry, None if there is none.
+        """
+        delay = self.next_delay()
+        if delay is None:
+            return None
+        self.retries += 1
+        self._delay = min(self._delay * self._policy.multiplier,
+                          self._policy.max_delay)
+        return delay
+
+    def sleep(self):
+        """Wait before the next retry.
+
+        If the wake event is set meanwhile, the waiting stops and the
+        delays start again from the initial one, since the awaited
+        condition probably changed.
+
+        :returns: False if there are no retries left, True otherwise.
+        """
+        delay = self.advance()
+        if delay is None:
+            return False
+        with profiling.span(profiling.SLEEP, "retry", delay=delay):
+            if self._wake is None:
+                time.sleep(delay)
+            else:
+                start = time.time()
+                if self._wake.wait(delay):
+                    self.restart()
+                    delay = time.time() - start
+        record_retry(delay)
+        return True
+
+
 def exec_with_retry(action, retry_count, retry_count_interval):
-    i = 0
+    retrier = RetryPolicy.from_config(
+        retries=retry_count, max_delay=retry_count_interval).start()
     while True:
         try:
             return action()
         except Exception:
-            if i < retry_count:
-                i += 1
-                time.sleep(retry_count_interval)
-            else:
+            if not retrier.sleep():
                 raise exceptions.ArgusTimeoutError(
                     "{!r} failed too many times."
                     .format(action))
@@ -202,6 +362,49 @@ class cached_property(object):  # pylint: disable=invalid-name
         return result
 
 
+class LRUCache(object):
+    """A thread safe mapping which keeps only the recently used items.
+
+    :param size:
+        The maximum number of items. The least recently used
+        item is dropped when a new one doesn't fit anymore.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """Get the value of the given key, marking it as recently used."""
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Add an item, dropping the least recently used one if needed."""
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
 def rand_name(name=''):
     """Generate a random name
 
@@ -316,10 +519,42 @@ COMMAND_MODIFIERS = {
 }
 
 
+_ENVELOPES = LRUCache(ENVELOPE_CACHE_SIZE)
+
+
 def get_command(command, command_type=None):
-    """Returns the command decorated according to the command_type """
-    modifier = COMMAND_MODIFIERS.get(command_type, lambda command: command)
-    return modifier(command)
+    """Returns the command decorated according to the command_type
+
+    The same commands are run again and again while polling an
+    instance, so the decorated commands are cached, except for
+    the ones which don't fit in a command line anyway.
+    """
+    key = (command, command_type)
+    decorated = _ENVELOPES.get(key)
+    if decorated is None:
+        modifier = COMMAND_MODIFIERS.get(command_type,
+                                         lambda command: command)
+        decorated = modifier(command)
+        if fits_command_line(decorated):
+            _ENVELOPES.put(key, decorated)
+    return decorated
+
+
+def fits_command_line(command):
+    """Check if the instance accepts the given command line."""
+    return len(command) <= MAX_COMMAND_LINE
+
+
+def decode_command(command):
+    """Get back the PowerShell command given to :func:`get_command`.
+
+    The commands which were not encoded are returned untouched.
+    """
+    prefix = _get_command_powershell("")
+    if not command.startswith(prefix):
+        return command
+    encoded = command[len(prefix):]
+    return base64.b64decode(encoded).decode("UTF-16LE")
 
 
 _BUILDS = ["Beta", "Stable", "test"]
@@ -24,6 +24,7 @@ from argus.introspection.cloud import windows as introspection
 from argus.recipes.cloud import windows as recipe
 from argus.scenarios.cloud import base as scenarios
 from argus.scenarios.cloud import windows as windows_scenarios
+from argus.scenarios import scheduler
 from argus.tests.cloud import smoke
 from argus.tests.cloud.windows import test_smoke
 from argus import util
@@ -39,7 +40,15 @@ def _availability_zones():
         api_manager.cleanup_credentials()
 
 CONFIG = argus_config.CONFIG
-AVAILABILITY_ZONES = _availability_zones()
+# The recorded sessions are replayed without any cloud.
+AVAILABILITY_ZONES = (set() if CONFIG.argus.replay_directory
+                      else _availability_zones())
+
+
+def load_tests(loader, tests, pattern):
+    """Prepare the scenarios concurrently, see ``scenario_concurrency``."""
+    # pylint: disable=unused-argument
+    return scheduler.load_scenarios(tests)
 
 
 class BaseWindowsScenario(scenarios.CloudScenario):